@@ -36,7 +36,7 @@ if __name__ == "__main__":
     contest_prefixes = args.contest
 
     results: Optional[FastTallyEverythingResults] = load_fast_tally(
-        tallydir, check_proofs=False
+        tallydir, check_proofs=False, cvr_columns=[]
     )
 
     if results is None:
@@ -27,7 +27,7 @@ if __name__ == "__main__":
     tallydir = args.directory
 
     results: Optional[FastTallyEverythingResults] = load_fast_tally(
-        tallydir, check_proofs=False
+        tallydir, check_proofs=False, cvr_columns=[]
     )
 
     if results is None:
@@ -0,0 +1,160 @@
+import argparse
+import os
+from multiprocessing import Pool
+from sys import exit
+from typing import Optional, Dict
+
+from electionguard.serializable import set_serializers, set_deserializers
+
+from arlo_e2e.admin import ElectionAdmin
+from arlo_e2e.eg_helpers import log_nothing_to_stdout
+from arlo_e2e.publish import load_fast_tally
+from arlo_e2e.segment_tree import (
+    load_segment_tree,
+    decrypt_group_tallies,
+    group_file_names,
+)
+from arlo_e2e.tally import TALLY_TYPE, SelectionTally
+from arlo_e2e.utils import load_json_helper, write_json_helper
+
+
+if __name__ == "__main__":
+    set_serializers()
+    set_deserializers()
+    log_nothing_to_stdout()
+
+    parser = argparse.ArgumentParser(
+        description="Computes, decrypts, and proves subtotals for groups of ballots, using the segment tree in an arlo-e2e tally"
+    )
+
+    parser.add_argument(
+        "-t",
+        "--tallies",
+        type=str,
+        default="tally_output",
+        help="directory name for where the tally artifacts can be found (default: tally_output)",
+    )
+
+    parser.add_argument(
+        "-k",
+        "--keys",
+        type=str,
+        default="secret_election_keys.json",
+        help="file name for the election official's key materials (default: secret_election_keys.json)",
+    )
+
+    parser.add_argument(
+        "-r",
+        "--root-hash",
+        "--root_hash",
+        type=str,
+        default=None,
+        help="optional root hash for the tally directory; if the manifest is tampered, an error is indicated",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default="subtotal_output",
+        help="directory name for where the decrypted subtotals, with their proofs, are written (default: subtotal_output)",
+    )
+
+    parser.add_argument(
+        "--range",
+        type=int,
+        nargs=2,
+        default=None,
+        metavar=("START", "END"),
+        help="computes the subtotal for the ballots from START up to, but not including, END, in the order of the CVR metadata",
+    )
+
+    parser.add_argument(
+        "column",
+        type=str,
+        nargs="?",
+        default=None,
+        help="CVR metadata column defining the groups (e.g., TabulatorNum, BatchId, or CountingGroup)",
+    )
+
+    args = parser.parse_args()
+    tallydir = args.tallies
+    keyfile = args.keys
+    root_hash = args.root_hash
+    output_dir = args.output
+    column: Optional[str] = args.column
+
+    if (column is None) == (args.range is None):
+        print("Specify either a CVR metadata column or a --range, but not both.")
+        exit(1)
+
+    admin_state: Optional[ElectionAdmin] = load_json_helper(".", keyfile, ElectionAdmin)
+    if admin_state is None or not admin_state.is_valid():
+        print(f"Election administration key material wasn't valid")
+        exit(1)
+
+    pool = Pool(os.cpu_count())
+
+    print(f"Loading tallies from {tallydir}.")
+    results = load_fast_tally(
+        tallydir,
+        check_proofs=False,
+        root_hash=root_hash,
+        cvr_columns=[column] if column is not None else [],
+    )
+    if results is None:
+        print(f"Failed to load results from {tallydir}")
+        exit(1)
+
+    tree = load_segment_tree(results)
+    if tree is None or not tree.is_consistent():
+        print(f"Failed to load a consistent segment tree from {tallydir}")
+        exit(1)
+
+    # The tree's internal nodes are checked against each other and the tally, above, but
+    # the leaves also have to match the ballots, or we'd be decrypting subtotals that no
+    # observer could reproduce.
+    print("Checking the segment tree against the ballots.")
+    if not tree.leaves_match_ballots(pool):
+        print(f"Segment tree in {tallydir} doesn't match its ballots")
+        exit(1)
+
+    group_tallies: Optional[Dict[str, TALLY_TYPE]]
+    if args.range is not None:
+        start, end = args.range
+        range_tally = tree.range_tally(start, end)
+        group_tallies = None if range_tally is None else {f"{start}-{end}": range_tally}
+        column = "range"
+    else:
+        group_tallies = tree.group_tallies(column)
+
+    if group_tallies is None:
+        print("Failed to compute the subtotals")
+        exit(1)
+
+    subtotals: Dict[str, SelectionTally] = decrypt_group_tallies(
+        group_tallies, results.context, admin_state.keypair, pool=pool
+    )
+    pool.close()
+
+    file_names = group_file_names(subtotals.keys())
+    for group in sorted(subtotals.keys()):
+        print(f"{column} = {group}")
+        for contest_title in results.metadata.contest_name_order:
+            selections = [
+                s
+                for s in results.metadata.contest_map[contest_title]
+                if s.object_id in subtotals[group].map
+            ]
+            if not selections:
+                continue
+            print(f"    {contest_title}")
+            for s in sorted(selections, key=lambda s: s.sequence_number):
+                print(
+                    f"        {s.to_string_no_contest():30}: {subtotals[group].map[s.object_id].decrypted_tally}"
+                )
+
+        print(f"    (written to {column}/{file_names[group]})")
+        write_json_helper(output_dir, file_names[group], subtotals[group], [column])
+
+    print(f"Subtotals and proofs written to {output_dir}.")
@@ -1,12 +1,12 @@
 import argparse
-from os import path
 from sys import exit
 from timeit import default_timer as timer
-from typing import Optional
+from typing import Optional, List
 
 from electionguard.serializable import set_serializers, set_deserializers
 
 from arlo_e2e.admin import ElectionAdmin
+from arlo_e2e.compression import supported_codecs
 from arlo_e2e.dominion import read_dominion_csv
 from arlo_e2e.publish import write_ray_tally
 from arlo_e2e.ray_helpers import (
@@ -16,7 +16,7 @@ from arlo_e2e.ray_helpers import (
 )
 from arlo_e2e.ray_tally import ray_tally_everything
 from arlo_e2e.ray_write_retry import wait_for_zero_pending_writes
-from arlo_e2e.utils import load_json_helper
+from arlo_e2e.utils import load_json_helper, directory_exists_helper
 
 if __name__ == "__main__":
     set_serializers()
@@ -37,13 +37,45 @@ if __name__ == "__main__":
         "--tallies",
         type=str,
         default="tally_output",
-        help="directory name for where the tally is written (default: tally_output)",
+        help="directory name, or s3://bucket/path URL, for where the tally is written (default: tally_output)",
     )
     parser.add_argument(
         "--cluster",
         action="store_true",
         help="uses a Ray cluster for distributed computation",
     )
+    parser.add_argument(
+        "--codec",
+        type=str,
+        choices=sorted(supported_codecs()),
+        default=None,
+        help="compresses the encrypted ballots with the given codec (default: no compression)",
+    )
+    parser.add_argument(
+        "--group-by",
+        "--group_by",
+        type=str,
+        nargs="+",
+        default=None,
+        help="also publishes decrypted subtotals, with proofs, for every value of these CVR metadata columns (e.g., TabulatorNum BatchId CountingGroup)",
+    )
+    parser.add_argument(
+        "--columnar",
+        action="store_true",
+        help="also writes the ciphertexts in columnar form, for fast tally checks with arlo_verify_tally --columns",
+    )
+    parser.add_argument(
+        "--segment-tree",
+        "--segment_tree",
+        action="store_true",
+        help="also writes a segment tree of partial tallies, for computing subtotals with arlo_subtotals",
+    )
+    parser.add_argument(
+        "--stage-locally",
+        "--stage_locally",
+        action="store_true",
+        help="writes the encrypted ballots to local disk first, then uploads them in bulk (helps with slow network storage)",
+    )
     parser.add_argument(
         "cvr_file",
         type=str,
@@ -56,8 +88,13 @@ if __name__ == "__main__":
     cvrfile = args.cvr_file[0]
     tallydir = args.tallies
     use_cluster = args.cluster
+    codec = args.codec
+    columnar = args.columnar
+    segment_tree = args.segment_tree
+    stage_locally = args.stage_locally
+    group_columns: Optional[List[str]] = args.group_by
 
-    if path.exists(tallydir):
+    if directory_exists_helper(tallydir):
         print(f"Tally directory ({tallydir}) already exists. Exiting.")
         exit(1)
 
@@ -91,10 +128,14 @@ if __name__ == "__main__":
         verbose=False,
         secret_key=admin_state.keypair.secret_key,
         root_dir=tallydir,
+        codec=codec,
+        group_columns=group_columns,
+        stage_locally=stage_locally,
+        columnar=columnar,
     )
     tally_end = timer()
     print(f"Tally rate:    {rows / (tally_end - tally_start): .3f} ballots/sec")
-    write_ray_tally(rtally, tallydir)
+    write_ray_tally(rtally, tallydir, columnar=columnar, segment_tree=segment_tree)
     print(f"Tally written to {tallydir}")
 
     num_failures = wait_for_zero_pending_writes()
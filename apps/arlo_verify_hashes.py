@@ -0,0 +1,78 @@
+import argparse
+from sys import exit
+
+from arlo_e2e.eg_helpers import log_nothing_to_stdout
+from arlo_e2e.manifest import verify_manifest_hashes, NUM_HASH_THREADS
+
+if __name__ == "__main__":
+    log_nothing_to_stdout()
+
+    parser = argparse.ArgumentParser(
+        description="Reads an arlo-e2e tally and verifies every file against the manifest, without checking any cryptography"
+    )
+
+    parser.add_argument(
+        "-t",
+        "--tallies",
+        type=str,
+        default="tally_output",
+        help="directory name for where the tally artifacts can be found (default: tally_output)",
+    )
+
+    parser.add_argument(
+        "-r",
+        "--root-hash",
+        "--root_hash",
+        type=str,
+        default=None,
+        help="optional root hash for the tally directory; if the manifest is tampered, an error is indicated",
+    )
+
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=NUM_HASH_THREADS,
+        help=f"number of threads to use for hashing files (default: {NUM_HASH_THREADS})",
+    )
+
+    parser.add_argument(
+        "--ignore-extra",
+        "--ignore_extra",
+        action="store_true",
+        help="don't complain about files in the directory that aren't in the manifest",
+    )
+    args = parser.parse_args()
+
+    tallydir = args.tallies
+
+    print(f"Verifying file hashes in {tallydir}.")
+    results = verify_manifest_hashes(
+        tallydir,
+        expected_root_hash=args.root_hash,
+        num_threads=args.threads,
+        check_extra_files=not args.ignore_extra,
+    )
+
+    if results is None:
+        print("Failed to load the manifest.")
+        exit(1)
+
+    for name in results.missing:
+        print(f"Missing: {name}")
+    for name in results.unreadable:
+        print(f"Unreadable: {name}")
+    for name in results.mismatched:
+        print(f"Hash mismatch: {name}")
+    for name in results.extra:
+        print(f"Not in manifest: {name}")
+
+    print(
+        f"{results.num_files} files checked: {len(results.missing)} missing, "
+        + f"{len(results.unreadable)} unreadable, {len(results.mismatched)} mismatched, "
+        + f"{len(results.extra)} extra."
+    )
+
+    if results.success:
+        print("All files verified.")
+    else:
+        exit(1)
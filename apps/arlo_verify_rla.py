@@ -79,7 +79,7 @@ if __name__ == "__main__":
 
     print(f"Loading tallies from {tally_dir}.")
     tally: Optional[FastTallyEverythingResults] = load_fast_tally(
-        tally_dir, check_proofs=False, root_hash=root_hash
+        tally_dir, check_proofs=False, root_hash=root_hash, cvr_columns=["ImprintedId"]
     )
 
     if tally is None:
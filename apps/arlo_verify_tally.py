@@ -2,16 +2,28 @@ import argparse
 import os
 from multiprocessing import Pool
 from sys import exit
-from typing import Optional, Set, Dict, Tuple, Union
+from typing import Optional, Set, Dict, Tuple, Union, List
 
 from electionguard.serializable import set_serializers, set_deserializers
 
+from arlo_e2e.columnar import NUM_SAMPLED_BALLOTS, verify_tally_from_columns
 from arlo_e2e.eg_helpers import log_nothing_to_stdout
+from arlo_e2e.manifest import make_existing_manifest
 from arlo_e2e.metadata import SelectionMetadata
 from arlo_e2e.publish import load_fast_tally, load_ray_tally
 from arlo_e2e.ray_helpers import ray_init_cluster
 from arlo_e2e.ray_tally import RayTallyEverythingResults
-from arlo_e2e.tally import FastTallyEverythingResults, SelectionInfo
+from arlo_e2e.segment_tree import (
+    load_group_subtotals,
+    load_segment_tree,
+    verify_group_subtotals,
+)
+from arlo_e2e.tally import (
+    FastTallyEverythingResults,
+    SelectionInfo,
+    contest_titles_matching,
+)
+from arlo_e2e.tally_faults import locate_tally_faults, subtotal_consistency_oracle
 
 if __name__ == "__main__":
     set_serializers()
@@ -50,26 +62,169 @@ if __name__ == "__main__":
         action="store_true",
         help="uses a Ray cluster for distributed computation",
     )
+
+    parser.add_argument(
+        "--prefixes",
+        type=str,
+        nargs="+",
+        default=None,
+        help="only verifies the ballots in the given ballot-id prefix directories (e.g., b0001), against the published subtotals",
+    )
+
+    parser.add_argument(
+        "--changed-since",
+        "--changed_since",
+        type=str,
+        default=None,
+        help="only verifies the ballot-id prefix directories that differ from this earlier copy of the tally directory",
+    )
+
+    parser.add_argument(
+        "--changed-since-root-hash",
+        "--changed_since_root_hash",
+        type=str,
+        default=None,
+        help="root hash for the earlier copy of the tally directory given with --changed-since; without it, the earlier copy is only as trustworthy as its own manifest",
+    )
+
+    parser.add_argument(
+        "--columns",
+        action="store_true",
+        help=f"recomputes the tally from the columnar ciphertexts (see arlo_tally_ballots --columnar) rather than from the ballots, and checks {NUM_SAMPLED_BALLOTS} ballots, chosen at random, against the columns",
+    )
+
+    parser.add_argument(
+        "--contests",
+        type=str,
+        nargs="+",
+        default=None,
+        help="only verifies the contests whose titles start with any of the given prefixes, and only the ballots that include them",
+    )
+
+    parser.add_argument(
+        "--locate-faults",
+        "--locate_faults",
+        action="store_true",
+        help="if the recomputed tally doesn't match, searches the partial tallies from the same pass for the ballot-id prefixes responsible, using the published subtotals",
+    )
+
+    parser.add_argument(
+        "--segment-tree",
+        "--segment_tree",
+        action="store_true",
+        help="checks the segment tree (see arlo_tally_ballots --segment-tree) against the tally and against the ballots",
+    )
+
+    parser.add_argument(
+        "--subtotals",
+        type=str,
+        nargs="+",
+        default=None,
+        metavar="COLUMN",
+        help="checks the decrypted subtotals for the given CVR metadata columns (see arlo_subtotals) against the segment tree, with their proofs",
+    )
+
+    parser.add_argument(
+        "--subtotals-dir",
+        "--subtotals_dir",
+        type=str,
+        default="subtotal_output",
+        help="directory name for where the decrypted subtotals can be found (default: subtotal_output)",
+    )
     args = parser.parse_args()
 
     tallydir = args.tallies
     totals = args.totals
     use_cluster = args.cluster
     root_hash = args.root_hash
+    prefixes: Optional[List[str]] = args.prefixes
+    contest_prefixes: Optional[List[str]] = args.contests
+    use_columns = args.columns
+    locate_faults = args.locate_faults
+    check_tree = args.segment_tree
+    subtotal_columns: Optional[List[str]] = args.subtotals
+
+    if use_columns and (prefixes is not None or args.changed_since is not None):
+        print("--columns can't be combined with --prefixes or --changed-since")
+        exit(1)
+
+    if locate_faults and (
+        use_columns
+        or prefixes is not None
+        or args.changed_since is not None
+        or contest_prefixes is not None
+    ):
+        print(
+            "--locate-faults can't be combined with --columns, --prefixes, --changed-since, or --contests"
+        )
+        exit(1)
+
+    if args.changed_since is not None:
+        current_manifest = make_existing_manifest(tallydir, root_hash)
+        prior_manifest = make_existing_manifest(
+            args.changed_since, args.changed_since_root_hash
+        )
+        if current_manifest is None or prior_manifest is None:
+            print("Failed to load manifests")
+            exit(1)
+        changed_prefixes = current_manifest.changed_prefixes(prior_manifest)
+        if changed_prefixes is None:
+            print("Failed to compare manifests")
+            exit(1)
+        prefixes = changed_prefixes + (prefixes if prefixes is not None else [])
+        if not prefixes:
+            # Not the same as verifying zero prefixes successfully: we haven't checked anything.
+            print(
+                f"No ballot-id prefixes changed since {args.changed_since}. Nothing was verified."
+            )
+            exit(0)
+        print(f"Found {len(prefixes)} changed prefixes since {args.changed_since}.")
+
+    # If we're only checking some prefixes, then we skip the full recheck when loading,
+    # and check those prefixes against their subtotals afterward. Likewise, if we're using
+    # the columns, we recompute the tally from them afterward, instead. If we're locating
+    # faults, we recompute the tally afterward, so we keep the partial tallies if it fails.
+    recheck = prefixes is None and not use_columns and not locate_faults
+
+    # If we're only checking some contests, then we skip the proof checks when loading,
+    # since we need the metadata to figure out which contests we're checking.
+    check_proofs = contest_prefixes is None
+    contest_titles: Optional[Set[str]] = None
 
     results: Optional[Union[RayTallyEverythingResults, FastTallyEverythingResults]]
 
+    # Verification only needs the ballot ids from the CVR metadata (plus any columns with group
+    # subtotals, which are always loaded), unless we're checking subtotals from the segment tree.
+    cvr_columns = subtotal_columns if subtotal_columns is not None else []
+
     print(f"Loading and verifying tallies and ballots from {tallydir}.")
     if use_cluster:
         ray_init_cluster()
 
         ray_results = load_ray_tally(
             tallydir,
-            check_proofs=True,
-            recheck_ballots_and_tallies=True,
+            check_proofs=check_proofs,
+            recheck_ballots_and_tallies=recheck,
             root_hash=root_hash,
+            cvr_columns=cvr_columns,
         )
 
+        if ray_results is not None and contest_prefixes is not None:
+            contest_titles = contest_titles_matching(
+                ray_results.metadata, contest_prefixes
+            )
+            if not contest_titles or not ray_results.all_proofs_valid(
+                recheck_ballots_and_tallies=recheck, contests=contest_titles
+            ):
+                ray_results = None
+
+        if (
+            ray_results is not None
+            and prefixes is not None
+            and not ray_results.to_fast_tally().verify_prefixes(prefixes)
+        ):
+            ray_results = None
+
         results = ray_results
 
     else:
@@ -77,27 +232,147 @@ if __name__ == "__main__":
 
         fast_results = load_fast_tally(
             tallydir,
-            check_proofs=True,
+            check_proofs=check_proofs,
             pool=pool,
-            recheck_ballots_and_tallies=True,
+            recheck_ballots_and_tallies=recheck,
             root_hash=root_hash,
+            cvr_columns=cvr_columns,
         )
 
+        if fast_results is not None and contest_prefixes is not None:
+            contest_titles = contest_titles_matching(
+                fast_results.metadata, contest_prefixes
+            )
+            if not contest_titles or not fast_results.all_proofs_valid(
+                pool, recheck_ballots_and_tallies=recheck, contests=contest_titles
+            ):
+                fast_results = None
+
+        if (
+            fast_results is not None
+            and prefixes is not None
+            and not fast_results.verify_prefixes(prefixes, pool)
+        ):
+            fast_results = None
+
         pool.close()
         results = fast_results
 
+    if results is not None and use_columns:
+        fast_tally = (
+            results.to_fast_tally()
+            if isinstance(results, RayTallyEverythingResults)
+            else results
+        )
+        selection_ids = (
+            None
+            if contest_titles is None
+            else {
+                s.object_id
+                for title in contest_titles
+                for s in results.metadata.contest_map[title]
+            }
+        )
+        if not verify_tally_from_columns(fast_tally, selection_ids):
+            results = None
+
+    if results is not None and locate_faults:
+        fast_tally = (
+            results.to_fast_tally()
+            if isinstance(results, RayTallyEverythingResults)
+            else results
+        )
+        fault_pool = Pool(os.cpu_count())
+        tally_success, prefix_tallies = fast_tally.verify_recomputed_tally(fault_pool)
+        if not tally_success and prefix_tallies is not None:
+            # Without published subtotals, the oracle can't narrow anything down, but we
+            # still learn which selections are wrong.
+            faults = locate_tally_faults(
+                fast_tally,
+                prefix_tallies,
+                subtotal_consistency_oracle(
+                    fast_tally.subtotals if fast_tally.subtotals is not None else {}
+                ),
+            )
+            if faults is not None:
+                print("Recomputed tally doesn't match the published tally.")
+                print(f"    Mismatched selections: {faults.mismatched_selections}")
+                print(f"    Inconsistent ballot-id prefixes: {faults.faulty_prefixes}")
+        fault_pool.close()
+        if not tally_success:
+            results = None
+
+    if results is not None and (check_tree or subtotal_columns is not None):
+        tree = load_segment_tree(
+            results.to_fast_tally()
+            if isinstance(results, RayTallyEverythingResults)
+            else results
+        )
+        tree_pool = Pool(os.cpu_count())
+        if tree is None or not tree.is_consistent():
+            print(f"Failed to load a consistent segment tree from {tallydir}")
+            results = None
+        elif check_tree and not tree.leaves_match_ballots(tree_pool):
+            print(f"Segment tree in {tallydir} doesn't match its ballots")
+            results = None
+        elif subtotal_columns is not None:
+            for column in subtotal_columns:
+                group_subtotals = load_group_subtotals(tree, args.subtotals_dir, column)
+                if group_subtotals is None or not verify_group_subtotals(
+                    tree, column, group_subtotals
+                ):
+                    print(
+                        f"Subtotals for {column} in {args.subtotals_dir} don't match the segment tree"
+                    )
+                    results = None
+                    break
+        tree_pool.close()
+
     if results is None:
         print(f"Failed to load results from {tallydir}")
         exit(1)
 
-    print(
-        f"Verified {results.num_ballots} encrypted ballots for {results.metadata.election_name}."
-    )
-    print("Tally proofs valid, and consistent with the encrypted ballots.")
+    if contest_titles is not None:
+        print(
+            f"Verified only these contests, and the ballots that include them: {sorted(contest_titles)}"
+        )
+
+    if use_columns:
+        print(
+            f"Verified the columnar ciphertexts for {results.metadata.election_name}, and checked up to {NUM_SAMPLED_BALLOTS} encrypted ballots against them."
+        )
+        print("Tally proofs valid, and consistent with the columnar ciphertexts.")
+    elif prefixes is None and contest_titles is not None:
+        print(
+            f"Verified the encrypted ballots with these contests for {results.metadata.election_name}."
+        )
+        print("Tally proofs valid, and consistent with the encrypted ballots.")
+    elif prefixes is None:
+        print(
+            f"Verified {results.num_ballots} encrypted ballots for {results.metadata.election_name}."
+        )
+        print("Tally proofs valid, and consistent with the encrypted ballots.")
+    else:
+        print(
+            f"Verified the encrypted ballots in {len(set(prefixes))} prefixes for {results.metadata.election_name}."
+        )
+        print(
+            "Tally proofs valid, consistent with the subtotals, and those subtotals are consistent with their encrypted ballots."
+        )
+
+    if check_tree:
+        print("Segment tree consistent with the tally and with the encrypted ballots.")
+
+    if subtotal_columns is not None:
+        print(
+            f"Subtotals for {', '.join(subtotal_columns)} valid, and consistent with the segment tree."
+        )
 
     if totals:
         print()
         for contest_title in results.metadata.contest_name_order:
+            if contest_titles is not None and contest_title not in contest_titles:
+                continue
             max_votes_per_contest = results.metadata.max_votes_for_map[contest_title]
             explanation = (
                 ""
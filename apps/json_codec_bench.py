@@ -0,0 +1,79 @@
+# This is a benchmark that runs as a standalone program. It takes one command-line argument: the name of a "CSV"
+# file in Dominion format. It encrypts the whole thing, then compares ElectionGuard's JSON serialization of the
+# encrypted ballots with our own (see arlo_e2e.json_codec), checking that the results are identical.
+import argparse
+from multiprocessing import Pool
+from os import cpu_count
+from sys import exit
+from timeit import default_timer as timer
+
+from electionguard.ballot import CiphertextAcceptedBallot
+from electionguard.elgamal import elgamal_keypair_from_secret
+from electionguard.group import int_to_q_unchecked
+from electionguard.utils import get_optional
+
+from arlo_e2e.dominion import read_dominion_csv
+from arlo_e2e.json_codec import encode_json, decode_json
+from arlo_e2e.tally import fast_tally_everything
+
+
+def run_bench(filename: str, pool: Pool) -> None:
+    print(f"Benchmarking: {filename}")
+    cvrs = read_dominion_csv(filename)
+    if cvrs is None:
+        print(f"Failed to read {filename}, terminating.")
+        exit(1)
+
+    # doesn't matter what the key is
+    keypair = get_optional(elgamal_keypair_from_secret(int_to_q_unchecked(31337)))
+    tally = fast_tally_everything(
+        cvrs, pool, verbose=False, secret_key=keypair.secret_key
+    )
+    ballots = tally.encrypted_ballots
+    num_ballots = len(ballots)
+    print(f"    Encrypted {num_ballots} ballots")
+
+    start = timer()
+    slow_json = [b.to_json(strip_privates=True) for b in ballots]
+    slow_encode_time = timer() - start
+
+    start = timer()
+    fast_json = [encode_json(b) for b in ballots]
+    fast_encode_time = timer() - start
+
+    assert slow_json == fast_json, "encodings differ!"
+
+    start = timer()
+    slow_ballots = [CiphertextAcceptedBallot.from_json(j) for j in slow_json]
+    slow_decode_time = timer() - start
+
+    start = timer()
+    fast_ballots = [decode_json(j, CiphertextAcceptedBallot) for j in fast_json]
+    fast_decode_time = timer() - start
+
+    assert slow_ballots == fast_ballots, "decodings differ!"
+
+    print(f"\nOVERALL PERFORMANCE")
+    print(
+        f"    to_json:     {num_ballots / slow_encode_time: .3f} ballots/sec\n"
+        f"    encode_json: {num_ballots / fast_encode_time: .3f} ballots/sec ({slow_encode_time / fast_encode_time: .2f}x)\n"
+        f"    from_json:   {num_ballots / slow_decode_time: .3f} ballots/sec\n"
+        f"    decode_json: {num_ballots / fast_decode_time: .3f} ballots/sec ({slow_decode_time / fast_decode_time: .2f}x)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compares our ballot JSON codec with ElectionGuard's"
+    )
+    parser.add_argument(
+        "cvr_file",
+        type=str,
+        nargs=1,
+        help="filename for the Dominion-style ballot CVR file",
+    )
+    args = parser.parse_args()
+
+    pool = Pool(cpu_count())
+    run_bench(args.cvr_file[0], pool)
+    pool.close()
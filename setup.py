@@ -65,6 +65,14 @@ setup(
         "flask==1.1.2",
         "ray==1.0.1",
     ],
+    extras_require={
+        # S3 storage (see arlo_e2e.storage) is optional
+        "s3": ["boto3"],
+        # the zstd codec (see arlo_e2e.compression) is optional
+        "zstd": ["zstandard"],
+        # tests/test_storage.py runs against a local moto server, and the zstd tests need zstandard
+        "dev": ["boto3", "moto[server]>=3.0", "zstandard"],
+    },
     # electionguard is also a requirement, but we're assuming that's being installed elsewhere, since
     # we're hanging on a dev branch, etc. Ray is also a bit weird, so we're leaving that out here.
 )
@@ -0,0 +1,283 @@
+# The ballot type of every ballot, published on its own, rather than as a dict inside
+# `election_metadata.json`, where it would be most of the file, and would be decoded, one entry
+# at a time, on every load. Instead, the ballot types are numbered, and there's one small integer
+# per ballot, in a flat array, alongside a plain list of the ballot ids. None of it is loaded
+# until it's used, at which point it's read, checked against the manifest, and kept.
+
+from typing import (
+    Dict,
+    Final,
+    Iterable,
+    Iterator,
+    KeysView,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    ItemsView,
+)
+
+import numpy as np
+from dataclasses import dataclass
+from electionguard.logs import log_error
+from electionguard.serializable import Serializable
+
+from arlo_e2e.manifest import Manifest, compose_manifest_name
+
+BALLOT_TYPES_DIR: Final[str] = "ballot_types"
+"""
+Subdirectory of a tally directory holding the ballot type of every ballot.
+"""
+
+BALLOT_TYPES_INDEX: Final[str] = "ballot_types.json"
+"""
+Name of the file, in `BALLOT_TYPES_DIR`, holding the `BallotTypesIndex`.
+"""
+
+BALLOT_IDS: Final[str] = "ballot_ids.txt"
+"""
+Name of the file, in `BALLOT_TYPES_DIR`, holding every ballot id, one per line, in UTF-8.
+"""
+
+BALLOT_TYPE_CODES: Final[str] = "ballot_type_codes.bin"
+"""
+Name of the file, in `BALLOT_TYPES_DIR`, holding the number of every ballot's type, in the same
+order as the ballot ids.
+"""
+
+
+@dataclass(eq=True)
+class BallotTypesIndex(Serializable):
+    """
+    Describes the ballot types of every ballot, published in `BALLOT_TYPES_DIR`.
+    """
+
+    num_ballots: int
+    """
+    Number of ballots, which is the number of lines in `BALLOT_IDS` and the number of
+    entries in `BALLOT_TYPE_CODES`.
+    """
+
+    ballot_type_names: List[str]
+    """
+    Every ballot type name (as provided by the election administrator). Ballot types are
+    numbered by their position in this list.
+    """
+
+    code_dtype: str
+    """
+    NumPy dtype of the entries in `BALLOT_TYPE_CODES`, the smallest that fits every number.
+    """
+
+
+class BallotTypeMap(Mapping[str, str]):
+    """
+    A read-only mapping from ballot ids to their ballot types, which loads them from a
+    tally directory the first time it's used. If they can't be loaded, an error is logged,
+    and a `RuntimeError` is raised, rather than answering as if there were no ballots. Use
+    `check_ballot_types_index` first to catch most problems without loading anything.
+    """
+
+    def __init__(self, manifest: Manifest) -> None:
+        self._manifest = manifest
+        self._contents: Optional[Tuple[List[str], List[str], np.ndarray]] = None
+        self._positions: Optional[Dict[str, int]] = None
+
+    def _load(self) -> Tuple[List[str], List[str], np.ndarray]:
+        if self._contents is None:
+            self._contents = load_ballot_types(self._manifest)
+            if self._contents is None:
+                raise RuntimeError("Failed to load the ballot types")
+        return self._contents
+
+    def _index(self) -> Dict[str, int]:
+        if self._positions is None:
+            ballot_ids, _, _ = self._load()
+            self._positions = {bid: i for i, bid in enumerate(ballot_ids)}
+        return self._positions
+
+    def __getitem__(self, ballot_id: str) -> str:
+        _, names, codes = self._load()
+        return names[codes[self._index()[ballot_id]]]
+
+    def __contains__(self, ballot_id: object) -> bool:
+        return ballot_id in self._index()
+
+    def __iter__(self) -> Iterator[str]:
+        ballot_ids, _, _ = self._load()
+        return iter(ballot_ids)
+
+    def __len__(self) -> int:
+        ballot_ids, _, _ = self._load()
+        return len(ballot_ids)
+
+    def keys(self) -> KeysView[str]:
+        return self._index().keys()
+
+    def items(self) -> ItemsView[str, str]:
+        ballot_ids, names, codes = self._load()
+        return dict(zip(ballot_ids, [names[c] for c in codes.tolist()])).items()
+
+    def ballot_ids_with_types(self, ballot_types: Iterable[str]) -> List[str]:
+        """
+        Returns the ids of every ballot having any of the given ballot types, in order.
+        """
+        ballot_ids, names, codes = self._load()
+        wanted = set(ballot_types)
+        wanted_codes = [code for code, name in enumerate(names) if name in wanted]
+        return [
+            ballot_ids[i] for i in np.flatnonzero(np.isin(codes, wanted_codes)).tolist()
+        ]
+
+
+def ballot_ids_with_types(
+    ballot_id_to_ballot_type: Mapping[str, str], ballot_types: Iterable[str]
+) -> List[str]:
+    """
+    Returns the ids of every ballot, in the given mapping, having any of the given ballot
+    types, without looking up every ballot, one at a time, if the mapping is a `BallotTypeMap`.
+    """
+    if isinstance(ballot_id_to_ballot_type, BallotTypeMap):
+        return ballot_id_to_ballot_type.ballot_ids_with_types(ballot_types)
+
+    wanted = set(ballot_types)
+    return [bid for bid, bt in ballot_id_to_ballot_type.items() if bt in wanted]
+
+
+def write_ballot_types(
+    manifest: Manifest,
+    ballot_id_to_ballot_type: Mapping[str, str],
+    num_retries: int = 1,
+) -> BallotTypesIndex:
+    """
+    Writes out the ballot type of every ballot, updating the manifest. Ballot type names
+    are written as strings, as they would be if they were the keys of a JSON object.
+    """
+    names = sorted({str(bt) for bt in ballot_id_to_ballot_type.values()})
+    codes = {name: code for code, name in enumerate(names)}
+    code_dtype = np.dtype(np.min_scalar_type(max(len(names) - 1, 0))).newbyteorder("<")
+
+    manifest.write_file(
+        BALLOT_IDS,
+        "\n".join(ballot_id_to_ballot_type.keys()),
+        [BALLOT_TYPES_DIR],
+        num_retries=num_retries,
+    )
+    manifest.write_file(
+        BALLOT_TYPE_CODES,
+        np.array(
+            [codes[str(bt)] for bt in ballot_id_to_ballot_type.values()],
+            dtype=code_dtype,
+        ).tobytes(),
+        [BALLOT_TYPES_DIR],
+        num_retries=num_retries,
+    )
+
+    index = BallotTypesIndex(len(ballot_id_to_ballot_type), names, code_dtype.str)
+    manifest.write_json_file(
+        BALLOT_TYPES_INDEX, index, [BALLOT_TYPES_DIR], num_retries=num_retries
+    )
+    return index
+
+
+def has_ballot_types(manifest: Manifest) -> bool:
+    """
+    Returns whether this tally has its ballot types published in `BALLOT_TYPES_DIR`. Older
+    tallies have them in `election_metadata.json` instead.
+    """
+    return (
+        compose_manifest_name(BALLOT_TYPES_INDEX, [BALLOT_TYPES_DIR]) in manifest.hashes
+    )
+
+
+def _load_index(manifest: Manifest) -> Optional[Tuple[BallotTypesIndex, np.dtype]]:
+    """
+    Internal helper: loads the `BallotTypesIndex` and the dtype of the ballot type codes, and
+    checks that the files it describes are in the manifest, with the right lengths, without
+    reading them. Returns `None` and logs an error on failure.
+    """
+    index: Optional[BallotTypesIndex] = manifest.read_json_file(
+        BALLOT_TYPES_INDEX, BallotTypesIndex, [BALLOT_TYPES_DIR]
+    )
+    if index is None:
+        return None
+
+    try:
+        code_dtype = np.dtype(index.code_dtype)
+    except TypeError:
+        log_error(f"Ballot type codes have unknown type {index.code_dtype}")
+        return None
+    if code_dtype.kind != "u":
+        log_error("Malformed ballot type codes")
+        return None
+
+    ids_info = manifest.get_file_info(
+        compose_manifest_name(BALLOT_IDS, [BALLOT_TYPES_DIR])
+    )
+    codes_info = manifest.get_file_info(
+        compose_manifest_name(BALLOT_TYPE_CODES, [BALLOT_TYPES_DIR])
+    )
+    if ids_info is None or codes_info is None:
+        log_error("Ballot type files are missing from the manifest")
+        return None
+    if codes_info.num_bytes != index.num_ballots * code_dtype.itemsize:
+        log_error(
+            f"Expected {index.num_ballots} ballot type codes, found {codes_info.num_bytes} bytes"
+        )
+        return None
+
+    return index, code_dtype
+
+
+def check_ballot_types_index(manifest: Manifest, num_ballots: int) -> bool:
+    """
+    Checks that the published ballot types are for exactly `num_ballots` ballots, and that
+    their files are in the manifest with the right lengths, without reading anything but
+    the (small) `BallotTypesIndex`. Returns True if everything is good. Errors are logged.
+    """
+    index_and_dtype = _load_index(manifest)
+    if index_and_dtype is None:
+        return False
+
+    index, _ = index_and_dtype
+    if index.num_ballots != num_ballots:
+        log_error(
+            f"Expected ballot types for {num_ballots} ballots, found {index.num_ballots}"
+        )
+        return False
+    return True
+
+
+def load_ballot_types(
+    manifest: Manifest,
+) -> Optional[Tuple[List[str], List[str], np.ndarray]]:
+    """
+    Loads the ballot types of every ballot: the ballot ids, the ballot type names, and
+    the number of every ballot's type. Every file is checked against the manifest.
+    Returns `None` and logs an error on failure.
+    """
+    index_and_dtype = _load_index(manifest)
+    if index_and_dtype is None:
+        return None
+    index, code_dtype = index_and_dtype
+
+    ballot_ids_text = manifest.read_file(BALLOT_IDS, [BALLOT_TYPES_DIR])
+    codes_bytes = manifest.read_file_bytes(BALLOT_TYPE_CODES, [BALLOT_TYPES_DIR])
+    if ballot_ids_text is None or codes_bytes is None:
+        return None
+    if len(codes_bytes) % code_dtype.itemsize != 0:
+        log_error("Malformed ballot type codes")
+        return None
+
+    ballot_ids = ballot_ids_text.split("\n") if index.num_ballots > 0 else []
+    codes = np.frombuffer(codes_bytes, dtype=code_dtype)
+    if len(ballot_ids) != index.num_ballots or len(codes) != index.num_ballots:
+        log_error(
+            f"Expected {index.num_ballots} ballot types, found {len(ballot_ids)} ballot ids and {len(codes)} codes"
+        )
+        return None
+    if len(codes) > 0 and int(codes.max()) >= len(index.ballot_type_names):
+        log_error("Ballot type codes refer to unknown ballot types")
+        return None
+
+    return ballot_ids, index.ballot_type_names, codes
@@ -0,0 +1,531 @@
+# A columnar store for the ciphertexts in every ballot, so tallies can be recomputed without
+# parsing any JSON. This is strictly an *additional* artifact: ballot proofs can only be checked
+# against the row-oriented ballot files, so the columns are useful for things like recomputing
+# the tally, the subtotals, contest-scoped tallies, or the tallies of arbitrary subsets of ballots.
+#
+# The columns are split into segments, each covering a run of ballots with the same ballot-id
+# prefix, so they can be written as the ballots are encrypted, without ever having every column
+# in memory. Each segment is a single container file, in `columns/<prefix>/`, holding one record
+# per selection for its ballots, and each record can be read on its own with a range read.
+
+from mmap import mmap
+from secrets import SystemRandom
+from typing import (
+    AbstractSet,
+    Dict,
+    Final,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+from dataclasses import dataclass
+from electionguard.ballot import CiphertextAcceptedBallot
+from electionguard.elgamal import ElGamalCiphertext
+from electionguard.group import P, int_to_p_unchecked
+from electionguard.logs import log_error
+from electionguard.serializable import Serializable
+
+from arlo_e2e.manifest import COLUMNS_DIR, Manifest, compose_manifest_name
+from arlo_e2e.tally import (
+    TALLY_TYPE,
+    FastTallyEverythingResults,
+    mismatched_subtotals,
+    restrict_tally,
+    sequential_tally,
+    tallies_match,
+)
+from arlo_e2e.utils import BALLOT_FILENAME_PREFIX_DIGITS, group_ballot_ids_by_prefix
+
+COLUMNS_INDEX: Final[str] = "columns.json"
+"""
+Name of the file, in `COLUMNS_DIR`, holding the `ColumnarIndex`.
+"""
+
+ELEMENT_BYTES: Final[int] = (P.bit_length() + 7) // 8
+"""
+Every ElGamal pad and data value is stored as a big-endian integer of exactly this many bytes.
+"""
+
+BALLOT_INDEX_BYTES: Final[int] = 4
+"""
+Every entry in a ballot-index column is a big-endian unsigned integer of this many bytes.
+"""
+
+COLUMN_SEGMENT_SUFFIX: Final[str] = ".columns"
+"""
+Suffix for the container file holding a segment of the columns (see `write_column_segments`).
+"""
+
+COLUMN_SEGMENT_BALLOTS: Final[int] = 1000
+"""
+When writing the columns from a stream of ballots (see `write_ciphertext_columns`), a segment
+is written out as soon as it has this many ballots, or the ballot-id prefix changes, so only one
+segment's worth of columns is ever in memory.
+"""
+
+NUM_SAMPLED_BALLOTS: Final[int] = 100
+"""
+Default number of ballots, chosen at random, that `verify_tally_from_columns` checks against
+the columns.
+"""
+
+
+@dataclass(eq=True)
+class ColumnarIndex(Serializable):
+    """
+    Describes the columnar ciphertext store. For every segment and every selection in it, there
+    are two records in the segment's container: `<segment>.<selection>.bin`, which has one
+    fixed-width record per ballot containing that selection, with the pad (alpha) followed by
+    the data (beta), and `<segment>.<selection>.idx`, which has the corresponding index into
+    `ballot_ids` for each record.
+    """
+
+    element_bytes: int
+    """
+    Width, in bytes, of every pad and data value.
+    """
+
+    ballot_ids: List[str]
+    """
+    Every ballot id, in the order that the ballot-index columns refer to.
+    """
+
+    selection_ids: List[str]
+    """
+    Every selection object_id with a column.
+    """
+
+    segments: Optional[List[str]] = None
+    """
+    The name of every segment, which is the id of its first ballot, so its ballot-id prefix
+    is also the subdirectory it's in. Older tallies don't have segments: they have one
+    `<selection>.bin` and one `<selection>.idx` file per selection, directly in `COLUMNS_DIR`.
+    """
+
+
+def _segment_columns(
+    ballots: Iterable[CiphertextAcceptedBallot], ballot_indices: Iterable[int]
+) -> Dict[str, Tuple[bytearray, bytearray]]:
+    """
+    Internal helper: builds the ciphertext and ballot-index columns for the given ballots,
+    at the given indices into `ColumnarIndex.ballot_ids`. Placeholder selections aren't included.
+    """
+    columns: Dict[str, Tuple[bytearray, bytearray]] = {}
+    for ballot, ballot_index in zip(ballots, ballot_indices):
+        index_bytes = ballot_index.to_bytes(BALLOT_INDEX_BYTES, "big")
+        for contest in ballot.contests:
+            for selection in contest.ballot_selections:
+                if selection.is_placeholder_selection:
+                    continue
+                ciphertexts, indices = columns.setdefault(
+                    selection.object_id, (bytearray(), bytearray())
+                )
+                ciphertexts += selection.ciphertext.pad.to_int().to_bytes(
+                    ELEMENT_BYTES, "big"
+                )
+                ciphertexts += selection.ciphertext.data.to_int().to_bytes(
+                    ELEMENT_BYTES, "big"
+                )
+                indices += index_bytes
+    return columns
+
+
+def write_column_segments(
+    manifest: Manifest,
+    ballots: Sequence[CiphertextAcceptedBallot],
+    ballot_indices: Sequence[int],
+    num_retries: int = 1,
+) -> List[str]:
+    """
+    Writes one segment of the columnar ciphertext store for each ballot-id prefix among the given
+    ballots, at the given indices into `ColumnarIndex.ballot_ids`, updating the manifest. This is
+    meant to be called wherever the ballots are written, while they're still in memory, so the
+    columns never have to be built from the ballot files. Returns the names of the segments.
+    The `ColumnarIndex` is written separately, with `write_columnar_index`.
+    """
+    positions = {b.object_id: i for i, b in enumerate(ballots)}
+    groups = group_ballot_ids_by_prefix(positions.keys())
+    segments: List[str] = []
+    for prefix in groups.keys():
+        segment = groups[prefix][0]
+        columns = _segment_columns(
+            [ballots[positions[bid]] for bid in groups[prefix]],
+            [ballot_indices[positions[bid]] for bid in groups[prefix]],
+        )
+        manifest.write_packed_files(
+            segment + COLUMN_SEGMENT_SUFFIX,
+            [
+                (f"{segment}.{sid}{suffix}", bytes(column))
+                for sid in sorted(columns.keys())
+                for suffix, column in zip((".bin", ".idx"), columns[sid])
+            ],
+            [COLUMNS_DIR, prefix],
+            num_retries=num_retries,
+        )
+        segments.append(segment)
+    return segments
+
+
+def column_segments_in_manifest(manifest: Manifest) -> List[str]:
+    """
+    Returns the names of every column segment in the manifest, sorted. All of the manifest
+    shards are loaded to find them.
+    """
+    if not manifest.load_all_shards():
+        return []
+
+    segments: List[str] = []
+    for name in manifest.hashes.keys():
+        elems = name.split("|")
+        if (
+            len(elems) == 3
+            and elems[0] == COLUMNS_DIR
+            and elems[2].endswith(COLUMN_SEGMENT_SUFFIX)
+        ):
+            segments.append(elems[2][0 : -len(COLUMN_SEGMENT_SUFFIX)])
+    return sorted(segments)
+
+
+def write_columnar_index(
+    manifest: Manifest,
+    ballot_ids: List[str],
+    selection_ids: List[str],
+    segments: List[str],
+    num_retries: int = 1,
+) -> ColumnarIndex:
+    """
+    Writes out the `ColumnarIndex` for segments that were already written (see
+    `write_column_segments`), updating the manifest.
+    """
+    index = ColumnarIndex(ELEMENT_BYTES, ballot_ids, sorted(selection_ids), segments)
+    manifest.write_json_file(
+        COLUMNS_INDEX, index, [COLUMNS_DIR], num_retries=num_retries
+    )
+    return index
+
+
+def write_ciphertext_columns(
+    manifest: Manifest,
+    ballots: Iterable[CiphertextAcceptedBallot],
+    num_retries: int = 1,
+) -> ColumnarIndex:
+    """
+    Writes out the columnar ciphertext store for the given ballots, updating the manifest.
+    Placeholder selections aren't included. The ballots are consumed as a stream, and each
+    segment is written out as soon as it's complete (see `COLUMN_SEGMENT_BALLOTS`), so only
+    one segment's worth of ballots and columns is ever in memory.
+    """
+    ballot_ids: List[str] = []
+    selection_ids: Set[str] = set()
+    segments: List[str] = []
+    pending: List[CiphertextAcceptedBallot] = []
+
+    def write_pending() -> None:
+        for ballot in pending:
+            for contest in ballot.contests:
+                selection_ids.update(
+                    s.object_id
+                    for s in contest.ballot_selections
+                    if not s.is_placeholder_selection
+                )
+        segments.extend(
+            write_column_segments(
+                manifest,
+                pending,
+                range(len(ballot_ids) - len(pending), len(ballot_ids)),
+                num_retries,
+            )
+        )
+        pending.clear()
+
+    for ballot in ballots:
+        if pending and (
+            len(pending) >= COLUMN_SEGMENT_BALLOTS
+            or ballot.object_id[0:BALLOT_FILENAME_PREFIX_DIGITS]
+            != pending[0].object_id[0:BALLOT_FILENAME_PREFIX_DIGITS]
+        ):
+            write_pending()
+        ballot_ids.append(ballot.object_id)
+        pending.append(ballot)
+    if pending:
+        write_pending()
+
+    return write_columnar_index(
+        manifest, ballot_ids, sorted(selection_ids), sorted(segments), num_retries
+    )
+
+
+def load_columnar_index(manifest: Manifest) -> Optional[ColumnarIndex]:
+    """
+    Loads the `ColumnarIndex`, if there is one, otherwise returns `None`.
+    """
+    if compose_manifest_name(COLUMNS_INDEX, [COLUMNS_DIR]) not in manifest.hashes:
+        log_error("No columnar ciphertext store in this tally")
+        return None
+
+    index: Optional[ColumnarIndex] = manifest.read_json_file(
+        COLUMNS_INDEX, ColumnarIndex, [COLUMNS_DIR]
+    )
+    if index is not None and index.element_bytes != ELEMENT_BYTES:
+        log_error(
+            f"Columnar store has {index.element_bytes}-byte elements, expected {ELEMENT_BYTES}"
+        )
+        return None
+    return index
+
+
+def _column_bytes(
+    manifest: Manifest, index: ColumnarIndex, selection_id: str
+) -> Optional[List[Tuple[Union[bytes, mmap], Union[bytes, mmap]]]]:
+    """
+    Internal helper: reads the ciphertext column and the ballot-index column for a selection,
+    from every segment that has it, checked against the manifest. The bytes that are checked
+    are the bytes that are returned, and big local files are memory-mapped (see
+    `Manifest.read_file_bytes`). Returns `None` and logs an error on failure.
+    """
+    if index.segments is None:
+        names = [(selection_id + ".bin", selection_id + ".idx", [COLUMNS_DIR])]
+    else:
+        names = []
+        for segment in index.segments:
+            subdirectories = [COLUMNS_DIR, segment[0:BALLOT_FILENAME_PREFIX_DIGITS]]
+            bin_name = f"{segment}.{selection_id}.bin"
+            idx_name = f"{segment}.{selection_id}.idx"
+            has_bin = (
+                manifest.get_file_info(compose_manifest_name(bin_name, subdirectories))
+                is not None
+            )
+            has_idx = (
+                manifest.get_file_info(compose_manifest_name(idx_name, subdirectories))
+                is not None
+            )
+            if has_bin != has_idx:
+                log_error(
+                    f"Segment {segment} has only half of the columns for selection {selection_id}"
+                )
+                return None
+            if has_bin:
+                # not every segment has every selection, since ballot styles differ
+                names.append((bin_name, idx_name, subdirectories))
+
+    result: List[Tuple[Union[bytes, mmap], Union[bytes, mmap]]] = []
+    for bin_name, idx_name, subdirectories in names:
+        ciphertexts = manifest.read_file_bytes(bin_name, subdirectories)
+        indices = manifest.read_file_bytes(idx_name, subdirectories)
+        if ciphertexts is None or indices is None:
+            return None
+
+        if len(ciphertexts) != (len(indices) // BALLOT_INDEX_BYTES) * 2 * ELEMENT_BYTES:
+            log_error(f"Column lengths don't match for selection {selection_id}")
+            return None
+        result.append((ciphertexts, indices))
+    return result
+
+
+def _column_entries(
+    ciphertexts: Union[bytes, mmap], indices: Union[bytes, mmap]
+) -> Iterator[Tuple[int, int, int]]:
+    """
+    Internal helper: yields the ballot index, pad, and data for every record in a column.
+    """
+    record_bytes = 2 * ELEMENT_BYTES
+    for i in range(len(indices) // BALLOT_INDEX_BYTES):
+        ballot_index = int.from_bytes(
+            indices[i * BALLOT_INDEX_BYTES : (i + 1) * BALLOT_INDEX_BYTES], "big"
+        )
+        offset = i * record_bytes
+        pad = int.from_bytes(ciphertexts[offset : offset + ELEMENT_BYTES], "big")
+        data = int.from_bytes(
+            ciphertexts[offset + ELEMENT_BYTES : offset + record_bytes], "big"
+        )
+        yield ballot_index, pad, data
+
+
+def prefix_tallies_from_columns(
+    manifest: Manifest,
+    selection_ids: Optional[AbstractSet[str]] = None,
+    ballot_ids: Optional[AbstractSet[str]] = None,
+) -> Optional[Dict[str, TALLY_TYPE]]:
+    """
+    Recomputes the partial tallies for every ballot-id prefix (see `group_ballot_ids_by_prefix`)
+    from the columnar ciphertext store, without decoding any JSON. If `selection_ids` is specified,
+    only those columns are read. If `ballot_ids` is specified, only those ballots are included.
+    Every column is checked against the manifest before it's used. Returns `None` if anything
+    fails to load.
+    """
+    index = load_columnar_index(manifest)
+    if index is None:
+        return None
+
+    included = (
+        None if ballot_ids is None else [bid in ballot_ids for bid in index.ballot_ids]
+    )
+
+    # Dict[prefix, Dict[selection, [pad, data]]], as plain integers, which are much faster
+    # to multiply than ElementModP objects.
+    products: Dict[str, Dict[str, List[int]]] = {}
+
+    for sid in index.selection_ids:
+        if selection_ids is not None and sid not in selection_ids:
+            continue
+
+        columns = _column_bytes(manifest, index, sid)
+        if columns is None:
+            return None
+
+        for ballot_index, pad, data in (
+            entry for column in columns for entry in _column_entries(*column)
+        ):
+            if ballot_index >= len(index.ballot_ids):
+                log_error(f"Bad ballot index {ballot_index} for selection {sid}")
+                return None
+            if included is not None and not included[ballot_index]:
+                continue
+
+            prefix = index.ballot_ids[ballot_index][0:BALLOT_FILENAME_PREFIX_DIGITS]
+            selection_products = products.setdefault(prefix, {})
+            if sid in selection_products:
+                product = selection_products[sid]
+                product[0] = (product[0] * pad) % P
+                product[1] = (product[1] * data) % P
+            else:
+                selection_products[sid] = [pad, data]
+
+    return {
+        prefix: {
+            sid: ElGamalCiphertext(int_to_p_unchecked(pad), int_to_p_unchecked(data))
+            for sid, (pad, data) in products[prefix].items()
+        }
+        for prefix in sorted(products.keys())
+    }
+
+
+def columns_match_ballots(
+    manifest: Manifest,
+    ballot_ids: Iterable[str],
+    selection_ids: Optional[AbstractSet[str]] = None,
+) -> bool:
+    """
+    Loads each of the given ballots, from its own file, and checks that the columnar
+    ciphertext store has exactly the same ciphertexts for it: one entry for each of its
+    non-placeholder selections, and no others. If `selection_ids` is specified, only those
+    selections are checked. This doesn't check any of the ballot proofs. Returns True if
+    everything matches. Errors are logged.
+    """
+    index = load_columnar_index(manifest)
+    if index is None:
+        return False
+
+    positions = {bid: i for i, bid in enumerate(index.ballot_ids)}
+    wanted: List[str] = []
+    for bid in ballot_ids:
+        if bid not in positions:
+            log_error(f"Ballot {bid} is missing from the columnar store")
+            return False
+        wanted.append(bid)
+    wanted_indices = {positions[bid] for bid in wanted}
+
+    # Dict[ballot index, Dict[selection, (pad, data)]], for only the ballots we're checking
+    columns: Dict[int, Dict[str, Tuple[int, int]]] = {i: {} for i in wanted_indices}
+    for sid in index.selection_ids:
+        if selection_ids is not None and sid not in selection_ids:
+            continue
+
+        column = _column_bytes(manifest, index, sid)
+        if column is None:
+            return False
+
+        for ballot_index, pad, data in (
+            entry for segment in column for entry in _column_entries(*segment)
+        ):
+            if ballot_index not in columns:
+                continue
+            if sid in columns[ballot_index]:
+                log_error(
+                    f"Selection {sid} appears twice for ballot {index.ballot_ids[ballot_index]}"
+                )
+                return False
+            columns[ballot_index][sid] = (pad, data)
+
+    for bid in wanted:
+        ballot = manifest.load_ciphertext_ballot(bid)
+        if ballot is None:
+            return False
+
+        expected = {
+            selection.object_id: (
+                selection.ciphertext.pad.to_int(),
+                selection.ciphertext.data.to_int(),
+            )
+            for contest in ballot.contests
+            for selection in contest.ballot_selections
+            if not selection.is_placeholder_selection
+            and (selection_ids is None or selection.object_id in selection_ids)
+        }
+        if expected != columns[positions[bid]]:
+            log_error(f"Columnar store doesn't match ballot {bid}")
+            return False
+
+    return True
+
+
+def verify_tally_from_columns(
+    results: FastTallyEverythingResults,
+    selection_ids: Optional[AbstractSet[str]] = None,
+    num_sampled_ballots: Optional[int] = NUM_SAMPLED_BALLOTS,
+) -> bool:
+    """
+    Recomputes the tally, and the subtotals if they're published, from the columnar ciphertext
+    store, and checks them against the published ones. This is much faster than
+    `FastTallyEverythingResults.all_proofs_valid` with `recheck_ballots_and_tallies`,
+    but it doesn't check any of the ballot proofs.
+
+    The columns are only a copy of the ballots, so `num_sampled_ballots` ballots, chosen at
+    random, are also checked against the columns (see `columns_match_ballots`). If it's `None`,
+    every ballot is checked, which takes about as long as recomputing the tally from the ballots.
+    If `selection_ids` is specified, only those selections are checked. Returns True if
+    everything matches. Errors are logged.
+    """
+    if results.manifest is None:
+        log_error("Cannot use the columnar store without a manifest")
+        return False
+
+    index = load_columnar_index(results.manifest)
+    if index is None:
+        return False
+    if sorted(index.ballot_ids) != sorted(
+        results.metadata.ballot_id_to_ballot_type.keys()
+    ):
+        log_error("Ballot ids in the columnar store don't match the metadata")
+        return False
+
+    sampled_ballot_ids = (
+        index.ballot_ids
+        if num_sampled_ballots is None or num_sampled_ballots >= len(index.ballot_ids)
+        else SystemRandom().sample(index.ballot_ids, num_sampled_ballots)
+    )
+    if not columns_match_ballots(results.manifest, sampled_ballot_ids, selection_ids):
+        return False
+
+    prefix_tallies = prefix_tallies_from_columns(results.manifest, selection_ids)
+    if prefix_tallies is None:
+        return False
+
+    if results.subtotals is not None and mismatched_subtotals(
+        results.subtotals, prefix_tallies, selection_ids
+    ):
+        return False
+
+    recomputed_tally = sequential_tally(
+        [prefix_tallies[p] for p in sorted(prefix_tallies.keys())]
+    )
+    provided_tally = results.tally.to_tally_map()
+    if selection_ids is not None:
+        provided_tally = restrict_tally(provided_tally, selection_ids)
+    return tallies_match(provided_tally, recomputed_tally)
@@ -0,0 +1,87 @@
+import gzip
+import zlib
+from typing import Final, Optional, Set, Tuple, Type
+
+from electionguard.logs import log_error
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+CODEC_GZIP: Final[str] = "gzip"
+"""
+Standard gzip compression, from the Python standard library.
+"""
+
+CODEC_ZSTD: Final[str] = "zstd"
+"""
+Zstandard compression; faster than gzip at a similar ratio, but requires the optional
+`zstandard` package.
+"""
+
+GZIP_COMPRESS_LEVEL: Final[int] = 6
+"""
+Level 9 (the default for `gzip.compress`) is much slower, and saves very little on
+our ballots, which are mostly long decimal numbers.
+"""
+
+ZSTD_COMPRESS_LEVEL: Final[int] = 3
+
+DECOMPRESSION_ERRORS: Final[Tuple[Type[Exception], ...]] = (
+    OSError,
+    EOFError,
+    zlib.error,
+) + ((zstandard.ZstdError,) if zstandard is not None else ())
+"""
+What the decompressors raise on corrupt or truncated data: gzip raises `OSError` for a
+bad header, `EOFError` if it's truncated, and `zlib.error` if the compressed data is bad.
+"""
+
+
+def supported_codecs() -> Set[str]:
+    """
+    Returns the names of every codec that's usable with the installed libraries.
+    """
+    return {CODEC_GZIP} if zstandard is None else {CODEC_GZIP, CODEC_ZSTD}
+
+
+def compress_bytes(data: bytes, codec: Optional[str]) -> Optional[bytes]:
+    """
+    Compresses the data with the given codec (`None` means no compression). The output is
+    deterministic, so the same input always yields the same bytes, and thus the same hash.
+    Returns `None` and logs an error if the codec isn't supported.
+    """
+    if codec is None:
+        return data
+    elif codec == CODEC_GZIP:
+        return gzip.compress(data, compresslevel=GZIP_COMPRESS_LEVEL, mtime=0)
+    elif codec == CODEC_ZSTD and zstandard is not None:
+        # with a checksum, as gzip has, so corrupt data is an error rather than garbage
+        return zstandard.ZstdCompressor(
+            level=ZSTD_COMPRESS_LEVEL, write_checksum=True
+        ).compress(data)
+    else:
+        log_error(f"Unsupported compression codec: {codec}")
+        return None
+
+
+def decompress_bytes(data: bytes, codec: Optional[str]) -> Optional[bytes]:
+    """
+    Decompresses the data with the given codec (`None` means no compression). Returns
+    `None` and logs an error if the codec isn't supported or the data is corrupt.
+    """
+    if codec is None:
+        return data
+
+    try:
+        if codec == CODEC_GZIP:
+            return gzip.decompress(data)
+        elif codec == CODEC_ZSTD and zstandard is not None:
+            return zstandard.ZstdDecompressor().decompress(data)
+    except DECOMPRESSION_ERRORS as e:
+        log_error(f"Failed to decompress {codec} data: {e}")
+        return None
+
+    log_error(f"Unsupported compression codec: {codec}")
+    return None
@@ -0,0 +1,285 @@
+# A columnar copy of the CVR metadata (everything we know about every ballot, except the voters'
+# selections), written alongside `cvr_metadata.csv`, so loading a tally doesn't require parsing
+# any CSV. Each column is its own file, covered by the manifest: numeric columns are flat arrays
+# of fixed-width little-endian values, which NumPy uses in place, and string columns are the UTF-8
+# text of every value, one after another, with a separate column of offsets. Only the columns
+# that are asked for are read. The CSV is still written, and remains the source of truth for
+# older tallies that don't have the columns.
+
+from math import isnan
+from typing import Dict, Final, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from electionguard.logs import log_error, log_warning
+from electionguard.serializable import Serializable
+
+from arlo_e2e.manifest import Manifest, compose_manifest_name
+
+CVR_COLUMNS_DIR: Final[str] = "cvr_columns"
+"""
+Subdirectory of a tally directory holding the columnar CVR metadata.
+"""
+
+CVR_COLUMNS_INDEX: Final[str] = "cvr_columns.json"
+"""
+Name of the file, in `CVR_COLUMNS_DIR`, holding the `CvrColumnsIndex`.
+"""
+
+STRING_COLUMN: Final[str] = "str"
+"""
+Column type for strings. Every other column type is a NumPy dtype string, like `<i8`.
+"""
+
+OFFSET_DTYPE: Final[str] = "<i8"
+"""
+NumPy dtype of the offsets into a string column.
+"""
+
+NULL_DTYPE: Final[str] = "|b1"
+"""
+NumPy dtype of the missing-value flags for a string column.
+"""
+
+
+@dataclass(eq=True)
+class CvrColumnsIndex(Serializable):
+    """
+    Describes the columnar CVR metadata. For the column at position `i`, there's a file
+    in `CVR_COLUMNS_DIR` named `<i>.bin`, with one value for every row. For string columns,
+    that's the UTF-8 text of every value, concatenated, and there's also `<i>.idx`, with the
+    `num_rows + 1` offsets where the values start and end, and, if any values are missing,
+    `<i>.nul`, with one flag per row.
+    """
+
+    num_rows: int
+    """
+    Number of rows (ballots) in every column.
+    """
+
+    column_names: List[str]
+    """
+    Names of the columns, in order.
+    """
+
+    column_types: List[str]
+    """
+    Types of the columns, in the same order: NumPy dtype strings, or `STRING_COLUMN`.
+    """
+
+    null_columns: List[str]
+    """
+    Names of the string columns with missing values.
+    """
+
+
+def cvr_column_file_names(position: int) -> Tuple[str, str, str]:
+    """
+    Helper function: given the position of a column, returns the file names, within
+    `CVR_COLUMNS_DIR`, of its values, its offsets, and its missing-value flags.
+    """
+    return f"{position:04d}.bin", f"{position:04d}.idx", f"{position:04d}.nul"
+
+
+def write_cvr_columns(
+    manifest: Manifest, cvr_metadata: pd.DataFrame, num_retries: int = 1
+) -> Optional[CvrColumnsIndex]:
+    """
+    Writes out the columnar CVR metadata, updating the manifest. The columns need to be
+    integers, floats, booleans, or strings, with missing strings as NaN, which is what
+    `pd.read_csv` makes of `cvr_metadata.csv`. If any column is anything else, nothing is
+    written, a warning is logged, and `None` is returned, so loaders use the CSV instead.
+    """
+    encoded: List[Tuple[str, bytes, Optional[bytes], Optional[bytes]]] = []
+    for name in cvr_metadata.columns:
+        column = _encode_column(cvr_metadata[name])
+        if column is None:
+            log_warning(
+                f"CVR metadata column {name} can't be stored as a column; using the CSV only"
+            )
+            return None
+        encoded.append(column)
+
+    null_columns: List[str] = []
+    for position, (name, (column_type, values, offsets, nulls)) in enumerate(
+        zip(cvr_metadata.columns, encoded)
+    ):
+        values_name, offsets_name, nulls_name = cvr_column_file_names(position)
+        manifest.write_file(
+            values_name, values, [CVR_COLUMNS_DIR], num_retries=num_retries
+        )
+        if offsets is not None:
+            manifest.write_file(
+                offsets_name, offsets, [CVR_COLUMNS_DIR], num_retries=num_retries
+            )
+        if nulls is not None:
+            manifest.write_file(
+                nulls_name, nulls, [CVR_COLUMNS_DIR], num_retries=num_retries
+            )
+            null_columns.append(name)
+
+    index = CvrColumnsIndex(
+        len(cvr_metadata),
+        [str(name) for name in cvr_metadata.columns],
+        [column_type for column_type, _, _, _ in encoded],
+        null_columns,
+    )
+    manifest.write_json_file(
+        CVR_COLUMNS_INDEX, index, [CVR_COLUMNS_DIR], num_retries=num_retries
+    )
+    return index
+
+
+def _encode_column(
+    column: pd.Series,
+) -> Optional[Tuple[str, bytes, Optional[bytes], Optional[bytes]]]:
+    """
+    Internal helper: returns the type of a column, its values, and, for strings, its offsets
+    and its missing-value flags (if any are missing). Returns `None` if the column can't be
+    stored.
+    """
+    values = column.to_numpy()
+    if values.dtype.kind in "biuf":
+        little_endian = values.dtype.newbyteorder("<")
+        return little_endian.str, values.astype(little_endian).tobytes(), None, None
+
+    if values.dtype.kind != "O":
+        return None
+
+    text = bytearray()
+    offsets = [0]
+    nulls = []
+    for value in values:
+        if isinstance(value, str):
+            text += value.encode("utf-8")
+            nulls.append(False)
+        elif isinstance(value, float) and isnan(value):
+            nulls.append(True)
+        else:
+            return None
+        offsets.append(len(text))
+
+    return (
+        STRING_COLUMN,
+        bytes(text),
+        np.array(offsets, dtype=OFFSET_DTYPE).tobytes(),
+        np.array(nulls, dtype=NULL_DTYPE).tobytes() if any(nulls) else None,
+    )
+
+
+def has_cvr_columns(manifest: Manifest) -> bool:
+    """
+    Returns whether this tally has the columnar CVR metadata. Older tallies don't.
+    """
+    return (
+        compose_manifest_name(CVR_COLUMNS_INDEX, [CVR_COLUMNS_DIR]) in manifest.hashes
+    )
+
+
+def load_cvr_columns(
+    manifest: Manifest, columns: Optional[Sequence[str]] = None
+) -> Optional[pd.DataFrame]:
+    """
+    Loads the columnar CVR metadata as a Pandas DataFrame, the same as `pd.read_csv` would
+    make of `cvr_metadata.csv`, but without parsing anything. If `columns` are given, only
+    those columns are read, in that order. Every file is checked against the manifest.
+    Returns `None` and logs an error on failure, including if a column doesn't exist.
+    """
+    index: Optional[CvrColumnsIndex] = manifest.read_json_file(
+        CVR_COLUMNS_INDEX, CvrColumnsIndex, [CVR_COLUMNS_DIR]
+    )
+    if index is None:
+        return None
+    if len(index.column_names) != len(index.column_types):
+        log_error("Malformed CVR columns index: names and types don't match up")
+        return None
+
+    positions = {name: i for i, name in enumerate(index.column_names)}
+    wanted = list(index.column_names) if columns is None else list(columns)
+    data: Dict[str, np.ndarray] = {}
+    for name in wanted:
+        if name not in positions:
+            log_error(f"No CVR metadata column named {name}")
+            return None
+        values = _load_column(
+            manifest,
+            positions[name],
+            index.column_types[positions[name]],
+            index.num_rows,
+            name in index.null_columns,
+        )
+        if values is None:
+            return None
+        data[name] = values
+
+    return pd.DataFrame(data, columns=wanted)
+
+
+def _load_column(
+    manifest: Manifest, position: int, column_type: str, num_rows: int, has_nulls: bool
+) -> Optional[np.ndarray]:
+    """
+    Internal helper: loads one column. Returns `None` and logs an error on failure.
+    """
+    values_name, offsets_name, nulls_name = cvr_column_file_names(position)
+    values = manifest.read_file_bytes(values_name, [CVR_COLUMNS_DIR])
+    if values is None:
+        return None
+
+    if column_type != STRING_COLUMN:
+        try:
+            dtype = np.dtype(column_type)
+        except TypeError:
+            log_error(f"CVR metadata column {position} has unknown type {column_type}")
+            return None
+        if dtype.kind not in "biuf" or len(values) != num_rows * dtype.itemsize:
+            log_error(f"CVR metadata column {position} is malformed")
+            return None
+        numbers = np.frombuffer(values, dtype=dtype)
+        return numbers if dtype.isnative else numbers.astype(dtype.newbyteorder("="))
+
+    offsets_bytes = manifest.read_file_bytes(offsets_name, [CVR_COLUMNS_DIR])
+    if offsets_bytes is None:
+        return None
+    offsets = np.frombuffer(offsets_bytes, dtype=OFFSET_DTYPE)
+    if (
+        len(offsets) != num_rows + 1
+        or offsets[0] != 0
+        or offsets[-1] != len(values)
+        or np.any(np.diff(offsets) < 0)
+    ):
+        log_error(f"CVR metadata column {position} has malformed offsets")
+        return None
+
+    text = bytes(values)
+    bounds = offsets.tolist()
+    try:
+        decoded = text.decode("utf-8")
+        if len(decoded) == len(text):
+            # pure ASCII, so byte offsets and character offsets are the same
+            strings: List[object] = [
+                decoded[bounds[i] : bounds[i + 1]] for i in range(num_rows)
+            ]
+        else:
+            strings = [
+                text[bounds[i] : bounds[i + 1]].decode("utf-8") for i in range(num_rows)
+            ]
+    except UnicodeDecodeError as e:
+        log_error(f"CVR metadata column {position} isn't valid UTF-8: {e}")
+        return None
+
+    if has_nulls:
+        nulls_bytes = manifest.read_file_bytes(nulls_name, [CVR_COLUMNS_DIR])
+        if nulls_bytes is None:
+            return None
+        nulls = np.frombuffer(nulls_bytes, dtype=NULL_DTYPE)
+        if len(nulls) != num_rows:
+            log_error(f"CVR metadata column {position} has malformed null flags")
+            return None
+        for i in np.flatnonzero(nulls).tolist():
+            strings[i] = np.nan
+
+    result = np.empty(num_rows, dtype=object)
+    result[:] = strings
+    return result
@@ -1,9 +1,23 @@
 # inspiration: https://github.com/byjokese/Generate-Index-Files/blob/master/generate-index.py
 
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
 from stat import S_ISDIR
+from typing import Dict, Final, List, Optional, Tuple
 
+from electionguard.logs import log_warning
+
+from arlo_e2e.manifest import INDEX_PAGES_STATE, Manifest
 from arlo_e2e.ray_write_retry import write_file_with_retries
+from arlo_e2e.storage import is_s3_path
+from arlo_e2e.utils import compose_filename, file_exists_helper, load_file_helper
+
+INDEX_WRITE_THREADS: Final[int] = 16
+"""
+Number of threads writing index.html files in parallel.
+"""
 
 index_start_text = """<!DOCTYPE html>
 <html>
@@ -27,16 +41,35 @@ index_end_text = """
 
 
 def generate_index_html_files(
-    title_text: str, directory_name: str, num_retries: int = 1
+    title_text: str,
+    directory_name: str,
+    num_retries: int = 1,
+    manifest: Optional[Manifest] = None,
 ) -> None:
     """
     Creates index.html files at every level of the directory. Note that this doesn't cause
     anything to be added to the manifest. That's not necessary, and could be messy.
+
+    If a `manifest` is given, for everything written to `directory_name`, the pages are built
+    from it, without walking the directory, and written in parallel. The hash of every page is
+    remembered in `INDEX_PAGES_STATE`, at the top of the directory, so when this runs again,
+    only the pages whose listings have changed are rewritten. This works in S3, too.
+
+    Otherwise, the directory is walked, and every page is rewritten. This only works on the
+    local filesystem; for anything in S3, it does nothing.
     """
+    if manifest is not None:
+        _generate_index_html_from_manifest(
+            title_text, directory_name, manifest, num_retries
+        )
+        return
+
+    if is_s3_path(directory_name):
+        log_warning(f"Not generating index.html files for {directory_name}, in S3")
+        return
+
     files = os.listdir(directory_name)
-    index_text = index_start_text.format(
-        title_text=title_text, path=directory_name if directory_name != "." else "/"
-    )
+    index_text = _index_start(title_text, directory_name)
 
     for file in sorted(files):
         full_path = os.path.join(directory_name, file)
@@ -48,13 +81,7 @@ def generate_index_html_files(
         stats = os.stat(full_path)
         is_dir = S_ISDIR(stats.st_mode)
         num_bytes = stats.st_size if not is_dir else 0
-        additional_text = (
-            f"<i>{num_bytes} bytes</i>" if not is_dir else "<b>directory</b>"
-        )
-
-        index_text += (
-            f"        <li><a href='{file}'>{file}</a> - {additional_text}</li>\n"
-        )
+        index_text += _index_entry(file, None if is_dir else num_bytes)
 
         if is_dir:
             generate_index_html_files(title_text, full_path, num_retries=num_retries)
@@ -63,3 +90,95 @@ def generate_index_html_files(
 
     file_path = os.path.join(directory_name, "index.html")
     write_file_with_retries(file_path, index_text, num_retries)
+
+
+def _index_start(title_text: str, directory_name: str) -> str:
+    return index_start_text.format(
+        title_text=title_text, path=directory_name if directory_name != "." else "/"
+    )
+
+
+def _index_entry(name: str, num_bytes: Optional[int]) -> str:
+    # num_bytes is None for directories
+    additional_text = (
+        f"<i>{num_bytes} bytes</i>" if num_bytes is not None else "<b>directory</b>"
+    )
+    return f"        <li><a href='{name}'>{name}</a> - {additional_text}</li>\n"
+
+
+def _directory_listings(
+    manifest: Manifest,
+) -> Dict[Tuple[str, ...], Dict[str, Optional[int]]]:
+    """
+    Internal helper: gets the contents of every directory with something written through the
+    manifest, mapping from the tuple of subdirectory names (empty for the top level) to the
+    names of its files, with their lengths, and subdirectories, with `None`.
+    """
+    if not manifest.load_all_shards():
+        raise RuntimeError("cannot index a manifest whose shards failed to load")
+
+    # records within containers aren't files of their own
+    files: Dict[str, int] = {
+        name: file_info.num_bytes
+        for name, file_info in manifest.hashes.items()
+        if file_info.container is None
+    }
+    files.update(manifest.unlisted_files)
+
+    listings: Dict[Tuple[str, ...], Dict[str, Optional[int]]] = {(): {}}
+    for name, num_bytes in files.items():
+        elems = name.split("|")
+        for i in range(len(elems) - 1):
+            parent = tuple(elems[0:i])
+            listings.setdefault(parent, {})[elems[i]] = None
+            listings.setdefault(tuple(elems[0 : i + 1]), {})
+        listings[tuple(elems[0:-1])][elems[-1]] = num_bytes
+
+    return listings
+
+
+def _generate_index_html_from_manifest(
+    title_text: str, directory_name: str, manifest: Manifest, num_retries: int
+) -> None:
+    """
+    Internal helper: the manifest-driven, incremental half of `generate_index_html_files`.
+    """
+    previous_hashes: Dict[str, str] = {}
+    if file_exists_helper(directory_name, INDEX_PAGES_STATE):
+        state = load_file_helper(directory_name, INDEX_PAGES_STATE)
+        try:
+            previous_hashes = json.loads(state) if state is not None else {}
+        except json.JSONDecodeError:
+            log_warning(f"Ignoring malformed {INDEX_PAGES_STATE} in {directory_name}")
+
+    page_hashes: Dict[str, str] = {}
+    changed_pages: List[Tuple[List[str], str]] = []
+    for subdirectories, listing in sorted(_directory_listings(manifest).items()):
+        index_text = "".join(
+            [_index_start(title_text, "/".join([directory_name, *subdirectories]))]
+            + [_index_entry(name, listing[name]) for name in sorted(listing.keys())]
+            + [index_end_text]
+        )
+
+        state_key = "|".join(subdirectories)
+        page_hashes[state_key] = sha256(index_text.encode("utf-8")).hexdigest()
+        if previous_hashes.get(state_key) != page_hashes[state_key]:
+            changed_pages.append((list(subdirectories), index_text))
+
+    def write_page(page: Tuple[List[str], str]) -> None:
+        subdirectories, index_text = page
+        write_file_with_retries(
+            compose_filename(directory_name, "index.html", subdirectories),
+            index_text,
+            num_retries,
+        )
+
+    with ThreadPoolExecutor(max_workers=INDEX_WRITE_THREADS) as executor:
+        list(executor.map(write_page, changed_pages))
+
+    if page_hashes != previous_hashes:
+        write_file_with_retries(
+            compose_filename(directory_name, INDEX_PAGES_STATE),
+            json.dumps(page_hashes, sort_keys=True),
+            num_retries,
+        )
@@ -0,0 +1,271 @@
+# Fast JSON encoding and decoding for the ballots we publish. ElectionGuard's `Serializable`
+# goes through the `jsons` library, which works out, by reflection, how to handle every value
+# of every object, every time. For the ballots, which are most of what we write and read, we
+# instead work out once per class which attributes get written, and how to convert each of
+# them back, and then use the standard `json` module's C encoder and decoder. The output is
+# exactly what `to_json` produces, byte for byte, so the hashes in the manifest don't change.
+
+import json
+from dataclasses import MISSING, fields, is_dataclass
+from datetime import datetime
+from enum import Enum
+from inspect import isfunction
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Final,
+    List,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    get_type_hints,
+)
+
+from electionguard.ballot import CiphertextAcceptedBallot
+from electionguard.decrypt_with_secrets import ProvenPlaintextBallot
+from electionguard.group import (
+    ElementModP,
+    ElementModQ,
+    int_to_p_unchecked,
+    int_to_q_unchecked,
+)
+from electionguard.serializable import Serializable
+from jsons import JsonSerializable
+
+try:
+    from electionguard.serializable import KEYS_TO_REMOVE
+except ImportError:  # pragma: no cover
+    KEYS_TO_REMOVE = []
+
+S = TypeVar("S", bound=Serializable)
+
+FAST_JSON_CLASSES: Final[Tuple[type, ...]] = (
+    CiphertextAcceptedBallot,
+    ProvenPlaintextBallot,
+)
+"""
+Classes that `encode_json` and `decode_json` handle themselves. Everything else goes through
+ElectionGuard's `to_json` and `from_json`. The classes inside these (contests, selections,
+proofs, ciphertexts, and so forth) are handled along the way.
+"""
+
+
+class _Unsupported(Exception):
+    """
+    Raised internally for anything the fast path doesn't know how to handle exactly the way
+    `jsons` would, so the caller can fall back to the slow path.
+    """
+
+
+_attributes: Dict[type, Tuple[str, ...]] = {}
+_converters: Dict[Any, Callable[[Any], Any]] = {}
+
+# dir(JsonSerializable) is surprisingly expensive, so we only do it once
+_excluded_attributes: Final[frozenset] = frozenset(dir(JsonSerializable)) | frozenset(
+    KEYS_TO_REMOVE
+)
+
+
+def encode_json(obj: Serializable) -> str:
+    """
+    Returns the same JSON text as `obj.to_json(strip_privates=True)`, but several times faster
+    for the classes in `FAST_JSON_CLASSES`. Anything else is handed to `to_json`.
+    """
+    if type(obj) in FAST_JSON_CLASSES:
+        try:
+            return json.dumps(_dump(obj))
+        except _Unsupported:
+            pass
+    return obj.to_json(strip_privates=True)
+
+
+def decode_json(json_str: Union[str, bytes], class_handle: Type[S]) -> S:
+    """
+    Returns the same object as `class_handle.from_json(json_str)`, but several times faster
+    for the classes in `FAST_JSON_CLASSES`. Anything else, as well as anything that doesn't
+    decode cleanly, is handed to `from_json`, so the errors it raises are the same as before.
+    The JSON can also be given as UTF-8 bytes, straight from a file, which the fast path
+    decodes without first making a string. Raises `UnicodeDecodeError` if the bytes aren't
+    valid UTF-8.
+    """
+    if class_handle in FAST_JSON_CLASSES:
+        try:
+            return _converter(class_handle)(json.loads(json_str))
+        except (_Unsupported, ValueError, TypeError, KeyError):
+            pass
+    if not isinstance(json_str, str):
+        json_str = json_str.decode("utf-8")
+    return class_handle.from_json(json_str)
+
+
+def _object_attributes(obj: Any) -> Tuple[str, ...]:
+    """
+    Internal helper: the names of the attributes that `jsons` writes for objects of this
+    class, in the order it writes them, with the same rules: everything in `dir`, which is
+    alphabetical, except private names, functions, and `jsons`'s own methods.
+    """
+    cls = type(obj)
+    names = _attributes.get(cls)
+    if names is None:
+        names = tuple(
+            name
+            for name in dir(obj)
+            if not name.startswith("_")
+            and name != "json"
+            and name not in _excluded_attributes
+            and not isfunction(getattr(cls, name, None))
+        )
+        _attributes[cls] = names
+    return names
+
+
+def _dump(value: Any) -> Any:
+    """
+    Internal helper: converts a value to plain lists, dicts, strings, and numbers, exactly as
+    ElectionGuard's serializers and `jsons` would, with `strip_nulls` and `strip_privates`.
+    """
+    value_type = type(value)
+    if value_type is ElementModP or value_type is ElementModQ:
+        return str(value)
+    elif value is None or value_type in (str, int, bool, float):
+        return value
+    elif value_type is list:
+        return [_dump(v) for v in value]
+    elif isinstance(value, Enum):
+        return value.name
+    elif isinstance(value, tuple) and hasattr(value, "_fields"):
+        return _without_nulls(
+            (name, _dump(getattr(value, name))) for name in value._fields
+        )
+    elif value_type is dict:
+        return _without_nulls((k, _dump(v)) for k, v in value.items())
+    elif value_type is datetime:
+        return value.isoformat()
+    elif is_dataclass(value):
+        return _without_nulls(
+            (name, _dump(getattr(value, name))) for name in _object_attributes(value)
+        )
+    else:
+        raise _Unsupported(f"can't encode {value_type}")
+
+
+def _without_nulls(items: Any) -> Dict[str, Any]:
+    return {k: v for k, v in items if v is not None}
+
+
+def _converter(hint: Any) -> Callable[[Any], Any]:
+    """
+    Internal helper: returns a function that turns decoded JSON into a value of the given
+    type (or type hint), made once per type, and then cached.
+    """
+    converter = _converters.get(hint)
+    if converter is None:
+        converter = _make_converter(hint)
+        _converters[hint] = converter
+    return converter
+
+
+def _make_converter(hint: Any) -> Callable[[Any], Any]:
+    origin = getattr(hint, "__origin__", None)
+    args = getattr(hint, "__args__", ())
+
+    if hint is ElementModP:
+        return _load_p
+    elif hint is ElementModQ:
+        return _load_q
+    elif hint in (str, int, bool):
+        return lambda x: _checked_primitive(x, hint)
+    elif hint is float:
+        return float
+    elif origin is Union:
+        non_null = [a for a in args if a is not type(None)]
+        if len(non_null) != 1:
+            raise _Unsupported(f"can't decode {hint}")
+        inner = _converter(non_null[0])
+        return lambda x: None if x is None else inner(x)
+    elif origin in (list, List):
+        element = _converter(args[0])
+        return lambda x: [element(e) for e in x]
+    elif origin in (dict, Dict):
+        value = _converter(args[1])
+        return lambda x: {k: value(v) for k, v in x.items()}
+    elif isinstance(hint, type) and issubclass(hint, Enum):
+        return lambda x: hint[x]
+    elif (
+        isinstance(hint, type) and issubclass(hint, tuple) and hasattr(hint, "_fields")
+    ):
+        hints = get_type_hints(hint)
+        return _make_constructor(
+            hint,
+            [
+                (name, hints[name], name not in hint._field_defaults)
+                for name in hint._fields
+            ],
+        )
+    elif isinstance(hint, type) and is_dataclass(hint):
+        # We use the types in the dataclass fields, rather than `get_type_hints`, since
+        # `jsons` overwrites entries in `__annotations__` with `None` as it serializes.
+        return _make_constructor(
+            hint,
+            [
+                (
+                    f.name,
+                    f.type,
+                    f.default is MISSING and f.default_factory is MISSING,  # type: ignore
+                )
+                for f in fields(hint)
+                if f.init
+            ],
+        )
+    else:
+        raise _Unsupported(f"can't decode {hint}")
+
+
+def _make_constructor(
+    cls: type, arguments: List[Tuple[str, Any, bool]]
+) -> Callable[[Any], Any]:
+    """
+    Internal helper: returns a function that constructs an instance of `cls`, given a dict
+    with the arguments (by name) to its constructor, converting each one to its type. The
+    arguments are given as tuples of their names, types, and whether they're required.
+    Like `jsons`, missing arguments get their default values, or `None` if they're required
+    but optional, since nulls are stripped when they're written. Other keys are ignored.
+    """
+    plan = [(name, _converter(hint)) for name, hint, _ in arguments]
+    nullable = [
+        name for name, hint, required in arguments if required and _is_optional(hint)
+    ]
+
+    def construct(x: Dict[str, Any]) -> Any:
+        kwargs = {name: convert(x[name]) for name, convert in plan if name in x}
+        for name in nullable:
+            kwargs.setdefault(name, None)
+        return cls(**kwargs)
+
+    return construct
+
+
+def _is_optional(hint: Any) -> bool:
+    return getattr(hint, "__origin__", None) is Union and type(None) in hint.__args__
+
+
+def _checked_primitive(x: Any, hint: type) -> Any:
+    if type(x) is not hint:
+        raise _Unsupported(f"expected {hint}, got {type(x)}")
+    return x
+
+
+def _load_p(x: Any) -> ElementModP:
+    p = int_to_p_unchecked(x)
+    if not p.is_in_bounds():
+        raise _Unsupported("ElementModP out of bounds")
+    return p
+
+
+def _load_q(x: Any) -> ElementModQ:
+    q = int_to_q_unchecked(x)
+    if not q.is_in_bounds():
+        raise _Unsupported("ElementModQ out of bounds")
+    return q
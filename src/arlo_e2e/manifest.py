@@ -1,22 +1,58 @@
+import json
 import shutil
-from base64 import b64encode
+from array import array
+from base64 import b64encode, b64decode
+from binascii import Error as BinasciiError
+from concurrent.futures import Future, ThreadPoolExecutor
 from hashlib import sha256
+from mmap import mmap, ACCESS_READ
+from os import fstat
 from pathlib import PurePath
-from typing import Dict, Optional, Type, List, Union, AnyStr, TypeVar
+from typing import (
+    Dict,
+    Optional,
+    Type,
+    List,
+    Union,
+    AnyStr,
+    TypeVar,
+    Iterable,
+    Final,
+    Set,
+    NamedTuple,
+    Sequence,
+    Tuple,
+    Any,
+    Iterator,
+    Mapping,
+    MutableMapping,
+)
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from electionguard.ballot import CiphertextAcceptedBallot
 from electionguard.logs import log_error, log_warning
 from electionguard.serializable import Serializable
 from electionguard.utils import flatmap_optional
 
+from arlo_e2e.compression import compress_bytes, decompress_bytes
 from arlo_e2e.eg_helpers import log_and_print
-from arlo_e2e.ray_write_retry import write_file_with_retries
+from arlo_e2e.json_codec import encode_json
+from arlo_e2e.ray_write_retry import (
+    write_file_with_retries,
+    write_chunks_with_retries,
+    get_write_behind_queue,
+)
+from arlo_e2e.ray_staging import StagedBundle, StagedFile, hand_off_staged_files
+from arlo_e2e.storage import is_s3_path, storage_for_path, storage_read_chunks
 from arlo_e2e.utils import (
     load_file_helper,
     compose_filename,
     mkdir_list_helper,
     decode_json_file_contents,
+    all_files_in_directory,
+    group_ballot_ids_by_prefix,
+    load_file_range_helper,
+    load_file_bytes_helper,
     BALLOT_FILENAME_PREFIX_DIGITS,
 )
 
@@ -24,6 +60,12 @@ T = TypeVar("T")
 S = TypeVar("S", bound=Serializable)
 
 
+DIGEST_BYTES: Final[int] = 32
+"""
+Length, in bytes, of a SHA256 digest.
+"""
+
+
 @dataclass(eq=True, unsafe_hash=True)
 class FileInfo(Serializable):
     """
@@ -33,15 +75,178 @@ class FileInfo(Serializable):
 
     hash: str
     """
-    SHA256 hash of the file, represented as a base64 string
+    SHA256 hash of the file, represented as a base64 string. If the file is compressed,
+    this is the hash of the compressed bytes, exactly as stored.
     """
 
     num_bytes: int
     """
-    Length of the file in bytes
+    Length of the file in bytes, as stored
+    """
+
+    container: Optional[str] = None
+    """
+    If present, this "file" is actually a record stored within a larger container file,
+    whose manifest name is given here. See `Manifest.write_ciphertext_ballots`.
+    """
+
+    offset: Optional[int] = None
+    """
+    If `container` is present, the offset, in bytes, of the record within the container.
+    """
+
+    codec: Optional[str] = None
+    """
+    If present, the compression codec used on the file (see `arlo_e2e.compression`).
     """
 
 
+class FileInfoTable(MutableMapping[str, FileInfo]):
+    """
+    A compact mapping from manifest names to `FileInfo`, used for `Manifest.hashes`. Rather than
+    a string and a `FileInfo` object for every entry, the SHA256 digests are stored as raw bytes
+    in one contiguous buffer, and the other fields in integer arrays. Each name is split into its
+    directory, which is stored once in a table of strings (along with the container names and
+    codecs), and its file name within that directory. `FileInfo` objects are only made as
+    entries are read. This pickles as a handful of flat arrays, so it's cheap to send through Ray.
+    """
+
+    def __init__(self, entries: Optional[Mapping[str, FileInfo]] = None) -> None:
+        self._digests = bytearray()
+        self._num_bytes = array("q")
+        self._offsets = array("q")
+        self._containers = array("l")
+        self._codecs = array("l")
+        self._strings: List[str] = []
+        self._string_ids: Dict[str, int] = {}
+
+        # Dict[directory string-id, Dict[file name, position in the arrays]]
+        self._index: Dict[int, Dict[str, int]] = {}
+
+        # entries whose hashes aren't base64-encoded SHA256 digests are kept as-is
+        self._irregular: Dict[int, FileInfo] = {}
+        self._len = 0
+
+        if entries is not None:
+            self.update(entries)
+
+    def _string_id(self, s: Optional[str]) -> int:
+        """
+        Internal helper: returns the id of the given string in the table of strings,
+        adding it if necessary, or -1 for `None`.
+        """
+        if s is None:
+            return -1
+        string_id = self._string_ids.get(s)
+        if string_id is None:
+            string_id = len(self._strings)
+            self._strings.append(s)
+            self._string_ids[s] = string_id
+        return string_id
+
+    def _position(self, manifest_name: str) -> Optional[int]:
+        """
+        Internal helper: returns the position of the given entry in the arrays, if present.
+        """
+        directory, _, file_name = manifest_name.rpartition("|")
+        directory_id = self._string_ids.get(directory)
+        if directory_id is None:
+            return None
+        return self._index.get(directory_id, {}).get(file_name)
+
+    def __getitem__(self, manifest_name: str) -> FileInfo:
+        position = self._position(manifest_name)
+        if position is None:
+            raise KeyError(manifest_name)
+        if position in self._irregular:
+            return self._irregular[position]
+
+        container = self._containers[position]
+        offset = self._offsets[position]
+        codec = self._codecs[position]
+        digest = self._digests[position * DIGEST_BYTES : (position + 1) * DIGEST_BYTES]
+        return FileInfo(
+            b64encode(digest).decode("utf-8"),
+            self._num_bytes[position],
+            self._strings[container] if container >= 0 else None,
+            offset if offset >= 0 else None,
+            self._strings[codec] if codec >= 0 else None,
+        )
+
+    def __setitem__(self, manifest_name: str, file_info: FileInfo) -> None:
+        try:
+            digest: Optional[bytes] = b64decode(file_info.hash, validate=True)
+        except (BinasciiError, ValueError):
+            digest = None
+        if digest is None or len(digest) != DIGEST_BYTES:
+            digest = None
+
+        position = self._position(manifest_name)
+        if position is None:
+            directory, _, file_name = manifest_name.rpartition("|")
+            position = len(self._num_bytes)
+            self._index.setdefault(self._string_id(directory), {})[file_name] = position
+            self._digests += bytes(DIGEST_BYTES)
+            self._num_bytes.append(0)
+            self._offsets.append(-1)
+            self._containers.append(-1)
+            self._codecs.append(-1)
+            self._len += 1
+
+        self._irregular.pop(position, None)
+        if digest is None:
+            self._irregular[position] = file_info
+            return
+
+        self._digests[position * DIGEST_BYTES : (position + 1) * DIGEST_BYTES] = digest
+        self._num_bytes[position] = file_info.num_bytes
+        self._offsets[position] = -1 if file_info.offset is None else file_info.offset
+        self._containers[position] = self._string_id(file_info.container)
+        self._codecs[position] = self._string_id(file_info.codec)
+
+    def __delitem__(self, manifest_name: str) -> None:
+        # The arrays aren't compacted; the deleted entry's slot is simply abandoned.
+        directory, _, file_name = manifest_name.rpartition("|")
+        position = self._position(manifest_name)
+        if position is None:
+            raise KeyError(manifest_name)
+        del self._index[self._string_ids[directory]][file_name]
+        self._irregular.pop(position, None)
+        self._len -= 1
+
+    def __iter__(self) -> Iterator[str]:
+        for directory_id, file_names in self._index.items():
+            directory = self._strings[directory_id]
+            for file_name in file_names:
+                yield directory + "|" + file_name if directory else file_name
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __repr__(self) -> str:
+        return f"FileInfoTable({self._len} entries)"
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # The index is flattened into a list of names and an array of positions for every
+        # directory, and rebuilt on arrival.
+        state = self.__dict__.copy()
+        state["_index"] = [
+            (directory_id, list(file_names.keys()), array("q", file_names.values()))
+            for directory_id, file_names in self._index.items()
+        ]
+        del state["_string_ids"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        index = state.pop("_index")
+        self.__dict__.update(state)
+        self._string_ids = {s: i for i, s in enumerate(self._strings)}
+        self._index = {
+            directory_id: dict(zip(file_names, positions))
+            for directory_id, file_names, positions in index
+        }
+
+
 @dataclass(eq=True, unsafe_hash=True)
 class ManifestExternal(Serializable):
     """
@@ -52,11 +257,69 @@ class ManifestExternal(Serializable):
     hashes: Dict[str, FileInfo]
     bytes_written: int = 0
 
+    merkle_root: Optional[str] = None
+    """
+    If present, the ballot entries aren't in `hashes`, but are instead in per-prefix manifest
+    shards, and this is the root of the Merkle tree over those shards (see `write_manifest`).
+    """
+
+    num_shards: int = 0
+    """
+    Number of manifest shards, i.e., the number of leaves in the Merkle tree.
+    """
+
     def to_manifest(self, root_dir: str) -> "Manifest":
         """
         Converts this to a Manifest class, suitable for working with in-memory.
         """
-        return Manifest(root_dir, self.hashes, self.bytes_written)
+        return Manifest(
+            root_dir,
+            self.hashes,
+            self.bytes_written,
+            self.merkle_root,
+            self.num_shards,
+        )
+
+
+@dataclass(eq=True, unsafe_hash=True)
+class ManifestShard(Serializable):
+    """
+    The on-disk representation of the manifest entries for every file in a single
+    ballot-id prefix directory (i.e., `ballots/<prefix>`).
+    """
+
+    prefix: str
+    hashes: Dict[str, FileInfo]
+
+
+@dataclass(eq=True, unsafe_hash=True)
+class MerkleProof(Serializable):
+    """
+    An inclusion proof for a single manifest shard: the sibling hashes needed to get from
+    the shard's leaf up to the Merkle root. See `verify_merkle_proof`.
+    """
+
+    index: int
+    """
+    Position of the shard's leaf in the Merkle tree, in sorted order of the prefixes.
+    """
+
+    siblings: List[str]
+    """
+    Sibling hashes, from the bottom of the tree to the top.
+    """
+
+
+@dataclass(eq=True, unsafe_hash=True)
+class MerkleTreeLeaves(Serializable):
+    """
+    Every leaf of the Merkle tree over the manifest shards, with its prefix. This is only
+    needed when loading every shard, since it's checked against the Merkle root by recomputing
+    the whole tree.
+    """
+
+    prefixes: List[str]
+    leaves: List[str]
 
 
 @dataclass(eq=True, unsafe_hash=True)
@@ -70,15 +333,184 @@ class Manifest:
     """
 
     root_dir: str
-    hashes: Dict[str, FileInfo]
+    hashes: MutableMapping[str, FileInfo]
     bytes_written: int = 0
 
+    # If the manifest was loaded from a sharded MANIFEST.json, then the ballot entries are
+    # only added to `hashes` as their shards are loaded, and checked against the Merkle root.
+    merkle_root: Optional[str] = None
+    num_shards: int = 0
+    loaded_shards: Set[str] = field(default_factory=set)
+
+    # If `write_behind` is true, `write_file` hands its files off to this process's
+    # `WriteBehindQueue` and returns immediately. Their entries are kept in `pending_writes`,
+    # with their lengths and codecs, until `flush_writes` adds them to `hashes`.
+    write_behind: bool = field(default=False, compare=False)
+    pending_writes: Dict[str, Tuple["Future[str]", int, Optional[str]]] = field(
+        default_factory=dict, compare=False
+    )
+
+    # If `staging_dir` is set, `write_file` writes its files to that local directory instead,
+    # and remembers them in `staged_files`, until `flush_writes` hands them off to be uploaded
+    # to `root_dir`. Their entries go straight into `hashes`, since the bytes are uploaded as-is,
+    # and once they're uploaded, `relocate_staged_files` points them at the bundles they're in.
+    staging_dir: Optional[str] = field(default=None, compare=False)
+    staged_files: List[StagedFile] = field(default_factory=list, compare=False)
+
+    # Files written through this manifest, but deliberately not included in it (e.g., the
+    # manifest shards), by manifest name, with their lengths, so `generate_index_html_files`
+    # can list them without walking the directory.
+    unlisted_files: Dict[str, int] = field(default_factory=dict, compare=False)
+
+    def __post_init__(self) -> None:
+        if not isinstance(self.hashes, FileInfoTable):
+            self.hashes = FileInfoTable(self.hashes)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # futures can't be pickled, so we wait for the hashes first
+        self.flush_writes()
+        return dict(self.__dict__)
+
+    def flush_writes(self) -> Dict[str, FileInfo]:
+        """
+        Waits for the hashes of every file handed off to the write-behind queue, adds their
+        entries to the manifest, and returns them. This doesn't wait for the files to be
+        written, which only `wait_for_zero_pending_writes` does. Every method that needs the
+        whole manifest calls this first. Raises the exception, if any, from hashing a file.
+
+        Any files in the local staging directory are also handed off to be uploaded, which
+        `wait_for_zero_pending_writes` likewise waits for. Without Ray, they're uploaded right
+        away, and their entries are pointed at the bundles they were uploaded in. With Ray,
+        that has to be done later, to the merged manifest (see `relocate_staged_files`).
+        """
+        if self.staged_files:
+            self.relocate_staged_files(hand_off_staged_files(self.staged_files))
+            self.staged_files = []
+
+        if not self.pending_writes:
+            return {}
+        get_write_behind_queue().report_counts()
+
+        flushed = {
+            name: FileInfo(hash_future.result(), num_bytes, codec=codec)
+            for name, (hash_future, num_bytes, codec) in self.pending_writes.items()
+        }
+        self.pending_writes = {}
+        for name, file_info in flushed.items():
+            self.hashes[name] = file_info
+        return flushed
+
+    def load_shard(self, prefix: str) -> bool:
+        """
+        Ensures that the manifest entries for the given ballot-id prefix are loaded. Only the
+        shard, itself, and its inclusion proof are read, so this needs O(log n) hashes to check
+        the shard against the Merkle root. Returns False, and logs an error, if the shard is
+        missing or doesn't match the Merkle root. Does nothing for manifests that aren't sharded.
+        """
+        if self.merkle_root is None or prefix in self.loaded_shards:
+            return True
+
+        shard = read_manifest_json(
+            compose_filename(self.root_dir, prefix + ".json", [MANIFEST_SHARDS_DIR]),
+            ManifestShard,
+        )
+        proof: Optional[MerkleProof] = flatmap_optional(
+            load_file_helper(
+                self.root_dir, prefix + MERKLE_PROOF_SUFFIX, [MANIFEST_SHARDS_DIR]
+            ),
+            lambda s: decode_json_file_contents(s, MerkleProof),
+        )
+        if shard is None or proof is None:
+            return False
+
+        shard_hash, shard_contents = shard
+        leaf = merkle_leaf_hash(prefix, shard_hash)
+        if not verify_merkle_proof(
+            leaf, proof.index, self.num_shards, proof.siblings, self.merkle_root
+        ):
+            log_error(f"Manifest shard for {prefix} doesn't match the Merkle root")
+            return False
+
+        return self._add_shard(prefix, shard_contents)
+
+    def load_all_shards(self) -> bool:
+        """
+        Ensures that every manifest entry is loaded, including any pending entries from the
+        write-behind queue (see `flush_writes`), checking every shard against the Merkle root.
+        Returns False, and logs an error, if anything fails to load or verify.
+        """
+        self.flush_writes()
+        if self.merkle_root is None or len(self.loaded_shards) == self.num_shards:
+            return True
+
+        tree: Optional[MerkleTreeLeaves] = flatmap_optional(
+            load_file_helper(self.root_dir, MERKLE_TREE_LEAVES, [MANIFEST_SHARDS_DIR]),
+            lambda s: decode_json_file_contents(s, MerkleTreeLeaves),
+        )
+        if tree is None:
+            return False
+        if (
+            len(tree.leaves) != self.num_shards
+            or len(tree.prefixes) != self.num_shards
+            or merkle_tree_levels(tree.leaves)[-1][0] != self.merkle_root
+        ):
+            log_error("Manifest shard leaves don't match the Merkle root")
+            return False
+
+        for prefix, leaf in zip(tree.prefixes, tree.leaves):
+            if prefix in self.loaded_shards:
+                continue
+            shard = read_manifest_json(
+                compose_filename(
+                    self.root_dir, prefix + ".json", [MANIFEST_SHARDS_DIR]
+                ),
+                ManifestShard,
+            )
+            if shard is None:
+                return False
+            shard_hash, shard_contents = shard
+            if merkle_leaf_hash(prefix, shard_hash) != leaf:
+                log_error(f"Manifest shard for {prefix} doesn't match the Merkle root")
+                return False
+            if not self._add_shard(prefix, shard_contents):
+                return False
+
+        return True
+
+    def _add_shard(self, prefix: str, shard: ManifestShard) -> bool:
+        """
+        Internal helper: adds the entries of an already-verified manifest shard.
+        """
+        if shard.prefix != prefix or any(
+            manifest_name_to_shard(name) != prefix for name in shard.hashes.keys()
+        ):
+            log_error(f"Manifest shard for {prefix} has entries for other prefixes")
+            return False
+
+        self.hashes.update(shard.hashes)
+        self.loaded_shards.add(prefix)
+        return True
+
+    def get_file_info(self, manifest_name: str) -> Optional[FileInfo]:
+        """
+        Gets the `FileInfo` for the given manifest name, loading its manifest shard if
+        necessary, or `None` if it's not present.
+        """
+        self.flush_writes()
+        prefix = manifest_name_to_shard(manifest_name)
+        if prefix is not None and not self.load_shard(prefix):
+            return None
+        return self.hashes.get(manifest_name)
+
     # TODO: add a call to this in the tally verification process.
     def all_hashes_unique(self) -> bool:
         """
         Checks that every hash value is unique. If a file hash repeated, then there's
         a chance that something went really wrong, like an identical ballot being repeated.
         """
+        if not self.load_all_shards():
+            return False
+
         expected_num_hashes = len(self.hashes.keys())
         actual_num_hashes = len({v.hash for v in self.hashes.values()})
 
@@ -90,12 +522,6 @@ class Manifest:
         else:
             return True
 
-    def to_manifest_external(self) -> ManifestExternal:
-        """
-        Converts this to a ManifestExternal class, suitable for serializing to disk.
-        """
-        return ManifestExternal(self.hashes, self.bytes_written)
-
     def merge_from(self, other: "Manifest") -> None:
         """
         Given a second manifest, reads all its contents and merges them into this manifest
@@ -107,17 +533,98 @@ class Manifest:
         assert (
             other.root_dir == self.root_dir
         ), "manifests must share the same root directory"
-        self_keys = set(self.hashes.keys())
-        other_keys = set(other.hashes.keys())
-        shared_keys = self_keys.intersection(other_keys)
-        for k in shared_keys:
-            if self.hashes[k] != other.hashes[k]:
-                msg = f"cannot merge manifests: disagreeing contents for {k}: {self.hashes[k]} vs. {other.hashes[k]}"
+        if not self.load_all_shards() or not other.load_all_shards():
+            raise RuntimeError("cannot merge manifests: shards failed to load")
+
+        # One lookup per entry in the other manifest, so the cost is linear in its size.
+        # Everything is checked before anything is changed.
+        other_items = list(other.hashes.items())
+        for k, file_info in other_items:
+            existing = self.hashes.get(k)
+            if existing is not None and existing != file_info:
+                msg = f"cannot merge manifests: disagreeing contents for {k}: {existing} vs. {file_info}"
                 log_error(msg)
                 raise RuntimeError(msg)
-        for k in other_keys:
-            self.hashes[k] = other.hashes[k]
+        for k, file_info in other_items:
+            self.hashes[k] = file_info
         self.bytes_written += other.bytes_written
+        self.unlisted_files.update(other.unlisted_files)
+
+    def relocate_staged_files(self, bundles: Sequence[StagedBundle]) -> None:
+        """
+        Given the bundles that staged files were uploaded in (see `arlo_e2e.ray_staging`),
+        points their manifest entries at the bundles. Each staged file becomes a record within
+        its bundle, and so does each record that was within a staged file, with its offset
+        adjusted to match. The bundles are listed, but aren't in the manifest themselves,
+        since every byte in them is covered by these entries.
+        """
+        if not bundles:
+            return
+        if not self.load_all_shards():
+            raise RuntimeError("cannot relocate entries: shards failed to load")
+
+        new_homes: Dict[str, Tuple[str, int]] = {}
+        for bundle in bundles:
+            bundle_name = path_to_manifest_name(
+                self.root_dir, PurePath(bundle.published_name)
+            )
+            self.unlisted_files[bundle_name] = bundle.num_bytes
+            for published_name, offset in bundle.members:
+                member_name = path_to_manifest_name(
+                    self.root_dir, PurePath(published_name)
+                )
+                new_homes[member_name] = (bundle_name, offset)
+
+        for name, file_info in list(self.hashes.items()):
+            home = new_homes.get(
+                file_info.container if file_info.container is not None else name
+            )
+            if home is not None:
+                bundle_name, offset = home
+                self.hashes[name] = FileInfo(
+                    file_info.hash,
+                    file_info.num_bytes,
+                    bundle_name,
+                    offset + (file_info.offset or 0),
+                    file_info.codec,
+                )
+
+    def subset(self, manifest_names: Iterable[str]) -> "Manifest":
+        """
+        Returns a new manifest, sharing the same root directory, having only the requested
+        entries. Useful when a worker only needs to read a handful of files and we don't
+        want to ship the whole manifest to it. Names missing from this manifest are
+        left out of the result (and any later attempt to read them will fail validation).
+        """
+        file_infos = {name: self.get_file_info(name) for name in manifest_names}
+        return Manifest(
+            self.root_dir,
+            {name: fi for name, fi in file_infos.items() if fi is not None},
+        )
+
+    def subset_for_ballots(self, ballot_ids: Iterable[str]) -> "Manifest":
+        """
+        Like `subset`, but takes ballot identifiers rather than manifest names, yielding
+        a manifest that's sufficient for `load_ciphertext_ballot` on those ballots.
+        """
+        return self.subset(ballot_manifest_name(bid) for bid in ballot_ids)
+
+    def changed_prefixes(self, other: "Manifest") -> Optional[List[str]]:
+        """
+        Compares this manifest to another one (e.g., from an earlier version of the same
+        tally directory), returning a sorted list of the ballot-id prefixes where any ballot
+        or subtotal file was added, removed, or changed. Verifiers only need to recheck
+        these directories. Returns `None` if either manifest's shards fail to load.
+        """
+        if not self.load_all_shards() or not other.load_all_shards():
+            return None
+
+        result: Set[str] = set()
+        for name in self.hashes.keys() | other.hashes.keys():
+            prefix = manifest_name_to_prefix(name)
+            if prefix is not None and self.hashes.get(name) != other.hashes.get(name):
+                result.add(prefix)
+        return sorted(result)
 
     def write_json_file(
         self,
@@ -126,7 +633,8 @@ class Manifest:
         subdirectories: List[str] = None,
         skip_manifest: bool = False,
         num_retries: int = 1,
-    ) -> str:
+        codec: Optional[str] = None,
+    ) -> Optional[str]:
         """
         Given a filename, subdirectory, and contents of the file, writes the contents out to the file. As a
         side-effect, the full filename and its contents' hash are remembered in `self.hashes`, to be written
@@ -137,12 +645,18 @@ class Manifest:
         :param content_obj: any ElectionGuard "Serializable" object
         :param skip_manifest: if true, the manifest is not updated for this particular file being written
         :param num_retries: how many attempts to make writing the file; works around occasional network filesystem glitches
-        :returns: the SHA256 hash of `file_contents`
+        :param codec: optional compression codec (see `arlo_e2e.compression`)
+        :returns: the SHA256 hash of `file_contents`, or `None` if it's computed in the background
         """
 
-        json_txt = content_obj.to_json(strip_privates=True)
+        json_txt = encode_json(content_obj)
         return self.write_file(
-            file_name, json_txt, subdirectories, skip_manifest, num_retries=num_retries
+            file_name,
+            json_txt,
+            subdirectories,
+            skip_manifest,
+            num_retries=num_retries,
+            codec=codec,
         )
 
     def write_file(
@@ -152,18 +666,29 @@ class Manifest:
         subdirectories: List[str] = None,
         skip_manifest: bool = False,
         num_retries: int = 1,
-    ) -> str:
+        codec: Optional[str] = None,
+    ) -> Optional[str]:
         """
         Given a filename, subdirectory, and contents of the file, writes the contents out to the file. As a
         side-effect, the full filename and its contents' hash are remembered in `self.hashes`, to be written
-        out later with a call to `write_manifest`.
+        out later with a call to `write_manifest`. If a compression `codec` is specified, the hash and length
+        are computed over the compressed bytes, exactly as they're stored, so integrity checks don't need
+        to decompress anything.
+
+        If the manifest is in `write_behind` mode, the contents are handed off to this process's
+        `WriteBehindQueue`, to be hashed and written in the background, and this returns immediately.
+        The file's entry is only added to `self.hashes` by `flush_writes`.
+
+        If the manifest has a `staging_dir`, the contents are written there instead, on local disk,
+        and are uploaded to `root_dir` after `flush_writes`.
 
         :param subdirectories: paths to be introduced between `root_dir` and the file; empty-list means no subdirectory
         :param file_name: name of the file, including any suffix
         :param file_contents: string to be written to the file
         :param skip_manifest: if true, the manifest is not updated for this particular file being written
         :param num_retries: how many attempts to make writing the file; works around occasional network filesystem glitches
-        :returns: the SHA256 hash of `file_contents`
+        :param codec: optional compression codec (see `arlo_e2e.compression`)
+        :returns: the SHA256 hash of the bytes written, or `None` if it's computed in the background
         """
 
         if subdirectories is None:
@@ -171,61 +696,181 @@ class Manifest:
 
         manifest_name = compose_manifest_name(file_name, subdirectories)
 
-        mkdir_list_helper(self.root_dir, subdirectories, num_retries=num_retries)
-        h = sha256_hash(file_contents)
-
         if isinstance(file_contents, bytes):
             file_utf8_bytes = file_contents
         else:
             file_utf8_bytes = file_contents.encode("utf-8")
 
-        file_content_bytes = len(file_utf8_bytes)
-        full_name = compose_filename(self.root_dir, file_name, subdirectories)
-        write_file_with_retries(
-            full_name, file_utf8_bytes, num_attempts=num_retries, initial_delay=1
-        )
-        file_info = FileInfo(h, file_content_bytes)
+        stored_bytes = compress_bytes(file_utf8_bytes, codec)
+        if stored_bytes is None:
+            raise ValueError(f"Unsupported compression codec: {codec}")
 
-        if manifest_name in self.hashes:
+        if manifest_name in self.hashes or manifest_name in self.pending_writes:
             log_warning(
                 f"Writing a file through a manifest that has already been written: {manifest_name}"
             )
 
+        full_name = compose_filename(self.root_dir, file_name, subdirectories)
+        if self.write_behind:
+            hash_future = get_write_behind_queue().submit(
+                full_name,
+                stored_bytes,
+                full_name.parent,
+                num_attempts=num_retries,
+            )
+            if not skip_manifest:
+                self.bytes_written += len(stored_bytes)
+                self.pending_writes[manifest_name] = (
+                    hash_future,
+                    len(stored_bytes),
+                    codec,
+                )
+            else:
+                self.unlisted_files[manifest_name] = len(stored_bytes)
+            return None
+
+        h = sha256_hash(stored_bytes)
+        if self.staging_dir is not None:
+            staged_name = compose_filename(self.staging_dir, file_name, subdirectories)
+            mkdir_list_helper(self.staging_dir, subdirectories)
+            with open(staged_name, "wb") as f:
+                f.write(stored_bytes)
+            self.staged_files.append((str(staged_name), str(full_name)))
+        else:
+            mkdir_list_helper(self.root_dir, subdirectories, num_retries=num_retries)
+            write_file_with_retries(
+                full_name, stored_bytes, num_attempts=num_retries, initial_delay=1
+            )
+        file_info = FileInfo(h, len(stored_bytes), codec=codec)
+
         if not skip_manifest:
             self.bytes_written += file_info.num_bytes
             self.hashes[manifest_name] = file_info
+        else:
+            self.unlisted_files[manifest_name] = file_info.num_bytes
         return file_info.hash
 
-    def write_manifest(self, num_retries: int = 1) -> str:
+    def write_manifest(self, num_retries: int = 1, sharded: bool = True) -> str:
         """
         Writes out `MANIFEST.json` into the existing `root_dir`, providing a mapping from filenames
         to their SHA256 hashes.
+
+        If `sharded` is true (the default), the entries for each ballot-id prefix directory
+        are instead written to their own manifest shard, `manifests/<prefix>.json`, and
+        `MANIFEST.json` has the root of a Merkle tree over the shards. Alongside each shard,
+        `manifests/<prefix>.proof.json` has the shard's inclusion proof, so a single ballot
+        can be checked against the root hash by reading `MANIFEST.json`, one shard, and
+        O(log n) sibling hashes. The Merkle leaves, in `manifests/merkle_leaves.json`, are
+        only needed to load every shard at once. None of these files are in the manifest,
+        since they're all checked against the Merkle root instead.
+
         :param num_retries: how many attempts to make writing the file; works around occasional network filesystem glitches
+        :param sharded: whether to write the ballot entries into Merkle-tree manifest shards (default: True)
         :returns: the SHA256 hash of `MANIFEST.json`, itself
         """
 
         # Note that we don't want to have the manifest, itself, inside the manifest, so
         # we're going to use the skip_manifest flag.
 
-        result = self.write_json_file(
-            "MANIFEST.json",
-            self.to_manifest_external(),
-            [],
+        if not self.load_all_shards():
+            raise RuntimeError("cannot write a manifest whose shards failed to load")
+
+        top_level: Dict[str, FileInfo] = {}
+        shards: Dict[str, Dict[str, FileInfo]] = {}
+        for name, file_info in self.hashes.items():
+            prefix = manifest_name_to_shard(name) if sharded else None
+            if prefix is None:
+                top_level[name] = file_info
+            else:
+                shards.setdefault(prefix, {})[name] = file_info
+
+        if not shards:
+            self.merkle_root = None
+            self.num_shards = 0
+            self.loaded_shards = set()
+            return self._write_manifest_json(
+                "MANIFEST.json",
+                [],
+                {
+                    "bytes_written": self.bytes_written,
+                    "merkle_root": None,
+                    "num_shards": 0,
+                },
+                self.hashes,
+                num_retries,
+            )
+
+        prefixes = sorted(shards.keys())
+        leaves = [
+            merkle_leaf_hash(
+                prefix,
+                self._write_manifest_json(
+                    prefix + ".json",
+                    [MANIFEST_SHARDS_DIR],
+                    {"prefix": prefix},
+                    shards[prefix],
+                    num_retries,
+                ),
+            )
+            for prefix in prefixes
+        ]
+        levels = merkle_tree_levels(leaves)
+        for index, prefix in enumerate(prefixes):
+            self.write_json_file(
+                prefix + MERKLE_PROOF_SUFFIX,
+                MerkleProof(index, merkle_proof(levels, index)),
+                [MANIFEST_SHARDS_DIR],
+                skip_manifest=True,
+                num_retries=num_retries,
+            )
+        self.write_json_file(
+            MERKLE_TREE_LEAVES,
+            MerkleTreeLeaves(prefixes, leaves),
+            [MANIFEST_SHARDS_DIR],
             skip_manifest=True,
             num_retries=num_retries,
         )
-        return result
 
-    def _get_hash_required(self, filename: str) -> Optional[FileInfo]:
+        self.merkle_root = levels[-1][0]
+        self.num_shards = len(prefixes)
+        self.loaded_shards = set(prefixes)
+        return self._write_manifest_json(
+            "MANIFEST.json",
+            [],
+            {
+                "bytes_written": self.bytes_written,
+                "merkle_root": self.merkle_root,
+                "num_shards": self.num_shards,
+            },
+            top_level,
+            num_retries,
+        )
+
+    def _write_manifest_json(
+        self,
+        file_name: str,
+        subdirectories: List[str],
+        header: Dict[str, Any],
+        hashes: Mapping[str, FileInfo],
+        num_retries: int,
+    ) -> str:
         """
-        Gets the hash for the requested filename (fully composed path, such as we might get from
-        `utils.compose_filename`). If absent, logs an error and returns None.
+        Internal helper: writes a manifest or manifest shard, which isn't itself included in
+        the manifest, with `write_manifest_json`, returning its hash.
         """
-        hash = self.hashes[filename]
-        if hash is None:
-            log_error(f"No hash available for file: {filename}")
-            return None
-        return hash
+        mkdir_list_helper(self.root_dir, subdirectories, num_retries=num_retries)
+        file_info = write_manifest_json(
+            compose_filename(self.root_dir, file_name, subdirectories),
+            header,
+            hashes,
+            num_retries,
+        )
+        if file_info is None:
+            raise RuntimeError(f"Failed to write {file_name}")
+        self.unlisted_files[
+            compose_manifest_name(file_name, subdirectories)
+        ] = file_info.num_bytes
+        return file_info.hash
 
     def read_json_file(
         self,
@@ -247,28 +892,36 @@ class Manifest:
         :returns: The contents of the file, or `None` if there was an error.
         """
 
-        # this loads the file and verifies the hashes
-        file_contents = self.read_file(file_name, subdirectories)
-        return flatmap_optional(
-            file_contents, lambda f: decode_json_file_contents(f, class_handle)
-        )
-
-    def validate_contents(self, manifest_file_name: str, file_contents: str) -> bool:
+        # this loads the file and verifies the hashes, and then the JSON is decoded straight
+        # from the same bytes, without first making a string
+        file_bytes = self.read_file_bytes(file_name, subdirectories)
+        if file_bytes is None:
+            return None
+        if isinstance(file_bytes, mmap):
+            # the JSON decoder can't read from a memory map, so this one file gets copied
+            with file_bytes:
+                file_bytes = file_bytes[:]
+        return decode_json_file_contents(file_bytes, class_handle)
+
+    def validate_contents(
+        self, manifest_file_name: str, file_contents: Union[str, bytes, mmap]
+    ) -> bool:
         """
         Checks the manifest for the given file name. Returns True if the name is
         included in the manifest *and* the file_contents match the manifest. If anything
         is not properly validated, a suitable error will be written to the ElectionGuard log.
+        The contents may be a string, which is encoded as UTF-8, or the raw bytes, which
+        are checked as they are, without any copying.
         """
-        if manifest_file_name not in self.hashes:
-            log_error(f"File {manifest_file_name} was not in the manifest")
-            return False
-
-        file_info: Optional[FileInfo] = self._get_hash_required(manifest_file_name)
+        file_info: Optional[FileInfo] = self.get_file_info(manifest_file_name)
 
         if file_info is None:
+            log_error(f"File {manifest_file_name} was not in the manifest")
             return False
 
-        file_len = len(file_contents.encode("utf-8"))
+        if isinstance(file_contents, str):
+            file_contents = file_contents.encode("utf-8")
+        file_len = len(file_contents)
 
         if file_len != file_info.num_bytes:
             log_error(
@@ -294,6 +947,37 @@ class Manifest:
         hash, then `None` will be returned and an error will be logged. If the file_name
         is actually a path-like object, the subdirectories are ignored.
 
+        :param subdirectories: Path elements to be introduced between `root_dir` and the file; empty-list means
+          no subdirectory. Ignored if the file_name is a path-like object.
+        :param file_name: Name of the file, including any suffix, or a path-like object.
+        :returns: The contents of the file, or `None` if there was an error.
+        """
+        file_bytes = self.read_file_bytes(file_name, subdirectories)
+        if file_bytes is None:
+            return None
+
+        try:
+            return str(file_bytes, "utf-8")
+        except UnicodeDecodeError as e:
+            log_error(f"File {file_name} isn't valid UTF-8: {e}")
+            return None
+        finally:
+            if isinstance(file_bytes, mmap):
+                file_bytes.close()
+
+    def read_file_bytes(
+        self, file_name: Union[PurePath, str], subdirectories: List[str] = None
+    ) -> Optional[Union[bytes, mmap]]:
+        """
+        Reads the requested file, by name, returning its contents as raw bytes, exactly as
+        they were hashed when the file was written, and decompressed, if necessary. The file
+        is read once, into a single buffer, which is checked against the manifest as it is.
+        Large local files are memory-mapped, rather than read (see `HASH_MMAP_THRESHOLD`),
+        and the caller should close the mapping when it's done. If no hash for the file is
+        present, or if the file doesn't match its known hash, then `None` will be returned
+        and an error will be logged. If the file_name is actually a path-like object, the
+        subdirectories are ignored.
+
         :param subdirectories: Path elements to be introduced between `root_dir` and the file; empty-list means
           no subdirectory. Ignored if the file_name is a path-like object.
         :param file_name: Name of the file, including any suffix, or a path-like object.
@@ -305,22 +989,213 @@ class Manifest:
             full_name = compose_filename(self.root_dir, file_name, subdirectories)
         manifest_name = path_to_manifest_name(self.root_dir, full_name)
 
-        file_contents = load_file_helper(self.root_dir, full_name, subdirectories)
-        if file_contents is not None and self.validate_contents(
-            manifest_name, file_contents
+        file_info = self.get_file_info(manifest_name)
+        if file_info is None or (
+            file_info.container is None and file_info.codec is None
+        ):
+            file_buffer = _load_file_buffer(full_name)
+            if file_buffer is not None and self.validate_contents(
+                manifest_name, file_buffer
+            ):
+                return file_buffer
+            else:
+                if isinstance(file_buffer, mmap):
+                    file_buffer.close()
+                return None
+
+        # Records within containers and compressed files are read as bytes, validated
+        # against the manifest, and only then decompressed.
+        stored_bytes = (
+            self._read_record(file_info)
+            if file_info.container is not None
+            else load_file_bytes_helper(full_name)
+        )
+        if stored_bytes is None or not self.validate_contents(
+            manifest_name, stored_bytes
         ):
-            return file_contents
-        else:
             return None
 
+        return decompress_bytes(stored_bytes, file_info.codec)
+
+    def _read_record(self, file_info: FileInfo) -> Optional[bytes]:
+        """
+        Internal helper: reads a record out of its container file, using a range read,
+        so the rest of the container isn't touched. The record isn't validated here.
+        """
+        if file_info.container is None or file_info.offset is None:
+            return None
+
+        return load_file_range_helper(
+            manifest_name_to_path(self.root_dir, file_info.container),
+            file_info.offset,
+            file_info.num_bytes,
+        )
+
+    def write_ciphertext_ballots(
+        self,
+        ballots: Sequence[CiphertextAcceptedBallot],
+        num_retries: int = 1,
+        packed: bool = True,
+        codec: Optional[str] = None,
+    ) -> None:
+        """
+        Given a manifest and a sequence of ciphertext ballots, writes the ballots to disk and
+        updates the manifest. Normally, the ballots are "packed": all the ballots with the same
+        ballot-id prefix are written, one JSON record per line, into a single container file in
+        `ballots/<prefix>`, named for its first ballot. Each ballot still gets its own manifest
+        entry, as if it were written to its own file, with its hash and length, plus the
+        container and the offset within it, so single ballots can be loaded with a range read.
+        The container gets its own manifest entry as well. This saves a vast number of small
+        writes on network filesystems like S3. If `packed` is false, each ballot is written to
+        its own file, as with `write_ciphertext_ballot`.
+
+        If a compression `codec` is specified, each ballot is compressed on its own, so single
+        ballots can still be loaded with a range read, and the records are concatenated without
+        newlines.
+
+        :param ballots: any "accepted" ballots, ready to be written out
+        :param num_retries: how many attempts to make writing the file; works around occasional network filesystem glitches
+        :param packed: whether to write the ballots into a container file (default: True)
+        :param codec: optional compression codec (see `arlo_e2e.compression`)
+        """
+        if not packed:
+            for ballot in ballots:
+                self.write_ciphertext_ballot(ballot, num_retries, codec)
+            return
+
+        ballots_by_id = {b.object_id: b for b in ballots}
+        groups = group_ballot_ids_by_prefix(ballots_by_id.keys())
+        for prefix in groups.keys():
+            self.write_packed_json_files(
+                groups[prefix][0] + PACKED_BALLOTS_SUFFIX,
+                [(bid + ".json", ballots_by_id[bid]) for bid in groups[prefix]],
+                ["ballots", prefix],
+                num_retries=num_retries,
+                codec=codec,
+            )
+
+    def write_packed_json_files(
+        self,
+        container_name: str,
+        contents: Sequence[Tuple[str, Serializable]],
+        subdirectories: List[str] = None,
+        num_retries: int = 1,
+        codec: Optional[str] = None,
+    ) -> None:
+        """
+        Writes a sequence of JSON objects, one record per line, into a single container file,
+        and updates the manifest. Each object gets its own manifest entry, as if it were written
+        to its own file in the same subdirectories, with its hash and length, plus the container
+        and the offset within it, so `read_json_file` can load it with a range read. The container
+        gets its own manifest entry as well.
+
+        If a compression `codec` is specified, each record is compressed on its own, and the
+        records are concatenated without newlines.
+
+        :param container_name: name of the container file, including any suffix
+        :param contents: pairs of file names and the "Serializable" objects to store under those names
+        :param subdirectories: paths to be introduced between `root_dir` and the files; empty-list means no subdirectory
+        :param num_retries: how many attempts to make writing the file; works around occasional network filesystem glitches
+        :param codec: optional compression codec (see `arlo_e2e.compression`)
+        """
+        self._write_packed_records(
+            container_name,
+            [
+                (file_name, encode_json(content_obj).encode("utf-8"))
+                for file_name, content_obj in contents
+            ],
+            b"\n" if codec is None else b"",
+            subdirectories,
+            num_retries,
+            codec,
+        )
+
+    def write_packed_files(
+        self,
+        container_name: str,
+        contents: Sequence[Tuple[str, bytes]],
+        subdirectories: List[str] = None,
+        num_retries: int = 1,
+        codec: Optional[str] = None,
+    ) -> None:
+        """
+        Like `write_packed_json_files`, but for raw bytes: the records are concatenated, with
+        nothing in between, into a single container file, and each gets its own manifest entry,
+        so `read_file_bytes` can load it with a range read.
+
+        :param container_name: name of the container file, including any suffix
+        :param contents: pairs of file names and the bytes to store under those names
+        :param subdirectories: paths to be introduced between `root_dir` and the files; empty-list means no subdirectory
+        :param num_retries: how many attempts to make writing the file; works around occasional network filesystem glitches
+        :param codec: optional compression codec (see `arlo_e2e.compression`)
+        """
+        self._write_packed_records(
+            container_name, contents, b"", subdirectories, num_retries, codec
+        )
+
+    def _write_packed_records(
+        self,
+        container_name: str,
+        contents: Sequence[Tuple[str, bytes]],
+        separator: bytes,
+        subdirectories: Optional[List[str]],
+        num_retries: int,
+        codec: Optional[str],
+    ) -> None:
+        """
+        Internal helper: compresses each record on its own, if there's a `codec`, writes them
+        into a container file, each followed by the `separator`, and adds a manifest entry for
+        each record, pointing into the container.
+        """
+        if subdirectories is None:
+            subdirectories = []
+
+        records: List[bytes] = []
+        for _, contents_bytes in contents:
+            record = compress_bytes(contents_bytes, codec)
+            if record is None:
+                raise ValueError(f"Unsupported compression codec: {codec}")
+            records.append(record)
+
+        self.write_file(
+            container_name,
+            b"".join(r + separator for r in records),
+            subdirectories,
+            num_retries=num_retries,
+        )
+
+        container_manifest_name = compose_manifest_name(container_name, subdirectories)
+        offset = 0
+        for (file_name, _), record in zip(contents, records):
+            manifest_name = compose_manifest_name(file_name, subdirectories)
+            if manifest_name in self.hashes:
+                log_warning(
+                    f"Writing a file through a manifest that has already been written: {manifest_name}"
+                )
+
+            # the container's bytes were already counted in bytes_written
+            self.hashes[manifest_name] = FileInfo(
+                sha256_hash(record),
+                len(record),
+                container_manifest_name,
+                offset,
+                codec,
+            )
+            offset += len(record) + len(separator)
+
     def write_ciphertext_ballot(
-        self, ballot: CiphertextAcceptedBallot, num_retries: int = 1
+        self,
+        ballot: CiphertextAcceptedBallot,
+        num_retries: int = 1,
+        codec: Optional[str] = None,
     ) -> None:
         """
-        Given a manifest and a ciphertext ballot, writes the ballot to disk and updates
-        the manifest.
+        Given a manifest and a ciphertext ballot, writes the ballot to disk, in its own file,
+        and updates the manifest. For writing many ballots, `write_ciphertext_ballots` is
+        much more efficient.
         :param ballot: any "accepted" ballot, ready to be written out
         :param num_retries: how many attempts to make writing the file; works around occasional network filesystem glitches
+        :param codec: optional compression codec (see `arlo_e2e.compression`)
         """
         ballot_name = ballot.object_id
         ballot_name_prefix = ballot_name[0:BALLOT_FILENAME_PREFIX_DIGITS]
@@ -329,6 +1204,7 @@ class Manifest:
             ballot,
             ["ballots", ballot_name_prefix],
             num_retries=num_retries,
+            codec=codec,
         )
 
     def load_ciphertext_ballot(
@@ -337,7 +1213,8 @@ class Manifest:
         """
         Given a manifest and a ballot identifier string, attempts to load the ballot
         from disk. Returns `None` if the ballot doesn't exist or if the hashes fail
-        to verify.
+        to verify. Works for ballots written either to their own files or packed into
+        containers (see `write_ciphertext_ballots`).
         """
         ballot_name_prefix = ballot_id[0:BALLOT_FILENAME_PREFIX_DIGITS]
         return self.read_json_file(
@@ -351,6 +1228,9 @@ class Manifest:
         Not exactly checking equality, but does check that the manifests are "equivalent",
         which means we're ignoring the root directories, but checking the rest.
         """
+        if not self.load_all_shards() or not other.load_all_shards():
+            return False
+
         same_bytes = self.bytes_written == other.bytes_written
         same_hashes = self.hashes == other.hashes
 
@@ -362,19 +1242,34 @@ class Manifest:
         return same_hashes and same_bytes
 
 
-def make_fresh_manifest(root_dir: str, delete_existing: bool = False) -> Manifest:
+def make_fresh_manifest(
+    root_dir: str,
+    delete_existing: bool = False,
+    write_behind: bool = False,
+    staging_dir: Optional[str] = None,
+) -> Manifest:
     """
     Constructs a fresh `Manifest` instance.
     :param root_dir: a name for the directory about to be filled up with fresh files
     :param delete_existing: if true, will delete any existing files in the given root directory (false by default)
+    :param write_behind: if true, files are hashed and written in the background (see `Manifest.write_file`)
+    :param staging_dir: if set, files are written to this local directory, then uploaded (see `Manifest.write_file`)
     """
     if delete_existing:
-        try:
-            shutil.rmtree(root_dir)
-        except FileNotFoundError:
-            pass
-
-    return Manifest(root_dir=root_dir, hashes={})
+        if is_s3_path(root_dir):
+            log_warning(f"Not deleting existing files in {root_dir}, which is in S3")
+        else:
+            try:
+                shutil.rmtree(root_dir)
+            except FileNotFoundError:
+                pass
+
+    return Manifest(
+        root_dir=root_dir,
+        hashes={},
+        write_behind=write_behind,
+        staging_dir=staging_dir,
+    )
 
 
 def make_existing_manifest(
@@ -383,30 +1278,473 @@ def make_existing_manifest(
     """
     Constructs a `Manifest` instance from a directory that contains a `MANIFEST.json` file.
     If the file is missing or something else goes wrong, you could get `None` as a result.
+    If the manifest is sharded, then only `MANIFEST.json` is loaded, and each shard is loaded
+    and checked against the Merkle root when it's first needed.
     :param expected_root_hash: optional string of the form produced by `sha256_hash`; validates the
       manifest against the hash, returns `None` and logs if there's a mismatch
     :param root_dir: a name for the directory containing `MANIFEST.json` and other files.
     """
-    manifest_str = load_file_helper(root_dir=root_dir, file_name="MANIFEST.json")
+    manifest = read_manifest_json(
+        compose_filename(root_dir, "MANIFEST.json"), ManifestExternal
+    )
 
-    if manifest_str is None:
+    if manifest is None:
         return None
 
-    if expected_root_hash is not None:
-        data_hash = sha256_hash(manifest_str)
-        if data_hash != expected_root_hash:
-            log_and_print(
-                f"Root hash mismatch on MANIFEST.json; expected {expected_root_hash}, got {data_hash}"
-            )
+    data_hash, manifest_ex = manifest
+    if expected_root_hash is not None and data_hash != expected_root_hash:
+        log_and_print(
+            f"Root hash mismatch on MANIFEST.json; expected {expected_root_hash}, got {data_hash}"
+        )
+        return None
+
+    return manifest_ex.to_manifest(root_dir)
+
+
+PACKED_BALLOTS_SUFFIX: Final[str] = ".jsonl"
+"""
+Suffix for container files holding many ballots, one JSON record per line.
+"""
+
+MANIFEST_SHARDS_DIR: Final[str] = "manifests"
+"""
+Subdirectory of a tally directory holding the manifest shards, one per ballot-id prefix,
+along with their Merkle inclusion proofs (see `Manifest.write_manifest`).
+"""
+
+MERKLE_PROOF_SUFFIX: Final[str] = ".proof.json"
+"""
+Suffix for the file, next to each manifest shard, holding the shard's `MerkleProof`.
+"""
+
+MERKLE_TREE_LEAVES: Final[str] = "merkle_leaves.json"
+"""
+Name of the file, in `MANIFEST_SHARDS_DIR`, holding the `MerkleTreeLeaves`.
+"""
+
+SUBTOTALS_DIR: Final[str] = "subtotals"
+"""
+Subdirectory of a tally directory holding the published subtotal for each ballot-id prefix.
+"""
+
+COLUMNS_DIR: Final[str] = "columns"
+"""
+Subdirectory of a tally directory holding the columnar ciphertext store (see `arlo_e2e.columnar`).
+Its per-prefix subdirectories go in the same manifest shards as the ballots.
+"""
+
+HASH_READ_BUFFER_SIZE: Final[int] = 1024 * 1024
+"""
+When hashing files for integrity checks, this is how many bytes we read at a time.
+"""
+
+HASH_MMAP_THRESHOLD: Final[int] = 16 * 1024 * 1024
+"""
+Local files at least this big are memory-mapped, rather than read, when hashing or
+loading them.
+"""
+
+MANIFEST_HASHES_OPENING: Final[bytes] = b'"hashes": {'
+"""
+How the first line of a manifest, or manifest shard, ends, when it's written by
+`write_manifest_json`. Anything else is decoded the slow way, all at once.
+"""
+
+MANIFEST_ENTRIES_PER_CHUNK: Final[int] = 10000
+"""
+When writing a manifest, this is how many entries are encoded, hashed, and written at a time.
+"""
+
+NUM_HASH_THREADS: Final[int] = 32
+"""
+Default number of threads used for integrity checking. Hashing releases the GIL, and on
+network filesystems, most of the time is spent waiting, so this can be well above the
+number of cores.
+"""
+
+INDEX_PAGES_STATE: Final[str] = "index_pages.json"
+"""
+File, at the top of a tally directory, where `generate_index_html_files` remembers the hash
+of every index.html it wrote, so it only rewrites the ones that change.
+"""
+
+FILES_NOT_IN_MANIFEST: Final[Set[str]] = {
+    "MANIFEST.json",
+    "index.html",
+    INDEX_PAGES_STATE,
+    "root_hash.html",
+    "root_hash_qrcode.png",
+}
+"""
+File names that we write into a tally directory without including them in the manifest.
+These are ignored when looking for extra files.
+"""
+
+
+class HashVerificationResults(NamedTuple):
+    """
+    The output of `verify_manifest_hashes`: lists of manifest names for files which were
+    missing, which shouldn't be there, which didn't match their hashes or lengths, or which
+    couldn't be read.
+    """
+
+    num_files: int
+    """
+    Number of files in the manifest that were checked.
+    """
+
+    missing: List[str]
+    """
+    Files in the manifest that weren't found.
+    """
+
+    extra: List[str]
+    """
+    Files found in the directory that aren't in the manifest.
+    """
+
+    mismatched: List[str]
+    """
+    Files whose hashes or lengths didn't match the manifest.
+    """
+
+    unreadable: List[str]
+    """
+    Files in the manifest that are there, but couldn't be read (e.g., permission errors, or
+    storage failures).
+    """
+
+    @property
+    def success(self) -> bool:
+        """
+        True if every file in the manifest was present and correct, and no others were found.
+        """
+        return (
+            not self.missing
+            and not self.extra
+            and not self.mismatched
+            and not self.unreadable
+        )
+
+
+def _load_file_buffer(full_name: Union[str, PurePath]) -> Optional[Union[bytes, mmap]]:
+    """
+    Internal helper: reads a whole file into a single buffer, or memory-maps it, if it's
+    a local file of at least `HASH_MMAP_THRESHOLD` bytes. Returns `None` and logs an error
+    on failure.
+    """
+    if is_s3_path(full_name):
+        return load_file_bytes_helper(full_name)
+
+    try:
+        with open(full_name, "rb") as f:
+            num_bytes = fstat(f.fileno()).st_size
+            if num_bytes >= HASH_MMAP_THRESHOLD:
+                # The mapping stays valid after the file is closed.
+                return mmap(f.fileno(), 0, access=ACCESS_READ)
+            return f.read()
+    except OSError as e:
+        log_error(f"Error reading file ({full_name}): {e}")
+        return None
+
+
+def sha256_hash_file(file_name: Union[str, PurePath]) -> Optional[FileInfo]:
+    """
+    Computes the SHA256 hash and length of a file without loading it into memory all at once.
+    Large local files are memory-mapped, while smaller files, and anything not on the local
+    filesystem, are read in large chunks. Returns `None` if the file can't be read.
+    """
+    try:
+        return _sha256_hash_file(file_name)
+    except OSError as e:
+        log_error(f"Error reading file ({file_name}): {e}")
+        return None
+
+
+def _sha256_hash_file(file_name: Union[str, PurePath]) -> FileInfo:
+    """
+    Internal helper: does the work of `sha256_hash_file`, but raises `OSError` if the file
+    can't be read (`FileNotFoundError` if it isn't there).
+    """
+    h = sha256()
+    if is_s3_path(file_name):
+        num_bytes = 0
+        for chunk in storage_read_chunks(file_name):
+            h.update(chunk)
+            num_bytes += len(chunk)
+        return FileInfo(b64encode(h.digest()).decode("utf-8"), num_bytes)
+
+    with open(file_name, "rb") as f:
+        num_bytes = fstat(f.fileno()).st_size
+        if num_bytes >= HASH_MMAP_THRESHOLD:
+            with mmap(f.fileno(), 0, access=ACCESS_READ) as m:
+                h.update(m)
+        else:
+            buffer = bytearray(HASH_READ_BUFFER_SIZE)
+            view = memoryview(buffer)
+            num_bytes = 0
+            while True:
+                n = f.readinto(buffer)
+                if not n:
+                    break
+                h.update(view[:n])
+                num_bytes += n
+
+    return FileInfo(b64encode(h.digest()).decode("utf-8"), num_bytes)
+
+
+def _file_info_to_dict(file_info: FileInfo) -> Dict[str, Any]:
+    """
+    Internal helper: converts a `FileInfo` to a dict, suitable for `json.dumps`, leaving
+    out the optional fields that aren't present.
+    """
+    result: Dict[str, Any] = {"hash": file_info.hash, "num_bytes": file_info.num_bytes}
+    if file_info.container is not None:
+        result["container"] = file_info.container
+        result["offset"] = file_info.offset
+    if file_info.codec is not None:
+        result["codec"] = file_info.codec
+    return result
+
+
+def encode_manifest_json(
+    header: Dict[str, Any], hashes: Mapping[str, FileInfo]
+) -> Iterator[bytes]:
+    """
+    Encodes a manifest, or manifest shard, as JSON, yielding it in chunks so the whole thing
+    never needs to be in memory at once. The `header` has every field except the `hashes`.
+    The header goes on the first line, followed by the entries, sorted by name, one per line,
+    so `read_manifest_json` can decode the entries without a streaming JSON parser. The result
+    is still ordinary JSON.
+    """
+    header_json = json.dumps(header, sort_keys=True)
+    separator = ", " if header else ""
+    yield (header_json[0:-1] + separator).encode(
+        "utf-8"
+    ) + MANIFEST_HASHES_OPENING + b"\n"
+
+    names = sorted(hashes.keys())
+    for start in range(0, len(names), MANIFEST_ENTRIES_PER_CHUNK):
+        end = start + MANIFEST_ENTRIES_PER_CHUNK
+        lines = ",\n".join(
+            json.dumps(name) + ": " + json.dumps(_file_info_to_dict(hashes[name]))
+            for name in names[start:end]
+        )
+        yield (lines + ("\n" if end >= len(names) else ",\n")).encode("utf-8")
+
+    yield b"}}\n"
+
+
+def write_manifest_json(
+    full_name: Union[str, PurePath],
+    header: Dict[str, Any],
+    hashes: Mapping[str, FileInfo],
+    num_retries: int = 1,
+) -> Optional[FileInfo]:
+    """
+    Writes a manifest, or manifest shard, with `encode_manifest_json`, hashing it as it's
+    written. Returns its hash and length, or `None` if the write failed.
+    """
+    file_infos: List[FileInfo] = []
+
+    def chunks() -> Iterator[bytes]:
+        h = sha256()
+        num_bytes = 0
+        for chunk in encode_manifest_json(header, hashes):
+            h.update(chunk)
+            num_bytes += len(chunk)
+            yield chunk
+        file_infos.append(FileInfo(b64encode(h.digest()).decode("utf-8"), num_bytes))
+
+    if not write_chunks_with_retries(
+        full_name, chunks, num_attempts=num_retries, initial_delay=1
+    ):
+        return None
+    return file_infos[-1]
+
+
+def read_manifest_json(
+    full_name: Union[str, PurePath], class_handle: Type[S]
+) -> Optional[Tuple[str, S]]:
+    """
+    Reads a manifest, or manifest shard, returning the SHA256 hash of the file along with its
+    contents, decoded as the given class. The file is read in buffered chunks, hashing and
+    decoding the entries in the same pass, so there's never more than one chunk of the file
+    in memory. Files that weren't written by `write_manifest_json` are decoded all at once.
+    Returns `None`, and logs an error, if anything goes wrong.
+    """
+    h = sha256()
+    header: Optional[Dict[str, Any]] = None
+    hashes = FileInfoTable()
+    closed = False
+    legacy_chunks: Optional[List[bytes]] = None
+    remainder = b""
+
+    try:
+        for chunk in storage_read_chunks(full_name):
+            h.update(chunk)
+            if legacy_chunks is not None:
+                legacy_chunks.append(chunk)
+                continue
+
+            lines = (remainder + chunk).split(b"\n")
+            remainder = lines.pop()
+            if header is None:
+                # the first line is short, so it's always in the first chunk
+                if not lines or not lines[0].endswith(MANIFEST_HASHES_OPENING):
+                    legacy_chunks = [b"\n".join(lines + [remainder])]
+                    continue
+                header = json.loads(lines[0] + b"}}")
+                del header["hashes"]
+                lines = lines[1:]
+
+            entry_lines: List[bytes] = []
+            for line in lines:
+                if closed:
+                    if line:
+                        raise ValueError("unexpected content after the end")
+                elif line == b"}}":
+                    closed = True
+                else:
+                    entry_lines.append(line.rstrip(b","))
+
+            # one call to the JSON decoder for every chunk, rather than every line
+            if entry_lines:
+                entries = json.loads(b"{" + b",".join(entry_lines) + b"}")
+                for name, entry in entries.items():
+                    hashes[name] = FileInfo(**entry)
+    except OSError as e:
+        log_error(f"Error reading file ({full_name}): {e}")
+        return None
+    except (ValueError, TypeError) as e:
+        log_error(f"Error decoding manifest ({full_name}): {e}")
+        return None
+
+    data_hash = b64encode(h.digest()).decode("utf-8")
+
+    if header is None or legacy_chunks is not None:
+        try:
+            json_str = b"".join(legacy_chunks or [remainder]).decode("utf-8")
+        except UnicodeDecodeError as e:
+            log_error(f"Manifest ({full_name}) isn't valid UTF-8: {e}")
             return None
+        legacy: Optional[S] = decode_json_file_contents(json_str, class_handle)
+        return None if legacy is None else (data_hash, legacy)
+
+    if not closed or remainder:
+        log_error(f"Manifest ({full_name}) is truncated or has extra content")
+        return None
+
+    try:
+        return data_hash, class_handle(hashes=hashes, **header)  # type: ignore
+    except TypeError as e:
+        log_error(f"Error decoding manifest ({full_name}): {e}")
+        return None
+
+
+def verify_manifest_hashes(
+    root_dir: str,
+    expected_root_hash: Optional[str] = None,
+    num_threads: int = NUM_HASH_THREADS,
+    check_extra_files: bool = True,
+) -> Optional[HashVerificationResults]:
+    """
+    Checks every file in the manifest against its hash and length, without decoding or
+    checking any cryptography. Files are hashed in parallel, using a pool of threads. If
+    `check_extra_files` is true (the default), the directory is also searched for files
+    that aren't in the manifest. Returns `None` if the manifest, itself, can't be loaded
+    or doesn't match the `expected_root_hash`.
+    """
+    manifest = make_existing_manifest(root_dir, expected_root_hash)
+    if manifest is None or not manifest.load_all_shards():
+        return None
+
+    names = sorted(manifest.hashes.keys())
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        file_infos = list(
+            executor.map(lambda name: _try_hash_manifest_entry(manifest, name), names)
+        )
+
+    missing: List[str] = []
+    unreadable: List[str] = []
+    mismatched: List[str] = []
+    for name, (file_info, error) in zip(names, file_infos):
+        if isinstance(error, FileNotFoundError):
+            missing.append(name)
+        elif error is not None:
+            log_error(f"Error reading file {name}: {error}")
+            unreadable.append(name)
+        elif file_info != manifest.hashes[name]:
+            log_error(
+                f"File {name} did not match the manifest (expected: {manifest.hashes[name]}, actual: {file_info})"
+            )
+            mismatched.append(name)
+
+    extra: List[str] = []
+    if check_extra_files:
+        # bundles of staged files (see `Manifest.relocate_staged_files`) are only in the
+        # manifest as the containers of their records
+        expected_names = set(names) | {
+            file_info.container
+            for file_info in manifest.hashes.values()
+            if file_info.container is not None
+        }
+        for path in all_files_in_directory(root_dir):
+            if path.name in FILES_NOT_IN_MANIFEST:
+                continue
+            name = path_to_manifest_name(root_dir, path)
+            if name.startswith(MANIFEST_SHARDS_DIR + "|"):
+                # checked against the Merkle root, rather than the manifest
+                continue
+            if name not in expected_names:
+                extra.append(name)
+
+    return HashVerificationResults(
+        len(names), missing, sorted(extra), mismatched, unreadable
+    )
+
+
+def _try_hash_manifest_entry(
+    manifest: Manifest, manifest_name: str
+) -> Tuple[Optional[FileInfo], Optional[OSError]]:
+    """
+    Internal helper: returns the result of `_hash_manifest_entry`, or the error it raised.
+    """
+    try:
+        return _hash_manifest_entry(manifest, manifest_name), None
+    except OSError as e:
+        return None, e
+
 
-    manifest_ex: Optional[ManifestExternal] = decode_json_file_contents(
-        manifest_str, class_handle=ManifestExternal
+def _hash_manifest_entry(manifest: Manifest, manifest_name: str) -> FileInfo:
+    """
+    Internal helper: computes the `FileInfo` for the given manifest entry from what's
+    actually on disk. Records within containers are hashed with a range read. Raises
+    `OSError` if the file can't be read (`FileNotFoundError` if it isn't there).
+    """
+    file_info = manifest.hashes[manifest_name]
+    if file_info.container is None or file_info.offset is None:
+        actual = _sha256_hash_file(
+            manifest_name_to_path(manifest.root_dir, manifest_name)
+        )
+        return FileInfo(actual.hash, actual.num_bytes, codec=file_info.codec)
+
+    # a short read means the container was truncated, which shows up as a mismatched length
+    backend, backend_name = storage_for_path(
+        manifest_name_to_path(manifest.root_dir, file_info.container)
+    )
+    record = backend.read_range(backend_name, file_info.offset, file_info.num_bytes)
+    return FileInfo(
+        sha256_hash(record),
+        len(record),
+        file_info.container,
+        file_info.offset,
+        file_info.codec,
     )
-    return flatmap_optional(manifest_ex, lambda m: m.to_manifest(root_dir))
 
 
-def sha256_hash(input: AnyStr) -> str:
+def sha256_hash(input: Union[str, bytes, mmap]) -> str:
     """
     Given a string or array of bytes, returns a base64-encoded representation of the
     256-bit SHA2-256 hash of that input string, first encoding the input string as UTF8.
@@ -436,6 +1774,129 @@ def compose_manifest_name(file_name: str, subdirectories: List[str] = None) -> s
     return "|".join(dirs)
 
 
+def ballot_manifest_name(ballot_id: str) -> str:
+    """
+    Helper function: given a ballot identifier, returns the name of the ballot's file, as it
+    would appear in MANIFEST.json.
+    """
+    ballot_name_prefix = ballot_id[0:BALLOT_FILENAME_PREFIX_DIGITS]
+    return compose_manifest_name(ballot_id + ".json", ["ballots", ballot_name_prefix])
+
+
+def subtotal_manifest_name(prefix: str) -> str:
+    """
+    Helper function: given a ballot-id prefix, returns the name of the file holding that
+    prefix's published subtotal, as it would appear in MANIFEST.json.
+    """
+    return compose_manifest_name(prefix + ".json", [SUBTOTALS_DIR])
+
+
+def manifest_name_to_prefix(manifest_name: str) -> Optional[str]:
+    """
+    Helper function: given the name of a file, as it would appear in MANIFEST.json, returns
+    the ballot-id prefix it belongs to, if it's a ballot or a subtotal, otherwise `None`.
+    """
+    elems = manifest_name.split("|")
+    if len(elems) == 3 and elems[0] == "ballots":
+        return elems[1]
+    elif len(elems) == 2 and elems[0] == SUBTOTALS_DIR and elems[1].endswith(".json"):
+        return elems[1][0 : -len(".json")]
+    else:
+        return None
+
+
+def manifest_name_to_shard(manifest_name: str) -> Optional[str]:
+    """
+    Helper function: given the name of a file, as it would appear in MANIFEST.json, returns
+    the ballot-id prefix of the manifest shard it belongs to, if it's in a ballot directory
+    or a per-prefix column directory, otherwise `None`.
+    """
+    elems = manifest_name.split("|")
+    if len(elems) == 3 and elems[0] in ("ballots", COLUMNS_DIR):
+        return elems[1]
+    else:
+        return None
+
+
+def merkle_leaf_hash(prefix: str, shard_hash: str) -> str:
+    """
+    Computes the Merkle tree leaf for a manifest shard, given its prefix and the `sha256_hash`
+    of the shard file. Leaves and interior nodes are hashed with distinct leading bytes, so
+    neither can be passed off as the other.
+    """
+    return sha256_hash("\x00" + prefix + "|" + shard_hash)
+
+
+def merkle_node_hash(left: str, right: str) -> str:
+    """
+    Computes an interior node of the Merkle tree, given its two children.
+    """
+    return sha256_hash("\x01" + left + "|" + right)
+
+
+def merkle_tree_levels(leaves: List[str]) -> List[List[str]]:
+    """
+    Computes every level of a Merkle tree, starting with the leaves and ending with a list
+    containing only the root. At each level, the nodes are hashed together in pairs, and
+    a node left over at the end is carried up to the next level unchanged. The leaves
+    must not be empty.
+    """
+    levels = [leaves]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        levels.append(
+            [
+                merkle_node_hash(level[i], level[i + 1])
+                if i + 1 < len(level)
+                else level[i]
+                for i in range(0, len(level), 2)
+            ]
+        )
+    return levels
+
+
+def merkle_proof(levels: List[List[str]], index: int) -> List[str]:
+    """
+    Given the levels of a Merkle tree (see `merkle_tree_levels`) and the index of a leaf,
+    returns the sibling hashes needed to recompute the root from that leaf.
+    """
+    siblings: List[str] = []
+    for level in levels[0:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            siblings.append(level[sibling])
+        index //= 2
+    return siblings
+
+
+def verify_merkle_proof(
+    leaf: str, index: int, num_leaves: int, siblings: List[str], root: str
+) -> bool:
+    """
+    Checks that the given leaf, at the given index, is in a Merkle tree with `num_leaves`
+    leaves and the given root, using the sibling hashes from `merkle_proof`.
+    """
+    if index < 0 or index >= num_leaves:
+        return False
+
+    node = leaf
+    level_size = num_leaves
+    remaining = list(siblings)
+    while level_size > 1:
+        if index % 2 == 1:
+            if not remaining:
+                return False
+            node = merkle_node_hash(remaining.pop(0), node)
+        elif index + 1 < level_size:
+            if not remaining:
+                return False
+            node = merkle_node_hash(node, remaining.pop(0))
+        index //= 2
+        level_size = (level_size + 1) // 2
+
+    return not remaining and node == root
+
+
 def manifest_name_to_filename(manifest_name: str) -> PurePath:
     """
     Helper function: given the name of a file, as it would appear in a MANIFEST.json
@@ -445,6 +1906,15 @@ def manifest_name_to_filename(manifest_name: str) -> PurePath:
     return compose_filename(manifest_name, subdirs[-1], subdirs[0:-1])
 
 
+def manifest_name_to_path(root_dir: str, manifest_name: str) -> PurePath:
+    """
+    Helper function: given the root directory and the name of a file, as it would appear
+    in MANIFEST.json, get the local filesystem path to that file.
+    """
+    elems = manifest_name.split("|")
+    return compose_filename(root_dir, elems[-1], elems[0:-1])
+
+
 def path_to_manifest_name(root_dir: str, path: PurePath) -> str:
     """
     Helper function: given the name of a file (or a Path to that file), return the name as
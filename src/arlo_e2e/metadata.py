@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Dict, Set, List
+from typing import Dict, Set, List, Mapping
 
 from electionguard.serializable import Serializable
 
@@ -86,10 +86,12 @@ class ElectionMetadata(Serializable):
     values are the different object id's used in ElectionGuard for those ballot styles.
     """
 
-    ballot_id_to_ballot_type: Dict[str, str]
+    ballot_id_to_ballot_type: Mapping[str, str]
     """
     Keys are the ballot id numbers, corresponding to their file names on disk (and their ElectionGuard
     object ids). Values are the ballot types (as provided by the election administrator).
+    When a tally is published, this is written separately, and loaded lazily, as a `BallotTypeMap`
+    (see `arlo_e2e.ballot_types`), so `election_metadata.json` has only an empty placeholder.
     """
 
     all_parties: Set[str]
@@ -1,10 +1,21 @@
 import csv
+from dataclasses import replace
 from io import StringIO
 from multiprocessing.pool import Pool
-from os import path
-from typing import Final, Optional, TypeVar, Tuple
+from typing import (
+    Final,
+    Optional,
+    TypeVar,
+    Tuple,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Sequence,
+)
 
 import pandas as pd
+from electionguard.ballot import CiphertextAcceptedBallot
 from electionguard.election import (
     ElectionConstants,
     ElectionDescription,
@@ -12,22 +23,41 @@ from electionguard.election import (
 )
 from electionguard.logs import log_error, log_info
 from electionguard.serializable import set_deserializers, Serializable, set_serializers
+from electionguard.utils import flatmap_optional
 
+from arlo_e2e.ballot_types import (
+    BallotTypeMap,
+    check_ballot_types_index,
+    has_ballot_types,
+    write_ballot_types,
+)
+from arlo_e2e.columnar import (
+    column_segments_in_manifest,
+    write_ciphertext_columns,
+    write_columnar_index,
+)
+from arlo_e2e.cvr_columns import has_cvr_columns, load_cvr_columns, write_cvr_columns
 from arlo_e2e.eg_helpers import log_and_print
 from arlo_e2e.html_index import generate_index_html_files
 from arlo_e2e.manifest import (
     make_fresh_manifest,
     make_existing_manifest,
+    manifest_name_to_prefix,
     Manifest,
+    SUBTOTALS_DIR,
 )
 from arlo_e2e.metadata import ElectionMetadata
 from arlo_e2e.ray_tally import RayTallyEverythingResults, NUM_WRITE_RETRIES
+from arlo_e2e.ray_write_retry import wait_for_zero_pending_writes
+from arlo_e2e.segment_tree import build_segment_tree, write_segment_tree
 from arlo_e2e.tally import (
     FastTallyEverythingResults,
     SelectionTally,
+    PrefixSubtotal,
+    GroupSubtotals,
     ballot_memos_from_metadata,
 )
-from arlo_e2e.utils import mkdir_helper
+from arlo_e2e.utils import mkdir_helper, directory_exists_helper
 
 T = TypeVar("T")
 U = TypeVar("U", bound=Serializable)
@@ -38,6 +68,7 @@ ELECTION_DESCRIPTION: Final[str] = "election_description.json"
 ENCRYPTED_TALLY: Final[str] = "encrypted_tally.json"
 CRYPTO_CONSTANTS: Final[str] = "constants.json"
 CRYPTO_CONTEXT: Final[str] = "cryptographic_context.json"
+GROUP_SUBTOTALS_DIR: Final[str] = "group_subtotals"
 
 
 def _write_tally_shared(
@@ -48,6 +79,8 @@ def _write_tally_shared(
     tally: SelectionTally,
     metadata: ElectionMetadata,
     cvr_metadata: pd.DataFrame,
+    subtotals: Optional[Dict[str, PrefixSubtotal]],
+    group_subtotals: Optional[Dict[str, GroupSubtotals]],
     num_retries: int = 1,
 ) -> Manifest:
     set_serializers()
@@ -73,24 +106,79 @@ def _write_tally_shared(
     log_info("_write_tally_shared: writing tally")
     manifest.write_json_file(ENCRYPTED_TALLY, tally, num_retries=num_retries)
 
+    # The ballot types of every ballot are most of the metadata, so they're written on
+    # their own, leaving an empty placeholder in the metadata.
     log_info("_write_tally_shared: writing metadata")
-    manifest.write_json_file(ELECTION_METADATA, metadata, num_retries=num_retries)
-
-    log_info("_write_tally_shared: writing cvr metadata")
-    manifest.write_file(
-        CVR_METADATA,
-        cvr_metadata.to_csv(index=False, quoting=csv.QUOTE_NONNUMERIC),
+    manifest.write_json_file(
+        ELECTION_METADATA,
+        replace(metadata, ballot_id_to_ballot_type={}),
         num_retries=num_retries,
     )
+    write_ballot_types(
+        manifest, metadata.ballot_id_to_ballot_type, num_retries=num_retries
+    )
+
+    log_info("_write_tally_shared: writing cvr metadata")
+    cvr_metadata_csv = cvr_metadata.to_csv(index=False, quoting=csv.QUOTE_NONNUMERIC)
+    manifest.write_file(CVR_METADATA, cvr_metadata_csv, num_retries=num_retries)
+
+    # The columns are made from the CSV, just as it'll be parsed by older loaders, so
+    # everybody gets exactly the same metadata, whichever they load.
+    log_info("_write_tally_shared: writing cvr metadata columns")
+    parsed_cvr_metadata = _parse_cvr_metadata(cvr_metadata_csv)
+    if parsed_cvr_metadata is not None:
+        write_cvr_columns(manifest, parsed_cvr_metadata, num_retries=num_retries)
+
+    if subtotals is not None:
+        log_info("_write_tally_shared: writing subtotals")
+        for prefix in sorted(subtotals.keys()):
+            manifest.write_json_file(
+                prefix + ".json",
+                subtotals[prefix],
+                [SUBTOTALS_DIR],
+                num_retries=num_retries,
+            )
+
+    if group_subtotals is not None:
+        log_info("_write_tally_shared: writing group subtotals")
+        for column in sorted(group_subtotals.keys()):
+            manifest.write_json_file(
+                column + ".json",
+                group_subtotals[column],
+                [GROUP_SUBTOTALS_DIR],
+                num_retries=num_retries,
+            )
 
     return manifest
 
 
-def write_fast_tally(results: FastTallyEverythingResults, results_dir: str) -> Manifest:
+def _parse_cvr_metadata(cvr_metadata_csv: str) -> Optional[pd.DataFrame]:
+    try:
+        return pd.read_csv(
+            StringIO(cvr_metadata_csv),
+            sep=",",
+            engine="python",
+        )
+    except pd.errors.ParserError:
+        return None
+
+
+def write_fast_tally(
+    results: FastTallyEverythingResults,
+    results_dir: str,
+    codec: Optional[str] = None,
+    columnar: bool = False,
+    segment_tree: bool = False,
+    pool: Optional[Pool] = None,
+) -> Manifest:
     """
-    Writes out a directory with the full contents of the tally structure. Each ciphertext ballot
-    will end up in its own file. Everything is JSON. Returns a `Manifest` object that reflects
-    everything that was written.
+    Writes out a directory with the full contents of the tally structure. The ciphertext ballots
+    are packed into one container file per ballot-id prefix (see `Manifest.write_ciphertext_ballots`),
+    and optionally compressed with the given `codec` (see `arlo_e2e.compression`).
+    Everything is JSON. If `columnar` is true, the ciphertexts are also written out in columnar
+    form (see `arlo_e2e.columnar`). If `segment_tree` is true, a segment tree of partial tallies
+    is also written out (see `arlo_e2e.segment_tree`), using the optional `pool` to compute it.
+    Returns a `Manifest` object that reflects everything that was written.
     """
     manifest = _write_tally_shared(
         results_dir,
@@ -100,16 +188,30 @@ def write_fast_tally(results: FastTallyEverythingResults, results_dir: str) -> M
         results.tally,
         results.metadata,
         results.cvr_metadata,
+        results.subtotals,
+        results.group_subtotals,
     )
 
     log_info("write_fast_tally: writing ballots")
 
-    for ballot in results.encrypted_ballots:
-        manifest.write_ciphertext_ballot(ballot)
+    manifest.write_ciphertext_ballots(results.encrypted_ballots, codec=codec)
+
+    if columnar:
+        log_info("write_fast_tally: writing ciphertext columns")
+        write_ciphertext_columns(manifest, results.encrypted_ballots)
+
+    if segment_tree:
+        log_info("write_fast_tally: writing segment tree")
+        tree = build_segment_tree(results, pool)
+        if tree is None:
+            raise RuntimeError("Failed to build the segment tree")
+        write_segment_tree(tree, manifest)
 
     log_info("write_fast_tally: writing MANIFEST.json")
     manifest.write_manifest()
-    generate_index_html_files(results.metadata.election_name, results_dir)
+    generate_index_html_files(
+        results.metadata.election_name, results_dir, manifest=manifest
+    )
 
     return manifest
 
@@ -117,11 +219,20 @@ def write_fast_tally(results: FastTallyEverythingResults, results_dir: str) -> M
 def write_ray_tally(
     results: RayTallyEverythingResults,
     results_dir: str,
+    columnar: bool = False,
+    segment_tree: bool = False,
+    pool: Optional[Pool] = None,
 ) -> Manifest:
     """
     Writes out a directory with the full contents of the tally structure. Basically everything
     except for the ballots themselves. Everything is JSON. Returns a `Manifest` object that reflects
-    everything that was written.
+    everything that was written. If `columnar` is true, the ciphertexts are also written out in
+    columnar form (see `arlo_e2e.columnar`). If the columns were already written along with the
+    ballots (see `ray_tally_everything`), only their index is written here; otherwise, every
+    ballot is read back in, one at a time, and the columns are written one segment at a time.
+    If `segment_tree` is true, a segment tree of partial tallies is also written out
+    (see `arlo_e2e.segment_tree`), which also requires reading every ballot back in, using the
+    optional `pool` for parallelism.
 
     If any ballots have been previously written out, perhaps using the Ray tally, the `prior_manifest`
     is merged into the final manifest that's returned.
@@ -135,6 +246,8 @@ def write_ray_tally(
         results.tally,
         results.metadata,
         results.cvr_metadata,
+        results.subtotals,
+        results.group_subtotals,
         num_retries=NUM_WRITE_RETRIES,
     )
 
@@ -147,17 +260,70 @@ def write_ray_tally(
 
     # ballots were written during the encryption process, so we don't write them here
 
+    if columnar or segment_tree:
+        # the ballots have to be on storage before we can read them back in
+        wait_for_zero_pending_writes()
+
+    if columnar:
+        segments = column_segments_in_manifest(manifest)
+        if segments:
+            log_and_print("Writing ciphertext column index to storage.")
+            write_columnar_index(
+                manifest,
+                [str(bid) for bid in results.cvr_metadata["BallotId"]],
+                [
+                    s.object_id
+                    for selections in results.metadata.contest_map.values()
+                    for s in selections
+                ],
+                segments,
+                num_retries=NUM_WRITE_RETRIES,
+            )
+        else:
+            log_and_print("Writing ciphertext columns to storage.")
+            write_ciphertext_columns(
+                manifest,
+                _load_ballots_or_fail(
+                    manifest, results.metadata.ballot_id_to_ballot_type.keys()
+                ),
+                num_retries=NUM_WRITE_RETRIES,
+            )
+
+    if segment_tree:
+        log_and_print("Writing segment tree to storage.")
+        tree = build_segment_tree(results.to_fast_tally(), pool)
+        if tree is None:
+            raise RuntimeError("Failed to build the segment tree")
+        write_segment_tree(tree, manifest, num_retries=NUM_WRITE_RETRIES)
+
     log_and_print("Writing manifest to storage.")
     manifest.write_manifest(num_retries=NUM_WRITE_RETRIES)
     generate_index_html_files(
-        results.metadata.election_name, results_dir, num_retries=NUM_WRITE_RETRIES
+        results.metadata.election_name,
+        results_dir,
+        num_retries=NUM_WRITE_RETRIES,
+        manifest=manifest,
     )
 
     return manifest
 
 
+def _load_ballots_or_fail(
+    manifest: Manifest, ballot_ids: Iterable[str]
+) -> Iterator[CiphertextAcceptedBallot]:
+    """
+    Internal helper: loads each of the given ballots, one at a time, and raises a `RuntimeError`
+    if any of them fails to load, rather than leaving it out of whatever is built from them.
+    """
+    for bid in ballot_ids:
+        ballot = manifest.load_ciphertext_ballot(bid)
+        if ballot is None:
+            raise RuntimeError(f"Failed to load ballot {bid}")
+        yield ballot
+
+
 def _load_tally_shared(
-    results_dir: str, root_hash: Optional[str]
+    results_dir: str, root_hash: Optional[str], cvr_columns: Optional[Sequence[str]]
 ) -> Optional[
     Tuple[
         Manifest,
@@ -166,6 +332,8 @@ def _load_tally_shared(
         SelectionTally,
         ElectionMetadata,
         pd.DataFrame,
+        Optional[Dict[str, PrefixSubtotal]],
+        Optional[Dict[str, GroupSubtotals]],
     ]
 ]:
     # Engineering grumble: if ever there was an argument in favor of monadic error handling
@@ -177,7 +345,7 @@ def _load_tally_shared(
     set_serializers()
     set_deserializers()
 
-    if not path.exists(results_dir):
+    if not directory_exists_helper(results_dir):
         log_error(f"Path ({results_dir}) not found, cannot load the fast-tally")
         return None
 
@@ -220,20 +388,102 @@ def _load_tally_shared(
     if metadata is None:
         return None
 
-    cvr_metadata = manifest.read_file(CVR_METADATA)
-    if cvr_metadata is None:
-        return None
+    # Subtotals are optional, since older tallies don't have them; if any are present,
+    # they all need to load correctly.
+    subtotals: Optional[Dict[str, PrefixSubtotal]] = None
+    for name in sorted(manifest.hashes.keys()):
+        prefix = manifest_name_to_prefix(name)
+        if prefix is None or not name.startswith(SUBTOTALS_DIR + "|"):
+            continue
 
-    try:
-        df = pd.read_csv(
-            StringIO(cvr_metadata),
-            sep=",",
-            engine="python",
+        subtotal: Optional[PrefixSubtotal] = manifest.read_json_file(
+            prefix + ".json", PrefixSubtotal, [SUBTOTALS_DIR]
         )
-    except pd.errors.ParserError:
+        if subtotal is None:
+            return None
+        if subtotals is None:
+            subtotals = {}
+        subtotals[prefix] = subtotal
+
+    # Likewise, group subtotals are optional.
+    group_subtotals: Optional[Dict[str, GroupSubtotals]] = None
+    for name in sorted(manifest.hashes.keys()):
+        elems = name.split("|")
+        if len(elems) != 2 or elems[0] != GROUP_SUBTOTALS_DIR:
+            continue
+
+        column_subtotals: Optional[GroupSubtotals] = manifest.read_json_file(
+            elems[1], GroupSubtotals, [GROUP_SUBTOTALS_DIR]
+        )
+        if column_subtotals is None:
+            return None
+        if group_subtotals is None:
+            group_subtotals = {}
+        group_subtotals[column_subtotals.column] = column_subtotals
+
+    # The group subtotals can only be checked with their columns, and everything needs the
+    # ballot ids, but no other columns are loaded unless they're asked for.
+    wanted_columns: Optional[List[str]] = None
+    if cvr_columns is not None:
+        wanted_columns = list(
+            dict.fromkeys(
+                ["BallotId"]
+                + list(cvr_columns)
+                + (
+                    sorted(group_subtotals.keys())
+                    if group_subtotals is not None
+                    else []
+                )
+            )
+        )
+
+    if has_cvr_columns(manifest):
+        df = load_cvr_columns(manifest, wanted_columns)
+    else:
+        df = flatmap_optional(
+            manifest.read_file(CVR_METADATA),
+            lambda csv_str: _select_cvr_columns(
+                _parse_cvr_metadata(csv_str), wanted_columns
+            ),
+        )
+    if df is None:
         return None
 
-    return manifest, election_description, cec, encrypted_tally, metadata, df
+    # The ballot types are only loaded when they're used, but we can check that they're
+    # for the same ballots, and that nothing is missing or truncated, right away.
+    if has_ballot_types(manifest):
+        if not check_ballot_types_index(manifest, len(df)):
+            return None
+        metadata.ballot_id_to_ballot_type = BallotTypeMap(manifest)
+
+    return (
+        manifest,
+        election_description,
+        cec,
+        encrypted_tally,
+        metadata,
+        df,
+        subtotals,
+        group_subtotals,
+    )
+
+
+def _select_cvr_columns(
+    df: Optional[pd.DataFrame], columns: Optional[List[str]]
+) -> Optional[pd.DataFrame]:
+    """
+    Internal helper: for older tallies, without `cvr_columns/`, narrows the parsed CVR metadata
+    down to the given columns, the same as `load_cvr_columns` would. Returns `None` and logs
+    an error if a column doesn't exist.
+    """
+    if df is None or columns is None:
+        return df
+
+    missing = [c for c in columns if c not in df.columns]
+    if missing:
+        log_error(f"No CVR metadata columns named {missing}")
+        return None
+    return df[columns]
 
 
 def load_ray_tally(
@@ -242,16 +492,18 @@ def load_ray_tally(
     verbose: bool = False,
     recheck_ballots_and_tallies: bool = False,
     root_hash: Optional[str] = None,
+    cvr_columns: Optional[Sequence[str]] = None,
 ) -> Optional[RayTallyEverythingResults]:
     """
     Given the directory name / path-name to a disk representation of a fast-tally structure, this reads
     it back in, makes sure it's well-formed, and optionally checks the cryptographic proofs. If any
     checks fail, `None` is returned. Errors are logged. This is executed across a Ray cluster, resulting
     in significant speedups, as well as having the ballot ciphertexts, themselves, spread across the
-    cluster, for improved concurrency later on.
+    cluster, for improved concurrency later on. If `cvr_columns` is specified, only those columns of
+    the CVR metadata are loaded, along with `BallotId` and any columns needed to check the group subtotals.
     """
 
-    result = _load_tally_shared(results_dir, root_hash)
+    result = _load_tally_shared(results_dir, root_hash, cvr_columns)
     if result is None:
         return None
 
@@ -262,6 +514,8 @@ def load_ray_tally(
         encrypted_tally,
         metadata,
         cvr_metadata,
+        subtotals,
+        group_subtotals,
     ) = result
 
     everything = RayTallyEverythingResults(
@@ -272,6 +526,8 @@ def load_ray_tally(
         cec,
         manifest,
         len(cvr_metadata),
+        subtotals,
+        group_subtotals,
     )
 
     if check_proofs:
@@ -290,15 +546,17 @@ def load_fast_tally(
     verbose: bool = False,
     recheck_ballots_and_tallies: bool = False,
     root_hash: Optional[str] = None,
+    cvr_columns: Optional[Sequence[str]] = None,
 ) -> Optional[FastTallyEverythingResults]:
     """
     Given the directory name / path-name to a disk representation of a fast-tally structure, this reads
     it back in, makes sure it's well-formed, and optionally checks the cryptographic proofs. If any
     checks fail, `None` is returned. Errors are logged. Optional `pool` allows for some parallelism
-    in the verification process.
+    in the verification process. If `cvr_columns` is specified, only those columns of the CVR metadata
+    are loaded, along with `BallotId` and any columns needed to check the group subtotals.
     """
 
-    result = _load_tally_shared(results_dir, root_hash)
+    result = _load_tally_shared(results_dir, root_hash, cvr_columns)
     if result is None:
         return None
 
@@ -309,6 +567,8 @@ def load_fast_tally(
         encrypted_tally,
         metadata,
         cvr_metadata,
+        subtotals,
+        group_subtotals,
     ) = result
 
     ballot_memos = ballot_memos_from_metadata(cvr_metadata, manifest)
@@ -320,6 +580,9 @@ def load_fast_tally(
         ballot_memos,
         encrypted_tally,
         cec,
+        manifest,
+        subtotals,
+        group_subtotals,
     )
 
     if check_proofs:
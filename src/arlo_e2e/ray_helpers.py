@@ -5,6 +5,7 @@ from time import sleep
 from arlo_e2e.ray_write_retry import (
     set_failure_probability_for_testing,
     init_status_actor,
+    init_retry_actors,
 )
 
 _ray_is_local = True
@@ -48,6 +49,7 @@ def ray_post_init(write_failure_probability: float = 0.0) -> None:
     the things that arlo-e2e cares about, call this method instead.
     """
     init_status_actor()
+    init_retry_actors()
     set_failure_probability_for_testing(write_failure_probability)
 
 
@@ -0,0 +1,325 @@
+# Node-local staging: rather than every worker writing its files straight to shared storage,
+# they can write to local scratch disk, which is fast and reliable, and then hand the files off
+# to an uploader on the same node. The uploader concatenates the staged files for each
+# directory into large bundles, and uploads a few bundles at a time, each as one object (in
+# parts, on S3). Every staged file is copied into its bundle byte-for-byte, so the manifest
+# entries, computed as they're staged, still describe exactly what's published, once they're
+# pointed at the bundles (see `Manifest.relocate_staged_files`).
+
+from asyncio import Event, Task, get_event_loop
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from os import path, remove
+from pathlib import PurePath
+from tempfile import gettempdir
+from typing import Dict, Final, List, NamedTuple, Optional, Set, Tuple, Iterator
+
+import ray
+
+from arlo_e2e.eg_helpers import log_and_print
+from arlo_e2e.ray_write_retry import (
+    get_node_actor,
+    get_node_actors_of_class,
+    get_status_actor,
+    write_chunks_with_retries,
+)
+from arlo_e2e.storage import storage_for_path, storage_read_chunks
+
+STAGING_DIR_NAME: Final[str] = "arlo_e2e_staging"
+"""
+Subdirectory of the local temporary directory where files are staged.
+"""
+
+UPLOAD_BATCH_FILES: Final[int] = 10000
+"""
+Most staged files taken off an uploader's queue, to be bundled and uploaded, at once.
+"""
+
+UPLOAD_BUNDLE_BYTES: Final[int] = 64 * 1024 * 1024
+"""
+Staged files for the same directory are concatenated into bundles of up to this many bytes,
+each uploaded as one object. A bigger file gets a bundle to itself.
+"""
+
+UPLOAD_CONCURRENCY: Final[int] = 4
+"""
+Most bundles uploaded at the same time by each node's uploader.
+"""
+
+BUNDLE_SUFFIX: Final[str] = ".bundle"
+"""
+A bundle is published under the name of its first file, plus this suffix.
+"""
+
+NUM_UPLOAD_ATTEMPTS: Final[int] = 10
+"""
+How many attempts to make uploading each staged file.
+"""
+
+StagedFile = Tuple[str, str]
+"""
+A staged file: the name of the local copy, and the name it's published under.
+"""
+
+
+class StagedBundle(NamedTuple):
+    """
+    Staged files that were uploaded together, as one object.
+    """
+
+    published_name: str
+    """
+    The name the bundle is published under.
+    """
+
+    num_bytes: int
+    """
+    Length of the bundle in bytes.
+    """
+
+    members: List[Tuple[str, int]]
+    """
+    The name each staged file would have been published under, and its offset in the bundle.
+    """
+
+
+def staging_dir_for(root_dir: str) -> str:
+    """
+    Returns the local staging directory for files that will be published in `root_dir`.
+    Every node uses the same name, and different tally directories get different ones.
+    """
+    return path.join(
+        gettempdir(),
+        STAGING_DIR_NAME,
+        sha256(root_dir.encode("utf-8")).hexdigest()[0:16],
+    )
+
+
+def bundle_staged_files(
+    staged_files: List[StagedFile], max_bytes: int = UPLOAD_BUNDLE_BYTES
+) -> List[List[StagedFile]]:
+    """
+    Groups the staged files by the directory they're published in, keeping them in order,
+    and splits each group into bundles of up to `max_bytes`. Staged files that can't be
+    found count as empty, and fail when they're uploaded.
+    """
+    by_directory: Dict[str, List[StagedFile]] = {}
+    for staged_file in staged_files:
+        by_directory.setdefault(path.dirname(staged_file[1]), []).append(staged_file)
+
+    bundles: List[List[StagedFile]] = []
+    for directory_files in by_directory.values():
+        bundle: List[StagedFile] = []
+        bundle_bytes = 0
+        for staged_file in directory_files:
+            num_bytes = (
+                path.getsize(staged_file[0]) if path.exists(staged_file[0]) else 0
+            )
+            if bundle and bundle_bytes + num_bytes > max_bytes:
+                bundles.append(bundle)
+                bundle = []
+                bundle_bytes = 0
+            bundle.append(staged_file)
+            bundle_bytes += num_bytes
+        if bundle:
+            bundles.append(bundle)
+    return bundles
+
+
+def _upload_bundle(
+    bundle: List[StagedFile], num_attempts: int
+) -> Tuple[int, Optional[StagedBundle]]:
+    """
+    Internal helper: uploads the staged files, as one object, deleting the local copies
+    afterward. A single file is uploaded under its own name, as-is. Returns the number of
+    files that couldn't be uploaded, which are left where they are, and a description of the
+    bundle, if there was more than one file and they were uploaded.
+    """
+    published_name = bundle[0][1] if len(bundle) == 1 else bundle[0][1] + BUNDLE_SUFFIX
+
+    members: List[Tuple[str, int]] = []
+    try:
+        offset = 0
+        for member_staged_name, member_published_name in bundle:
+            members.append((member_published_name, offset))
+            offset += path.getsize(member_staged_name)
+    except OSError as e:
+        log_and_print(f"failed to bundle staged files for {published_name}: {str(e)}")
+        return len(bundle), None
+
+    def chunks() -> Iterator[bytes]:
+        for name, _ in bundle:
+            for chunk in storage_read_chunks(name):
+                yield chunk
+
+    if not write_chunks_with_retries(
+        published_name, chunks, num_attempts=num_attempts, initial_delay=1
+    ):
+        return len(bundle), None
+
+    for name, _ in bundle:
+        remove(name)
+    return 0, (
+        StagedBundle(published_name, offset, members) if len(bundle) > 1 else None
+    )
+
+
+def upload_staged_files(
+    staged_files: List[StagedFile], num_attempts: int
+) -> Tuple[int, List[StagedBundle]]:
+    """
+    Uploads the given staged files, bundled together by directory (see
+    `bundle_staged_files`), with up to `UPLOAD_CONCURRENCY` bundles uploaded at a time,
+    deleting the local copies once they're uploaded. Returns the number of files that
+    couldn't be uploaded, which are left where they are, along with the bundles, so
+    the manifest entries for the files can be pointed at them.
+    """
+    bundles = bundle_staged_files(staged_files)
+
+    made_dirs: Set[str] = set()
+    for bundle in bundles:
+        directory = path.dirname(bundle[0][1])
+        if directory and directory not in made_dirs:
+            backend, backend_name = storage_for_path(directory)
+            try:
+                backend.make_dirs(backend_name)
+                made_dirs.add(directory)
+            except OSError as e:
+                log_and_print(f"failed to make directory {directory}: {str(e)}")
+
+    with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY) as executor:
+        results = list(executor.map(lambda b: _upload_bundle(b, num_attempts), bundles))
+
+    num_failures = sum(r[0] for r in results)
+    uploaded = [r[1] for r in results if r[1] is not None]
+    return num_failures, uploaded
+
+
+def _published_in(root_dir: str, published_name: str) -> bool:
+    # Python 3.9 has PurePath.is_relative_to, but we're coding for 3.8.x
+    try:
+        PurePath(published_name).relative_to(root_dir)
+        return True
+    except ValueError:
+        return False
+
+
+@ray.remote(num_cpus=0)
+class StagedUploadActor:  # pragma: no cover
+    """
+    Owns the queue of staged files on one node, and uploads them in batches, one batch at
+    a time, with the files in each batch bundled together (see `upload_staged_files`). The
+    uploads run in threads, so this doesn't use any worker CPUs. Like `WriteRetryActor`, it
+    keeps its own counts of pending and failed uploads, and `wait_for_zero_pending_writes`
+    waits for it. It keeps the bundles, too, until `take_staged_bundles` collects them.
+
+    Handing off files is fire-and-forget, so the files are counted as pending writes on the
+    `WriteRetryStatusActor` while they're on their way here (see `hand_off_staged_files`),
+    and once they've been added to this actor's own counts, they're reported as finished there.
+
+    Don't construct this directly. Instead, use `get_node_actor(StagedUploadActor)`.
+    """
+
+    num_failures: int
+    num_pending: int
+    queue: List[StagedFile]
+    bundles: List[StagedBundle]
+    idle: Event
+    task: Optional[Task]
+
+    def __init__(self) -> None:
+        self.num_failures = 0
+        self.num_pending = 0
+        self.queue = []
+        self.bundles = []
+        self.idle = Event()
+        self.idle.set()
+        self.task = None
+
+    async def upload(self, staged_files: List[StagedFile]) -> None:
+        """
+        Adds staged files to the queue. Returns immediately.
+        """
+        self.queue.extend(staged_files)
+        self.num_pending += len(staged_files)
+        if self.num_pending > 0:
+            self.idle.clear()
+        if self.task is None:
+            self.task = get_event_loop().create_task(self._upload_all())
+
+        # they're counted here now, so they're no longer pending on the status actor
+        get_status_actor().update_counts.remote(0, len(staged_files), 0)
+
+    async def _upload_all(self) -> None:
+        while self.queue:
+            batch = self.queue[0:UPLOAD_BATCH_FILES]
+            del self.queue[0:UPLOAD_BATCH_FILES]
+            num_failures, bundles = await get_event_loop().run_in_executor(
+                None, upload_staged_files, batch, NUM_UPLOAD_ATTEMPTS
+            )
+            self.num_failures += num_failures
+            self.bundles.extend(bundles)
+            self.num_pending -= len(batch)
+
+        self.task = None
+        self.idle.set()
+
+    async def take_bundles(self, root_dir: str) -> List[StagedBundle]:
+        """
+        Returns the bundles published in `root_dir`, and forgets about them.
+        """
+        taken = [b for b in self.bundles if _published_in(root_dir, b.published_name)]
+        self.bundles = [
+            b for b in self.bundles if not _published_in(root_dir, b.published_name)
+        ]
+        return taken
+
+    async def get_counts(self) -> Tuple[int, int]:
+        """
+        Returns the number of pending uploads and the number of failed uploads.
+        """
+        return self.num_pending, self.num_failures
+
+    async def wait_for_zero_pending(self) -> int:
+        """
+        Blocking call: waits until there are no more pending uploads. Returns the
+        total number of failures.
+        """
+        await self.idle.wait()
+        return self.num_failures
+
+
+def hand_off_staged_files(staged_files: List[StagedFile]) -> List[StagedBundle]:
+    """
+    Hands off staged files to be uploaded. With Ray, this goes to the uploader on this
+    node, and returns immediately, but the files are first counted as pending writes on
+    the `WriteRetryStatusActor`, the same way `WriteBehindQueue.report_counts` does it, so
+    `wait_for_zero_pending_writes` can't miss them while they're on their way to the uploader.
+    The bundles they end up in are collected later, with `take_staged_bundles`, so this
+    returns an empty list. Without Ray, the files are uploaded before this returns, and
+    this returns their bundles.
+    """
+    if not staged_files:
+        return []
+
+    if ray.is_initialized():
+        get_status_actor().update_counts.remote(len(staged_files), 0, 0)
+        get_node_actor(StagedUploadActor).upload.remote(staged_files)
+        return []
+    else:
+        return upload_staged_files(staged_files, NUM_UPLOAD_ATTEMPTS)[1]
+
+
+def take_staged_bundles(root_dir: str) -> List[StagedBundle]:
+    """
+    Collects the bundles of staged files published in `root_dir` from the uploader on every
+    node, so the manifest entries can be pointed at them (see
+    `Manifest.relocate_staged_files`). Call this after `wait_for_zero_pending_writes`.
+    """
+    bundle_lists = ray.get(
+        [
+            a.take_bundles.remote(root_dir)
+            for a in get_node_actors_of_class(StagedUploadActor)
+        ]
+    )
+    return [b for bundles in bundle_lists for b in bundles]
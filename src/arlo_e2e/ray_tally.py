@@ -14,6 +14,8 @@ from typing import (
     Any,
     Final,
     TypeVar,
+    Iterable,
+    AbstractSet,
 )
 
 import pandas as pd
@@ -36,18 +38,22 @@ from electionguard.elgamal import (
 )
 from electionguard.encrypt import encrypt_ballot
 from electionguard.group import ElementModQ, rand_q, ElementModP
+from electionguard.hash import hash_elems
 from electionguard.nonces import Nonces
 from electionguard.utils import get_optional
 from ray import ObjectRef
 from ray.actor import ActorHandle
 
+from arlo_e2e.columnar import write_column_segments
 from arlo_e2e.dominion import DominionCSV, BallotPlaintextFactory
 from arlo_e2e.eg_helpers import log_and_print
-from arlo_e2e.manifest import Manifest, make_fresh_manifest, manifest_name_to_filename
+from arlo_e2e.manifest import Manifest, make_fresh_manifest, manifest_name_to_path
 from arlo_e2e.metadata import ElectionMetadata
 from arlo_e2e.ray_helpers import ray_wait_for_workers
 from arlo_e2e.ray_progress import ProgressBar
 from arlo_e2e.ray_reduce import ray_reduce_with_ray_wait
+from arlo_e2e.ray_staging import staging_dir_for, take_staged_bundles
+from arlo_e2e.ray_write_retry import wait_for_zero_pending_writes
 from arlo_e2e.tally import (
     FastTallyEverythingResults,
     TALLY_TYPE,
@@ -60,8 +66,34 @@ from arlo_e2e.tally import (
     ballot_memos_from_metadata,
     DecryptOutput,
     DecryptInput,
+    PrefixSubtotal,
+    subtotals_from_prefix_tallies,
+    subtotals_match_tally,
+    mismatched_subtotals,
+    ContestScope,
+    make_contest_scope,
+    restrict_tally,
+    verify_ballot_contest_proofs,
+    ciphertext_ballot_contests_to_dict,
+    BALLOT_GROUPS_TYPE,
+    GroupSubtotals,
+    add_group_keys,
+    ballot_groups_by_id,
+    ballot_groups_from_row,
+    group_subtotal_selections,
+    group_subtotals_match_tally,
+    make_group_subtotals,
+    mismatched_group_subtotals,
+    partition_grouped_tally,
+    partition_prefix_tallies,
+    selection_tally_from_decryption,
+)
+from arlo_e2e.utils import (
+    shard_list_uniform,
+    mkdir_helper,
+    group_ballot_ids_by_prefix,
+    BALLOT_FILENAME_PREFIX_DIGITS,
 )
-from arlo_e2e.utils import shard_list_uniform, mkdir_helper
 
 # When we're writing files to s3fs, we'll rarely see failures, but with enough files, it's a certainty.
 # This is how many times we'll retry each write until it works.
@@ -71,6 +103,7 @@ NUM_WRITE_RETRIES: Final = 10
 BATCH_SIZE: Final = 10000
 BALLOTS_PER_SHARD: Final = 4
 PARTIAL_TALLIES_PER_SHARD: Final = 10
+MANIFESTS_PER_SHARD: Final = 10
 
 # Nomenclature in this file: methods starting with "ray_" are meant to be called from the
 # main node. Methods starting with "r_" are "Ray remote methods". Variables starting with
@@ -86,54 +119,69 @@ PARTIAL_TALLIES_PER_SHARD: Final = 10
 
 
 @ray.remote
-class ManifestAggregatorActor:
+def r_merge_manifests(
+    root_dir: str, *manifests: Optional[Manifest]
+) -> Optional[Manifest]:  # pragma: no cover
     """
-    This is a Ray "actor" to which we'll send all of the partial manifests from within
-    r_encrypt_and_write. They're accumulated as they show up.
+    Merges partial manifests, from `r_encrypt_and_write`, into a single manifest. This is
+    used as the reducer in a reduction tree, just like the tallies, so there's no single
+    actor that every partial manifest has to pass through. Returns `None` if any of the
+    manifests is `None` or if they can't be merged.
     """
-
-    aggregate: Manifest
-
-    def __init__(self, root_dir: str) -> None:
-        self.aggregate = make_fresh_manifest(root_dir)
-
-    def add(self, m: Manifest) -> None:
-        """
-        Aggregates this manifest.
-        """
-        self.aggregate.merge_from(m)
-
-    def result(self) -> Manifest:
-        """
-        Gets the aggregate of all the partial manifests.
-        """
-
-        return self.aggregate
+    try:
+        if None in manifests:
+            return None
+        result = make_fresh_manifest(root_dir)
+        for m in manifests:
+            result.merge_from(get_optional(m))
+        return result
+    except Exception as e:
+        log_and_print(f"Unexpected exception in r_merge_manifests: {e}", True)
+        return None
 
 
-@ray.remote
+@ray.remote(num_returns=2)
 def r_encrypt_and_write(
     ied: InternalElectionDescription,
     cec: CiphertextElectionContext,
     seed_hash: ElementModQ,
     root_dir: Optional[str],
-    manifest_aggregator: Optional[ActorHandle],
     progressbar_actor: Optional[ActorHandle],
     bpf: BallotPlaintextFactory,
     nonces: Nonces,
     nonce_indices: List[int],
+    codec: Optional[str],
+    group_columns: Optional[List[str]],
+    stage_locally: bool,
+    columnar: bool,
     *plaintext_ballot_dicts: Dict[str, Any],
-) -> Optional[TALLY_TYPE]:  # pragma: no cover
+) -> Tuple[Optional[TALLY_TYPE], Optional[Manifest]]:  # pragma: no cover
     """
     Remotely encrypts a list of ballots and their associated nonces. If a `root_dir`
-    is specified, the encrypted ballots are written to disk, otherwise no disk activity.
-    What's returned is a `RemoteTallyResult`. If the ballots were written, the
-    `manifest_aggregator` actor will be notified. A "partial tally" of the
-    encrypted ballots is returned.
+    is specified, the encrypted ballots are written to disk, compressed with the
+    optional `codec`, otherwise no disk activity.
+    Two values are returned, as separate Ray objects: a "partial tally" of the encrypted
+    ballots, and if the ballots were written, a partial manifest for them, otherwise
+    `None`. The manifests are merged with `r_merge_manifests`. If `group_columns` are
+    specified, the partial tally also includes grouped partial tallies (see `add_group_keys`).
+    If `stage_locally` is true, the ballots are written to this node's local disk, then
+    uploaded in bundles by the node's `StagedUploadActor`. If `columnar` is true, the ciphertexts
+    are also written in columnar form, as a segment per ballot-id prefix (see
+    `write_column_segments`), with the nonce indices as the ballots' positions, since those
+    are the ballots' rows in the CVRs.
     """
 
     try:
-        manifest = make_fresh_manifest(root_dir) if root_dir is not None else None
+        # The ballots are hashed and written in the background, so this task can finish
+        # without waiting on storage; the driver waits for the writes at the end.
+        if root_dir is None:
+            manifest = None
+        elif stage_locally:
+            manifest = make_fresh_manifest(
+                root_dir, staging_dir=staging_dir_for(root_dir)
+            )
+        else:
+            manifest = make_fresh_manifest(root_dir, write_behind=True)
 
         num_ballots = len(plaintext_ballot_dicts)
         assert (
@@ -142,6 +190,7 @@ def r_encrypt_and_write(
         assert num_ballots > 0, "need at least one ballot"
 
         ptally_final: Optional[TALLY_TYPE] = None
+        cballots: List[CiphertextAcceptedBallot] = []
         for i in range(0, num_ballots):
             pballot = bpf.row_to_plaintext_ballot(plaintext_ballot_dicts[i])
             cballot = ciphertext_ballot_to_accepted(
@@ -157,12 +206,17 @@ def r_encrypt_and_write(
                 )
             )
             if manifest is not None:
-                manifest.write_ciphertext_ballot(cballot, num_retries=NUM_WRITE_RETRIES)
+                cballots.append(cballot)
 
             if progressbar_actor is not None:
                 progressbar_actor.update_completed.remote("Ballots", 1)
 
             ptally = ciphertext_ballot_to_dict(cballot)
+            if group_columns:
+                ptally = add_group_keys(
+                    ptally,
+                    ballot_groups_from_row(plaintext_ballot_dicts[i], group_columns),
+                )
             ptally_final = (
                 sequential_tally([ptally_final, ptally]) if ptally_final else ptally
             )
@@ -170,13 +224,21 @@ def r_encrypt_and_write(
             if progressbar_actor is not None:
                 progressbar_actor.update_completed.remote("Tallies", 1)
 
-        if manifest is not None and manifest_aggregator is not None:
-            manifest_aggregator.add.remote(manifest)
+        if manifest is not None:
+            # one container file per ballot-id prefix in this shard, rather than one file per ballot
+            manifest.write_ciphertext_ballots(
+                cballots, num_retries=NUM_WRITE_RETRIES, codec=codec
+            )
+            if columnar:
+                write_column_segments(
+                    manifest, cballots, nonce_indices, num_retries=NUM_WRITE_RETRIES
+                )
+            manifest.flush_writes()
 
-        return ptally_final
+        return ptally_final, manifest
     except Exception as e:
         log_and_print(f"Unexpected exception in r_encrypt_and_write: {e}", True)
-        return None
+        return None, None
 
 
 def partial_tally(
@@ -352,6 +414,27 @@ def right_tuple_list(input: Sequence[Tuple[T, U]]) -> List[U]:
     return [u for t, u in input]
 
 
+def batch_prefixes(groups: Dict[str, Sequence[T]], batch_size: int) -> List[List[str]]:
+    """
+    Given a dict from ballot-id prefixes to the inputs having that prefix, returns a list of
+    batches of prefixes, in sorted order, each having approximately `batch_size` inputs
+    (but never splitting a prefix across batches).
+    """
+    batches: List[List[str]] = []
+    current_batch: List[str] = []
+    current_size = 0
+    for prefix in sorted(groups.keys()):
+        current_batch.append(prefix)
+        current_size += len(groups[prefix])
+        if current_size >= batch_size:
+            batches.append(current_batch)
+            current_batch = []
+            current_size = 0
+    if current_batch:
+        batches.append(current_batch)
+    return batches
+
+
 def ray_tally_everything(
     cvrs: DominionCSV,
     verbose: bool = True,
@@ -361,6 +444,10 @@ def ray_tally_everything(
     master_nonce: Optional[ElementModQ] = None,
     secret_key: Optional[ElementModQ] = None,
     root_dir: Optional[str] = None,
+    codec: Optional[str] = None,
+    group_columns: Optional[Sequence[str]] = None,
+    stage_locally: bool = False,
+    columnar: bool = False,
 ) -> "RayTallyEverythingResults":
     """
     This top-level function takes a collection of Dominion CVRs and produces everything that
@@ -375,7 +462,23 @@ def ray_tally_everything(
     If `root_dir` is specified, then the tally is written out to the specified directory, and
     the resulting `RayTallyEverythingResults` object will support the methods that allow those
     ballots to be read back in again. Conversely, if `root_dir` is `None`, then nothing is
-    written to disk, and the result will not have access to individual ballots.
+    written to disk, and the result will not have access to individual ballots. The optional
+    `codec` (see `arlo_e2e.compression`) is used to compress the ballots as they're written.
+
+    If `group_columns` is specified, with names of CVR metadata columns (e.g., "TabulatorNum",
+    "BatchId", or "CountingGroup"), then decrypted subtotals, with proofs, are also computed for
+    each distinct value of each of those columns. These are accumulated in the same pass as the
+    tally, so the only extra cost is the additional ciphertext multiplications (and decryptions).
+
+    If `stage_locally` is true, the encrypted ballots are first written to local disk on each
+    node, then concatenated, for each ballot-id prefix, into large bundles, which are uploaded
+    to `root_dir` a few at a time. This helps when `root_dir` is on network storage that does
+    badly with many small concurrent writes. The manifest entries are pointed at the bundles
+    once they're all uploaded (see `Manifest.relocate_staged_files`).
+
+    If `columnar` is true, the ciphertexts are also written in columnar form, by the same tasks
+    that write the ballots, so `write_ray_tally` only has to write the index (see
+    `arlo_e2e.columnar`).
     """
 
     rows, cols = cvrs.data.shape
@@ -387,11 +490,9 @@ def ray_tally_everything(
 
     if root_dir is not None:
         mkdir_helper(root_dir, num_retries=NUM_WRITE_RETRIES)
-        r_manifest_aggregator = ManifestAggregatorActor.remote(root_dir)  # type: ignore
-    else:
-        r_manifest_aggregator = None
 
     r_root_dir = ray.put(root_dir)
+    r_group_columns = ray.put(list(group_columns) if group_columns else None)
 
     start_time = timer()
 
@@ -444,7 +545,15 @@ def ray_tally_everything(
 
     inputs = list(zip(ballot_dicts, nonce_indices))
 
-    batches = shard_list_uniform(inputs, BATCH_SIZE)
+    # We never let a shard span two ballot-id prefixes, so we end up with a partial
+    # tally per prefix, which we publish as a subtotal. Each batch is a whole number
+    # of prefixes.
+    prefix_groups: Dict[str, List[Tuple[Dict[str, Any], int]]] = {}
+    for i in inputs:
+        prefix_groups.setdefault(
+            i[0]["BallotId"][0:BALLOT_FILENAME_PREFIX_DIGITS], []
+        ).append(i)
+    batches = batch_prefixes(prefix_groups, BATCH_SIZE)
     num_batches = len(batches)
     log_and_print(
         f"Launching Ray.io remote encryption! (number of batches: {num_batches})"
@@ -466,52 +575,75 @@ def ray_tally_everything(
     )
     progressbar_actor = progressbar.actor if progressbar is not None else None
 
-    batch_tallies: List[ObjectRef] = []
+    # Dict[str, ObjectRef[Optional[TALLY_TYPE]]]
+    r_prefix_tallies: Dict[str, ObjectRef] = {}
+
+    # List[ObjectRef[Optional[Manifest]]]
+    partial_manifest_refs: List[ObjectRef] = []
+
     for batch in batches:
         if progressbar_actor:
             progressbar_actor.update_completed.remote("Batch", 1)
 
-        num_ballots_in_batch = len(batch)
-        sharded_inputs = shard_list_uniform(batch, BALLOTS_PER_SHARD)
-        num_shards = len(sharded_inputs)
+        # first, we launch all the encryption work for the batch, then we reduce each prefix
+        encryption_refs: Dict[str, List[Tuple[ObjectRef, ObjectRef]]] = {
+            prefix: [
+                r_encrypt_and_write.remote(
+                    r_ied,
+                    r_cec,
+                    r_seed_hash,
+                    r_root_dir,
+                    progressbar_actor,
+                    r_ballot_plaintext_factory,
+                    r_nonces,
+                    right_tuple_list(shard),
+                    codec,
+                    r_group_columns,
+                    stage_locally,
+                    columnar,
+                    *(left_tuple_list(shard)),
+                )
+                for shard in shard_list_uniform(
+                    prefix_groups[prefix], BALLOTS_PER_SHARD
+                )
+            ]
+            for prefix in batch
+        }
 
-        partial_tally_refs = [
-            r_encrypt_and_write.remote(
-                r_ied,
-                r_cec,
-                r_seed_hash,
-                r_root_dir,
-                r_manifest_aggregator,
-                progressbar_actor,
-                r_ballot_plaintext_factory,
-                r_nonces,
-                right_tuple_list(shard),
-                *(left_tuple_list(shard)),
+        for prefix in batch:
+            r_prefix_tallies[prefix] = ray_tally_ballots(
+                left_tuple_list(encryption_refs[prefix]), BALLOTS_PER_SHARD, progressbar
             )
-            for shard in sharded_inputs
-        ]
+            partial_manifest_refs += right_tuple_list(encryption_refs[prefix])
 
-        # log_and_print("Remote tallying.")
-        btally = ray_tally_ballots(partial_tally_refs, BALLOTS_PER_SHARD, progressbar)
-        batch_tallies.append(btally)
+    # Each prefix ultimately yields one partial tally; we add these up here at the
+    # very end. If we have a million ballots and 1000 ballots per prefix, this
+    # would mean we'd have only 1000 partial tallies. So, what's here works just fine.
 
-    # Each batch ultimately yields one partial tally; we add these up here at the
-    # very end. If we have a million ballots and have batches of 10k ballots, this
-    # would mean we'd have only 100 partial tallies. So, what's here works just fine.
-    # If we wanted, we could certainly burn some scalar time and keep a running,
-    # singular, partial tally. It's probably more important to push onward to the
-    # next batch, so we can do as much work in parallel as possible.
-
-    if len(batch_tallies) > 1:
-        tally = ray.get(ray_tally_ballots(batch_tallies, 10, progressbar))
+    prefixes = sorted(r_prefix_tallies.keys())
+    if len(prefixes) > 1:
+        tally = ray.get(
+            ray_tally_ballots([r_prefix_tallies[p] for p in prefixes], 10, progressbar)
+        )
     else:
-        tally = ray.get(batch_tallies[0])
+        tally = ray.get(r_prefix_tallies[prefixes[0]])
+
+    prefix_tallies: List[Optional[TALLY_TYPE]] = ray.get(
+        [r_prefix_tallies[p] for p in prefixes]
+    )
+    assert None not in prefix_tallies, "subtotals failed!"
 
     if progressbar:
         progressbar.close()
 
     assert tally is not None, "tally failed!"
 
+    # any grouped partial tallies were accumulated alongside everything else; we separate them here
+    plain_prefix_tallies, _ = partition_prefix_tallies(
+        {p: t for p, t in zip(prefixes, prefix_tallies) if t is not None}
+    )
+    tally, grouped = partition_grouped_tally(tally)
+
     log_and_print("Tally decryption.")
     decrypted_tally: DECRYPT_TALLY_OUTPUT_TYPE = ray_decrypt_tally(
         tally, r_cec, r_keypair, seed_hash
@@ -533,27 +665,62 @@ def ray_tally_everything(
         decryption, proof = decrypted_tally[obj_id]
         assert cvr_sum == decryption, f"decryption failed for {obj_id}"
 
+    group_subtotals: Optional[Dict[str, GroupSubtotals]] = None
+    if grouped:
+        log_and_print("Group subtotal decryption.")
+        # the group proofs need nonces that are distinct from those of the tally proofs
+        decrypted_grouped = ray_decrypt_tally(
+            grouped, r_cec, r_keypair, hash_elems(seed_hash, "group_subtotals")
+        )
+        assert decrypted_grouped, "group subtotal decryption failed!"
+        group_subtotals = make_group_subtotals(
+            grouped, decrypted_grouped, cvrs.dataframe_without_selections()
+        )
+
+        # Sanity-checking logic: for each column, the group subtotals must add up to the totals.
+        for column, subtotals in group_subtotals.items():
+            for obj_id, (decryption, _) in decrypted_tally.items():
+                group_sum = sum(
+                    g.tally.map[obj_id].decrypted_tally
+                    for g in subtotals.groups.values()
+                    if obj_id in g.tally.map
+                )
+                assert (
+                    group_sum == decryption
+                ), f"group subtotals for {column} don't add up for {obj_id}"
+
     final_manifest: Optional[Manifest] = None
 
     if root_dir is not None:
-        final_manifest = ray.get(r_manifest_aggregator.result.remote())
+        # The partial manifests are merged with a reduction tree, as with the tallies,
+        # and only the final result comes back here.
+        final_manifest = ray.get(
+            ray_reduce_with_ray_wait(
+                partial_manifest_refs,
+                MANIFESTS_PER_SHARD,
+                r_root_dir,
+                r_merge_manifests.remote,
+                timeout=0.5,
+            )
+        )
         assert isinstance(
             final_manifest, Manifest
         ), "type error: bad result from manifest aggregation"
 
+        # the encryption tasks wrote their ballots in the background; they need to be on
+        # storage before anybody can read them back in
+        num_failures = wait_for_zero_pending_writes()
+        if num_failures > 0:
+            log_and_print(f"WARNING: {num_failures} ballot writes failed")
+
+        if stage_locally:
+            # the uploaders bundled the staged files together, so the entries follow them
+            final_manifest.relocate_staged_files(take_staged_bundles(root_dir))
+
     # Assemble the data structure that we're returning. Having nonces in the ciphertext makes these
     # structures sensitive for writing out to disk, but otherwise they're ready to go.
     log_and_print("Constructing results.")
-    reported_tally: Dict[str, SelectionInfo] = {
-        k: SelectionInfo(
-            object_id=k,
-            encrypted_tally=tally[k],
-            # we need to forcibly convert mpz to int here to make serialization work properly
-            decrypted_tally=int(decrypted_tally[k][0]),
-            proof=decrypted_tally[k][1],
-        )
-        for k in tally.keys()
-    }
+    reported_tally = selection_tally_from_decryption(tally, decrypted_tally)
 
     tabulate_time = timer()
 
@@ -568,8 +735,12 @@ def ray_tally_everything(
         election_description=ed,
         num_ballots=rows,
         manifest=final_manifest,
-        tally=SelectionTally(reported_tally),
+        tally=reported_tally,
         context=cec,
+        subtotals=subtotals_from_prefix_tallies(
+            plain_prefix_tallies, cvrs.data["BallotId"]
+        ),
+        group_subtotals=group_subtotals,
     )
 
 
@@ -598,7 +769,7 @@ def manifest_ballot_name_to_cballot(
     """
     Helper to fetch a ballot from disk.
     """
-    filename = manifest_name_to_filename(manifest_name)
+    filename = manifest_name_to_path(manifest.root_dir, manifest_name)
     ballot = manifest.read_json_file(filename, CiphertextAcceptedBallot)
     return ballot
 
@@ -608,13 +779,18 @@ def r_verify_ballot_proofs(
     manifest: Manifest,
     public_key: ElementModP,
     hash_header: ElementModQ,
+    contest_ids: Optional[AbstractSet[str]],
+    ballot_groups: Optional[List[BALLOT_GROUPS_TYPE]],
     progressbar_actor: Optional[ActorHandle],
     *cballot_filenames: str,
 ) -> Optional[TALLY_TYPE]:  # pragma: no cover
     """
-    Given a list of ballots, verify their Chaum-Pedersen proofs and redo the tally.
+    Given a list of ballots, verify their Chaum-Pedersen proofs and redo the tally. The
+    `manifest` only needs entries for these ballots (see `Manifest.subset_for_ballots`).
     Returns `None` if anything didn't verify correctly, otherwise a partial tally
-    of the ballots (of type `TALLY_TYPE`).
+    of the ballots (of type `TALLY_TYPE`). If `contest_ids` is not `None`, only
+    those contests are verified and tallied. If `ballot_groups` is not `None`, with
+    the groups of each ballot, the partial tally also includes grouped partial tallies.
     """
 
     # We're never moving ciphertext ballots through Ray's remote object system. Instead,
@@ -627,22 +803,33 @@ def r_verify_ballot_proofs(
         num_ballots = len(cballot_filenames)
         ptallies: List[TALLY_TYPE] = []
 
-        for name in cballot_filenames:
+        for i, name in enumerate(cballot_filenames):
             cballot = manifest.load_ciphertext_ballot(name)
 
             if cballot is None:
                 return None
 
-            is_valid = cballot.is_valid_encryption(
-                cballot.description_hash, public_key, hash_header
-            )
+            if contest_ids is None:
+                is_valid = cballot.is_valid_encryption(
+                    cballot.description_hash, public_key, hash_header
+                )
+                ptallies.append(ciphertext_ballot_to_dict(cballot))
+            else:
+                is_valid = verify_ballot_contest_proofs(
+                    cballot, contest_ids, public_key, hash_header
+                )
+                ptallies.append(
+                    ciphertext_ballot_contests_to_dict(cballot, contest_ids)
+                )
+
+            if ballot_groups is not None:
+                ptallies[-1] = add_group_keys(ptallies[-1], ballot_groups[i])
+
             if is_valid:
                 valid_count = valid_count + 1
             if progressbar_actor is not None:
                 progressbar_actor.update_completed.remote("Ballots", 1)
 
-            ptallies.append(ciphertext_ballot_to_dict(cballot))
-
         if valid_count < num_ballots:
             # log_and_print(f"Only {valid_count} of {num_ballots} ballots are valid.")
             return None
@@ -697,6 +884,17 @@ class RayTallyEverythingResults(NamedTuple):
     Number of ballots.
     """
 
+    subtotals: Optional[Dict[str, PrefixSubtotal]] = None
+    """
+    Published partial tallies, one per ballot-id prefix, if present.
+    """
+
+    group_subtotals: Optional[Dict[str, GroupSubtotals]] = None
+    """
+    Published decrypted subtotals, with proofs, for groups of ballots defined by columns of
+    the CVR metadata (e.g., per tabulator or per batch), if present. Keys are the column names.
+    """
+
     @property
     def encrypted_ballots(self) -> List[CiphertextAcceptedBallot]:
         """
@@ -743,6 +941,7 @@ class RayTallyEverythingResults(NamedTuple):
         verbose: bool = False,
         recheck_ballots_and_tallies: bool = False,
         use_progressbar: bool = True,
+        contests: Optional[Iterable[str]] = None,
     ) -> bool:
         """
         Checks all the proofs used in this tally, returns True if everything is good.
@@ -750,8 +949,21 @@ class RayTallyEverythingResults(NamedTuple):
         with the totals. If you want to also recompute the tally (i.e., tabulate the
         encrypted ballots) and verify every individual ballot proof, then set
         `recheck_ballots_and_tallies` to True.
+
+        If `contests` is specified, as a list of contest titles, then only the proofs and tallies
+        for those contests are checked, and only the ballots whose styles include those contests
+        are loaded.
         """
 
+        scope: Optional[ContestScope] = None
+        if contests is not None:
+            scope = make_contest_scope(
+                self.metadata, self.election_description, contests
+            )
+            if scope is None:
+                return False
+        selection_ids = scope.selection_ids if scope is not None else None
+
         ray_wait_for_workers(min_workers=2)
 
         log_and_print("Verifying proofs.", verbose)
@@ -760,7 +972,13 @@ class RayTallyEverythingResults(NamedTuple):
         r_hash_header = ray.put(self.context.crypto_extended_base_hash)
 
         start = timer()
-        selections = self.tally.map.values()
+        selections = [
+            self.tally.map[k]
+            for k in self.tally.map.keys()
+            if selection_ids is None or k in selection_ids
+        ]
+        if self.group_subtotals is not None:
+            selections += group_subtotal_selections(self.group_subtotals, selection_ids)
         sharded_selections: Sequence[Sequence[SelectionInfo]] = shard_list_uniform(
             selections, 2
         )
@@ -776,13 +994,29 @@ class RayTallyEverythingResults(NamedTuple):
 
         log_and_print(f"Verification time: {end - start: .3f} sec", verbose)
         log_and_print(
-            f"Verification rate: {len(self.tally.map.keys()) / (end - start): .3f} selection/sec",
+            f"Verification rate: {len(selections) / (end - start): .3f} selection/sec",
             verbose,
         )
 
         if False in results:
             return False
 
+        if self.subtotals is not None and not subtotals_match_tally(
+            self.subtotals,
+            self.tally.to_tally_map(),
+            self.cvr_metadata["BallotId"],
+            selection_ids,
+        ):
+            return False
+
+        if self.group_subtotals is not None and not group_subtotals_match_tally(
+            self.group_subtotals,
+            self.tally.to_tally_map(),
+            self.cvr_metadata,
+            selection_ids,
+        ):
+            return False
+
         if recheck_ballots_and_tallies:
             if self.manifest is None:
                 log_and_print("cannot recheck ballots and tallies without a manifest")
@@ -790,9 +1024,10 @@ class RayTallyEverythingResults(NamedTuple):
 
             # next, check each individual ballot's proofs; in this case, we're going to always
             # show the progress bar, even if verbose is false
-            num_ballots = self.num_ballots
-
-            r_manifest = ray.put(self.manifest)
+            ballot_ids = (
+                scope.ballot_ids if scope is not None else self.cvr_metadata["BallotId"]
+            )
+            num_ballots = len(ballot_ids)
 
             progressbar = (
                 ProgressBar(
@@ -810,57 +1045,61 @@ class RayTallyEverythingResults(NamedTuple):
 
             ballot_start = timer()
 
-            batches: Sequence[Sequence[str]] = shard_list_uniform(
-                self.cvr_metadata["BallotId"], BATCH_SIZE
+            prefix_groups = group_ballot_ids_by_prefix(ballot_ids)
+            r_contest_ids = ray.put(scope.contest_ids if scope is not None else None)
+            ballot_groups = (
+                ballot_groups_by_id(
+                    self.cvr_metadata, sorted(self.group_subtotals.keys())
+                )
+                if self.group_subtotals is not None
+                else None
             )
+            batches = batch_prefixes(prefix_groups, BATCH_SIZE)
 
-            # List[ObjectRef[Optional[TALLY_TYPE]]]
-            recomputed_tallies: List[ObjectRef] = []
+            # Dict[str, ObjectRef[Optional[TALLY_TYPE]]]
+            r_prefix_tallies: Dict[str, ObjectRef] = {}
 
             for batch in batches:
                 if progressbar_actor:
                     progressbar_actor.update_completed.remote("Batch", 1)
 
-                cballot_manifest_name_shards: Sequence[
-                    Sequence[str]
-                ] = shard_list_uniform(batch, BALLOTS_PER_SHARD)
-
-                # List[ObjectRef[Optional[TALLY_TYPE]]]
-                ballot_results: List[ObjectRef] = [
-                    r_verify_ballot_proofs.remote(
-                        r_manifest,
-                        r_public_key,
-                        r_hash_header,
-                        progressbar_actor,
-                        *shard,
+                # Dict[str, List[ObjectRef[Optional[TALLY_TYPE]]]]
+                ballot_results: Dict[str, List[ObjectRef]] = {
+                    prefix: [
+                        r_verify_ballot_proofs.remote(
+                            # each task gets only the manifest entries for its own ballots,
+                            # rather than every task deserializing the whole manifest
+                            self.manifest.subset_for_ballots(shard),
+                            r_public_key,
+                            r_hash_header,
+                            r_contest_ids,
+                            [ballot_groups[bid] for bid in shard]
+                            if ballot_groups is not None
+                            else None,
+                            progressbar_actor,
+                            *shard,
+                        )
+                        for shard in shard_list_uniform(
+                            prefix_groups[prefix], BALLOTS_PER_SHARD
+                        )
+                    ]
+                    for prefix in batch
+                }
+
+                for prefix in batch:
+                    r_prefix_tallies[prefix] = ray_tally_ballots(
+                        ballot_results[prefix], PARTIAL_TALLIES_PER_SHARD, progressbar
                     )
-                    for shard in cballot_manifest_name_shards
-                ]
-                # ray.wait(
-                #     ballot_results,
-                #     num_returns=len(cballot_manifest_name_shards),
-                #     timeout=None,
-                # )
-                # log_and_print("Recomputing tallies.", verbose)
-
-                ptally = ray_tally_ballots(
-                    ballot_results, PARTIAL_TALLIES_PER_SHARD, progressbar
-                )
-                recomputed_tallies.append(ptally)
 
-            if len(recomputed_tallies) > 1:
-                recomputed_tally = ray.get(
-                    ray_tally_ballots(
-                        recomputed_tallies, PARTIAL_TALLIES_PER_SHARD, progressbar
-                    )
-                )
-            else:
-                recomputed_tally = ray.get(recomputed_tallies[0])
+            prefixes = sorted(r_prefix_tallies.keys())
+            prefix_tallies: List[Optional[TALLY_TYPE]] = ray.get(
+                [r_prefix_tallies[p] for p in prefixes]
+            )
 
             if progressbar:
                 progressbar.close()
 
-            if not recomputed_tally:
+            if None in prefix_tallies or {} in prefix_tallies:
                 return False
 
             ballot_end = timer()
@@ -870,7 +1109,30 @@ class RayTallyEverythingResults(NamedTuple):
                 True,
             )
 
-            tally_success = tallies_match(self.tally.to_tally_map(), recomputed_tally)
+            (
+                recomputed_prefix_tallies,
+                recomputed_group_tallies,
+            ) = partition_prefix_tallies(
+                {p: t for p, t in zip(prefixes, prefix_tallies) if t is not None}
+            )
+            if self.subtotals is not None and mismatched_subtotals(
+                self.subtotals, recomputed_prefix_tallies, selection_ids
+            ):
+                return False
+
+            if self.group_subtotals is not None and mismatched_group_subtotals(
+                self.group_subtotals, recomputed_group_tallies, selection_ids
+            ):
+                return False
+
+            recomputed_tally = sequential_tally(
+                [recomputed_prefix_tallies[p] for p in prefixes]
+            )
+
+            provided_tally = self.tally.to_tally_map()
+            if selection_ids is not None:
+                provided_tally = restrict_tally(provided_tally, selection_ids)
+            tally_success = tallies_match(provided_tally, recomputed_tally)
 
             if not tally_success:
                 return False
@@ -897,4 +1159,7 @@ class RayTallyEverythingResults(NamedTuple):
             tally=self.tally,
             context=self.context,
             encrypted_ballot_memos=ballot_memos,
+            manifest=self.manifest,
+            subtotals=self.subtotals,
+            group_subtotals=self.group_subtotals,
         )
@@ -1,14 +1,47 @@
 import random
-from asyncio import Event
+from asyncio import Event, Task, get_event_loop, sleep as async_sleep
+from base64 import b64encode
+from concurrent.futures import Future, ThreadPoolExecutor
+from hashlib import sha256
+from os import cpu_count, getpid
 from pathlib import PurePath
-from time import sleep
-from typing import Union, AnyStr, Optional
+from threading import Condition, Lock
+from time import sleep, monotonic
+from typing import (
+    Any,
+    Dict,
+    Union,
+    AnyStr,
+    Optional,
+    Callable,
+    Iterable,
+    Set,
+    Final,
+    List,
+    Tuple,
+)
 
 import ray
 from electionguard.logs import log_warning, log_error, log_info
 from ray.actor import ActorHandle
 
 from arlo_e2e.eg_helpers import log_and_print
+from arlo_e2e.storage import (
+    storage_for_path,
+    storage_write_bytes,
+    storage_write_chunks,
+)
+from arlo_e2e.write_limiter import (
+    BaseWriteLimiter,
+    LeasedWriteLimiter,
+    WriteLimiter,
+    WriteOutcome,
+    get_write_limiter as get_process_write_limiter,
+    WRITE_CONCURRENCY,
+    WRITE_LIMIT_INITIAL,
+    WRITE_LIMIT_MAX,
+    WRITE_LIMIT_MIN,
+)
 
 
 @ray.remote
@@ -27,24 +60,37 @@ class WriteRetryStatusActor:  # pragma: no cover
         self.num_failures = 0
         self.num_pending = 0
         self.failure_probability = 0.0
+        self.node_actors: List[ActorHandle] = []
 
-    def increment_pending(self) -> None:
+    def register_node_actor(self, node_actor: ActorHandle) -> None:
         """
-        Increments the internal number of pending writes.
+        Remembers a per-node actor with pending writes of its own (see `get_node_actor`),
+        so `wait_for_zero_pending_writes` can wait for it.
         """
-        self.num_pending += 1
+        self.node_actors.append(node_actor)
 
-    def decrement_pending(self, failure_happened: bool) -> None:
+    def get_node_actors(self) -> List[ActorHandle]:
         """
-        Decrements the internal number of pending writes and also tracks whether
-        the write ultimately succeeded (pass `failure_happened=False`) or failed
-        (pass `failure_happened=True`).
+        Returns every per-node actor that's been registered.
         """
-        if failure_happened:
-            self.num_failures += 1
+        return self.node_actors
 
-        self.num_pending -= 1
-        if self.num_pending == 0:
+    def get_counts(self) -> Tuple[int, int]:
+        """
+        Returns the number of pending writes and the number of failed writes.
+        """
+        return self.num_pending, self.num_failures
+
+    def update_counts(self, num_new: int, num_finished: int, num_failed: int) -> None:
+        """
+        Batched update: adds `num_new` pending writes, then removes `num_finished` of them,
+        of which `num_failed` ultimately failed.
+        """
+        self.num_failures += num_failed
+        self.num_pending += num_new - num_finished
+        if self.num_pending > 0:
+            self.event.clear()
+        else:
             self.event.set()
 
     def set_failure_probability(self, failure_probability: float) -> None:
@@ -69,11 +115,12 @@ class WriteRetryStatusActor:  # pragma: no cover
     async def wait_for_zero_pending(self) -> int:
         """
         Blocking call: waits until there are no more pending writes. Returns the
-        total number of failures.
+        total number of failures. The count can go to zero and back up again, so this
+        checks it again every time it's woken up.
         """
-        if self.num_pending > 0:
-            await self.event.wait()
+        while self.num_pending > 0:
             self.event.clear()
+            await self.event.wait()
         return self.num_failures
 
 
@@ -84,54 +131,133 @@ def _write_once(
 ) -> bool:
     """
     Internal function: returns True if the write succeeds. Logs an error and returns
-    False if something went wrong.
+    False if something went wrong. Waits for a permit from the write limiter first (see
+    `get_write_limiter`), and tells it how the write went.
     """
     fp = get_failure_probability_for_testing()
-    if fp > 0.0:
-        r = random.random()  # in the range [0.0, 1.0)
-        if r < fp:
+    with get_write_limiter().permit() as permit:
+        if fp > 0.0:
+            r = random.random()  # in the range [0.0, 1.0)
+            if r < fp:
+                log_and_print(
+                    f"test-induced write error: {full_file_name} (attempt #{counter})"
+                )
+                permit.failed()
+                return False
+
+        try:
+            storage_write_bytes(
+                full_file_name,
+                contents.encode("utf-8") if isinstance(contents, str) else contents,
+            )
+            return True
+        except Exception as e:
             log_and_print(
-                f"test-induced write error: {full_file_name} (attempt #{counter})"
+                f"failed to write {full_file_name} (attempt #{counter}): {str(e)}"
             )
+            permit.failed()
             return False
 
-    write_mode = "w" if isinstance(contents, str) else "wb"
-    try:
-        with open(full_file_name, write_mode) as f:
-            f.write(contents)
-        return True
-    except Exception as e:
-        log_and_print(
-            f"failed to write {full_file_name} (attempt #{counter}): {str(e)}"
+
+@ray.remote(num_cpus=0)
+class WriteRetryActor:  # pragma: no cover
+    """
+    Owns the queue of failed writes on one node, and retries them with an increasing delay
+    between attempts. The delays are asyncio timers and the writes run in a thread pool, so
+    this doesn't tie up any worker CPUs while a storage brownout passes. It keeps its own
+    counts of pending and failed writes, which are only collected when somebody asks for
+    them, rather than sending a status update for every write.
+
+    Don't construct this directly. Instead, use `get_retry_actor`.
+    """
+
+    num_failures: int
+    num_pending: int
+    idle: Event
+    tasks: Set[Task]
+
+    def __init__(self) -> None:
+        self.num_failures = 0
+        self.num_pending = 0
+        self.idle = Event()
+        self.idle.set()
+        self.tasks = set()
+
+    async def retry_write(
+        self,
+        full_file_name: Union[str, PurePath],
+        contents: AnyStr,
+        num_attempts: int,
+        initial_delay: float,
+        delta_delay: float,
+        counter: int,
+    ) -> None:
+        """
+        Adds a failed write to the queue, to be retried up to `num_attempts` times, starting
+        with attempt number `counter`. Returns immediately. The write was counted as pending
+        on the `WriteRetryStatusActor` before it was handed off, and now that it's counted
+        here, it's reported as finished there.
+        """
+        self.num_pending += 1
+        self.idle.clear()
+        get_status_actor().update_counts.remote(0, 1, 0)
+        task = get_event_loop().create_task(
+            self._retry(
+                full_file_name,
+                contents,
+                num_attempts,
+                initial_delay,
+                delta_delay,
+                counter,
+            )
         )
-        return False
 
+        # the event loop only keeps weak references to its tasks
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _retry(
+        self,
+        full_file_name: Union[str, PurePath],
+        contents: AnyStr,
+        num_attempts: int,
+        delay: float,
+        delta_delay: float,
+        counter: int,
+    ) -> None:
+        success = False
+        for attempt in range(counter, num_attempts + 1):
+            await async_sleep(delay)
+            success = await get_event_loop().run_in_executor(
+                None, _write_once, full_file_name, contents, attempt
+            )
+            if success:
+                break
+            delay += delta_delay
 
-@ray.remote
-def r_delayed_write_file_with_retries(
-    full_file_name: Union[str, PurePath],
-    contents: AnyStr,
-    num_attempts: int,
-    initial_delay: float,
-    delta_delay: float,
-    counter: int,
-    status_actor: Optional[ActorHandle],  # pragma: no cover
-) -> None:
-    # actual return type: Optional[ActorHandle[WriteRetryStatusActor]], but type params not supported
-
-    for attempt in range(counter, num_attempts):
-        sleep(initial_delay)
-        success = _write_once(full_file_name, contents, attempt)
-        if success:
-            if status_actor:
-                status_actor.decrement_pending.remote(False)
-            return
+        if not success:
+            log_and_print(
+                f"giving up writing {full_file_name}: failed {num_attempts} times"
+            )
+            self.num_failures += 1
 
-        initial_delay += delta_delay
+        self.num_pending -= 1
+        if self.num_pending == 0:
+            self.idle.set()
 
-    log_and_print(f"giving up writing {full_file_name}: failed {num_attempts} times")
-    if status_actor:
-        status_actor.decrement_pending.remote(True)
+    async def get_counts(self) -> Tuple[int, int]:
+        """
+        Returns the number of pending writes and the number of failed writes.
+        """
+        return self.num_pending, self.num_failures
+
+    async def wait_for_zero_pending(self) -> int:
+        """
+        Blocking call: waits until there are no more pending writes. Returns the
+        total number of failures.
+        """
+        await self.idle.wait()
+        return self.num_failures
 
 
 __singleton_name = "WriteRetryStatusActorSingleton"
@@ -144,13 +270,23 @@ def reset_pending_state() -> None:
     the internal counters. Also, this will remove any actors, which will then be restarted
     if necessary.
 
-    In a testing scenario, you might call this after a call to `ray.shutdown()`.
+    In a testing scenario, you might call this after a call to `ray.shutdown()`. This also
+    waits for, and then discards, this process's write-behind queue, which would otherwise
+    remember directories that a test might since have deleted.
     """
     global __status_actor
     global __failure_probability
     global __local_failed_writes
+    global __write_behind_queue
+    global __node_write_limiter
+
+    if __write_behind_queue is not None and __write_behind_pid == getpid():
+        __write_behind_queue.wait_until_empty()
+    __write_behind_queue = None
+    __node_write_limiter = None
 
     __status_actor = None
+    __node_actors.clear()
     __failure_probability = None
     __local_failed_writes = 0
 
@@ -191,6 +327,205 @@ def get_status_actor() -> ActorHandle:
     return __status_actor
 
 
+__node_actors: Dict[str, ActorHandle] = {}
+
+
+def _node_actor_name(actor_class: Any, node_ip_address: str) -> str:
+    # The Ray actor class keeps the name of the class it wraps in its metadata.
+    return f"{actor_class.__ray_metadata__.class_name}:{node_ip_address}"
+
+
+def _make_node_actor(actor_class: Any, node_ip_address: str) -> ActorHandle:
+    """
+    Internal function: makes the actor of the given class for the given node, and registers
+    it with the status actor. Raises `ValueError` if somebody else already made it.
+    """
+    node_actor = actor_class.options(
+        name=_node_actor_name(actor_class, node_ip_address),
+        resources={f"node:{node_ip_address}": 0.001},
+    ).remote()
+    get_status_actor().register_node_actor.remote(node_actor)
+    return node_actor
+
+
+def get_node_actor(actor_class: Any) -> ActorHandle:
+    """
+    Gets the actor of the given class (e.g., `WriteRetryActor`) for the node we're running
+    on, making it if necessary. There's one of each, per node, named for the class and the
+    node's IP address. Actors made this way must have `get_counts` and `wait_for_zero_pending`
+    methods, so `wait_for_zero_pending_writes` can wait for them.
+    """
+    node_ip_address = ray.worker.global_worker.node_ip_address
+    name = _node_actor_name(actor_class, node_ip_address)
+    if name not in __node_actors:
+        try:
+            __node_actors[name] = ray.get_actor(name)
+        except ValueError:
+            try:
+                __node_actors[name] = _make_node_actor(actor_class, node_ip_address)
+            except ValueError:
+                # another process on this node made it first
+                __node_actors[name] = ray.get_actor(name)
+
+    return __node_actors[name]
+
+
+def get_node_actors_of_class(actor_class: Any) -> List[ActorHandle]:
+    """
+    Gets the actors of the given class (see `get_node_actor`) for every node in the cluster
+    that has one, without making any.
+    """
+    node_actors: List[ActorHandle] = []
+    for node in ray.nodes():
+        if node["Alive"]:
+            try:
+                node_actors.append(
+                    ray.get_actor(
+                        _node_actor_name(actor_class, node["NodeManagerAddress"])
+                    )
+                )
+            except ValueError:
+                pass
+    return node_actors
+
+
+def init_retry_actors() -> None:
+    """
+    Helper function, called by our own ray_init_* routines, exactly once, to make a
+    `WriteRetryActor` for every node in the cluster. Nodes that join the cluster later
+    get theirs when they first need it.
+    """
+    for node in ray.nodes():
+        if node["Alive"]:
+            try:
+                _make_node_actor(WriteRetryActor, node["NodeManagerAddress"])
+            except ValueError:
+                pass
+
+
+def get_retry_actor() -> ActorHandle:
+    """
+    Gets the `WriteRetryActor` for the node we're running on, making it if necessary.
+    """
+    return get_node_actor(WriteRetryActor)
+
+
+WRITE_COUNTS_POLL_INTERVAL: Final[float] = 1.0
+"""
+How often, in seconds, each `NodeWriteLimitActor` checks the write counts on the
+`WriteRetryStatusActor` and its node's `WriteRetryActor`.
+"""
+
+
+@ray.remote(num_cpus=0)
+class NodeWriteLimitActor:  # pragma: no cover
+    """
+    Holds the `WriteLimiter` for one node, shared by every process on it, which lease its
+    permits in batches (see `LeasedWriteLimiter`). The limit covers the whole node, so during
+    a brownout it can go all the way down to `WRITE_LIMIT_MIN` writes at once, no matter
+    how many workers there are. Besides the outcomes of the writes, which come back with the
+    permits, it's driven by the write counts, which it checks every
+    `WRITE_COUNTS_POLL_INTERVAL` seconds: failed writes, and writes waiting to be retried,
+    shrink the limit (see `WriteLimiter.observe_counts`).
+
+    Don't construct this directly. Instead, use `get_write_limiter`.
+    """
+
+    limiter: WriteLimiter
+    released: Event
+    task: Optional[Task]
+
+    def __init__(self) -> None:
+        num_cpus = cpu_count() or 1
+        self.limiter = WriteLimiter(
+            initial_limit=WRITE_LIMIT_INITIAL * num_cpus,
+            min_limit=WRITE_LIMIT_MIN,
+            max_limit=WRITE_LIMIT_MAX * num_cpus,
+        )
+        self.released = Event()
+        self.task = None
+
+    async def lease(self, wanted: int) -> int:
+        """
+        Blocking call: waits until there's room under the limit, then grants up to `wanted`
+        permits, returning how many.
+        """
+        if self.task is None:
+            self.task = get_event_loop().create_task(self._poll_counts())
+
+        while True:
+            granted = self.limiter.try_acquire(wanted)
+            if granted > 0:
+                return granted
+            self.released.clear()
+            await self.released.wait()
+
+    async def give_back(self, count: int, outcomes: List[WriteOutcome]) -> None:
+        """
+        Gives back `count` leased permits, along with the outcomes of the writes done
+        with them.
+        """
+        self.limiter.give_back(count, outcomes)
+        self.released.set()
+
+    async def _poll_counts(self) -> None:
+        while True:
+            await async_sleep(WRITE_COUNTS_POLL_INTERVAL)
+            try:
+                num_pending, num_failures = await get_status_actor().get_counts.remote()
+                (
+                    num_retrying,
+                    num_retry_failures,
+                ) = await get_retry_actor().get_counts.remote()
+            except Exception as e:
+                log_warning(f"failed to get the write counts: {e}")
+                continue
+
+            self.limiter.observe_counts(
+                num_pending + num_retrying,
+                num_retrying,
+                num_failures + num_retry_failures,
+            )
+
+    async def get_counts(self) -> Tuple[int, int]:
+        """
+        This actor doesn't write anything itself, so it never has pending or failed writes.
+        """
+        return 0, 0
+
+    async def wait_for_zero_pending(self) -> int:
+        """
+        This actor doesn't write anything itself, so there's never anything to wait for.
+        """
+        return 0
+
+
+__node_write_limiter: Optional[LeasedWriteLimiter] = None
+__node_write_limiter_pid: Optional[int] = None
+
+
+def get_write_limiter() -> BaseWriteLimiter:
+    """
+    Gets the write limiter that every write goes through. With Ray, it leases permits from
+    the `NodeWriteLimitActor` for the node we're running on, so one limit applies to all the
+    processes on the node. Otherwise, it's this process's own `WriteLimiter`.
+    """
+    global __node_write_limiter
+    global __node_write_limiter_pid
+
+    if not ray.is_initialized():
+        return get_process_write_limiter()
+
+    if __node_write_limiter is None or __node_write_limiter_pid != getpid():
+        node_actor = get_node_actor(NodeWriteLimitActor)
+        __node_write_limiter = LeasedWriteLimiter(
+            lambda wanted: ray.get(node_actor.lease.remote(wanted)),
+            lambda count, outcomes: node_actor.give_back.remote(count, outcomes),
+        )
+        __node_write_limiter_pid = getpid()
+    return __node_write_limiter
+
+
 __failure_probability: Optional[float] = None
 
 
@@ -240,13 +575,47 @@ def wait_for_zero_pending_writes() -> int:
     with the number, perhaps suggesting that something really bad happened.
     """
     global __local_failed_writes
+    if __write_behind_queue is not None and __write_behind_pid == getpid():
+        __write_behind_queue.wait_until_empty()
+
     if ray.is_initialized():
-        num_failures: int = ray.get(get_status_actor().wait_for_zero_pending.remote())
+        status_actor = get_status_actor()
+        num_failures: int = ray.get(status_actor.wait_for_zero_pending.remote())
+
+        # the per-node actors are waited for last, since background writes might fail and
+        # be handed off to them
+        node_actors = ray.get(status_actor.get_node_actors.remote())
+        num_failures += sum(
+            ray.get([a.wait_for_zero_pending.remote() for a in node_actors])
+        )
         return num_failures
     else:
         return __local_failed_writes
 
 
+def get_pending_write_counts() -> Tuple[int, int]:
+    """
+    Returns the number of writes that are still pending, including writes waiting to be
+    retried, along with the number of writes that failed (i.e., where the number of failures
+    exceeded the number of retry attempts). Doesn't wait for anything.
+    """
+    if not ray.is_initialized():
+        num_pending = (
+            __write_behind_queue.num_pending()
+            if __write_behind_queue is not None and __write_behind_pid == getpid()
+            else 0
+        )
+        return num_pending, __local_failed_writes
+
+    status_actor = get_status_actor()
+    node_actors = ray.get(status_actor.get_node_actors.remote())
+    counts = ray.get(
+        [status_actor.get_counts.remote()]
+        + [a.get_counts.remote() for a in node_actors]
+    )
+    return sum(c[0] for c in counts), sum(c[1] for c in counts)
+
+
 def write_file_with_retries(
     full_file_name: Union[str, PurePath],
     contents: AnyStr,  # bytes or str
@@ -259,11 +628,12 @@ def write_file_with_retries(
     a file location, writes the given contents to the a file of that name, and if it
     fails, tries it again and again (based on the `num_attempts` parameter). This works
     around occasional failures that happen, for no good reason, with s3fs-fuse in big
-    clouds.
+    clouds, as well as transient errors from the S3 API (see `arlo_e2e.storage`).
 
-    If Ray is in use, this gets a little more interesting. If it fails, it will
-    launch a Ray task to delay a bit and try again, allowing the initial call to
-    return immediately, and the file will *eventually* get written out.
+    If Ray is in use, this gets a little more interesting. If it fails, it hands the
+    write off to the `WriteRetryActor` on this node, which will delay a bit and try
+    again, allowing the initial call to return immediately, and the file will
+    *eventually* get written out.
 
     The delay time, in seconds, starts with the `initial_delay` (default: 1 second)
     then grows by `delta_delay` (default: 1 second) each time.
@@ -272,20 +642,23 @@ def write_file_with_retries(
     prev_exception = None
 
     if ray.is_initialized():
-        status_actor = get_status_actor()
         if _write_once(full_file_name, contents, 1):
             return
-        if status_actor:
-            status_actor.increment_pending.remote()
-        r_delayed_write_file_with_retries.remote(
-            full_file_name,
-            contents,
-            num_attempts,
-            initial_delay,
-            delta_delay,
-            2,
-            status_actor,
-        )
+        if num_attempts > 1:
+            # The hand-off is fire-and-forget, so the write is counted as pending on the status
+            # actor until the retry actor has it, or wait_for_zero_pending_writes could miss it.
+            get_status_actor().update_counts.remote(1, 0, 0)
+            get_retry_actor().retry_write.remote(
+                full_file_name,
+                contents,
+                num_attempts,
+                initial_delay,
+                delta_delay,
+                2,
+            )
+        else:
+            log_and_print(f"giving up writing {full_file_name}")
+            get_status_actor().update_counts.remote(0, 0, 1)
 
     else:
         for retry_number in range(1, num_attempts + 1):
@@ -305,3 +678,246 @@ def write_file_with_retries(
 
         if prev_exception:
             raise prev_exception
+
+
+def write_chunks_with_retries(
+    full_file_name: Union[str, PurePath],
+    chunks: Callable[[], Iterable[bytes]],
+    num_attempts: int = 1,
+    initial_delay: float = 1.0,
+    delta_delay: float = 1.0,
+) -> bool:
+    """
+    Helper function: like `write_file_with_retries`, but the contents are written as a
+    stream of chunks, so they never need to be in memory all at once. Every attempt calls
+    `chunks` again, so it has to yield the same contents each time. Since the chunks can't
+    be handed off to a Ray task, this always retries synchronously. Returns True if the
+    write eventually succeeded.
+    """
+    global __local_failed_writes
+
+    for retry_number in range(1, num_attempts + 1):
+        fp = get_failure_probability_for_testing()
+        with get_write_limiter().permit() as permit:
+            if fp > 0.0 and random.random() < fp:
+                log_and_print(
+                    f"test-induced write error: {full_file_name} (attempt #{retry_number})"
+                )
+                permit.failed()
+            else:
+                try:
+                    storage_write_chunks(full_file_name, chunks())
+                    return True
+                except Exception as e:
+                    log_and_print(
+                        f"failed to write {full_file_name} (attempt #{retry_number}): {str(e)}"
+                    )
+                    permit.failed()
+
+        if retry_number < num_attempts:
+            sleep(initial_delay)
+            initial_delay += delta_delay
+
+    log_and_print(f"giving up writing {full_file_name}")
+    __local_failed_writes += 1
+    return False
+
+
+WRITE_BEHIND_THREADS: Final[int] = WRITE_CONCURRENCY
+"""
+Number of threads, per process, hashing and writing files handed off to the write-behind queue.
+The `WriteLimiter` never allows more writes than this at once, so it's what actually limits them.
+"""
+
+WRITE_BEHIND_MAX_BYTES: Final[int] = 256 * 1024 * 1024
+"""
+Most bytes, per process, that can be waiting in the write-behind queue. Once it's full,
+handing off another file blocks until there's room, which throttles whoever is producing
+the files when storage can't keep up.
+"""
+
+STATUS_UPDATE_INTERVAL: Final[float] = 0.5
+"""
+Seconds between batched updates from a `WriteBehindQueue` to the `WriteRetryStatusActor`.
+"""
+
+
+class WriteBehindQueue:
+    """
+    A per-process queue of files to be hashed and written in the background, by a pool of
+    threads, so the caller can hand off the bytes and go back to work. Each file's hash is
+    available as soon as it's computed, before the file is written, so a manifest can be
+    completed without waiting on storage. The writes themselves are counted as pending
+    writes (see `wait_for_zero_pending_writes`), and are retried as with
+    `write_file_with_retries`. Directories are only made once per process.
+
+    With Ray, the counts are sent to the `WriteRetryStatusActor` in batches: whenever
+    `report_counts` is called, whenever the queue empties, and otherwise at most every
+    `STATUS_UPDATE_INTERVAL` seconds.
+
+    The writes go through the node's write limiter (see `get_write_limiter`), so when storage
+    is struggling, the files back up here, up to `WRITE_BEHIND_MAX_BYTES`, and then `submit` starts blocking.
+
+    Don't construct this directly. Instead, use `get_write_behind_queue`.
+    """
+
+    def __init__(self, num_threads: int = WRITE_BEHIND_THREADS) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=num_threads)
+        self._lock = Lock()
+        self._made_dirs: Set[str] = set()
+        self._num_pending = 0
+        self._num_bytes = 0
+        self._idle = Condition(self._lock)
+        self._room = Condition(self._lock)
+
+        # counts not yet sent to the status actor: new, finished, and failed writes
+        self._unreported = [0, 0, 0]
+        self._last_report = monotonic()
+
+    def submit(
+        self,
+        full_file_name: Union[str, PurePath],
+        contents: bytes,
+        directory: Optional[Union[str, PurePath]] = None,
+        num_attempts: int = 1,
+    ) -> "Future[str]":
+        """
+        Hands off the contents of a file, to be hashed and written in the background.
+        If `directory` is specified, it's made first, unless this process already made it.
+        Returns a future for the base64-encoded SHA256 hash of the contents. Blocks if
+        the queue already has `WRITE_BEHIND_MAX_BYTES` waiting to be written.
+        """
+        hash_future: "Future[str]" = Future()
+        with self._lock:
+            while (
+                self._num_bytes > 0
+                and self._num_bytes + len(contents) > WRITE_BEHIND_MAX_BYTES
+            ):
+                self._room.wait()
+            self._num_pending += 1
+            self._num_bytes += len(contents)
+            self._unreported[0] += 1
+
+        self._executor.submit(
+            self._hash_and_write,
+            hash_future,
+            full_file_name,
+            contents,
+            directory,
+            num_attempts,
+        )
+        return hash_future
+
+    def _hash_and_write(
+        self,
+        hash_future: "Future[str]",
+        full_file_name: Union[str, PurePath],
+        contents: bytes,
+        directory: Optional[Union[str, PurePath]],
+        num_attempts: int,
+    ) -> None:
+        failure_happened = True
+        try:
+            hash_future.set_result(b64encode(sha256(contents).digest()).decode("utf-8"))
+
+            if directory is not None:
+                self._make_dir_once(directory, num_attempts)
+
+            # Any failures from here on are counted by write_file_with_retries, or by the
+            # Ray task it launches to retry.
+            write_file_with_retries(
+                full_file_name, contents, num_attempts=num_attempts, initial_delay=1
+            )
+            failure_happened = False
+        except Exception as e:
+            if not hash_future.done():
+                hash_future.set_exception(e)
+            log_and_print(f"failed to write {full_file_name} in the background: {e}")
+        finally:
+            with self._lock:
+                self._num_pending -= 1
+                self._num_bytes -= len(contents)
+                self._room.notify_all()
+                self._unreported[1] += 1
+                if failure_happened:
+                    self._unreported[2] += 1
+                if self._num_pending == 0:
+                    self._idle.notify_all()
+                report_now = (
+                    self._num_pending == 0
+                    or monotonic() - self._last_report >= STATUS_UPDATE_INTERVAL
+                )
+            if report_now:
+                self.report_counts()
+
+    def report_counts(self) -> None:
+        """
+        Sends any counts that haven't yet been sent to the `WriteRetryStatusActor`, all in
+        one call. This has to be called before a Ray task finishes, so the status actor knows
+        about every pending write (`Manifest.flush_writes` takes care of this).
+        """
+        with self._lock:
+            counts = self._unreported
+            self._unreported = [0, 0, 0]
+            self._last_report = monotonic()
+        if counts != [0, 0, 0] and ray.is_initialized():
+            get_status_actor().update_counts.remote(*counts)
+
+    def _make_dir_once(
+        self, directory: Union[str, PurePath], num_attempts: int
+    ) -> None:
+        name = str(directory)
+        with self._lock:
+            if name in self._made_dirs:
+                return
+
+        backend, backend_name = storage_for_path(directory)
+        for attempt in range(1, num_attempts + 1):
+            try:
+                backend.make_dirs(backend_name)
+            except OSError as e:
+                log_and_print(
+                    f"failed to make directory {directory} (attempt #{attempt}): {str(e)}"
+                )
+                if attempt < num_attempts:
+                    sleep(1)
+                continue
+
+            # only remembered once it's made, so the next file in it tries again otherwise
+            with self._lock:
+                self._made_dirs.add(name)
+            return
+
+    def num_pending(self) -> int:
+        """
+        Returns the number of files handed off that haven't yet been written.
+        """
+        with self._lock:
+            return self._num_pending
+
+    def wait_until_empty(self) -> None:
+        """
+        Blocking call: waits until every file handed off to this queue has been written,
+        or given up on.
+        """
+        with self._lock:
+            while self._num_pending > 0:
+                self._idle.wait()
+
+
+__write_behind_queue: Optional[WriteBehindQueue] = None
+__write_behind_pid: Optional[int] = None
+
+
+def get_write_behind_queue() -> WriteBehindQueue:
+    """
+    Gets this process's `WriteBehindQueue`, making it if necessary. After a fork, the
+    child process gets its own.
+    """
+    global __write_behind_queue
+    global __write_behind_pid
+
+    if __write_behind_queue is None or __write_behind_pid != getpid():
+        __write_behind_queue = WriteBehindQueue()
+        __write_behind_pid = getpid()
+    return __write_behind_queue
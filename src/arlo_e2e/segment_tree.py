@@ -0,0 +1,540 @@
+# A segment tree of partial tallies over the ballots, in the order of the CVR metadata. Every
+# leaf is the homomorphic tally of a small, contiguous block of ballots, and every internal node
+# is the product of its two children, so the root is the tally of everything. The encrypted
+# subtotal of any contiguous range of ballots can then be assembled from O(log n) nodes, plus
+# at most two partial leaves' worth of ballots. Since the CVR metadata is sorted by tabulator
+# and batch, groups defined by those columns are a small number of contiguous runs, so their
+# subtotals are cheap to compute, decrypt, and prove.
+
+import re
+from collections import Counter
+from hashlib import sha256
+from multiprocessing.pool import Pool
+from typing import Dict, Final, Iterable, List, NamedTuple, Optional, Tuple
+
+from dataclasses import dataclass
+from electionguard.ballot import CiphertextAcceptedBallot
+from electionguard.election import CiphertextElectionContext
+from electionguard.elgamal import ElGamalCiphertext, ElGamalKeyPair
+from electionguard.group import ElementModQ, rand_q
+from electionguard.hash import hash_elems
+from electionguard.logs import log_error
+from electionguard.serializable import Serializable
+
+from arlo_e2e.manifest import Manifest, compose_manifest_name
+from arlo_e2e.memo import Memo, make_memo_lambda, make_memo_value
+from arlo_e2e.tally import (
+    BALLOT_SHARD_TYPE,
+    TALLY_TYPE,
+    FastTallyEverythingResults,
+    SelectionTally,
+    ciphertext_ballot_to_dict,
+    fast_decrypt_tally,
+    selection_tally_from_decryption,
+    sequential_tally,
+    tallies_match,
+)
+from arlo_e2e.utils import shard_list, load_json_helper
+
+SEGMENT_TREE_DIR: Final[str] = "segment_tree"
+"""
+Subdirectory of a tally directory holding the segment tree.
+"""
+
+SEGMENT_TREE_INFO: Final[str] = "segment_tree.json"
+"""
+Name of the file, in `SEGMENT_TREE_DIR`, holding the `SegmentTreeInfo`.
+"""
+
+SEGMENT_TREE_LEAF_SIZE: Final[int] = 16
+"""
+Number of ballots in each leaf of the segment tree. Smaller leaves make for a taller tree,
+with more nodes to store, while larger leaves mean that more ballots need to be loaded and
+tallied at the edges of every range.
+"""
+
+
+@dataclass(eq=True)
+class SegmentTreeInfo(Serializable):
+    """
+    Describes the shape of a segment tree. Level 0 holds the leaves, and the last level
+    holds only the root. Node `j` on level `k` covers the ballots from position
+    `j * leaf_size * 2**k` up to, but not including, `(j + 1) * leaf_size * 2**k`,
+    truncated to the number of ballots.
+    """
+
+    leaf_size: int
+    """
+    Number of ballots in each leaf. (The last leaf may have fewer.)
+    """
+
+    ballot_ids: List[str]
+    """
+    Every ballot id, in the same order as the CVR metadata.
+    """
+
+    level_sizes: List[int]
+    """
+    Number of nodes on each level of the tree, from the leaves to the root.
+    """
+
+
+@dataclass(eq=True)
+class SegmentTreeNode(Serializable):
+    """
+    One node of a segment tree: the homomorphic tally of the ballots from position
+    `start` up to, but not including, `end`.
+    """
+
+    level: int
+    index: int
+    start: int
+    end: int
+
+    tally: Dict[str, ElGamalCiphertext]
+    """
+    A mapping from selection object_ids to the encrypted subtotal for that selection.
+    """
+
+
+def segment_tree_node_name(level: int, index: int) -> str:
+    """
+    Helper function: the file name of a node in `SEGMENT_TREE_DIR`. The nodes of each level
+    are packed into a single container file (see `Manifest.write_packed_json_files`).
+    """
+    return f"{level}_{index}.json"
+
+
+def _node_range(info: SegmentTreeInfo, level: int, index: int) -> Tuple[int, int]:
+    width = info.leaf_size << level
+    return index * width, min((index + 1) * width, len(info.ballot_ids))
+
+
+class SegmentTree(NamedTuple):
+    """
+    A segment tree of partial tallies (see `build_segment_tree` and `load_segment_tree`),
+    along with the tally results that it covers. The nodes are loaded lazily.
+    """
+
+    info: SegmentTreeInfo
+    results: FastTallyEverythingResults
+    nodes: List[List[Memo[TALLY_TYPE]]]
+
+    @property
+    def num_ballots(self) -> int:
+        return len(self.info.ballot_ids)
+
+    def _ballots_tally(self, start: int, end: int) -> Optional[TALLY_TYPE]:
+        ballots = [
+            self.results.get_encrypted_ballot(bid)
+            for bid in self.info.ballot_ids[start:end]
+        ]
+        if None in ballots:
+            return None
+        return sequential_tally([ciphertext_ballot_to_dict(b) for b in ballots])
+
+    def range_tally(self, start: int, end: int) -> Optional[TALLY_TYPE]:
+        """
+        Computes the encrypted subtotal for the ballots from position `start` up to, but not
+        including, `end`, in the order of the CVR metadata. At most two leaves' worth of ballots
+        are loaded from disk; everything else comes from O(log n) tree nodes. Returns `None`
+        if anything fails to load.
+        """
+        if not 0 <= start < end <= self.num_ballots:
+            log_error(
+                f"Bad ballot range [{start}, {end}) for {self.num_ballots} ballots"
+            )
+            return None
+
+        leaf_size = self.info.leaf_size
+        first_leaf = -(-start // leaf_size)
+        # the last leaf may be short, but it's still usable if the range reaches the end
+        last_leaf = len(self.nodes[0]) if end == self.num_ballots else end // leaf_size
+        if first_leaf >= last_leaf:
+            return self._ballots_tally(start, end)
+
+        ptallies: List[Optional[TALLY_TYPE]] = []
+        if start < first_leaf * leaf_size:
+            ptallies.append(self._ballots_tally(start, first_leaf * leaf_size))
+        if last_leaf * leaf_size < end:
+            ptallies.append(self._ballots_tally(last_leaf * leaf_size, end))
+
+        # The usual bottom-up decomposition of a range of leaves into maximal subtrees.
+        level = 0
+        lo, hi = first_leaf, last_leaf
+        while lo < hi:
+            if lo % 2 == 1:
+                ptallies.append(self.nodes[level][lo].contents)
+                lo += 1
+            if hi % 2 == 1:
+                hi -= 1
+                ptallies.append(self.nodes[level][hi].contents)
+            lo //= 2
+            hi //= 2
+            level += 1
+
+        if None in ptallies:
+            return None
+        return sequential_tally(ptallies)
+
+    def group_ranges(self, column: str) -> Optional[Dict[str, List[Tuple[int, int]]]]:
+        """
+        Given the name of a column in the CVR metadata (e.g., "TabulatorNum" or "BatchId"),
+        returns a dict from each distinct value in the column, as a string, to the contiguous
+        ranges of ballot positions having that value. Returns `None` if there's no such column.
+        """
+        cvr_metadata = self.results.cvr_metadata
+        if column not in cvr_metadata.columns:
+            log_error(f"No column {column} in the CVR metadata")
+            return None
+
+        values = [str(v) for v in cvr_metadata[column]]
+        ranges: Dict[str, List[Tuple[int, int]]] = {}
+        start = 0
+        for i in range(1, len(values) + 1):
+            if i == len(values) or values[i] != values[start]:
+                ranges.setdefault(values[start], []).append((start, i))
+                start = i
+        return ranges
+
+    def group_tallies(self, column: str) -> Optional[Dict[str, TALLY_TYPE]]:
+        """
+        Computes the encrypted subtotal for each distinct value of the given column
+        in the CVR metadata (see `group_ranges`). Returns `None` if anything fails to load.
+        """
+        ranges = self.group_ranges(column)
+        if ranges is None:
+            return None
+
+        result: Dict[str, TALLY_TYPE] = {}
+        for group in sorted(ranges.keys()):
+            ptallies = [self.range_tally(start, end) for start, end in ranges[group]]
+            if None in ptallies:
+                return None
+            result[group] = sequential_tally(ptallies)
+        return result
+
+    def is_consistent(self) -> bool:
+        """
+        Checks that the root of the tree matches the tally and that every internal node
+        is the product of its children. This doesn't look at any of the ballots; use
+        `leaves_match_ballots` for that. Returns True if everything is good. Errors are logged.
+        """
+        root = self.nodes[-1][0].contents
+        if root is None or not tallies_match(self.results.tally.to_tally_map(), root):
+            log_error("Segment tree root doesn't match the tally")
+            return False
+
+        for level in range(1, len(self.nodes)):
+            for index, node in enumerate(self.nodes[level]):
+                children = self.nodes[level - 1][2 * index : 2 * index + 2]
+                child_tallies = [c.contents for c in children]
+                if (
+                    node.contents is None
+                    or None in child_tallies
+                    or node.contents != sequential_tally(child_tallies)
+                ):
+                    log_error(f"Segment tree node {level}/{index} doesn't match")
+                    return False
+        return True
+
+    def leaves_match_ballots(self, pool: Optional[Pool] = None) -> bool:
+        """
+        Loads every ballot and checks that every leaf of the tree is the tally of its ballots.
+        This doesn't check any of the ballot proofs. Returns True if everything is good.
+        Errors are logged.
+        """
+        leaf_tallies = _leaf_tallies(self.results, self.info, pool)
+        if leaf_tallies is None:
+            return False
+
+        for index, (leaf, expected) in enumerate(zip(self.nodes[0], leaf_tallies)):
+            if leaf.contents != expected:
+                log_error(f"Segment tree leaf {index} doesn't match its ballots")
+                return False
+        return True
+
+
+def _tally_leaf(shard: BALLOT_SHARD_TYPE) -> Optional[TALLY_TYPE]:  # pragma: no cover
+    manifest, ballots_or_ids = shard
+    ballots: List[Optional[CiphertextAcceptedBallot]] = [
+        (manifest.load_ciphertext_ballot(b) if manifest is not None else None)
+        if isinstance(b, str)
+        else b
+        for b in ballots_or_ids
+    ]
+    if None in ballots:
+        return None
+    return sequential_tally([ciphertext_ballot_to_dict(b) for b in ballots])
+
+
+def _leaf_tallies(
+    results: FastTallyEverythingResults,
+    info: SegmentTreeInfo,
+    pool: Optional[Pool] = None,
+) -> Optional[List[TALLY_TYPE]]:
+    shards: List[BALLOT_SHARD_TYPE] = []
+    for leaf in shard_list(info.ballot_ids, info.leaf_size):
+        memos = [results.encrypted_ballot_memos[bid] for bid in leaf]
+        shards.append(
+            (
+                None
+                if results.manifest is None
+                else results.manifest.subset_for_ballots(
+                    bid for bid, m in zip(leaf, memos) if not m.is_evaluated
+                ),
+                [m.contents if m.is_evaluated else bid for bid, m in zip(leaf, memos)],
+            )
+        )
+
+    tallies = (
+        [_tally_leaf(s) for s in shards]
+        if pool is None
+        else pool.map(func=_tally_leaf, iterable=shards)
+    )
+
+    result: List[TALLY_TYPE] = []
+    for t in tallies:
+        if t is None:
+            log_error("Failed to load the ballots for a segment tree leaf")
+            return None
+        result.append(t)
+    return result
+
+
+def build_segment_tree(
+    results: FastTallyEverythingResults,
+    pool: Optional[Pool] = None,
+    leaf_size: int = SEGMENT_TREE_LEAF_SIZE,
+) -> Optional[SegmentTree]:
+    """
+    Computes a segment tree of partial tallies over every ballot, in the order of the CVR
+    metadata. Every ballot is loaded once, and the leaves are computed in parallel if
+    a `pool` is provided. Returns `None` if anything fails to load.
+    """
+    ballot_ids = [str(bid) for bid in results.cvr_metadata["BallotId"]]
+    if len(ballot_ids) == 0:
+        log_error("Cannot build a segment tree without any ballots")
+        return None
+
+    info = SegmentTreeInfo(leaf_size, ballot_ids, [])
+    leaves = _leaf_tallies(results, info, pool)
+    if leaves is None:
+        return None
+
+    levels: List[List[TALLY_TYPE]] = [leaves]
+    while len(levels[-1]) > 1:
+        pairs = shard_list(levels[-1], 2)
+        levels.append(
+            [sequential_tally(p) for p in pairs]
+            if pool is None
+            else pool.map(func=sequential_tally, iterable=pairs)
+        )
+
+    info.level_sizes = [len(level) for level in levels]
+    return SegmentTree(
+        info,
+        results,
+        [[make_memo_value(t) for t in level] for level in levels],
+    )
+
+
+def write_segment_tree(
+    tree: SegmentTree, manifest: Manifest, num_retries: int = 1
+) -> None:
+    """
+    Writes out the segment tree into `SEGMENT_TREE_DIR`, with one container file per level,
+    updating the manifest.
+    """
+    for level, nodes in enumerate(tree.nodes):
+        manifest.write_packed_json_files(
+            f"level_{level}.jsonl",
+            [
+                (
+                    segment_tree_node_name(level, index),
+                    SegmentTreeNode(
+                        level,
+                        index,
+                        *_node_range(tree.info, level, index),
+                        node.contents,
+                    ),
+                )
+                for index, node in enumerate(nodes)
+            ],
+            [SEGMENT_TREE_DIR],
+            num_retries=num_retries,
+        )
+    manifest.write_json_file(
+        SEGMENT_TREE_INFO, tree.info, [SEGMENT_TREE_DIR], num_retries=num_retries
+    )
+
+
+def _load_node(
+    manifest: Manifest, info: SegmentTreeInfo, level: int, index: int
+) -> Optional[TALLY_TYPE]:
+    node: Optional[SegmentTreeNode] = manifest.read_json_file(
+        segment_tree_node_name(level, index), SegmentTreeNode, [SEGMENT_TREE_DIR]
+    )
+    if node is None:
+        return None
+    if (node.level, node.index) != (level, index) or (
+        node.start,
+        node.end,
+    ) != _node_range(info, level, index):
+        log_error(f"Segment tree node {level}/{index} is mislabeled")
+        return None
+    return node.tally
+
+
+def load_segment_tree(results: FastTallyEverythingResults) -> Optional[SegmentTree]:
+    """
+    Loads the segment tree for the given tally results, if it was written out, otherwise
+    returns `None`. The nodes are only loaded, and checked against the manifest, as they're used.
+    Use `SegmentTree.is_consistent` to check the whole tree against the tally.
+    """
+    manifest = results.manifest
+    if manifest is None or (
+        compose_manifest_name(SEGMENT_TREE_INFO, [SEGMENT_TREE_DIR])
+        not in manifest.hashes
+    ):
+        log_error("No segment tree in this tally")
+        return None
+
+    info: Optional[SegmentTreeInfo] = manifest.read_json_file(
+        SEGMENT_TREE_INFO, SegmentTreeInfo, [SEGMENT_TREE_DIR]
+    )
+    if info is None:
+        return None
+
+    if info.ballot_ids != [str(bid) for bid in results.cvr_metadata["BallotId"]]:
+        log_error("Segment tree ballot ids don't match the CVR metadata")
+        return None
+
+    expected_sizes = [-(-len(info.ballot_ids) // info.leaf_size)]
+    while expected_sizes[-1] > 1:
+        expected_sizes.append(-(-expected_sizes[-1] // 2))
+    if info.leaf_size < 1 or info.level_sizes != expected_sizes:
+        log_error(f"Segment tree has the wrong shape: {info.level_sizes}")
+        return None
+
+    return SegmentTree(
+        info,
+        results,
+        [
+            [
+                (
+                    lambda k, j: make_memo_lambda(
+                        lambda: _load_node(manifest, info, k, j)
+                    )
+                )(level, index)
+                for index in range(size)
+            ]
+            for level, size in enumerate(info.level_sizes)
+        ],
+    )
+
+
+def decrypt_group_tallies(
+    group_tallies: Dict[str, TALLY_TYPE],
+    cec: CiphertextElectionContext,
+    keypair: ElGamalKeyPair,
+    proof_seed: Optional[ElementModQ] = None,
+    pool: Optional[Pool] = None,
+) -> Dict[str, SelectionTally]:
+    """
+    Decrypts each group's subtotal, with Chaum-Pedersen proofs that anybody can check with
+    `SelectionInfo.is_valid_proof`. The proofs for each group are seeded with a hash of the
+    group name and the `proof_seed` (random, if absent), so no two groups share proof nonces.
+    """
+    if proof_seed is None:
+        proof_seed = rand_q()
+
+    return {
+        group: selection_tally_from_decryption(
+            group_tallies[group],
+            fast_decrypt_tally(
+                group_tallies[group],
+                cec,
+                keypair,
+                hash_elems(proof_seed, group),
+                pool,
+                show_progress=False,
+            ),
+        )
+        for group in sorted(group_tallies.keys())
+    }
+
+
+def verify_group_subtotals(
+    tree: SegmentTree, column: str, subtotals: Dict[str, SelectionTally]
+) -> bool:
+    """
+    Recomputes the encrypted subtotal for each group defined by the given column of the CVR
+    metadata, from the segment tree, and checks them against the published `subtotals` and
+    their decryption proofs. Returns True if everything is good. Errors are logged.
+    """
+    group_tallies = tree.group_tallies(column)
+    if group_tallies is None:
+        return False
+
+    if group_tallies.keys() != subtotals.keys():
+        log_error(f"Groups for {column} don't match the CVR metadata")
+        return False
+
+    public_key = tree.results.context.elgamal_public_key
+    hash_header = tree.results.context.crypto_extended_base_hash
+    for group in sorted(group_tallies.keys()):
+        if group_tallies[group] != subtotals[group].to_tally_map():
+            log_error(f"Encrypted subtotal for {column} = {group} doesn't match")
+            return False
+        if not all(
+            s.is_valid_proof(public_key, hash_header)
+            for s in subtotals[group].map.values()
+        ):
+            return False
+    return True
+
+
+def group_file_names(groups: Iterable[str]) -> Dict[str, str]:
+    """
+    Group names come from the CVRs, so we make them safe for use as file names. If two groups
+    would get the same file name (including on a case-insensitive filesystem), each of them
+    gets a short hash of its original name appended, so no group's subtotal overwrites another's.
+    """
+    safe_names = {group: re.sub(r"[^A-Za-z0-9_.-]", "_", group) for group in groups}
+    counts = Counter(name.lower() for name in safe_names.values())
+    return {
+        group: (
+            name
+            if name and counts[name.lower()] == 1
+            else f"{name}_{sha256(group.encode('utf-8')).hexdigest()[0:8]}"
+        )
+        + ".json"
+        for group, name in safe_names.items()
+    }
+
+
+def load_group_subtotals(
+    tree: SegmentTree, subtotals_dir: str, column: str
+) -> Optional[Dict[str, SelectionTally]]:
+    """
+    Loads the decrypted subtotals for every group defined by the given column of the CVR
+    metadata, as written by `arlo_subtotals` (in a subdirectory named for the column, with
+    file names from `group_file_names`), for checking with `verify_group_subtotals`.
+    Returns `None` if any group's subtotal is missing or fails to load.
+    """
+    ranges = tree.group_ranges(column)
+    if ranges is None:
+        return None
+
+    file_names = group_file_names(ranges.keys())
+    result: Dict[str, SelectionTally] = {}
+    for group in sorted(ranges.keys()):
+        subtotal = load_json_helper(
+            subtotals_dir, file_names[group], SelectionTally, [column]
+        )
+        if subtotal is None:
+            log_error(f"Failed to load the subtotal for {column} = {group}")
+            return None
+        result[group] = subtotal
+    return result
@@ -0,0 +1,380 @@
+# Storage backends: everything we read or write, other than a handful of local configuration
+# files, goes through here. Local files are the default. Anything named with an "s3://" URL is
+# instead read and written with the S3 API, using a pooled HTTP client, so there's no need for
+# an s3fs-fuse mount. The S3 backend requires boto3, which is optional.
+
+import io
+import os
+from abc import ABC, abstractmethod
+from os import path, stat, walk
+from pathlib import Path, PurePath
+from stat import S_ISREG
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union, Final, Any
+
+from electionguard.logs import log_error
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    HAVE_BOTO3 = True
+except ImportError:  # pragma: no cover
+    HAVE_BOTO3 = False
+
+S3_PREFIX: Final[str] = "s3:/"
+"""
+Paths starting with this are in S3. (After going through `PurePath`, "s3://bucket/key"
+becomes "s3:/bucket/key", so we accept either.)
+"""
+
+S3_ENDPOINT_URL_ENV: Final[str] = "ARLO_S3_ENDPOINT_URL"
+"""
+Environment variable with the URL of an S3-compatible service, if we're not using AWS.
+This is how a cluster of Ray workers can all find the same service.
+"""
+
+S3_MAX_POOL_CONNECTIONS: Final[int] = 64
+"""
+Maximum number of pooled HTTP connections per S3 client. Each process has one client,
+shared by all its threads.
+"""
+
+S3_MULTIPART_THRESHOLD: Final[int] = 8 * 1024 * 1024
+"""
+Objects at least this big are uploaded in parts, in parallel.
+"""
+
+S3_MULTIPART_CONCURRENCY: Final[int] = 8
+"""
+Number of parts of a multipart upload sent at the same time.
+"""
+
+READ_CHUNK_SIZE: Final[int] = 1024 * 1024
+"""
+When reading through a file, this is how many bytes we read at a time.
+"""
+
+PathLike = Union[str, PurePath]
+
+
+class StorageBackend(ABC):
+    """
+    Interface for reading and writing files, addressed by the names used by the backend
+    (see `storage_for_path`). Failures raise `OSError`.
+    """
+
+    @abstractmethod
+    def read_bytes(self, name: str) -> bytes:
+        """
+        Reads the whole file.
+        """
+
+    @abstractmethod
+    def read_range(self, name: str, offset: int, num_bytes: int) -> bytes:
+        """
+        Reads up to `num_bytes` bytes, starting at `offset`, without reading the rest of the file.
+        """
+
+    @abstractmethod
+    def read_chunks(self, name: str) -> Iterator[bytes]:
+        """
+        Reads the file, a chunk at a time.
+        """
+
+    @abstractmethod
+    def write_bytes(self, name: str, data: bytes) -> None:
+        """
+        Writes the file, replacing anything already there.
+        """
+
+    @abstractmethod
+    def write_chunks(self, name: str, chunks: Iterable[bytes]) -> None:
+        """
+        Writes the file from a stream of chunks, so it never needs to be in memory all at once.
+        """
+
+    @abstractmethod
+    def size(self, name: str) -> Optional[int]:
+        """
+        Returns the size of the file, or `None` if it's not there.
+        """
+
+    @abstractmethod
+    def make_dirs(self, name: str) -> None:
+        """
+        Makes the directory, along with any parents, if they don't already exist.
+        """
+
+    @abstractmethod
+    def directory_exists(self, name: str) -> bool:
+        """
+        Checks whether the directory exists.
+        """
+
+    @abstractmethod
+    def list_files(self, name: str) -> List[str]:
+        """
+        Returns the names of every file within the directory, recursively.
+        """
+
+
+class LocalStorage(StorageBackend):
+    """
+    Storage on the local filesystem (or anything mounted there).
+    """
+
+    def read_bytes(self, name: str) -> bytes:
+        with open(name, "rb") as f:
+            return f.read()
+
+    def read_range(self, name: str, offset: int, num_bytes: int) -> bytes:
+        with open(name, "rb") as f:
+            f.seek(offset)
+            return f.read(num_bytes)
+
+    def read_chunks(self, name: str) -> Iterator[bytes]:
+        with open(name, "rb") as f:
+            while True:
+                chunk = f.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+    def write_bytes(self, name: str, data: bytes) -> None:
+        with open(name, "wb") as f:
+            f.write(data)
+
+    def write_chunks(self, name: str, chunks: Iterable[bytes]) -> None:
+        with open(name, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+
+    def size(self, name: str) -> Optional[int]:
+        try:
+            s = stat(name)
+        except FileNotFoundError:
+            return None
+        return s.st_size if S_ISREG(s.st_mode) else None
+
+    def make_dirs(self, name: str) -> None:
+        Path(name).mkdir(parents=True, exist_ok=True)
+
+    def directory_exists(self, name: str) -> bool:
+        return path.isdir(name)
+
+    def list_files(self, name: str) -> List[str]:
+        results: List[str] = []
+        for root, dirs, files in walk(name):
+            for file in files:
+                results.append(path.join(root, file))
+        return results
+
+
+class _ChunkReader(io.RawIOBase):
+    """
+    Internal helper: a read-only file-like object over a stream of chunks, for uploads.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b: Any) -> int:
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buffer))
+        b[0:n] = self._buffer[0:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+class S3Storage(StorageBackend):
+    """
+    Storage in an S3 bucket, or any S3-compatible service. Names are of the form "bucket/key".
+    One client, with a pool of HTTP connections, is shared by every thread in the process.
+    There are no directories as such, so `make_dirs` does nothing.
+    """
+
+    def __init__(self, endpoint_url: Optional[str] = None) -> None:
+        if not HAVE_BOTO3:
+            raise OSError("S3 storage requires boto3, which isn't installed")
+
+        self._client = boto3.session.Session().client(
+            "s3",
+            endpoint_url=endpoint_url,
+            config=BotoConfig(
+                max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                retries={"max_attempts": 10, "mode": "adaptive"},
+            ),
+        )
+        self._transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_THRESHOLD,
+            max_concurrency=S3_MULTIPART_CONCURRENCY,
+        )
+
+    @staticmethod
+    def _bucket_and_key(name: str) -> Tuple[str, str]:
+        bucket, _, key = name.partition("/")
+        return bucket, key
+
+    def _call(self, method: str, name: str, **kwargs: Any) -> Any:
+        """
+        Internal helper: calls the S3 client, turning its exceptions into `OSError`.
+        """
+        bucket, key = self._bucket_and_key(name)
+        try:
+            return getattr(self._client, method)(Bucket=bucket, Key=key, **kwargs)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                raise FileNotFoundError(f"s3://{name}") from e
+            raise OSError(f"S3 {method} failed for s3://{name}: {e}") from e
+        except BotoCoreError as e:
+            raise OSError(f"S3 {method} failed for s3://{name}: {e}") from e
+
+    def read_bytes(self, name: str) -> bytes:
+        return self._call("get_object", name)["Body"].read()
+
+    def read_range(self, name: str, offset: int, num_bytes: int) -> bytes:
+        if num_bytes == 0:
+            return b""
+        return self._call(
+            "get_object", name, Range=f"bytes={offset}-{offset + num_bytes - 1}"
+        )["Body"].read()
+
+    def read_chunks(self, name: str) -> Iterator[bytes]:
+        body = self._call("get_object", name)["Body"]
+        for chunk in body.iter_chunks(READ_CHUNK_SIZE):
+            yield chunk
+
+    def write_bytes(self, name: str, data: bytes) -> None:
+        if len(data) >= S3_MULTIPART_THRESHOLD:
+            self.write_chunks(name, [data])
+        else:
+            self._call("put_object", name, Body=data)
+
+    def write_chunks(self, name: str, chunks: Iterable[bytes]) -> None:
+        bucket, key = self._bucket_and_key(name)
+        try:
+            self._client.upload_fileobj(
+                io.BufferedReader(_ChunkReader(chunks), READ_CHUNK_SIZE),
+                bucket,
+                key,
+                Config=self._transfer_config,
+            )
+        except (ClientError, BotoCoreError) as e:
+            raise OSError(f"S3 upload failed for s3://{name}: {e}") from e
+
+    def size(self, name: str) -> Optional[int]:
+        try:
+            return int(self._call("head_object", name)["ContentLength"])
+        except FileNotFoundError:
+            return None
+
+    def make_dirs(self, name: str) -> None:
+        pass
+
+    def directory_exists(self, name: str) -> bool:
+        bucket, key = self._bucket_and_key(name)
+        try:
+            response = self._client.list_objects_v2(
+                Bucket=bucket, Prefix=key.rstrip("/") + "/", MaxKeys=1
+            )
+        except (ClientError, BotoCoreError) as e:
+            raise OSError(f"S3 listing failed for s3://{name}: {e}") from e
+        return response.get("KeyCount", 0) > 0
+
+    def list_files(self, name: str) -> List[str]:
+        bucket, key = self._bucket_and_key(name)
+        prefix = key.rstrip("/") + "/" if key else ""
+        results: List[str] = []
+        try:
+            paginator = self._client.get_paginator("list_objects_v2")
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+                for obj in page.get("Contents", []):
+                    results.append(S3_PREFIX + "/" + bucket + "/" + obj["Key"])
+        except (ClientError, BotoCoreError) as e:
+            raise OSError(f"S3 listing failed for s3://{name}: {e}") from e
+        return results
+
+
+__local_storage: Final[LocalStorage] = LocalStorage()
+__s3_storage: Dict[Optional[str], S3Storage] = {}
+
+
+def is_s3_path(p: PathLike) -> bool:
+    """
+    Checks whether the given path, or path-like object, names something in S3.
+    """
+    return str(p).replace(os.sep, "/").startswith(S3_PREFIX)
+
+
+def storage_for_path(p: PathLike) -> Tuple[StorageBackend, str]:
+    """
+    Given a path, or path-like object, returns the storage backend for it, along with the
+    name that backend uses for it. Anything starting with "s3://" is in S3, using the
+    endpoint from the `ARLO_S3_ENDPOINT_URL` environment variable, if it's set, and
+    everything else is on the local filesystem.
+    """
+    if not is_s3_path(p):
+        return __local_storage, str(p)
+
+    name = str(p).replace(os.sep, "/")[len(S3_PREFIX) :].lstrip("/")
+    endpoint_url = os.environ.get(S3_ENDPOINT_URL_ENV)
+    if endpoint_url not in __s3_storage:
+        __s3_storage[endpoint_url] = S3Storage(endpoint_url)
+    return __s3_storage[endpoint_url], name
+
+
+def reset_storage() -> None:
+    """
+    Discards any S3 clients, so new ones will be made on demand (e.g., after changing
+    the `ARLO_S3_ENDPOINT_URL` environment variable).
+    """
+    __s3_storage.clear()
+
+
+def storage_read_chunks(p: PathLike) -> Iterator[bytes]:
+    """
+    Reads the given file, a chunk at a time, from whatever storage it's in. Raises
+    `OSError` on failure.
+    """
+    backend, name = storage_for_path(p)
+    return backend.read_chunks(name)
+
+
+def storage_write_chunks(p: PathLike, chunks: Iterable[bytes]) -> None:
+    """
+    Writes the given file from a stream of chunks, to whatever storage it's in. Raises
+    `OSError` on failure.
+    """
+    backend, name = storage_for_path(p)
+    backend.write_chunks(name, chunks)
+
+
+def storage_write_bytes(p: PathLike, data: bytes) -> None:
+    """
+    Writes the given file, to whatever storage it's in. Raises `OSError` on failure.
+    """
+    backend, name = storage_for_path(p)
+    backend.write_bytes(name, data)
+
+
+def storage_file_size(p: PathLike) -> Optional[int]:
+    """
+    Returns the size of the given file, or `None` if it's not there or can't be checked.
+    """
+    backend, name = storage_for_path(p)
+    try:
+        return backend.size(name)
+    except OSError as e:
+        log_error(f"Error checking file ({p}): {e}")
+        return None
@@ -1,8 +1,10 @@
 import functools
+import os
 from datetime import datetime
 from multiprocessing.pool import Pool
 from timeit import default_timer as timer
 from typing import (
+    Callable,
     Tuple,
     List,
     Optional,
@@ -14,6 +16,9 @@ from typing import (
     Any,
     Set,
     Iterable,
+    Iterator,
+    FrozenSet,
+    AbstractSet,
 )
 
 import pandas as pd
@@ -53,18 +58,26 @@ from electionguard.group import (
     rand_q,
     int_to_q_unchecked,
 )
+from electionguard.hash import hash_elems
 from electionguard.logs import log_error
 from electionguard.nonces import Nonces
 from electionguard.serializable import Serializable
 from electionguard.utils import get_optional
 from tqdm import tqdm
 
+from arlo_e2e.ballot_types import ballot_ids_with_types
 from arlo_e2e.dominion import DominionCSV
 from arlo_e2e.eg_helpers import log_and_print
 from arlo_e2e.manifest import Manifest
 from arlo_e2e.memo import Memo, make_memo_value, make_memo_lambda
 from arlo_e2e.metadata import ElectionMetadata
-from arlo_e2e.utils import shard_list_uniform
+from arlo_e2e.utils import (
+    shard_list_uniform,
+    flatmap,
+    group_ballot_ids_by_prefix,
+    imap_unordered_bounded,
+    BALLOT_FILENAME_PREFIX_DIGITS,
+)
 
 
 def encrypt_ballot_helper(
@@ -187,8 +200,130 @@ will be the work unit.
 """
 
 
+VERIFY_BALLOTS_PER_SHARD: Final[int] = 20
+"""
+For ballot verification, we'll "shard" the list of ballots up into groups, and that
+will be the work unit. Each shard is loaded, verified, and tallied by a single worker.
+"""
+
+VERIFY_SHARDS_IN_FLIGHT_PER_CPU: Final[int] = 2
+"""
+When verifying ballots with a process pool, this many shards per CPU are handed to the
+pool at a time, so the workers always have something to do without every shard being
+made up front.
+"""
+
+BALLOT_SHARD_TYPE = Tuple[
+    Optional[Manifest], Sequence[Union[str, Optional[CiphertextAcceptedBallot]]]
+]
+"""
+A shard of ballots for verification: each entry is either a ballot that's already in
+memory or the id of a ballot to be loaded with the accompanying manifest.
+"""
+
+
+class ContestScope(NamedTuple):
+    """
+    Everything we need to verify only a subset of the contests in an election: the contests'
+    object_ids, the object_ids of their selections, and the ballots whose styles include
+    any of those contests. See `make_contest_scope`.
+    """
+
+    contest_titles: FrozenSet[str]
+    """
+    Titles of the contests, as they appear in `ElectionMetadata.contest_map`.
+    """
+
+    contest_ids: FrozenSet[str]
+    """
+    ElectionGuard object_ids for the contests.
+    """
+
+    selection_ids: FrozenSet[str]
+    """
+    ElectionGuard object_ids for every selection within the contests.
+    """
+
+    ballot_ids: List[str]
+    """
+    Sorted ids of every ballot whose style includes at least one of the contests.
+    """
+
+
+def make_contest_scope(
+    metadata: ElectionMetadata,
+    election_description: ElectionDescription,
+    contest_titles: Iterable[str],
+) -> Optional[ContestScope]:
+    """
+    Given the titles of one or more contests, finds everything necessary to verify
+    just those contests. Returns `None` and logs an error if any title is unknown.
+    """
+    assert not isinstance(
+        contest_titles, str
+    ), "passed a string where a list or set of string was expected"
+
+    titles = frozenset(contest_titles)
+    unknown_titles = titles - metadata.contest_map.keys()
+    if unknown_titles:
+        log_error(f"Unknown contest titles: {sorted(unknown_titles)}")
+        return None
+
+    styles = {
+        style
+        for style, style_titles in metadata.style_map.items()
+        if style_titles.intersection(titles)
+    }
+
+    return ContestScope(
+        contest_titles=titles,
+        contest_ids=frozenset(
+            c.object_id for c in election_description.contests if c.name in titles
+        ),
+        selection_ids=frozenset(
+            s.object_id for t in titles for s in metadata.contest_map[t]
+        ),
+        ballot_ids=sorted(
+            ballot_ids_with_types(metadata.ballot_id_to_ballot_type, styles)
+        ),
+    )
+
+
+def contest_titles_matching(
+    metadata: ElectionMetadata, prefixes: Iterable[str]
+) -> Set[str]:
+    """
+    Returns a set of all contest titles that match any of the given text prefixes. If an
+    empty list of prefixes is provided, the result will be the empty-set.
+    """
+
+    # Python annoyance: strings are iterable, yielding each individual character.
+    # We're okay with List[str] or Set[str], which gets us to Iterable[str]. If the
+    # caller passes a bare string, that would preferably be a static error from mypy,
+    # but sadly it won't be, thus the need for this assertion.
+    assert not isinstance(
+        prefixes, str
+    ), "passed a string where a list or set of string was expected"
+
+    if not prefixes:
+        return set()
+    else:
+        return {
+            contest_title
+            for contest_title in sorted(metadata.contest_map.keys())
+            if [prefix for prefix in prefixes if contest_title.startswith(prefix)]
+        }
+
+
+def restrict_tally(tally: TALLY_TYPE, selection_ids: AbstractSet[str]) -> TALLY_TYPE:
+    """
+    Returns a new tally with only the given selection object_ids.
+    """
+    return {k: tally[k] for k in tally.keys() if k in selection_ids}
+
+
 def fast_tally_ballots(
-    ballots: Sequence[CiphertextBallot],
+    ballots: Sequence[TALLY_INPUT_TYPE],
     pool: Optional[Pool] = None,
 ) -> TALLY_TYPE:
     """
@@ -221,6 +356,55 @@ def fast_tally_ballots(
         initial_tallies = partial_tallies
 
 
+def fast_tally_ballots_by_prefix(
+    ballots: Sequence[CiphertextBallot],
+    pool: Optional[Pool] = None,
+    ballot_groups: Optional[Dict[str, "BALLOT_GROUPS_TYPE"]] = None,
+) -> Dict[str, TALLY_TYPE]:
+    """
+    Similar to `fast_tally_ballots`, but computes a separate partial tally for each ballot-id
+    prefix (see `group_ballot_ids_by_prefix`), returning a dict from prefixes to their
+    partial tallies. Every round of the reduction is a single `pool.map` across all the prefixes,
+    with no shard ever spanning two prefixes. The product of the results is the full tally.
+    If `ballot_groups` is specified, a dict from ballot ids to their groups, the partial tallies
+    also include grouped partial tallies (see `add_group_keys`).
+    """
+    ptallies: Dict[str, List[TALLY_INPUT_TYPE]] = {}
+    for ballot in ballots:
+        prefix = ballot.object_id[0:BALLOT_FILENAME_PREFIX_DIGITS]
+        ptallies.setdefault(prefix, []).append(
+            ballot
+            if ballot_groups is None
+            else add_group_keys(
+                ciphertext_ballot_to_dict(ballot), ballot_groups[ballot.object_id]
+            )
+        )
+
+    while True:
+        # Even when a prefix is already down to a single ballot, we run it through
+        # sequential_tally, which converts it from a ballot to TALLY_TYPE.
+        shards = [
+            (prefix, shard)
+            for prefix in sorted(ptallies.keys())
+            for shard in shard_list_uniform(ptallies[prefix], BALLOTS_PER_SHARD)
+        ]
+        inputs = [shard for _, shard in shards]
+        partial_tallies: Sequence[TALLY_TYPE] = (
+            [sequential_tally(x) for x in inputs]
+            if pool is None
+            else pool.map(func=sequential_tally, iterable=inputs)
+        )
+
+        reduced: Dict[str, List[TALLY_TYPE]] = {}
+        for (prefix, _), ptally in zip(shards, partial_tallies):
+            reduced.setdefault(prefix, []).append(ptally)
+
+        if all(len(x) == 1 for x in reduced.values()):
+            return {prefix: reduced[prefix][0] for prefix in reduced.keys()}
+
+        ptallies = {prefix: [x for x in reduced[prefix]] for prefix in reduced.keys()}
+
+
 @dataclass(eq=True, unsafe_hash=True)
 class DecryptOutput:
     object_id: str
@@ -375,6 +559,412 @@ class SelectionTally(Serializable):
         return result
 
 
+def selection_tally_from_decryption(
+    tally: TALLY_TYPE, decrypted_tally: DECRYPT_TALLY_OUTPUT_TYPE
+) -> SelectionTally:
+    """
+    Given an encrypted tally and its decryption, as we might get from `fast_decrypt_tally`,
+    assembles the corresponding `SelectionTally`.
+    """
+    return SelectionTally(
+        {
+            k: SelectionInfo(
+                object_id=k,
+                encrypted_tally=tally[k],
+                # we need to forcibly convert mpz to int here to make serialization work properly
+                decrypted_tally=int(decrypted_tally[k][0]),
+                proof=decrypted_tally[k][1],
+            )
+            for k in tally.keys()
+        }
+    )
+
+
+@dataclass(eq=True)
+class PrefixSubtotal(Serializable):
+    """
+    The homomorphic partial tally of every ballot whose id starts with `prefix`, i.e., every
+    ballot in the `ballots/<prefix>` directory. These are published alongside the tally,
+    and the product of all of them must equal the tally. This allows each directory of ballots
+    to be verified independently of the others.
+    """
+
+    prefix: str
+    """
+    Ballot-id prefix for this subtotal. See `group_ballot_ids_by_prefix`.
+    """
+
+    num_ballots: int
+    """
+    Number of ballots included in this subtotal.
+    """
+
+    tally: Dict[str, ElGamalCiphertext]
+    """
+    A mapping from selection object_ids to the encrypted subtotal for that selection.
+    """
+
+
+def subtotals_from_prefix_tallies(
+    prefix_tallies: Dict[str, TALLY_TYPE], ballot_ids: Iterable[str]
+) -> Dict[str, PrefixSubtotal]:
+    """
+    Given partial tallies per prefix, and the ids of every ballot, assembles a dict from
+    prefixes to `PrefixSubtotal` objects.
+    """
+    groups = group_ballot_ids_by_prefix(ballot_ids)
+    return {
+        prefix: PrefixSubtotal(
+            prefix, len(groups.get(prefix, [])), prefix_tallies[prefix]
+        )
+        for prefix in sorted(prefix_tallies.keys())
+    }
+
+
+def subtotals_match_tally(
+    subtotals: Dict[str, PrefixSubtotal],
+    tally: TALLY_TYPE,
+    ballot_ids: Iterable[str],
+    selection_ids: Optional[AbstractSet[str]] = None,
+) -> bool:
+    """
+    Checks that the subtotals cover exactly the given ballot ids, and that their product is
+    equal to the tally. This doesn't look at any ballots, so it's cheap. Logs errors if
+    anything doesn't match. If `selection_ids` is specified, only those selections are checked.
+    """
+    groups = group_ballot_ids_by_prefix(ballot_ids)
+    if groups.keys() != subtotals.keys():
+        log_error(
+            f"Subtotal prefixes ({sorted(subtotals.keys())}) don't match the ballot-id prefixes ({sorted(groups.keys())})"
+        )
+        return False
+
+    for prefix in sorted(groups.keys()):
+        subtotal = subtotals[prefix]
+        if subtotal.prefix != prefix or subtotal.num_ballots != len(groups[prefix]):
+            log_error(
+                f"Subtotal for prefix {prefix} has the wrong prefix ({subtotal.prefix}) or number of ballots ({subtotal.num_ballots}, expected {len(groups[prefix])})"
+            )
+            return False
+
+    if selection_ids is not None:
+        tally = restrict_tally(tally, selection_ids)
+        product = sequential_tally(
+            [
+                restrict_tally(subtotals[p].tally, selection_ids)
+                for p in sorted(subtotals.keys())
+                if not subtotals[p].tally.keys().isdisjoint(selection_ids)
+            ]
+        )
+    else:
+        product = sequential_tally(
+            [subtotals[p].tally for p in sorted(subtotals.keys())]
+        )
+
+    if product.keys() != tally.keys():
+        log_error(
+            f"Subtotal selections ({sorted(product.keys())}) don't match the tally selections ({sorted(tally.keys())})"
+        )
+        return False
+
+    return tallies_match(tally, product)
+
+
+def mismatched_subtotals(
+    subtotals: Dict[str, PrefixSubtotal],
+    prefix_tallies: Dict[str, TALLY_TYPE],
+    selection_ids: Optional[AbstractSet[str]] = None,
+) -> List[str]:
+    """
+    Given recomputed partial tallies for some prefixes, returns a sorted list of the prefixes
+    whose recomputation doesn't match the published subtotal. Logs errors for each one.
+    If `selection_ids` is specified, only those selections are compared.
+    """
+    result: List[str] = []
+    for prefix in sorted(prefix_tallies.keys()):
+        if prefix not in subtotals:
+            log_error(f"No published subtotal for prefix {prefix}")
+            result.append(prefix)
+        elif prefix_tallies[prefix] != (
+            subtotals[prefix].tally
+            if selection_ids is None
+            else restrict_tally(subtotals[prefix].tally, selection_ids)
+        ):
+            log_error(f"Recomputed subtotal doesn't match for prefix {prefix}")
+            result.append(prefix)
+    return result
+
+
+GROUP_KEY_SEPARATOR: Final[str] = "\x1f"
+"""
+Grouped partial tallies (e.g., per tabulator or per batch) travel through the tally
+computation in the same `TALLY_TYPE` dicts as the election tally, under keys made by
+`group_tally_key`, so they're accumulated in the same pass, with no extra machinery.
+This character never appears in a selection object_id or in a CVR metadata column name.
+"""
+
+BALLOT_GROUPS_TYPE = Sequence[Tuple[str, str]]
+"""
+The groups that one ballot belongs to, as (column, value) pairs from the CVR metadata.
+"""
+
+
+def group_tally_key(column: str, value: str, selection_id: str) -> str:
+    """
+    Helper function: the key, in a `TALLY_TYPE` dict, for the given selection's partial
+    tally within the group of ballots having the given value in the given CVR metadata column.
+    """
+    return GROUP_KEY_SEPARATOR.join([column, value, selection_id])
+
+
+def ballot_groups_from_row(
+    row: Dict[str, Any], group_columns: Sequence[str]
+) -> BALLOT_GROUPS_TYPE:
+    """
+    Given a row of CVR data and the names of the grouping columns, returns the groups
+    the ballot belongs to. Values are converted to strings.
+    """
+    return [(column, str(row[column])) for column in group_columns]
+
+
+def ballot_groups_by_id(
+    cvr_metadata: pd.DataFrame, group_columns: Sequence[str]
+) -> Dict[str, BALLOT_GROUPS_TYPE]:
+    """
+    Given the CVR metadata and the names of the grouping columns, returns a dict from
+    every ballot id to the groups that ballot belongs to.
+    """
+    return {
+        str(bid): [(column, str(value)) for column, value in zip(group_columns, values)]
+        for bid, *values in zip(
+            cvr_metadata["BallotId"], *(cvr_metadata[c] for c in group_columns)
+        )
+    }
+
+
+def add_group_keys(ptally: TALLY_TYPE, groups: BALLOT_GROUPS_TYPE) -> TALLY_TYPE:
+    """
+    Given the tally of a single ballot and the groups it belongs to, returns the tally along
+    with a copy of every ciphertext under the corresponding key for each group (see
+    `group_tally_key`). Tallying these costs only the extra ciphertext multiplications.
+    """
+    result = dict(ptally)
+    for column, value in groups:
+        for selection_id, ciphertext in ptally.items():
+            result[group_tally_key(column, value, selection_id)] = ciphertext
+    return result
+
+
+def partition_grouped_tally(tally: TALLY_TYPE) -> Tuple[TALLY_TYPE, TALLY_TYPE]:
+    """
+    Splits a tally, which may include grouped partial tallies (see `add_group_keys`),
+    into the ordinary tally and the grouped part.
+    """
+    plain: TALLY_TYPE = {}
+    grouped: TALLY_TYPE = {}
+    for k, v in tally.items():
+        if GROUP_KEY_SEPARATOR in k:
+            grouped[k] = v
+        else:
+            plain[k] = v
+    return plain, grouped
+
+
+def unpack_group_tallies(grouped: TALLY_TYPE) -> Dict[str, Dict[str, TALLY_TYPE]]:
+    """
+    Given the grouped part of a tally (see `partition_grouped_tally`), returns a dict from
+    column names to dicts from values to the partial tally for that group.
+    """
+    result: Dict[str, Dict[str, TALLY_TYPE]] = {}
+    for k, v in grouped.items():
+        column, rest = k.split(GROUP_KEY_SEPARATOR, 1)
+        value, selection_id = rest.rsplit(GROUP_KEY_SEPARATOR, 1)
+        result.setdefault(column, {}).setdefault(value, {})[selection_id] = v
+    return result
+
+
+def partition_prefix_tallies(
+    prefix_tallies: Dict[str, TALLY_TYPE]
+) -> Tuple[Dict[str, TALLY_TYPE], Dict[str, Dict[str, TALLY_TYPE]]]:
+    """
+    Given partial tallies per prefix, which may include grouped partial tallies, returns
+    the ordinary partial tallies per prefix, and the grouped tallies for all the prefixes
+    combined (see `unpack_group_tallies`).
+    """
+    plain: Dict[str, TALLY_TYPE] = {}
+    grouped_parts: List[TALLY_TYPE] = []
+    for prefix in sorted(prefix_tallies.keys()):
+        plain[prefix], grouped = partition_grouped_tally(prefix_tallies[prefix])
+        if grouped:
+            grouped_parts.append(grouped)
+
+    return (
+        plain,
+        unpack_group_tallies(sequential_tally(grouped_parts)) if grouped_parts else {},
+    )
+
+
+@dataclass(eq=True)
+class GroupSubtotal(Serializable):
+    """
+    The decrypted subtotal, with proofs, of every ballot having a particular value in
+    a particular column of the CVR metadata (e.g., a tabulator or a batch). These are
+    computed in the same pass as the tally, and are published alongside it.
+    """
+
+    value: str
+    """
+    Value in the CVR metadata column shared by every ballot in this group, as a string.
+    """
+
+    num_ballots: int
+    """
+    Number of ballots included in this subtotal.
+    """
+
+    tally: SelectionTally
+    """
+    The encrypted and decrypted subtotals, with proofs, for every selection on these ballots.
+    """
+
+
+@dataclass(eq=True)
+class GroupSubtotals(Serializable):
+    """
+    Every `GroupSubtotal` for a single column of the CVR metadata. The product of
+    the encrypted subtotals must equal the tally.
+    """
+
+    column: str
+    """
+    Name of the CVR metadata column (e.g., "TabulatorNum", "BatchId", or "CountingGroup").
+    """
+
+    groups: Dict[str, GroupSubtotal]
+    """
+    A mapping from each distinct value in the column to the subtotal for those ballots.
+    """
+
+
+def make_group_subtotals(
+    grouped: TALLY_TYPE,
+    decrypted_grouped: DECRYPT_TALLY_OUTPUT_TYPE,
+    cvr_metadata: pd.DataFrame,
+) -> Dict[str, GroupSubtotals]:
+    """
+    Given the grouped part of a tally (see `partition_grouped_tally`), its decryption, as we
+    might get from `fast_decrypt_tally`, and the CVR metadata, assembles a dict from column
+    names to their `GroupSubtotals`.
+    """
+    result: Dict[str, GroupSubtotals] = {}
+    decrypted_groups = unpack_group_tallies(grouped)
+    for column in sorted(decrypted_groups.keys()):
+        counts = cvr_metadata[column].astype(str).value_counts()
+        result[column] = GroupSubtotals(
+            column,
+            {
+                value: GroupSubtotal(
+                    value,
+                    int(counts[value]),
+                    selection_tally_from_decryption(
+                        group_tally,
+                        {
+                            sid: decrypted_grouped[group_tally_key(column, value, sid)]
+                            for sid in group_tally.keys()
+                        },
+                    ),
+                )
+                for value, group_tally in sorted(decrypted_groups[column].items())
+            },
+        )
+    return result
+
+
+def group_subtotal_selections(
+    group_subtotals: Dict[str, GroupSubtotals],
+    selection_ids: Optional[AbstractSet[str]] = None,
+) -> List[SelectionInfo]:
+    """
+    Returns every `SelectionInfo` in the group subtotals, so their proofs can be checked
+    along with the tally's. If `selection_ids` is specified, only those selections are included.
+    """
+    return [
+        info
+        for column in sorted(group_subtotals.keys())
+        for group in group_subtotals[column].groups.values()
+        for sid, info in group.tally.map.items()
+        if selection_ids is None or sid in selection_ids
+    ]
+
+
+def group_subtotals_match_tally(
+    group_subtotals: Dict[str, GroupSubtotals],
+    tally: TALLY_TYPE,
+    cvr_metadata: pd.DataFrame,
+    selection_ids: Optional[AbstractSet[str]] = None,
+) -> bool:
+    """
+    Checks that every column's groups cover exactly the ballots in the CVR metadata, and that the
+    product of each column's subtotals is equal to the tally. This doesn't look at any ballots, and
+    doesn't check the decryption proofs (see `group_subtotal_selections`). Logs errors if anything
+    doesn't match. If `selection_ids` is specified, only those selections are checked.
+    """
+    if selection_ids is not None:
+        tally = restrict_tally(tally, selection_ids)
+
+    for column in sorted(group_subtotals.keys()):
+        subtotals = group_subtotals[column]
+        if subtotals.column != column or column not in cvr_metadata.columns:
+            log_error(f"Group subtotals for an unknown column: {column}")
+            return False
+
+        counts = cvr_metadata[column].astype(str).value_counts()
+        expected = {str(value): int(n) for value, n in counts.items()}
+        actual = {value: g.num_ballots for value, g in subtotals.groups.items()}
+        if expected != actual or any(
+            g.value != value for value, g in subtotals.groups.items()
+        ):
+            log_error(f"Group subtotals for {column} don't match the CVR metadata")
+            return False
+
+        group_tallies = [
+            g.tally.to_tally_map()
+            if selection_ids is None
+            else restrict_tally(g.tally.to_tally_map(), selection_ids)
+            for g in subtotals.groups.values()
+        ]
+        product = sequential_tally([t for t in group_tallies if t])
+        if product.keys() != tally.keys() or not tallies_match(tally, product):
+            log_error(f"Group subtotals for {column} don't match the tally")
+            return False
+
+    return True
+
+
+def mismatched_group_subtotals(
+    group_subtotals: Dict[str, GroupSubtotals],
+    group_tallies: Dict[str, Dict[str, TALLY_TYPE]],
+    selection_ids: Optional[AbstractSet[str]] = None,
+) -> List[Tuple[str, str]]:
+    """
+    Given recomputed grouped tallies (see `unpack_group_tallies`), returns a sorted list of the
+    (column, value) pairs whose recomputation doesn't match the published subtotal. Logs errors
+    for each one. If `selection_ids` is specified, only those selections are compared.
+    """
+    result: List[Tuple[str, str]] = []
+    for column in sorted(group_subtotals.keys()):
+        groups = group_subtotals[column].groups
+        recomputed = group_tallies.get(column, {})
+        for value in sorted(set(groups.keys()) | set(recomputed.keys())):
+            published = groups[value].tally.to_tally_map() if value in groups else {}
+            if selection_ids is not None:
+                published = restrict_tally(published, selection_ids)
+            if recomputed.get(value, {}) != published:
+                log_error(f"Recomputed subtotal doesn't match for {column} = {value}")
+                result.append((column, value))
+    return result
+
+
 def verify_tally_selection_proof(
     public_key: ElementModP, hash_header: Optional[ElementModQ], s: SelectionInfo
 ) -> bool:  # pragma: no cover
@@ -438,6 +1028,24 @@ class FastTallyEverythingResults(NamedTuple):
     Cryptographic context used in creating the tally.
     """
 
+    manifest: Optional[Manifest] = None
+    """
+    Cryptographic manifest for the ballots, if they were loaded from disk. When present,
+    verification can stream the ballots from disk rather than keeping them all in memory.
+    """
+
+    subtotals: Optional[Dict[str, PrefixSubtotal]] = None
+    """
+    Published partial tallies, one per ballot-id prefix, if present. When present,
+    each directory of ballots can be verified independently. (See `verify_prefixes`.)
+    """
+
+    group_subtotals: Optional[Dict[str, GroupSubtotals]] = None
+    """
+    Published decrypted subtotals, with proofs, for groups of ballots defined by columns of
+    the CVR metadata (e.g., per tabulator or per batch), if present. Keys are the column names.
+    """
+
     def all_files_present(self) -> bool:
         """
         Loads every encrypted ballot, but does not check the proofs. If any file does
@@ -508,6 +1116,7 @@ class FastTallyEverythingResults(NamedTuple):
         pool: Optional[Pool] = None,
         verbose: bool = True,
         recheck_ballots_and_tallies: bool = False,
+        contests: Optional[Iterable[str]] = None,
     ) -> bool:
         """
         Checks all the proofs used in this tally, returns True if everything is good.
@@ -515,8 +1124,20 @@ class FastTallyEverythingResults(NamedTuple):
         with the totals. If you want to also recompute the tally (i.e., tabulate the
         encrypted ballots) and verify every individual ballot proof, then set
         `recheck_ballots_and_tallies` to True.
+
+        If `contests` is specified, as a list of contest titles, then only the proofs and tallies
+        for those contests are checked, and only the ballots whose styles include those contests
+        are loaded. This is much faster for an observer who only cares about one race.
         """
 
+        scope: Optional[ContestScope] = None
+        if contests is not None:
+            scope = make_contest_scope(
+                self.metadata, self.election_description, contests
+            )
+            if scope is None:
+                return False
+
         wrapped_func = functools.partial(
             verify_tally_selection_proof,
             self.context.elgamal_public_key,
@@ -524,7 +1145,14 @@ class FastTallyEverythingResults(NamedTuple):
         )
         start = timer()
 
-        inputs = self.tally.map.values()
+        selection_ids = scope.selection_ids if scope is not None else None
+        inputs = [
+            self.tally.map[k]
+            for k in self.tally.map.keys()
+            if selection_ids is None or k in selection_ids
+        ]
+        if self.group_subtotals is not None:
+            inputs += group_subtotal_selections(self.group_subtotals, selection_ids)
         if verbose:  # pragma: no cover
             inputs = tqdm(list(inputs), "Tally proof")
 
@@ -536,70 +1164,276 @@ class FastTallyEverythingResults(NamedTuple):
         end = timer()
         log_and_print(f"Verification time: {end - start: .3f} sec", verbose)
         log_and_print(
-            f"Verification rate: {len(self.tally.map.keys()) / (end - start): .3f} selection/sec",
+            f"Verification rate: {len(result) / (end - start): .3f} selection/sec",
             verbose,
         )
 
         if False in result:
             return False
 
+        if self.subtotals is not None and not subtotals_match_tally(
+            self.subtotals,
+            self.tally.to_tally_map(),
+            self.metadata.ballot_id_to_ballot_type.keys(),
+            selection_ids,
+        ):
+            return False
+
+        if self.group_subtotals is not None and not group_subtotals_match_tally(
+            self.group_subtotals,
+            self.tally.to_tally_map(),
+            self.cvr_metadata,
+            selection_ids,
+        ):
+            return False
+
         if recheck_ballots_and_tallies:
-            # first, try to load all the ballots and make sure there are no hash errors
-            if not self.all_files_present():
-                return False
+            tally_success, _ = self.verify_recomputed_tally(pool, scope, verbose)
+            return tally_success
 
-            # next, check each individual ballot's proofs; in this case, we're going to always
-            # show the progress bar, even if verbose is false
-            ballot_iter = tqdm(self.encrypted_ballots, desc="Ballot proofs")
-            ballot_func = functools.partial(verify_ballot_proof, self.context)
+        return True
 
-            ballot_start = timer()
-            ballot_result: List[bool] = (
-                [ballot_func(x) for x in ballot_iter]
-                if pool is None
-                else pool.map(func=ballot_func, iterable=ballot_iter)
-            )
+    def verify_recomputed_tally(
+        self,
+        pool: Optional[Pool] = None,
+        scope: Optional[ContestScope] = None,
+        verbose: bool = True,
+    ) -> Tuple[bool, Optional[Dict[str, TALLY_TYPE]]]:
+        """
+        Checks every individual ballot's hash and proofs while recomputing the tally, in
+        a single pass, and compares the result to the published tally and to any published
+        subtotals. (This is what `all_proofs_valid` does with `recheck_ballots_and_tallies`.)
+        Returns whether everything matched, along with the recomputed partial tallies per
+        ballot-id prefix. These are returned even when they don't match, so they can be handed
+        to `locate_tally_faults` without loading every ballot again. They're `None` if any
+        ballot failed to load or verify. If `scope` is specified (see `make_contest_scope`),
+        only the ballots and contests within it are considered.
+        """
+        selection_ids = scope.selection_ids if scope is not None else None
+
+        # first, make sure the ballots we have are exactly the ballots in the metadata
+        if (
+            self.encrypted_ballot_memos.keys()
+            != self.metadata.ballot_id_to_ballot_type.keys()
+        ):
+            log_error("Ballot ids don't match the ballot ids in the metadata")
+            return False, None
+
+        # next, check each individual ballot's hash and proofs while recomputing the tally,
+        # in a single pass; in this case, we're going to always show the progress bar,
+        # even if verbose is false
+        ballot_start = timer()
+        group_columns = (
+            sorted(self.group_subtotals.keys())
+            if self.group_subtotals is not None
+            else None
+        )
+        all_prefix_tallies = self.recompute_prefix_tallies(
+            pool, scope=scope, group_columns=group_columns
+        )
+        ballot_end = timer()
+        num_ballots = len(scope.ballot_ids) if scope is not None else self.num_ballots
+        log_and_print(
+            f"Ballot verification rate: {num_ballots / (ballot_end - ballot_start): .3f} ballot/sec",
+            verbose,
+        )
 
-            ballot_end = timer()
-            log_and_print(
-                f"Ballot verification rate: {len(self.encrypted_ballots) / (ballot_end - ballot_start): .3f} ballot/sec",
-                verbose,
+        if all_prefix_tallies is None:
+            return False, None
+
+        prefix_tallies, group_tallies = partition_prefix_tallies(all_prefix_tallies)
+
+        if self.subtotals is not None and mismatched_subtotals(
+            self.subtotals, prefix_tallies, selection_ids
+        ):
+            return False, prefix_tallies
+
+        if self.group_subtotals is not None and mismatched_group_subtotals(
+            self.group_subtotals, group_tallies, selection_ids
+        ):
+            return False, prefix_tallies
+
+        recomputed_tally = sequential_tally(
+            [prefix_tallies[p] for p in sorted(prefix_tallies.keys())]
+        )
+        provided_tally = self.tally.to_tally_map()
+        if selection_ids is not None:
+            provided_tally = restrict_tally(provided_tally, selection_ids)
+
+        if not tallies_match(provided_tally, recomputed_tally):
+            log_error(
+                "Recomputed tally doesn't match; use `locate_tally_faults` (or arlo_verify_tally --locate-faults) to find the ballots responsible"
             )
+            return False, prefix_tallies
 
-            if False in ballot_result:
-                return False
+        return True, prefix_tallies
 
-            log_and_print("Recomputing tallies:", verbose)
-            recomputed_tally = fast_tally_ballots(self.encrypted_ballots, pool)
-            tally_success = tallies_match(self.tally.to_tally_map(), recomputed_tally)
+    def verify_prefixes(
+        self,
+        prefixes: Iterable[str],
+        pool: Optional[Pool] = None,
+        verbose: bool = True,
+    ) -> bool:
+        """
+        Incremental verification: checks the hashes and proofs of only the ballots with the
+        given ballot-id prefixes (i.e., the ballots in `ballots/<prefix>`), recomputes their partial
+        tallies, and compares them to the published subtotals. Also checks that the product
+        of the subtotals is equal to the tally, which doesn't require looking at any ballots.
+        Different prefixes can thus be verified on different computers, or at different times,
+        and only directories whose contents have changed need to be checked again. (See
+        `Manifest.changed_prefixes`.) Returns True if everything is good.
+        """
+        if self.subtotals is None:
+            log_error("Cannot verify prefixes without published subtotals")
+            return False
 
-            if not tally_success:
-                return False
+        if not subtotals_match_tally(
+            self.subtotals,
+            self.tally.to_tally_map(),
+            self.metadata.ballot_id_to_ballot_type.keys(),
+        ):
+            return False
 
-        return True
+        prefix_list = sorted(set(prefixes))
+        unknown_prefixes = [p for p in prefix_list if p not in self.subtotals]
+        if unknown_prefixes:
+            log_error(f"Unknown ballot-id prefixes: {unknown_prefixes}")
+            return False
+
+        start = timer()
+        prefix_tallies = self.recompute_prefix_tallies(pool, prefix_list)
+        end = timer()
+        log_and_print(
+            f"Verified {len(prefix_list)} prefixes in {end - start: .3f} sec", verbose
+        )
+
+        if prefix_tallies is None:
+            return False
+
+        return not mismatched_subtotals(self.subtotals, prefix_tallies)
+
+    def _ballot_shards(
+        self,
+        prefixes: Optional[Sequence[str]] = None,
+        ballot_ids: Optional[Iterable[str]] = None,
+    ) -> Iterator[BALLOT_SHARD_TYPE]:
+        """
+        Internal generator: breaks the ballots up into shards for verification. Shards never
+        span two ballot-id prefixes (see `group_ballot_ids_by_prefix`). Ballots that
+        are already in memory are passed along directly, while ballots that haven't been
+        loaded are passed by name, with just enough of the manifest to load them. Either way,
+        the ballots aren't cached here, so they can be garbage collected once verified.
+        If `ballot_ids` is specified, only those ballots are included.
+        """
+        groups = group_ballot_ids_by_prefix(
+            self.encrypted_ballot_memos.keys() if ballot_ids is None else ballot_ids
+        )
+        shards = flatmap(
+            lambda prefix: shard_list_uniform(groups[prefix], VERIFY_BALLOTS_PER_SHARD),
+            groups.keys() if prefixes is None else [p for p in prefixes if p in groups],
+        )
+        for shard in shards:
+            if self.manifest is None:
+                yield None, [self.encrypted_ballot_memos[bid].contents for bid in shard]
+            else:
+                memos = [self.encrypted_ballot_memos[bid] for bid in shard]
+                yield (
+                    self.manifest.subset_for_ballots(
+                        bid for bid, m in zip(shard, memos) if not m.is_evaluated
+                    ),
+                    [
+                        m.contents if m.is_evaluated else bid
+                        for bid, m in zip(shard, memos)
+                    ],
+                )
+
+    def recompute_prefix_tallies(
+        self,
+        pool: Optional[Pool] = None,
+        prefixes: Optional[Sequence[str]] = None,
+        scope: Optional[ContestScope] = None,
+        group_columns: Optional[Sequence[str]] = None,
+    ) -> Optional[Dict[str, TALLY_TYPE]]:
+        """
+        Loads every ballot exactly once, checks its hash and its proofs, and folds it into
+        a partial tally for its ballot-id prefix (see `group_ballot_ids_by_prefix`). Shards are
+        made as they're needed, and at most `VERIFY_SHARDS_IN_FLIGHT_PER_CPU` per CPU are
+        handed to the pool at any given time, so memory use grows with the number of prefixes,
+        not the number of ballots. Returns a dict from prefixes to their
+        partial tallies, or `None` if anything failed to load or verify. If `prefixes` is
+        specified, only the ballots with those prefixes are considered. If `scope` is specified
+        (see `make_contest_scope`), only the ballots and contests within it are considered.
+        If `group_columns` is specified, the partial tallies also include grouped partial tallies
+        for those columns of the CVR metadata, in the same pass (see `partition_prefix_tallies`).
+
+        The product of the partial tallies is the recomputed tally. If it doesn't match, the
+        partial tallies can be handed to `locate_tally_faults` to find the ballots responsible.
+        """
+        contest_ids = scope.contest_ids if scope is not None else None
+        ballot_ids = (
+            scope.ballot_ids
+            if scope is not None
+            else list(self.encrypted_ballot_memos.keys())
+        )
+        shards: Iterable[Any] = self._ballot_shards(prefixes, ballot_ids)
+        if group_columns is None:
+            shard_func: Callable[
+                [Any], Optional[Tuple[str, int, TALLY_TYPE]]
+            ] = functools.partial(
+                verify_and_tally_ballot_shard, self.context, contest_ids=contest_ids
+            )
+        else:
+            # each shard travels with the groups of its ballots
+            ballot_groups = ballot_groups_by_id(self.cvr_metadata, group_columns)
+            shards = (
+                (shard, [ballot_groups.get(_shard_ballot_id(b), []) for b in shard[1]])
+                for shard in shards
+            )
+            shard_func = functools.partial(
+                _verify_and_tally_grouped_shard, self.context, contest_ids
+            )
+        prefix_set = set(prefixes) if prefixes is not None else None
+        num_ballots = (
+            len(ballot_ids)
+            if prefix_set is None
+            else sum(
+                1
+                for bid in ballot_ids
+                if bid[0:BALLOT_FILENAME_PREFIX_DIGITS] in prefix_set
+            )
+        )
+        results: Iterable[Optional[Tuple[str, int, TALLY_TYPE]]] = (
+            map(shard_func, shards)
+            if pool is None
+            else imap_unordered_bounded(
+                pool,
+                shard_func,
+                shards,
+                VERIFY_SHARDS_IN_FLIGHT_PER_CPU * (os.cpu_count() or 1),
+            )
+        )
+
+        prefix_tallies: Dict[str, TALLY_TYPE] = {}
+        with tqdm(total=num_ballots, desc="Ballot proofs") as progress:
+            for result in results:
+                if result is None:
+                    return None
+                prefix, num_shard_ballots, ptally = result
+                prefix_tallies[prefix] = (
+                    sequential_tally([prefix_tallies[prefix], ptally])
+                    if prefix in prefix_tallies
+                    else ptally
+                )
+                progress.update(num_shard_ballots)
+
+        return prefix_tallies
 
     def get_contest_titles_matching(self, prefixes: Iterable[str]) -> Set[str]:
         """
         Returns a set of all contest titles that match any of the given text prefixes. If an
         empty list of prefixes is provided, the result will be the empty-set.
         """
-
-        # Python annoyance: strings are iterable, yielding each individual character.
-        # We're okay with List[str] or Set[str], which gets us to Iterable[str]. If the
-        # caller passes a bare string, that would preferably be a static error from mypy,
-        # but sadly it won't be, thus the need for this assertion.
-        assert not isinstance(
-            prefixes, str
-        ), "passed a string where a list or set of string was expected"
-
-        if not prefixes:
-            return set()
-        else:
-            return {
-                contest_title
-                for contest_title in sorted(self.metadata.contest_map.keys())
-                if [prefix for prefix in prefixes if contest_title.startswith(prefix)]
-            }
+        return contest_titles_matching(self.metadata, prefixes)
 
     def get_ballot_styles_for_contest_titles(
         self, contest_titles: Iterable[str]
@@ -649,13 +1483,9 @@ class FastTallyEverythingResults(NamedTuple):
             ballot_styles, str
         ), "passed a string where a list or set of string was expected"
 
-        matching_ballot_ids = [
-            bid
-            for bid in self.metadata.ballot_id_to_ballot_type.keys()
-            if self.metadata.ballot_id_to_ballot_type[bid] in ballot_styles
-        ]
-
-        return matching_ballot_ids
+        return ballot_ids_with_types(
+            self.metadata.ballot_id_to_ballot_type, ballot_styles
+        )
 
     def equivalent(
         self,
@@ -738,6 +1568,135 @@ def verify_ballot_proof(
     )
 
 
+def verify_ballot_contest_proofs(
+    ballot: CiphertextAcceptedBallot,
+    contest_ids: AbstractSet[str],
+    public_key: ElementModP,
+    hash_header: ElementModQ,
+) -> bool:  # pragma: no cover
+    """
+    Given a ballot, verify its hash, and then the Chaum-Pedersen proofs of only the given
+    contests and their selections. The ballot hash covers every contest, so this still
+    detects tampering with the rest of the ballot, but skips the expensive proof checks.
+    """
+    if ballot.crypto_hash != ballot.crypto_hash_with(ballot.description_hash):
+        log_error(f"Mismatching crypto hash for ballot {ballot.object_id}")
+        return False
+
+    for contest in ballot.contests:
+        if contest.object_id not in contest_ids:
+            continue
+        if not contest.is_valid_encryption(
+            contest.description_hash,
+            public_key,
+            hash_header,
+        ):
+            return False
+        for selection in contest.ballot_selections:
+            if not selection.is_valid_encryption(
+                selection.description_hash,
+                public_key,
+                hash_header,
+            ):
+                return False
+    return True
+
+
+def ciphertext_ballot_contests_to_dict(
+    ballot: CiphertextAcceptedBallot, contest_ids: AbstractSet[str]
+) -> TALLY_TYPE:
+    """
+    Like `ciphertext_ballot_to_dict`, but only includes the selections of the given contests.
+    Placeholder selections are skipped.
+    """
+    return {
+        selection.object_id: selection.ciphertext
+        for contest in ballot.contests
+        if contest.object_id in contest_ids
+        for selection in contest.ballot_selections
+        if not selection.is_placeholder_selection
+    }
+
+
+def _shard_ballot_id(b: Union[str, Optional[CiphertextAcceptedBallot]]) -> str:
+    if isinstance(b, str):
+        return b
+    return b.object_id if b is not None else ""
+
+
+def _verify_and_tally_grouped_shard(
+    cec: CiphertextElectionContext,
+    contest_ids: Optional[AbstractSet[str]],
+    shard_and_groups: Tuple[BALLOT_SHARD_TYPE, Sequence[BALLOT_GROUPS_TYPE]],
+) -> Optional[Tuple[str, int, TALLY_TYPE]]:  # pragma: no cover
+    shard, ballot_groups = shard_and_groups
+    return verify_and_tally_ballot_shard(cec, shard, contest_ids, ballot_groups)
+
+
+def verify_and_tally_ballot_shard(
+    cec: CiphertextElectionContext,
+    shard: BALLOT_SHARD_TYPE,
+    contest_ids: Optional[AbstractSet[str]] = None,
+    ballot_groups: Optional[Sequence[BALLOT_GROUPS_TYPE]] = None,
+) -> Optional[Tuple[str, int, TALLY_TYPE]]:  # pragma: no cover
+    """
+    Given a shard of ballots (see `BALLOT_SHARD_TYPE`), loads each ballot (checking its hash),
+    verifies its proofs, and accumulates it into a partial tally. Each ballot is dropped as
+    soon as it's been accumulated. Returns the ballot-id prefix of the shard, the number of
+    ballots, and their partial tally. If any ballot fails to load or to verify, the result
+    is `None`. If `contest_ids` is specified, only those contests are verified and tallied.
+    If `ballot_groups` is specified, with the groups of each ballot in the shard, the partial
+    tally also includes the grouped partial tallies (see `add_group_keys`).
+    """
+    manifest, ballots_or_ids = shard
+    ptally: Optional[TALLY_TYPE] = None
+    ballot: Optional[CiphertextAcceptedBallot] = None
+
+    for i, b in enumerate(ballots_or_ids):
+        if isinstance(b, str):
+            ballot = (
+                manifest.load_ciphertext_ballot(b) if manifest is not None else None
+            )
+            if ballot is None or ballot.object_id != b:
+                log_error(f"Failed to load ballot {b}")
+                return None
+        elif b is None:
+            # an error will have been logged when the ballot failed to load
+            return None
+        else:
+            ballot = b
+
+        if contest_ids is None:
+            valid = verify_ballot_proof(cec, ballot)
+            ballot_tally = ciphertext_ballot_to_dict(ballot)
+        else:
+            valid = verify_ballot_contest_proofs(
+                ballot,
+                contest_ids,
+                cec.elgamal_public_key,
+                cec.crypto_extended_base_hash,
+            )
+            ballot_tally = ciphertext_ballot_contests_to_dict(ballot, contest_ids)
+
+        if not valid:
+            log_error(f"Ballot proofs failed for ballot {ballot.object_id}")
+            return None
+
+        if ballot_groups is not None:
+            ballot_tally = add_group_keys(ballot_tally, ballot_groups[i])
+
+        ptally = sequential_tally([ptally, ballot_tally]) if ptally else ballot_tally
+
+    if ptally is None or ballot is None:
+        return None
+
+    return (
+        ballot.object_id[0:BALLOT_FILENAME_PREFIX_DIGITS],
+        len(ballots_or_ids),
+        ptally,
+    )
+
+
 def fast_tally_everything(
     cvrs: DominionCSV,
     pool: Optional[Pool] = None,
@@ -747,6 +1706,7 @@ def fast_tally_everything(
     master_nonce: Optional[ElementModQ] = None,
     secret_key: Optional[ElementModQ] = None,
     use_progressbar: bool = True,
+    group_columns: Optional[Sequence[str]] = None,
 ) -> FastTallyEverythingResults:
     """
     This top-level function takes a collection of Dominion CVRs and produces everything that
@@ -757,6 +1717,10 @@ def fast_tally_everything(
 
     For parallelism, a `multiprocessing.pool.Pool` may be provided, and should result in significant
     speedups on multicore computers. If absent, the computation will proceed sequentially.
+
+    If `group_columns` is specified, with names of CVR metadata columns (e.g., "TabulatorNum"
+    or "BatchId"), then decrypted subtotals, with proofs, are also computed for each distinct
+    value of each of those columns, in the same pass as the tally.
     """
     rows, cols = cvrs.data.shape
 
@@ -821,7 +1785,13 @@ def fast_tally_everything(
         verbose,
     )
 
-    tally: TALLY_TYPE = fast_tally_ballots(cballots, pool)
+    ballot_groups = (
+        ballot_groups_by_id(cvrs.data, group_columns) if group_columns else None
+    )
+    prefix_tallies = fast_tally_ballots_by_prefix(cballots, pool, ballot_groups)
+    tally: TALLY_TYPE = fast_tally_ballots(list(prefix_tallies.values()), pool)
+    prefix_tallies, _ = partition_prefix_tallies(prefix_tallies)
+    tally, grouped = partition_grouped_tally(tally)
     eg_tabulate_time = timer()
 
     log_and_print(
@@ -860,18 +1830,33 @@ def fast_tally_everything(
         decryption, proof = decrypted_tally[obj_id]
         assert cvr_sum == decryption, f"decryption failed for {obj_id}"
 
+    group_subtotals: Optional[Dict[str, GroupSubtotals]] = None
+    if grouped:
+        # the group proofs need nonces that are distinct from those of the tally proofs
+        decrypted_grouped = fast_decrypt_tally(
+            grouped,
+            cec,
+            keypair,
+            hash_elems(seed_hash, "group_subtotals"),
+            pool,
+            verbose,
+        )
+        for column, groups in unpack_group_tallies(grouped).items():
+            values = cvrs.data[column].astype(str)
+            for value, group_tally in groups.items():
+                for obj_id in group_tally.keys():
+                    cvr_sum = int(cvrs.data[id_map[obj_id]][values == value].sum())
+                    decryption, proof = decrypted_grouped[
+                        group_tally_key(column, value, obj_id)
+                    ]
+                    assert (
+                        cvr_sum == decryption
+                    ), f"decryption failed for {obj_id} in {column} = {value}"
+        group_subtotals = make_group_subtotals(grouped, decrypted_grouped, cvrs.data)
+
     # Assemble the data structure that we're returning. Having nonces in the ciphertext makes these
     # structures sensitive for writing out to disk, but otherwise they're ready to go.
-    reported_tally: Dict[str, SelectionInfo] = {
-        k: SelectionInfo(
-            object_id=k,
-            encrypted_tally=tally[k],
-            # we need to forcibly convert mpz to int here to make serialization work properly
-            decrypted_tally=int(decrypted_tally[k][0]),
-            proof=decrypted_tally[k][1],
-        )
-        for k in tally.keys()
-    }
+    reported_tally = selection_tally_from_decryption(tally, decrypted_tally)
 
     # strips the ballots of their nonces, which is important because those could allow for decryption
     accepted_ballots = [ciphertext_ballot_to_accepted(x) for x in cballots]
@@ -883,8 +1868,12 @@ def fast_tally_everything(
         encrypted_ballot_memos={
             ballot.object_id: make_memo_value(ballot) for ballot in accepted_ballots
         },
-        tally=SelectionTally(reported_tally),
+        tally=reported_tally,
         context=cec,
+        subtotals=subtotals_from_prefix_tallies(
+            prefix_tallies, [b.object_id for b in cballots]
+        ),
+        group_subtotals=group_subtotals,
     )
 
 
@@ -897,8 +1886,7 @@ def ballot_memos_from_metadata(
     """
     ballot_memos: Dict[str, Memo[CiphertextAcceptedBallot]] = {}
 
-    for index, row in cvr_metadata.iterrows():
-        ballot_id = row["BallotId"]
+    for ballot_id in cvr_metadata["BallotId"]:
         ballot_memo = (
             lambda b, m: make_memo_lambda(lambda: m.load_ciphertext_ballot(b))
         )(ballot_id, manifest)
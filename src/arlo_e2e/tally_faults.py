@@ -0,0 +1,224 @@
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from electionguard.ballot import CiphertextAcceptedBallot
+from electionguard.decrypt_with_secrets import ciphertext_ballot_to_dict
+from electionguard.elgamal import ElGamalKeyPair
+from electionguard.logs import log_error
+
+from arlo_e2e.dominion import DominionCSV
+from arlo_e2e.eg_helpers import log_and_print
+from arlo_e2e.tally import (
+    FastTallyEverythingResults,
+    PrefixSubtotal,
+    TALLY_TYPE,
+    sequential_tally,
+)
+from arlo_e2e.utils import group_ballot_ids_by_prefix
+
+CONSISTENCY_ORACLE_TYPE = Callable[[Sequence[str], TALLY_TYPE], bool]
+"""
+A function that's given a list of ballot ids and the partial tally of exactly those
+ballots, and returns whether that partial tally is what it should be. Where "should"
+comes from is up to the oracle: decrypting the partial tally and comparing it to the
+original CVRs, or comparing it to a published subtotal, etc.
+"""
+
+
+class TallyFaults(NamedTuple):
+    """
+    The output of `locate_tally_faults`.
+    """
+
+    mismatched_selections: List[str]
+    """
+    Selection object_ids where the recomputed tally differs from the published tally.
+    """
+
+    faulty_prefixes: List[str]
+    """
+    Ballot-id prefixes whose partial tallies were found to be inconsistent.
+    """
+
+    faulty_ballot_ids: List[str]
+    """
+    Individual ballots whose encryptions were found to be inconsistent.
+    """
+
+    num_oracle_calls: int
+    """
+    How many times the consistency oracle was consulted. For a single faulty ballot,
+    this grows logarithmically with the number of ballots.
+    """
+
+
+def mismatched_selections(
+    provided_tally: TALLY_TYPE, recomputed_tally: TALLY_TYPE
+) -> List[str]:
+    """
+    Returns a sorted list of the selection object_ids where the two tallies disagree,
+    including selections that are present in one tally but not the other.
+    """
+    return sorted(
+        k
+        for k in provided_tally.keys() | recomputed_tally.keys()
+        if provided_tally.get(k) != recomputed_tally.get(k)
+    )
+
+
+def locate_tally_faults(
+    results: FastTallyEverythingResults,
+    prefix_tallies: Dict[str, TALLY_TYPE],
+    is_consistent: CONSISTENCY_ORACLE_TYPE,
+    verbose: bool = True,
+) -> Optional[TallyFaults]:
+    """
+    Given the partial tallies per ballot-id prefix, as computed by
+    `FastTallyEverythingResults.recompute_prefix_tallies`, searches for the ballots responsible
+    for an inconsistent tally. The search descends a binary reduction tree over the prefixes,
+    only visiting subtrees that the oracle says are inconsistent. Within an inconsistent prefix,
+    the ballots are loaded once and bisected by re-tallying halves. A single bad ballot is found
+    with a number of oracle calls that's logarithmic in the number of ballots.
+
+    Faults that exactly cancel each other out within a subtree can't be seen by this search.
+
+    Returns `None` if any ballot fails to load.
+    """
+    ballot_ids_by_prefix = group_ballot_ids_by_prefix(
+        results.encrypted_ballot_memos.keys()
+    )
+    recomputed_tally = sequential_tally(
+        [prefix_tallies[p] for p in sorted(prefix_tallies.keys())]
+    )
+    selections = mismatched_selections(results.tally.to_tally_map(), recomputed_tally)
+
+    num_oracle_calls = 0
+    faulty_prefixes: List[str] = []
+    faulty_ballot_ids: List[str] = []
+
+    def consistent(ballot_ids: Sequence[str], tally: TALLY_TYPE) -> bool:
+        nonlocal num_oracle_calls
+        num_oracle_calls += 1
+        return is_consistent(ballot_ids, tally)
+
+    def search_ballots(ballots: List[TALLY_TYPE], ballot_ids: List[str]) -> None:
+        if len(ballot_ids) == 1:
+            faulty_ballot_ids.append(ballot_ids[0])
+            return
+
+        mid = len(ballot_ids) // 2
+        for lo, hi in ((0, mid), (mid, len(ballot_ids))):
+            tally = sequential_tally(ballots[lo:hi])
+            if not consistent(ballot_ids[lo:hi], tally):
+                search_ballots(ballots[lo:hi], ballot_ids[lo:hi])
+
+    def search_prefixes(prefixes: List[str]) -> bool:
+        if len(prefixes) == 1:
+            prefix = prefixes[0]
+            faulty_prefixes.append(prefix)
+            ballot_ids = ballot_ids_by_prefix[prefix]
+            ballots = [_load_ballot(results, bid) for bid in ballot_ids]
+            if None in ballots:
+                return False
+            search_ballots(
+                [ciphertext_ballot_to_dict(b) for b in ballots if b is not None],
+                ballot_ids,
+            )
+            return True
+
+        mid = len(prefixes) // 2
+        for half in (prefixes[0:mid], prefixes[mid:]):
+            tally = sequential_tally([prefix_tallies[p] for p in half])
+            ballot_ids = [bid for p in half for bid in ballot_ids_by_prefix[p]]
+            if not consistent(ballot_ids, tally) and not search_prefixes(half):
+                return False
+        return True
+
+    all_prefixes = sorted(prefix_tallies.keys())
+    if all_prefixes and not consistent(
+        [bid for p in all_prefixes for bid in ballot_ids_by_prefix[p]],
+        recomputed_tally,
+    ):
+        if not search_prefixes(all_prefixes):
+            return None
+
+    log_and_print(
+        f"Fault search: {len(faulty_ballot_ids)} faulty ballots in {len(faulty_prefixes)} prefixes, {num_oracle_calls} oracle calls",
+        verbose,
+    )
+
+    return TallyFaults(
+        selections, sorted(faulty_prefixes), faulty_ballot_ids, num_oracle_calls
+    )
+
+
+def _load_ballot(
+    results: FastTallyEverythingResults, ballot_id: str
+) -> Optional[CiphertextAcceptedBallot]:
+    """
+    Internal helper: gets a ballot. If the ballots are on disk, it's loaded from there
+    without caching it in the results' memo, so a search over many ballots doesn't keep them
+    all in memory. Otherwise, the ballots are already in memory, and it comes from the memo.
+    """
+    if results.manifest is not None:
+        ballot = results.manifest.load_ciphertext_ballot(ballot_id)
+    else:
+        ballot = results.get_encrypted_ballot(ballot_id)
+
+    if ballot is None:
+        log_error(f"Failed to load ballot {ballot_id}")
+    return ballot
+
+
+def cvr_consistency_oracle(
+    cvrs: DominionCSV, keypair: ElGamalKeyPair
+) -> CONSISTENCY_ORACLE_TYPE:
+    """
+    Builds a consistency oracle for election administrators, who have the election secret
+    key and the original CVRs. Partial tallies are decrypted and compared against the sums
+    of the corresponding CVR columns.
+    """
+    columns = {
+        s.object_id: s.to_string()
+        for selections in cvrs.metadata.contest_map.values()
+        for s in selections
+    }
+    data = cvrs.data.set_index("BallotId")
+
+    def is_consistent(ballot_ids: Sequence[str], tally: TALLY_TYPE) -> bool:
+        rows = data.loc[list(ballot_ids)]
+        for object_id, ciphertext in tally.items():
+            if object_id not in columns:
+                log_error(f"Unknown selection object_id: {object_id}")
+                return False
+            cvr_sum = int(rows[columns[object_id]].sum())
+            if ciphertext.decrypt(keypair.secret_key) != cvr_sum:
+                return False
+        return True
+
+    return is_consistent
+
+
+def subtotal_consistency_oracle(
+    subtotals: Dict[str, PrefixSubtotal]
+) -> CONSISTENCY_ORACLE_TYPE:
+    """
+    Builds a consistency oracle from the published subtotals, which anybody can use, since
+    it doesn't need any secrets. Subtotals only cover whole ballot-id prefixes, so this oracle can
+    narrow down a fault to a prefix directory, but no further. Any set of ballots that doesn't
+    cover whole prefixes is treated as consistent.
+    """
+
+    def is_consistent(ballot_ids: Sequence[str], tally: TALLY_TYPE) -> bool:
+        groups = group_ballot_ids_by_prefix(ballot_ids)
+        for prefix in groups.keys():
+            if prefix not in subtotals or subtotals[prefix].num_ballots != len(
+                groups[prefix]
+            ):
+                return True
+
+        expected = sequential_tally(
+            [subtotals[prefix].tally for prefix in groups.keys()]
+        )
+        return expected == tally
+
+    return is_consistent
@@ -1,7 +1,8 @@
+from itertools import islice
 from math import ceil, floor
-from os import path, stat, walk
+from multiprocessing.pool import Pool
 from pathlib import PurePath, Path
-from stat import S_ISREG
+from queue import Queue
 from time import sleep
 from typing import (
     TypeVar,
@@ -9,9 +10,13 @@ from typing import (
     Sequence,
     List,
     Iterable,
+    Iterator,
     Optional,
     Type,
     Union,
+    Dict,
+    Tuple,
+    Any,
 )
 
 from electionguard.logs import log_error
@@ -20,7 +25,9 @@ from electionguard.utils import flatmap_optional
 from jsons import DecodeError, UnfulfilledArgumentError
 
 from arlo_e2e.eg_helpers import log_and_print
+from arlo_e2e.json_codec import encode_json, decode_json
 from arlo_e2e.ray_write_retry import write_file_with_retries
+from arlo_e2e.storage import storage_for_path
 
 T = TypeVar("T")
 U = TypeVar("U")
@@ -35,6 +42,18 @@ that take forever to list or interact with.
 """
 
 
+def group_ballot_ids_by_prefix(ballot_ids: Iterable[str]) -> Dict[str, List[str]]:
+    """
+    Groups ballot ids by their filename prefix (see `BALLOT_FILENAME_PREFIX_DIGITS`), i.e.,
+    by the subdirectory their files are written into. The ballot ids in each group, as well
+    as the prefixes themselves, are sorted.
+    """
+    groups: Dict[str, List[str]] = {}
+    for bid in sorted(ballot_ids):
+        groups.setdefault(bid[0:BALLOT_FILENAME_PREFIX_DIGITS], []).append(bid)
+    return groups
+
+
 def flatmap(f: Callable[[T], Iterable[U]], li: Iterable[T]) -> Sequence[U]:
     """
     General-purpose flatmapping on sequences/lists/iterables. The lambda is
@@ -54,6 +73,42 @@ def flatmap(f: Callable[[T], Iterable[U]], li: Iterable[T]) -> Sequence[U]:
     return result
 
 
+def imap_unordered_bounded(
+    pool: Pool, func: Callable[[T], U], inputs: Iterable[T], max_in_flight: int
+) -> Iterator[U]:
+    """
+    Like `pool.imap_unordered`, but with at most `max_in_flight` inputs handed to the pool at
+    any given time. (`imap_unordered` consumes its inputs as fast as it can, so if they're
+    made by a generator, every one of them is made, and pickled, right away.) The next input
+    is only taken once a result comes back. If `func` raises an exception, it's raised here.
+    """
+    done: "Queue[Tuple[bool, Any]]" = Queue()
+    remaining = iter(inputs)
+    num_in_flight = 0
+
+    def submit(item: T) -> None:
+        pool.apply_async(
+            func,
+            (item,),
+            callback=lambda r: done.put((True, r)),
+            error_callback=lambda e: done.put((False, e)),
+        )
+
+    for item in islice(remaining, max(1, max_in_flight)):
+        submit(item)
+        num_in_flight += 1
+
+    while num_in_flight > 0:
+        success, result = done.get()
+        num_in_flight -= 1
+        if not success:
+            raise result
+        for item in islice(remaining, 1):
+            submit(item)
+            num_in_flight += 1
+        yield result
+
+
 def shard_list(input: Iterable[T], num_per_group: int) -> Sequence[Sequence[T]]:
     """
     Breaks a list up into a list of lists, with `num_per_group` entries in each group,
@@ -110,16 +165,14 @@ def shard_list_uniform(input: Iterable[T], num_per_group: int) -> Sequence[Seque
 def mkdir_helper(p: Union[str, Path], num_retries: int = 1) -> None:
     """
     Wrapper around `os.mkdir` that will work correctly even if the directory already exists.
+    For storage without directories, like S3, this does nothing.
     """
     prev_exception = None
-    if isinstance(p, str):
-        path = Path(p)
-    else:
-        path = p
+    backend, name = storage_for_path(p)
 
     for attempt in range(0, num_retries):
         try:
-            path.mkdir(parents=True, exist_ok=True)
+            backend.make_dirs(name)
             return
         except Exception as e:
             prev_exception = e
@@ -192,14 +245,26 @@ def file_exists_helper(
         full_name = compose_filename(root_dir, file_name, subdirectories)
 
     try:
-        s = stat(full_name)
-        return s.st_size > 0 and S_ISREG(s.st_mode)
-    except FileNotFoundError:
-        return False
+        backend, name = storage_for_path(full_name)
+        num_bytes = backend.size(name)
+        return num_bytes is not None and num_bytes > 0
     except OSError:
         return False
 
 
+def directory_exists_helper(root_dir: Union[str, PurePath]) -> bool:
+    """
+    Checks whether the desired directory exists. In S3, this means that there's at
+    least one file in it.
+    """
+    try:
+        backend, name = storage_for_path(root_dir)
+        return backend.directory_exists(name)
+    except OSError as e:
+        log_error(f"Error checking directory ({root_dir}): {e}")
+        return False
+
+
 def load_file_helper(
     root_dir: str,
     file_name: Union[str, PurePath],
@@ -223,36 +288,80 @@ def load_file_helper(
         full_name = compose_filename(root_dir, file_name, subdirectories)
 
     try:
-        s = stat(full_name)
-        if s.st_size == 0:  # pragma: no cover
+        backend, name = storage_for_path(full_name)
+        data = backend.read_bytes(name)
+        if len(data) == 0:  # pragma: no cover
             log_error(f"The file ({full_name}) is empty")
             return None
 
-        with open(full_name, "r") as f:
-            data = f.read()
-
-            return data
+        return data.decode("utf-8")
     except FileNotFoundError as e:
         log_error(f"Error reading file ({full_name}): {e}")
         return None
     except OSError as e:
         log_error(f"Error reading file ({full_name}): {e}")
         return None
+    except UnicodeDecodeError as e:
+        log_error(f"Error decoding file ({full_name}): {e}")
+        return None
 
 
-def decode_json_file_contents(json_str: str, class_handle: Type[S]) -> Optional[S]:
+def load_file_bytes_helper(full_name: Union[str, PurePath]) -> Optional[bytes]:
+    """
+    Reads the requested file, by name, returning its contents as raw bytes, or `None`
+    if there was an error.
     """
-    Wrapper around JSON deserialization. Given a string of JSON text and a handle to an
-    ElectionGuard `Serializable` class, tries to decode the JSON into an instance of that
-    class. If anything fails, the result will be `None`. No exceptions will be raised outside
-    of this method, but all such failures will be logged to the ElectionGuard log.
+    try:
+        backend, name = storage_for_path(full_name)
+        return backend.read_bytes(name)
+    except OSError as e:
+        log_error(f"Error reading file ({full_name}): {e}")
+        return None
+
+
+def load_file_range_helper(
+    full_name: Union[str, PurePath], offset: int, num_bytes: int
+) -> Optional[bytes]:
+    """
+    Reads `num_bytes` bytes, starting at `offset`, from the requested file, without reading
+    the rest of the file. Returns `None` if there was an error, including if the file is
+    too short to contain the requested range.
+    """
+    try:
+        backend, name = storage_for_path(full_name)
+        data = backend.read_range(name, offset, num_bytes)
+    except OSError as e:
+        log_error(f"Error reading file ({full_name}): {e}")
+        return None
 
-    :param json_str: any JSON string
+    if len(data) != num_bytes:
+        log_error(
+            f"File ({full_name}) too short: wanted {num_bytes} bytes at offset {offset}, got {len(data)}"
+        )
+        return None
+
+    return data
+
+
+def decode_json_file_contents(
+    json_str: Union[str, bytes], class_handle: Type[S]
+) -> Optional[S]:
+    """
+    Wrapper around JSON deserialization. Given a string of JSON text, or its UTF-8 bytes, and
+    a handle to an ElectionGuard `Serializable` class, tries to decode the JSON into an instance
+    of that class. If anything fails, the result will be `None`. No exceptions will be raised
+    outside of this method, but all such failures will be logged to the ElectionGuard log.
+    Ballots are decoded with the faster decoder in `arlo_e2e.json_codec`.
+
+    :param json_str: any JSON string, or its UTF-8 bytes
     :param class_handle: the class, itself, that we're trying to deserialize to
     :returns: the contents of the file, or `None` if there was an error
     """
     try:
-        result = class_handle.from_json(json_str)
+        result = decode_json(json_str, class_handle)
+    except UnicodeDecodeError as err:
+        log_error(f"JSON for {class_handle} isn't valid UTF-8: {err}")
+        return None
     except DecodeError as err:  # pragma: no cover
         log_error(f"Failed to decode an instance of {class_handle}: {err}")
         return None
@@ -292,7 +401,7 @@ def write_json_helper(
         full_name = compose_filename(root_dir, file_name, subdirectories)
         mkdir_list_helper(root_dir, subdirectories, num_retries=num_retries)
 
-    json_txt = json_obj.to_json(strip_privates=True)
+    json_txt = encode_json(json_obj)
     json_bytes = json_txt.encode("utf-8")
     num_bytes = len(json_bytes)
 
@@ -332,10 +441,13 @@ def load_json_helper(
 def all_files_in_directory(root_dir: str) -> List[PurePath]:
     """
     Given a directory name, returns a list of all the files in that directory. The
-    directory name will be prepended before each filename in the result.
+    directory name will be prepended before each filename in the result. Returns an
+    empty list if the directory can't be listed.
     """
-    results: List[str] = []
-    for root, dirs, files in walk(root_dir):
-        for file in files:
-            results.append(path.join(root, file))
+    try:
+        backend, name = storage_for_path(root_dir)
+        results = backend.list_files(name)
+    except OSError as e:
+        log_error(f"Error listing directory ({root_dir}): {e}")
+        return []
     return [PurePath(x) for x in results]
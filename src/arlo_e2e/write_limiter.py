@@ -0,0 +1,397 @@
+# Adaptive limit on the number of concurrent writes, using AIMD (additive increase,
+# multiplicative decrease), the same idea as TCP congestion control. When storage starts
+# failing or slowing down, every writer backs off, rather than turning the brownout into a
+# storm of retries, and when the writes succeed again, the limit grows back. With Ray,
+# there's one limit for each node, shared by all of its processes, which lease permits from
+# it in batches (see `arlo_e2e.ray_write_retry.get_write_limiter`).
+
+from contextlib import contextmanager
+from os import getpid
+from threading import Condition, Timer
+from time import monotonic
+from typing import Callable, Final, List, Optional, Iterator, Sequence, Tuple
+
+WRITE_CONCURRENCY: Final[int] = 8
+"""
+Number of threads, per process, writing files in the background (see
+`arlo_e2e.ray_write_retry.WriteBehindQueue`), which is about as many writes as a process
+ever has going at once. A limit above this wouldn't hold anything back.
+"""
+
+WRITE_LIMIT_MIN: Final[float] = 1.0
+"""
+The concurrent write limit never goes below this.
+"""
+
+WRITE_LIMIT_MAX: Final[float] = float(WRITE_CONCURRENCY)
+"""
+The concurrent write limit never goes above this.
+"""
+
+WRITE_LIMIT_INITIAL: Final[float] = WRITE_CONCURRENCY / 2
+"""
+The concurrent write limit starts here, below `WRITE_CONCURRENCY`, so the very first
+failures slow things down.
+"""
+
+WRITE_LIMIT_DECREASE_FACTOR: Final[float] = 0.5
+"""
+On a failure or a latency spike, the limit is multiplied by this.
+"""
+
+LATENCY_SPIKE_FACTOR: Final[float] = 4.0
+"""
+A write is a latency spike if it takes this many times longer than the moving average.
+"""
+
+LATENCY_SPIKE_MIN_SECONDS: Final[float] = 0.25
+"""
+Writes faster than this are never latency spikes, no matter how fast the average is.
+"""
+
+LATENCY_AVERAGE_WEIGHT: Final[float] = 0.1
+"""
+Weight of each new measurement in the exponential moving average of write latency.
+"""
+
+WRITE_LEASE_SECONDS: Final[float] = 1.0
+"""
+A process holds on to permits leased from its node's limiter (see `LeasedWriteLimiter`) for
+at most this long before giving them back, so the other processes on the node get their
+turn, and so the node's limiter hears how the writes went.
+"""
+
+WriteOutcome = Tuple[bool, float]
+"""
+Whether a write succeeded, and how long it took, in seconds.
+"""
+
+
+class BaseWriteLimiter:
+    """
+    Anything that hands out permits for writes: `acquire` one before writing, and `release`
+    it afterward, saying how the write went.
+    """
+
+    def acquire(self) -> None:
+        """
+        Blocking call: waits until there's room for another write under the limit.
+        """
+        raise NotImplementedError
+
+    def release(self, success: bool, latency: float) -> None:
+        """
+        Gives back the permit from `acquire`, saying whether the write succeeded and how
+        long it took, in seconds.
+        """
+        raise NotImplementedError
+
+    @contextmanager
+    def permit(self) -> Iterator["WritePermit"]:
+        """
+        Context manager: acquires a permit, then releases it at the end, timing the write.
+        Call `failed` on the result if the write didn't succeed. Exceptions count as failures.
+        """
+        self.acquire()
+        write_permit = WritePermit()
+        start = monotonic()
+        try:
+            yield write_permit
+        except BaseException:
+            write_permit.failed()
+            raise
+        finally:
+            self.release(write_permit.success, monotonic() - start)
+
+
+class WriteLimiter(BaseWriteLimiter):
+    """
+    Limits the number of concurrent writes, adjusting the limit as it goes. Every successful
+    write adds `1 / limit` to the limit, so it grows by about one for every round of writes.
+    Every failure, or latency spike, multiplies the limit by `WRITE_LIMIT_DECREASE_FACTOR`,
+    at most once per average write latency, so a burst of failures from the same brownout
+    only counts once. Writers wait for a permit, so when the limit shrinks, the writes back
+    up in their callers' queues instead of hitting storage.
+
+    The limit can also be driven by the overall write counts (see `observe_counts`), and
+    permits can be handed out, and given back, in batches (see `try_acquire` and
+    `give_back`), which is how one of these is shared by every process on a Ray node.
+
+    Don't construct this directly, except for testing. Instead, use `get_write_limiter`.
+    """
+
+    def __init__(
+        self,
+        initial_limit: float = WRITE_LIMIT_INITIAL,
+        min_limit: float = WRITE_LIMIT_MIN,
+        max_limit: float = WRITE_LIMIT_MAX,
+    ) -> None:
+        self._condition = Condition()
+        self._limit = initial_limit
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._in_flight = 0
+        self._average_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._last_counts: Optional[Tuple[int, int]] = None
+        self._retrying = False
+
+    @property
+    def limit(self) -> float:
+        """
+        The current limit on concurrent writes. Only the integer part matters.
+        """
+        with self._condition:
+            return self._limit
+
+    @property
+    def in_flight(self) -> int:
+        """
+        The number of writes currently holding permits.
+        """
+        with self._condition:
+            return self._in_flight
+
+    def acquire(self) -> None:
+        """
+        Blocking call: waits until there's room for another write under the limit.
+        """
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+    def try_acquire(self, max_count: int) -> int:
+        """
+        Takes as many permits as there's room for under the limit, up to `max_count`,
+        without waiting, and returns how many it took, which might be zero.
+        """
+        with self._condition:
+            count = max(0, min(max_count, int(self._limit) - self._in_flight))
+            self._in_flight += count
+            return count
+
+    def release(self, success: bool, latency: float) -> None:
+        """
+        Gives back the permit from `acquire`, and adjusts the limit based on whether the
+        write succeeded and how long it took, in seconds.
+        """
+        self.give_back(1, [(success, latency)])
+
+    def give_back(self, count: int, outcomes: Sequence[WriteOutcome]) -> None:
+        """
+        Gives back `count` permits, from `acquire` or `try_acquire`, and adjusts the limit
+        based on the outcomes of the writes done with them, in the order they finished.
+        Some of the permits might not have been used at all, so there can be fewer
+        outcomes than permits.
+        """
+        with self._condition:
+            self._in_flight -= count
+            for success, latency in outcomes:
+                self._record(success, latency)
+            self._condition.notify_all()
+
+    def observe_counts(
+        self, num_pending: int, num_retrying: int, num_failures: int
+    ) -> None:
+        """
+        Adjusts the limit based on the write counts everywhere, polled every so often: the
+        number of pending writes, how many of them are waiting to be retried, and the total
+        number of writes that have failed for good so far. New failures, or pending writes
+        piling up while there are writes to retry, count as a failure. While there are writes
+        to retry, the limit doesn't grow.
+        """
+        with self._condition:
+            if self._last_counts is not None:
+                last_pending, last_failures = self._last_counts
+                if num_failures > last_failures or (
+                    num_retrying > 0 and num_pending > last_pending
+                ):
+                    self._decrease()
+            self._last_counts = (num_pending, num_failures)
+            self._retrying = num_retrying > 0
+
+    def _record(self, success: bool, latency: float) -> None:
+        spike = (
+            self._average_latency is not None
+            and latency >= LATENCY_SPIKE_MIN_SECONDS
+            and latency > LATENCY_SPIKE_FACTOR * self._average_latency
+        )
+        if success:
+            self._average_latency = (
+                latency
+                if self._average_latency is None
+                else (1 - LATENCY_AVERAGE_WEIGHT) * self._average_latency
+                + LATENCY_AVERAGE_WEIGHT * latency
+            )
+
+        if not success or spike:
+            self._decrease()
+        elif not self._retrying:
+            self._limit = min(self._max_limit, self._limit + 1.0 / self._limit)
+
+    def _decrease(self) -> None:
+        now = monotonic()
+        if now - self._last_decrease >= (self._average_latency or 0.0):
+            self._limit = max(
+                self._min_limit, self._limit * WRITE_LIMIT_DECREASE_FACTOR
+            )
+            self._last_decrease = now
+
+
+class LeasedWriteLimiter(BaseWriteLimiter):
+    """
+    Limits the number of concurrent writes in one process, using permits leased from a
+    limiter shared with other processes (on Ray, the node's `WriteLimiter`). The permits are
+    leased in batches, as many as there are writers waiting, by calling `lease`, which blocks
+    until at least one is available and returns how many were granted. They're reused for
+    further writes, and then given back, by calling `give_back` with the count and the
+    outcomes of the writes, at the first failure, when the process has no more writes to do,
+    or after `lease_seconds`, whichever comes first. So the shared limit applies to all the
+    processes together, and can hold them to fewer concurrent writes than there are
+    processes.
+
+    Don't construct this directly, except for testing. Instead, use
+    `arlo_e2e.ray_write_retry.get_write_limiter`.
+    """
+
+    def __init__(
+        self,
+        lease: Callable[[int], int],
+        give_back: Callable[[int, List[WriteOutcome]], None],
+        lease_seconds: float = WRITE_LEASE_SECONDS,
+    ) -> None:
+        self._condition = Condition()
+        self._lease = lease
+        self._give_back = give_back
+        self._lease_seconds = lease_seconds
+        self._available = 0
+        self._in_flight = 0
+        self._waiting = 0
+        self._leasing = False
+        self._leased_at = 0.0
+        self._outcomes: List[WriteOutcome] = []
+        self._idle_timer: Optional[Timer] = None
+
+    @property
+    def num_leased(self) -> int:
+        """
+        The number of permits this process holds, whether or not they're in use.
+        """
+        with self._condition:
+            return self._available + self._in_flight
+
+    def acquire(self) -> None:
+        """
+        Blocking call: waits until there's room for another write under the shared limit.
+        """
+        with self._condition:
+            self._waiting += 1
+            try:
+                while self._available == 0:
+                    if self._leasing:
+                        # another thread is already asking, for all of us
+                        self._condition.wait()
+                        continue
+
+                    self._leasing = True
+                    wanted = self._waiting
+                    self._condition.release()
+                    try:
+                        granted = self._lease(wanted)
+                    finally:
+                        self._condition.acquire()
+                        self._leasing = False
+                        self._condition.notify_all()
+                    if self._available + self._in_flight == 0:
+                        self._leased_at = monotonic()
+                    self._available += granted
+
+                self._available -= 1
+                self._in_flight += 1
+            finally:
+                self._waiting -= 1
+
+    def release(self, success: bool, latency: float) -> None:
+        """
+        Returns the permit from `acquire`, to be reused, and notes how the write went.
+        Gives back every permit that isn't in use if the write failed or the lease is up.
+        If this process has nothing else to write, they're given back a little later,
+        unless a write comes along in the meantime.
+        """
+        with self._condition:
+            self._in_flight -= 1
+            self._available += 1
+            self._outcomes.append((success, latency))
+            idle = self._in_flight == 0 and self._waiting == 0
+            if success and monotonic() - self._leased_at < self._lease_seconds:
+                self._condition.notify_all()
+                if idle and self._idle_timer is None:
+                    self._idle_timer = Timer(self._lease_seconds, self._give_back_idle)
+                    self._idle_timer.daemon = True
+                    self._idle_timer.start()
+                return
+            count, outcomes = self._take_unused()
+
+        self._give_back(count, outcomes)
+
+    def give_back_unused(self) -> None:
+        """
+        Gives back every permit that isn't in use, right away.
+        """
+        with self._condition:
+            count, outcomes = self._take_unused()
+        if count > 0 or outcomes:
+            self._give_back(count, outcomes)
+
+    def _give_back_idle(self) -> None:
+        with self._condition:
+            self._idle_timer = None
+            if self._in_flight > 0 or self._waiting > 0:
+                return
+            count, outcomes = self._take_unused()
+        if count > 0 or outcomes:
+            self._give_back(count, outcomes)
+
+    def _take_unused(self) -> Tuple[int, List[WriteOutcome]]:
+        count, outcomes = self._available, self._outcomes
+        self._available = 0
+        self._outcomes = []
+        self._leased_at = monotonic()
+        return count, outcomes
+
+
+class WritePermit:
+    """
+    Returned by `WriteLimiter.permit`, to record whether the write succeeded.
+    """
+
+    success: bool
+
+    def __init__(self) -> None:
+        self.success = True
+
+    def failed(self) -> None:
+        """
+        Records that the write failed.
+        """
+        self.success = False
+
+
+__write_limiter: Optional[WriteLimiter] = None
+__write_limiter_pid: Optional[int] = None
+
+
+def get_write_limiter() -> WriteLimiter:
+    """
+    Gets this process's own `WriteLimiter`, making it if necessary. After a fork, the child
+    process gets its own. With Ray, use `arlo_e2e.ray_write_retry.get_write_limiter`
+    instead, which shares one limit with every process on the node.
+    """
+    global __write_limiter
+    global __write_limiter_pid
+
+    if __write_limiter is None or __write_limiter_pid != getpid():
+        __write_limiter = WriteLimiter()
+        __write_limiter_pid = getpid()
+    return __write_limiter
@@ -0,0 +1,113 @@
+import pickle
+import shutil
+import unittest
+from typing import Dict
+
+from hypothesis import given, settings
+from hypothesis.strategies import dictionaries, sampled_from, integers
+
+from arlo_e2e.ballot_types import (
+    BallotTypeMap,
+    ballot_ids_with_types,
+    check_ballot_types_index,
+    has_ballot_types,
+    write_ballot_types,
+    BALLOT_TYPES_DIR,
+    BALLOT_TYPE_CODES,
+)
+from arlo_e2e.manifest import make_fresh_manifest, make_existing_manifest
+from arlo_e2e.utils import mkdir_helper, compose_filename
+
+BALLOT_TYPES_TESTING_DIR = "ballot_types_testing"
+
+BALLOT_STYLES = ["Ballot 1 - Type 1", "Ballot 2 - Type 2", "STR5", "Städtisch"]
+
+
+class TestBallotTypes(unittest.TestCase):
+    def removeTree(self) -> None:
+        shutil.rmtree(BALLOT_TYPES_TESTING_DIR, ignore_errors=True)
+
+    def setUp(self) -> None:
+        self.removeTree()
+
+    def tearDown(self) -> None:
+        self.removeTree()
+
+    @given(
+        dictionaries(
+            integers(0, 100000).map(lambda i: f"b{i:07d}"),
+            sampled_from(BALLOT_STYLES),
+            min_size=1,
+            max_size=50,
+        )
+    )
+    @settings(max_examples=20)
+    def test_round_trip(self, bid_to_type: Dict[str, str]) -> None:
+        self.removeTree()
+        mkdir_helper(BALLOT_TYPES_TESTING_DIR)
+
+        manifest = make_fresh_manifest(BALLOT_TYPES_TESTING_DIR)
+        self.assertFalse(has_ballot_types(manifest))
+        write_ballot_types(manifest, bid_to_type)
+        manifest2 = make_existing_manifest(
+            BALLOT_TYPES_TESTING_DIR, manifest.write_manifest()
+        )
+        self.assertTrue(has_ballot_types(manifest2))
+        self.assertTrue(check_ballot_types_index(manifest2, len(bid_to_type)))
+        self.assertFalse(check_ballot_types_index(manifest2, len(bid_to_type) + 1))
+
+        ballot_types = BallotTypeMap(manifest2)
+        self.assertEqual(bid_to_type, ballot_types)
+        self.assertEqual(ballot_types, bid_to_type)
+        self.assertEqual(bid_to_type.keys(), ballot_types.keys())
+        self.assertListEqual(list(bid_to_type), list(ballot_types))
+        for bid, bt in bid_to_type.items():
+            self.assertIn(bid, ballot_types)
+            self.assertEqual(bt, ballot_types[bid])
+        self.assertNotIn("nonexistent", ballot_types)
+
+        for style in BALLOT_STYLES:
+            self.assertListEqual(
+                ballot_ids_with_types(bid_to_type, [style]),
+                ballot_ids_with_types(ballot_types, [style]),
+            )
+        self.assertListEqual(
+            list(bid_to_type), ballot_ids_with_types(ballot_types, BALLOT_STYLES)
+        )
+
+        # it survives being sent elsewhere, e.g., to a Ray worker
+        self.assertEqual(bid_to_type, pickle.loads(pickle.dumps(ballot_types)))
+
+        self.removeTree()
+
+    def test_tampering(self) -> None:
+        mkdir_helper(BALLOT_TYPES_TESTING_DIR)
+        manifest = make_fresh_manifest(BALLOT_TYPES_TESTING_DIR)
+        write_ballot_types(manifest, {"b0000001": "STR5", "b0000002": "STSF"})
+        manifest2 = make_existing_manifest(
+            BALLOT_TYPES_TESTING_DIR, manifest.write_manifest()
+        )
+
+        with open(
+            compose_filename(
+                BALLOT_TYPES_TESTING_DIR, BALLOT_TYPE_CODES, [BALLOT_TYPES_DIR]
+            ),
+            "wb",
+        ) as f:
+            f.write(b"\x01\x01")
+
+        # the tampered file has the right length, so it's only caught when it's loaded, and
+        # then it's an error, rather than an empty map
+        self.assertTrue(check_ballot_types_index(manifest2, 2))
+        ballot_types = BallotTypeMap(manifest2)
+        with self.assertRaises(RuntimeError):
+            len(ballot_types)
+        with self.assertRaises(RuntimeError):
+            ballot_ids_with_types(ballot_types, ["STR5"])
+
+        # a truncated file is caught without loading it, even if the manifest agrees with it
+        manifest.write_file(BALLOT_TYPE_CODES, b"\x01", [BALLOT_TYPES_DIR])
+        manifest3 = make_existing_manifest(
+            BALLOT_TYPES_TESTING_DIR, manifest.write_manifest()
+        )
+        self.assertFalse(check_ballot_types_index(manifest3, 2))
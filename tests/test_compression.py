@@ -0,0 +1,39 @@
+import unittest
+
+from hypothesis import given
+from hypothesis.strategies import binary, sampled_from
+
+from arlo_e2e.compression import (
+    compress_bytes,
+    decompress_bytes,
+    supported_codecs,
+)
+
+
+class TestCompression(unittest.TestCase):
+    @given(binary(max_size=1000), sampled_from(sorted(supported_codecs())))
+    def test_round_trip(self, data: bytes, codec: str) -> None:
+        compressed = compress_bytes(data, codec)
+        self.assertIsNotNone(compressed)
+        self.assertEqual(compressed, compress_bytes(data, codec))
+        self.assertEqual(data, decompress_bytes(compressed, codec))
+
+    @given(sampled_from(sorted(supported_codecs())))
+    def test_corrupt_data(self, codec: str) -> None:
+        compressed = compress_bytes(b"0123456789" * 100, codec)
+        self.assertIsNotNone(compressed)
+
+        # truncated, garbage, and damaged in the middle: errors, not exceptions
+        self.assertIsNone(decompress_bytes(compressed[0 : len(compressed) // 2], codec))
+        self.assertIsNone(decompress_bytes(b"not compressed at all", codec))
+        damaged = (
+            compressed[0:12]
+            + bytes(b ^ 0xFF for b in compressed[12:-8])
+            + compressed[-8:]
+        )
+        self.assertIsNone(decompress_bytes(damaged, codec))
+
+    def test_unsupported_codec(self) -> None:
+        self.assertIsNone(compress_bytes(b"data", "nonexistent"))
+        self.assertIsNone(decompress_bytes(b"data", "nonexistent"))
+        self.assertEqual(b"data", decompress_bytes(b"data", None))
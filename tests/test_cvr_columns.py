@@ -0,0 +1,81 @@
+import csv
+import shutil
+import unittest
+from datetime import timedelta
+from io import StringIO
+
+import pandas as pd
+from hypothesis import given, settings, HealthCheck, Phase
+
+from arlo_e2e.cvr_columns import (
+    write_cvr_columns,
+    load_cvr_columns,
+    has_cvr_columns,
+)
+from arlo_e2e.dominion import read_dominion_csv
+from arlo_e2e.manifest import make_fresh_manifest, make_existing_manifest
+from arlo_e2e.utils import mkdir_helper
+from arlo_e2e_testing.dominion_hypothesis import dominion_cvrs
+
+CVR_COLUMNS_TESTING_DIR = "cvr_columns_testing"
+
+
+class TestCvrColumns(unittest.TestCase):
+    def removeTree(self) -> None:
+        shutil.rmtree(CVR_COLUMNS_TESTING_DIR, ignore_errors=True)
+
+    def setUp(self) -> None:
+        self.removeTree()
+
+    def tearDown(self) -> None:
+        self.removeTree()
+
+    @given(dominion_cvrs(max_rows=20))
+    @settings(
+        deadline=timedelta(milliseconds=50000),
+        suppress_health_check=[HealthCheck.too_slow],
+        max_examples=5,
+        # disabling the "shrink" phase, because it runs very slowly
+        phases=[Phase.explicit, Phase.reuse, Phase.generate, Phase.target],
+    )
+    def test_matches_csv(self, cvrs: str) -> None:
+        self.removeTree()
+        mkdir_helper(CVR_COLUMNS_TESTING_DIR)
+
+        parsed = read_dominion_csv(StringIO(cvrs))
+        self.assertIsNotNone(parsed)
+        csv_data = parsed.dataframe_without_selections().to_csv(
+            index=False, quoting=csv.QUOTE_NONNUMERIC
+        )
+        from_csv = pd.read_csv(StringIO(csv_data), sep=",", engine="python")
+
+        manifest = make_fresh_manifest(CVR_COLUMNS_TESTING_DIR)
+        self.assertFalse(has_cvr_columns(manifest))
+        self.assertIsNotNone(write_cvr_columns(manifest, from_csv))
+        manifest2 = make_existing_manifest(
+            CVR_COLUMNS_TESTING_DIR, manifest.write_manifest()
+        )
+        self.assertTrue(has_cvr_columns(manifest2))
+
+        from_columns = load_cvr_columns(manifest2)
+        self.assertIsNotNone(from_columns)
+        self.assertTrue(from_csv.equals(from_columns))
+        self.assertListEqual(list(from_csv.dtypes), list(from_columns.dtypes))
+
+        # we can load just the columns we need, in any order
+        subset = load_cvr_columns(manifest2, ["BallotType", "BallotId"])
+        self.assertIsNotNone(subset)
+        self.assertTrue(from_csv[["BallotType", "BallotId"]].equals(subset))
+        self.assertIsNone(load_cvr_columns(manifest2, ["NoSuchColumn"]))
+
+        self.removeTree()
+
+    def test_unsupported_columns(self) -> None:
+        mkdir_helper(CVR_COLUMNS_TESTING_DIR)
+        manifest = make_fresh_manifest(CVR_COLUMNS_TESTING_DIR)
+
+        # a column of mixed strings and numbers isn't what read_csv would give us
+        mixed = pd.DataFrame({"BallotId": ["b1", "b2"], "Mixed": ["x", 3]})
+        self.assertIsNone(write_cvr_columns(manifest, mixed))
+        self.assertFalse(has_cvr_columns(manifest))
+        self.assertEqual(0, len(manifest.hashes))
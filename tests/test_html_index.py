@@ -0,0 +1,43 @@
+import shutil
+import unittest
+from os import path, remove
+
+from arlo_e2e.html_index import generate_index_html_files
+from arlo_e2e.manifest import INDEX_PAGES_STATE, make_fresh_manifest
+
+INDEX_TESTING_DIR = "index_testing"
+
+
+class TestHtmlIndex(unittest.TestCase):
+    def removeTree(self) -> None:
+        shutil.rmtree(INDEX_TESTING_DIR, ignore_errors=True)
+
+    def setUp(self) -> None:
+        self.removeTree()
+
+    def tearDown(self) -> None:
+        self.removeTree()
+
+    def test_incremental_index(self) -> None:
+        manifest = make_fresh_manifest(INDEX_TESTING_DIR)
+        manifest.write_file("top.json", "top")
+        manifest.write_file("x.json", "xxxx", ["a", "b"])
+        manifest.write_manifest()
+        generate_index_html_files("Test", INDEX_TESTING_DIR, manifest=manifest)
+
+        with open(path.join(INDEX_TESTING_DIR, "index.html"), "r") as f:
+            root_page = f.read()
+        self.assertIn("top.json", root_page)
+        self.assertIn("MANIFEST.json", root_page)
+        self.assertIn("<a href='a'>a</a> - <b>directory</b>", root_page)
+        self.assertNotIn(INDEX_PAGES_STATE, root_page)
+        with open(path.join(INDEX_TESTING_DIR, "a", "b", "index.html"), "r") as f:
+            self.assertIn("<a href='x.json'>x.json</a> - <i>4 bytes</i>", f.read())
+
+        # only the page for the directory that changed is written again
+        remove(path.join(INDEX_TESTING_DIR, "index.html"))
+        manifest.write_file("y.json", "yy", ["a", "b"])
+        generate_index_html_files("Test", INDEX_TESTING_DIR, manifest=manifest)
+        self.assertFalse(path.exists(path.join(INDEX_TESTING_DIR, "index.html")))
+        with open(path.join(INDEX_TESTING_DIR, "a", "b", "index.html"), "r") as f:
+            self.assertIn("y.json", f.read())
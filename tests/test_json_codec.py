@@ -0,0 +1,60 @@
+import unittest
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from electionguard.ballot import CiphertextAcceptedBallot
+from electionguard.decrypt_with_secrets import ProvenPlaintextBallot
+from electionguard.election import InternalElectionDescription
+from electionguard.elgamal import ElGamalKeyPair
+from electionguardtest.elgamal import elgamal_keypairs
+from hypothesis import settings, given, HealthCheck, Phase
+
+from arlo_e2e.decrypt import decrypt_ballots
+from arlo_e2e.dominion import read_dominion_csv
+from arlo_e2e.json_codec import encode_json, decode_json
+from arlo_e2e.tally import fast_tally_everything
+from arlo_e2e_testing.dominion_hypothesis import dominion_cvrs
+
+
+class TestJsonCodec(unittest.TestCase):
+    @given(dominion_cvrs(max_rows=5), elgamal_keypairs())
+    @settings(
+        deadline=timedelta(milliseconds=50000),
+        suppress_health_check=[HealthCheck.too_slow],
+        max_examples=3,
+        # disabling the "shrink" phase, because it runs very slowly
+        phases=[Phase.explicit, Phase.reuse, Phase.generate, Phase.target],
+    )
+    def test_matches_electionguard(self, input: str, keypair: ElGamalKeyPair) -> None:
+        cvrs = read_dominion_csv(StringIO(input))
+        self.assertIsNotNone(cvrs)
+        tally = fast_tally_everything(
+            cvrs, None, verbose=False, secret_key=keypair.secret_key
+        )
+        pballots = decrypt_ballots(
+            InternalElectionDescription(tally.election_description),
+            tally.context.crypto_extended_base_hash,
+            keypair,
+            None,
+            tally.encrypted_ballots,
+        )
+
+        for cls, objs in [
+            (CiphertextAcceptedBallot, tally.encrypted_ballots),
+            (ProvenPlaintextBallot, pballots),
+        ]:
+            for obj in objs:
+                self.assertIsNotNone(obj)
+                expected = obj.to_json(strip_privates=True)
+
+                # make sure we're testing the fast paths, not the fallbacks
+                with patch.object(cls, "to_json", side_effect=AssertionError):
+                    encoded = encode_json(obj)
+                self.assertEqual(expected, encoded)
+
+                with patch.object(cls, "from_json", side_effect=AssertionError):
+                    decoded = decode_json(expected, cls)
+                self.assertEqual(cls.from_json(expected), decoded)
+                self.assertEqual(obj, decoded)
+                self.assertEqual(expected, encode_json(decoded))
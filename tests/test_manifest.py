@@ -1,20 +1,52 @@
+import pickle
 import shutil
 import unittest
 from datetime import timedelta
-from os import path, getcwd
+from mmap import mmap
+from os import path, getcwd, mkdir, remove
 from pathlib import PurePath
 from typing import List
+from unittest.mock import patch
 
 from electionguard.logs import log_warning
 from hypothesis import given, assume, settings
-from hypothesis.strategies import lists, integers, booleans
+from hypothesis.strategies import lists, integers, booleans, sampled_from
 
+from arlo_e2e.compression import CODEC_GZIP, supported_codecs
 from arlo_e2e.manifest import (
     make_fresh_manifest,
     make_existing_manifest,
     path_to_manifest_name,
+    compose_manifest_name,
+    verify_manifest_hashes,
+    manifest_name_to_prefix,
+    subtotal_manifest_name,
+    ballot_manifest_name,
+    SUBTOTALS_DIR,
+    MANIFEST_SHARDS_DIR,
+    merkle_leaf_hash,
+    merkle_tree_levels,
+    merkle_proof,
+    verify_merkle_proof,
+    read_manifest_json,
+    ManifestExternal,
+    sha256_hash,
+    FileInfo,
+    FileInfoTable,
+    Manifest,
+)
+from arlo_e2e.ray_staging import BUNDLE_SUFFIX
+from arlo_e2e.ray_write_retry import (
+    get_write_behind_queue,
+    reset_pending_state,
+    wait_for_zero_pending_writes,
+)
+from arlo_e2e.utils import (
+    all_files_in_directory,
+    mkdir_helper,
+    compose_filename,
+    decode_json_file_contents,
 )
-from arlo_e2e.utils import mkdir_helper
 from arlo_e2e_testing.manifest_hypothesis import (
     file_name_and_contents,
     FileNameAndContents,
@@ -211,3 +243,455 @@ class TestManifestPublishing(unittest.TestCase):
             manifest1.merge_from(manifest2)
 
         self.removeTree()
+
+    @given(list_file_names_contents(5))
+    @settings(
+        deadline=timedelta(milliseconds=50000),
+    )
+    def test_manifest_subset(self, files: List[FileNameAndContents]) -> None:
+        self.removeTree()
+        mkdir_helper(MANIFEST_TESTING_DIR)
+
+        manifest = make_fresh_manifest(MANIFEST_TESTING_DIR)
+        for file_name, file_path, file_contents in files:
+            manifest.write_file(file_name, file_contents, file_path)
+
+        names = [compose_manifest_name(f.file_name, f.file_path) for f in files]
+        subset = manifest.subset(names[0:2] + ["not_a_file"])
+
+        self.assertEqual(set(names[0:2]), set(subset.hashes.keys()))
+        self.assertEqual(
+            files[0].file_contents,
+            subset.read_file(files[0].file_name, files[0].file_path),
+        )
+        self.assertIsNone(subset.read_file(files[2].file_name, files[2].file_path))
+
+        self.removeTree()
+
+    @given(list_file_names_contents(5))
+    @settings(
+        deadline=timedelta(milliseconds=50000),
+    )
+    def test_verify_manifest_hashes(self, files: List[FileNameAndContents]) -> None:
+        self.removeTree()
+        mkdir_helper(MANIFEST_TESTING_DIR)
+
+        manifest = make_fresh_manifest(MANIFEST_TESTING_DIR)
+        for file_name, file_path, file_contents in files:
+            manifest.write_file(file_name, file_contents, file_path)
+        root_hash = manifest.write_manifest()
+
+        results = verify_manifest_hashes(MANIFEST_TESTING_DIR, root_hash)
+        self.assertIsNotNone(results)
+        self.assertTrue(results.success)
+        self.assertEqual(5, results.num_files)
+
+        # wrong root hash: we don't even get started
+        self.assertIsNone(verify_manifest_hashes(MANIFEST_TESTING_DIR, "12345"))
+
+        names = [compose_manifest_name(f.file_name, f.file_path) for f in files]
+
+        # now, damage the directory: one file deleted, one modified, one unreadable (it's
+        # been replaced by a directory), and one added
+        remove(
+            compose_filename(
+                MANIFEST_TESTING_DIR, files[0].file_name, files[0].file_path
+            )
+        )
+        with open(
+            compose_filename(
+                MANIFEST_TESTING_DIR, files[1].file_name, files[1].file_path
+            ),
+            "a",
+        ) as f:
+            f.write("x")
+        unreadable_file = compose_filename(
+            MANIFEST_TESTING_DIR, files[2].file_name, files[2].file_path
+        )
+        remove(unreadable_file)
+        mkdir(unreadable_file)
+        with open(path.join(MANIFEST_TESTING_DIR, "extra_file.txt"), "w") as f:
+            f.write("not in the manifest")
+        with open(path.join(MANIFEST_TESTING_DIR, "index.html"), "w") as f:
+            f.write("ignored")
+
+        results = verify_manifest_hashes(MANIFEST_TESTING_DIR, root_hash)
+        self.assertIsNotNone(results)
+        self.assertFalse(results.success)
+        self.assertEqual([names[0]], results.missing)
+        self.assertEqual([names[1]], results.mismatched)
+        self.assertEqual([names[2]], results.unreadable)
+        self.assertEqual(["extra_file.txt"], results.extra)
+
+        self.removeTree()
+
+    @given(list_file_names_contents(3))
+    @settings(
+        deadline=timedelta(milliseconds=50000),
+    )
+    def test_read_file_bytes(self, files: List[FileNameAndContents]) -> None:
+        self.removeTree()
+        mkdir_helper(MANIFEST_TESTING_DIR)
+
+        manifest = make_fresh_manifest(MANIFEST_TESTING_DIR)
+        for file_name, file_path, file_contents in files:
+            manifest.write_file(file_name, file_contents, file_path)
+        manifest2 = make_existing_manifest(
+            MANIFEST_TESTING_DIR, manifest.write_manifest()
+        )
+
+        for file_name, file_path, file_contents in files:
+            self.assertEqual(
+                file_contents.encode("utf-8"),
+                manifest2.read_file_bytes(file_name, file_path),
+            )
+
+        # big files are memory-mapped, rather than read, but they come out the same
+        with patch("arlo_e2e.manifest.HASH_MMAP_THRESHOLD", 1):
+            for file_name, file_path, file_contents in files:
+                contents = manifest2.read_file_bytes(file_name, file_path)
+                self.assertIsInstance(contents, mmap)
+                self.assertEqual(file_contents.encode("utf-8"), contents[:])
+                contents.close()
+                self.assertEqual(
+                    file_contents, manifest2.read_file(file_name, file_path)
+                )
+
+        with open(
+            compose_filename(
+                MANIFEST_TESTING_DIR, files[0].file_name, files[0].file_path
+            ),
+            "ab",
+        ) as f:
+            f.write(b"x")
+        self.assertIsNone(
+            manifest2.read_file_bytes(files[0].file_name, files[0].file_path)
+        )
+
+        self.removeTree()
+
+    @given(list_file_names_contents(3), sampled_from(sorted(supported_codecs())))
+    @settings(
+        deadline=timedelta(milliseconds=50000),
+    )
+    def test_compressed_files(
+        self, files: List[FileNameAndContents], codec: str
+    ) -> None:
+        self.removeTree()
+        mkdir_helper(MANIFEST_TESTING_DIR)
+
+        manifest = make_fresh_manifest(MANIFEST_TESTING_DIR)
+        for file_name, file_path, file_contents in files:
+            manifest.write_file(file_name, file_contents, file_path, codec=codec)
+        root_hash = manifest.write_manifest()
+
+        manifest2 = make_existing_manifest(MANIFEST_TESTING_DIR, root_hash)
+        self.assertTrue(manifest.equivalent(manifest2))
+        for file_name, file_path, file_contents in files:
+            name = compose_manifest_name(file_name, file_path)
+            self.assertEqual(codec, manifest2.hashes[name].codec)
+            self.assertEqual(file_contents, manifest2.read_file(file_name, file_path))
+
+        # the manifest hashes the compressed bytes, so no decompression is necessary here
+        results = verify_manifest_hashes(MANIFEST_TESTING_DIR, root_hash)
+        self.assertIsNotNone(results)
+        self.assertTrue(results.success)
+
+        # compression is deterministic, so the hashes don't change if we write again
+        manifest3 = make_fresh_manifest(MANIFEST_TESTING_DIR)
+        for file_name, file_path, file_contents in files:
+            manifest3.write_file(file_name, file_contents, file_path, codec=codec)
+        self.assertEqual(root_hash, manifest3.write_manifest())
+
+        # a damaged compressed file fails validation, rather than decompressing into garbage
+        with open(
+            compose_filename(
+                MANIFEST_TESTING_DIR, files[0].file_name, files[0].file_path
+            ),
+            "ab",
+        ) as f:
+            f.write(b"x")
+        self.assertIsNone(manifest2.read_file(files[0].file_name, files[0].file_path))
+
+        self.assertIn(CODEC_GZIP, supported_codecs())
+        self.removeTree()
+
+    def test_changed_prefixes(self) -> None:
+        self.removeTree()
+        mkdir_helper(MANIFEST_TESTING_DIR)
+
+        manifest1 = make_fresh_manifest(MANIFEST_TESTING_DIR)
+        manifest1.write_file("b0000001.json", "ballot 1", ["ballots", "b0000"])
+        manifest1.write_file("b0001001.json", "ballot 2", ["ballots", "b0001"])
+        manifest1.write_file("b0000.json", "subtotal 1", [SUBTOTALS_DIR])
+        manifest1.write_file("b0001.json", "subtotal 2", [SUBTOTALS_DIR])
+        manifest1.write_file("something_else.json", "other stuff")
+
+        self.assertEqual([], manifest1.changed_prefixes(manifest1))
+
+        manifest2 = make_fresh_manifest(MANIFEST_TESTING_DIR)
+        manifest2.merge_from(manifest1)
+        manifest2.write_file("b0001001.json", "ballot 2, changed", ["ballots", "b0001"])
+        manifest2.write_file("b0002001.json", "ballot 3", ["ballots", "b0002"])
+        manifest2.write_file("something_else.json", "other stuff, changed")
+
+        self.assertEqual(["b0001", "b0002"], manifest2.changed_prefixes(manifest1))
+        self.assertEqual(["b0001", "b0002"], manifest1.changed_prefixes(manifest2))
+
+        self.assertEqual(
+            "b0000", manifest_name_to_prefix(subtotal_manifest_name("b0000"))
+        )
+        self.assertEqual(
+            "b0000", manifest_name_to_prefix(ballot_manifest_name("b0000001"))
+        )
+        self.assertIsNone(manifest_name_to_prefix("something_else.json"))
+
+        self.removeTree()
+
+    def test_sharded_manifest(self) -> None:
+        self.removeTree()
+        mkdir_helper(MANIFEST_TESTING_DIR)
+
+        manifest = make_fresh_manifest(MANIFEST_TESTING_DIR)
+        ballot_ids = [f"b000{p}00{i}" for p in range(3) for i in range(3)]
+        for bid in ballot_ids:
+            manifest.write_file(bid + ".json", "ballot " + bid, ["ballots", bid[0:5]])
+        manifest.write_file("b0000.json", "subtotal 1", [SUBTOTALS_DIR])
+        manifest.write_file("something_else.json", "other stuff")
+        root_hash = manifest.write_manifest()
+        self.assertIsNotNone(manifest.merkle_root)
+        self.assertEqual(3, manifest.num_shards)
+
+        # only the top-level entries are loaded at first, then only the shards we need
+        manifest2 = make_existing_manifest(MANIFEST_TESTING_DIR, root_hash)
+        self.assertNotIn(ballot_manifest_name(ballot_ids[0]), manifest2.hashes)
+        self.assertIn(subtotal_manifest_name("b0000"), manifest2.hashes)
+        self.assertEqual(
+            "ballot " + ballot_ids[0],
+            manifest2.read_file(ballot_ids[0] + ".json", ["ballots", "b0000"]),
+        )
+        self.assertEqual({"b0000"}, manifest2.loaded_shards)
+        self.assertTrue(manifest.equivalent(manifest2))
+        self.assertEqual({"b0000", "b0001", "b0002"}, manifest2.loaded_shards)
+
+        results = verify_manifest_hashes(MANIFEST_TESTING_DIR, root_hash)
+        self.assertIsNotNone(results)
+        self.assertTrue(results.success)
+        self.assertEqual(len(ballot_ids) + 2, results.num_files)
+
+        # a tampered shard doesn't match the Merkle root, so its ballots can't be read
+        with open(
+            compose_filename(MANIFEST_TESTING_DIR, "b0001.json", [MANIFEST_SHARDS_DIR]),
+            "a",
+        ) as f:
+            f.write(" ")
+        manifest3 = make_existing_manifest(MANIFEST_TESTING_DIR, root_hash)
+        self.assertEqual(
+            "ballot " + ballot_ids[0],
+            manifest3.read_file(ballot_ids[0] + ".json", ["ballots", "b0000"]),
+        )
+        self.assertIsNone(
+            manifest3.read_file(ballot_ids[3] + ".json", ["ballots", "b0001"])
+        )
+        self.assertIsNone(verify_manifest_hashes(MANIFEST_TESTING_DIR, root_hash))
+
+        # the older, flat layout is still available
+        manifest.write_manifest(sharded=False)
+        self.assertIsNone(manifest.merkle_root)
+        manifest4 = make_existing_manifest(MANIFEST_TESTING_DIR)
+        self.assertIn(ballot_manifest_name(ballot_ids[0]), manifest4.hashes)
+
+        self.removeTree()
+
+    @given(integers(1, 40), integers(0, 39))
+    def test_merkle_proofs(self, num_leaves: int, index: int) -> None:
+        assume(index < num_leaves)
+        leaves = [merkle_leaf_hash(f"b{i:04d}", str(i)) for i in range(num_leaves)]
+        levels = merkle_tree_levels(leaves)
+        root = levels[-1][0]
+        proof = merkle_proof(levels, index)
+
+        self.assertLessEqual(len(proof), (num_leaves - 1).bit_length())
+        self.assertTrue(
+            verify_merkle_proof(leaves[index], index, num_leaves, proof, root)
+        )
+        self.assertFalse(
+            verify_merkle_proof(
+                merkle_leaf_hash("b9999", "x"), index, num_leaves, proof, root
+            )
+        )
+        if num_leaves > 1:
+            self.assertFalse(
+                verify_merkle_proof(
+                    leaves[index], (index + 1) % num_leaves, num_leaves, proof, root
+                )
+            )
+
+    @given(list_file_names_contents(5))
+    @settings(
+        deadline=timedelta(milliseconds=50000),
+    )
+    def test_manifest_json_streaming(self, files: List[FileNameAndContents]) -> None:
+        self.removeTree()
+        mkdir_helper(MANIFEST_TESTING_DIR)
+
+        manifest = make_fresh_manifest(MANIFEST_TESTING_DIR)
+        for file_name, file_path, file_contents in files:
+            manifest.write_file(file_name, file_contents, file_path)
+        root_hash = manifest.write_manifest()
+
+        # the streaming reader yields the same hash as reading the whole file, and the
+        # whole file is still ordinary JSON
+        manifest_file = compose_filename(MANIFEST_TESTING_DIR, "MANIFEST.json")
+        result = read_manifest_json(manifest_file, ManifestExternal)
+        self.assertIsNotNone(result)
+        self.assertEqual(root_hash, result[0])
+        self.assertEqual(manifest.hashes, result[1].hashes)
+        with open(manifest_file, "r") as f:
+            manifest_str = f.read()
+        self.assertEqual(root_hash, sha256_hash(manifest_str))
+        self.assertEqual(
+            result[1], decode_json_file_contents(manifest_str, ManifestExternal)
+        )
+
+        # manifests written all at once, without any shards, as older versions did, are
+        # still readable
+        manifest.write_json_file(
+            "MANIFEST.json",
+            ManifestExternal(dict(manifest.hashes), manifest.bytes_written),
+            skip_manifest=True,
+        )
+        manifest2 = make_existing_manifest(MANIFEST_TESTING_DIR)
+        self.assertTrue(manifest.equivalent(manifest2))
+
+        # a truncated manifest is rejected
+        with open(manifest_file, "w") as f:
+            f.write(manifest_str[0:-4])
+        self.assertIsNone(make_existing_manifest(MANIFEST_TESTING_DIR))
+
+        self.removeTree()
+
+    @given(list_file_names_contents(5))
+    def test_file_info_table(self, files: List[FileNameAndContents]) -> None:
+        entries = {
+            compose_manifest_name(f.file_name, f.file_path): FileInfo(
+                sha256_hash(f.file_contents),
+                len(f.file_contents),
+                "container.jsonl" if i % 2 == 0 else None,
+                i if i % 2 == 0 else None,
+                "gzip" if i == 0 else None,
+            )
+            for i, f in enumerate(files)
+        }
+        entries["irregular"] = FileInfo("not a SHA256 hash", 0)
+
+        table = FileInfoTable(entries)
+        self.assertEqual(len(entries), len(table))
+        self.assertEqual(entries, dict(table))
+        self.assertEqual(table, pickle.loads(pickle.dumps(table)))
+
+        name = next(iter(entries.keys()))
+        table[name] = entries["irregular"]
+        self.assertEqual(entries["irregular"], table[name])
+        del table[name]
+        self.assertNotIn(name, table)
+        self.assertIsNone(table.get(name))
+        self.assertEqual(len(entries) - 1, len(table))
+
+        # manifests always use the compact representation
+        manifest = make_fresh_manifest(MANIFEST_TESTING_DIR)
+        manifest.merge_from(
+            Manifest(
+                MANIFEST_TESTING_DIR,
+                entries,
+                sum(e.num_bytes for e in entries.values()),
+            )
+        )
+        self.assertIsInstance(manifest.hashes, FileInfoTable)
+        self.assertEqual(entries, dict(manifest.hashes))
+
+    @given(list_file_names_contents(5))
+    @settings(deadline=timedelta(milliseconds=50000), max_examples=10)
+    def test_write_behind(self, files: List[FileNameAndContents]) -> None:
+        self.removeTree()
+        manifest = make_fresh_manifest(MANIFEST_TESTING_DIR)
+        manifest2 = make_fresh_manifest(MANIFEST_TESTING_DIR + "2", write_behind=True)
+        for name, _, contents in files:
+            manifest.write_file(name, contents, ["a", "b"])
+            self.assertIsNone(manifest2.write_file(name, contents, ["a", "b"]))
+
+        # the entries only show up after they're flushed, but the writes might still be pending
+        self.assertEqual(0, len(manifest2.hashes))
+        self.assertEqual(dict(manifest.hashes), manifest2.flush_writes())
+        self.assertEqual({}, manifest2.flush_writes())
+        self.assertEqual(0, wait_for_zero_pending_writes())
+        self.assertEqual(0, get_write_behind_queue().num_pending())
+
+        # pickling waits for the hashes, if they haven't already been flushed
+        manifest2.write_file("extra.json", "extra")
+        manifest3 = pickle.loads(pickle.dumps(manifest2))
+        self.assertEqual({}, manifest3.pending_writes)
+        self.assertEqual(manifest2.hashes, manifest3.hashes)
+        self.assertEqual(0, wait_for_zero_pending_writes())
+        self.assertEqual("extra", manifest3.read_file("extra.json"))
+        self.assertEqual("extra", manifest2.read_file("extra.json"))
+
+        shutil.rmtree(MANIFEST_TESTING_DIR + "2", ignore_errors=True)
+        self.removeTree()
+        reset_pending_state()
+
+    @given(list_file_names_contents(5))
+    @settings(deadline=timedelta(milliseconds=50000), max_examples=10)
+    def test_staging(self, files: List[FileNameAndContents]) -> None:
+        self.removeTree()
+        staging_dir = MANIFEST_TESTING_DIR + "_staging"
+        manifest = make_fresh_manifest(MANIFEST_TESTING_DIR)
+        manifest2 = make_fresh_manifest(
+            MANIFEST_TESTING_DIR + "2", staging_dir=staging_dir
+        )
+        for name, _, contents in files:
+            manifest.write_file(name, contents, ["a", "b"])
+            manifest2.write_file(name, contents, ["a", "b"])
+
+        # the entries are there right away, but the files are only uploaded after a flush
+        self.assertEqual(manifest.hashes, manifest2.hashes)
+        self.assertEqual(len(files), len(manifest2.staged_files))
+        manifest2.flush_writes()
+        self.assertEqual([], manifest2.staged_files)
+        self.assertEqual([], all_files_in_directory(staging_dir))
+        for name, _, contents in files:
+            self.assertEqual(contents, manifest2.read_file(name, ["a", "b"]))
+
+        # they were uploaded as one bundle, which the entries now point into
+        bundle_name = compose_manifest_name(
+            files[0].file_name + BUNDLE_SUFFIX, ["a", "b"]
+        )
+        self.assertEqual(
+            [bundle_name],
+            [
+                path_to_manifest_name(MANIFEST_TESTING_DIR + "2", p)
+                for p in all_files_in_directory(MANIFEST_TESTING_DIR + "2")
+            ],
+        )
+        offsets = [
+            manifest2.hashes[compose_manifest_name(name, ["a", "b"])].offset
+            for name, _, _ in files
+        ]
+        self.assertEqual(0, offsets[0])
+        self.assertEqual(offsets, sorted(offsets))
+        for name, _, _ in files:
+            file_info = manifest2.hashes[compose_manifest_name(name, ["a", "b"])]
+            self.assertEqual(bundle_name, file_info.container)
+            self.assertEqual(
+                manifest.hashes[compose_manifest_name(name, ["a", "b"])].hash,
+                file_info.hash,
+            )
+
+        root_hash = manifest2.write_manifest()
+        results = verify_manifest_hashes(MANIFEST_TESTING_DIR + "2", root_hash)
+        self.assertIsNotNone(results)
+        self.assertTrue(results.success)
+
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        shutil.rmtree(MANIFEST_TESTING_DIR + "2", ignore_errors=True)
+        self.removeTree()
@@ -20,8 +20,18 @@ from arlo_e2e.decrypt import (
     write_proven_ballot,
     load_proven_ballot,
 )
+from arlo_e2e.columnar import (
+    columns_match_ballots,
+    verify_tally_from_columns,
+    prefix_tallies_from_columns,
+)
 from arlo_e2e.dominion import read_dominion_csv
 from arlo_e2e.eg_helpers import log_and_print
+from arlo_e2e.manifest import (
+    ballot_manifest_name,
+    make_fresh_manifest,
+    verify_manifest_hashes,
+)
 from arlo_e2e.publish import (
     write_fast_tally,
     load_fast_tally,
@@ -30,11 +40,20 @@ from arlo_e2e.publish import (
 )
 from arlo_e2e.ray_helpers import ray_init_localhost
 from arlo_e2e.ray_tally import ray_tally_everything
-from arlo_e2e.tally import fast_tally_everything
+from arlo_e2e.segment_tree import (
+    load_segment_tree,
+    decrypt_group_tallies,
+    verify_group_subtotals,
+    group_file_names,
+    load_group_subtotals,
+)
+from arlo_e2e.tally import fast_tally_everything, sequential_tally
+from arlo_e2e.utils import write_json_helper
 from arlo_e2e_testing.dominion_hypothesis import dominion_cvrs
 
 TALLY_TESTING_DIR = "tally_test"
 DECRYPTED_DIR = "decrypted_test"
+LEGACY_DIR = "legacy_test"
 
 
 class TestTallyPublishing(unittest.TestCase):
@@ -42,6 +61,7 @@ class TestTallyPublishing(unittest.TestCase):
         try:
             shutil.rmtree(TALLY_TESTING_DIR, ignore_errors=True)
             shutil.rmtree(DECRYPTED_DIR, ignore_errors=True)
+            shutil.rmtree(LEGACY_DIR, ignore_errors=True)
         except FileNotFoundError:
             # okay if it's not there
             pass
@@ -77,13 +97,19 @@ class TestTallyPublishing(unittest.TestCase):
         assert len(ballots) > 0, "can't have zero ballots!"
 
         results = fast_tally_everything(
-            cvrs, self.pool, secret_key=keypair.secret_key, verbose=True
+            cvrs,
+            self.pool,
+            secret_key=keypair.secret_key,
+            verbose=True,
+            group_columns=["BallotType", "TabulatorNum"],
         )
 
         self.assertTrue(results.all_proofs_valid(self.pool))
 
         # dump files out to disk
-        write_fast_tally(results, TALLY_TESTING_DIR)
+        write_fast_tally(
+            results, TALLY_TESTING_DIR, columnar=True, segment_tree=True, pool=self.pool
+        )
         log_and_print("tally_testing written, proceeding to read it back in again")
 
         # now, read it back again!
@@ -101,6 +127,118 @@ class TestTallyPublishing(unittest.TestCase):
         self.assertTrue(_list_eq(results.encrypted_ballots, results2.encrypted_ballots))
         self.assertTrue(results.equivalent(results2, keypair, self.pool))
 
+        # tools that don't need the CVR metadata only load the ballot ids, plus the columns
+        # with group subtotals, which are needed to verify them
+        results3 = load_fast_tally(
+            TALLY_TESTING_DIR, check_proofs=check_proofs, pool=self.pool, cvr_columns=[]
+        )
+        self.assertIsNotNone(results3)
+        self.assertEqual(
+            ["BallotId", "BallotType", "TabulatorNum"],
+            list(results3.cvr_metadata.columns),
+        )
+        self.assertEqual(
+            results2.encrypted_ballot_memos.keys(),
+            results3.encrypted_ballot_memos.keys(),
+        )
+        self.assertIsNone(
+            load_fast_tally(
+                TALLY_TESTING_DIR, check_proofs=False, cvr_columns=["nonexistent"]
+            )
+        )
+
+        # every prefix directory has a published subtotal, and each one verifies on its own
+        self.assertIsNotNone(results2.subtotals)
+        self.assertEqual(results.subtotals, results2.subtotals)
+        for prefix in results2.subtotals.keys():
+            self.assertTrue(results2.verify_prefixes([prefix], self.pool))
+
+        # the group subtotals are published, and they're checked against the ballots
+        self.assertIsNotNone(results2.group_subtotals)
+        self.assertEqual(results.group_subtotals, results2.group_subtotals)
+        self.assertFalse(results2.verify_prefixes(["nonexistent"], self.pool))
+
+        # ballots are packed into container files, but each one can still be loaded on its own,
+        # and ballots written one file per ballot, the older layout, can still be loaded as well
+        eballot = results.encrypted_ballots[0]
+        file_info = results2.manifest.get_file_info(
+            ballot_manifest_name(eballot.object_id)
+        )
+        self.assertIsNotNone(file_info.container)
+        self.assertEqual(
+            eballot, results2.manifest.load_ciphertext_ballot(eballot.object_id)
+        )
+        self.assertTrue(verify_manifest_hashes(TALLY_TESTING_DIR).success)
+
+        # the columnar store yields the same tally and subtotals, with or without a subset of
+        # the selections
+        self.assertTrue(verify_tally_from_columns(results2))
+        self.assertTrue(verify_tally_from_columns(results2, num_sampled_ballots=None))
+        self.assertFalse(columns_match_ballots(results2.manifest, ["nonexistent"]))
+        for selections in results2.metadata.contest_map.values():
+            self.assertTrue(
+                verify_tally_from_columns(
+                    results2, frozenset(s.object_id for s in selections)
+                )
+            )
+        self.assertEqual(
+            results2.recompute_prefix_tallies(self.pool),
+            prefix_tallies_from_columns(results2.manifest),
+        )
+
+        # the segment tree agrees with the tally and the ballots, yields the same subtotal as the
+        # ballots for any range, and its decrypted group subtotals add up to the tally
+        tree = load_segment_tree(results2)
+        self.assertIsNotNone(tree)
+        self.assertTrue(tree.is_consistent())
+        self.assertTrue(tree.leaves_match_ballots(self.pool))
+        num_ballots = tree.num_ballots
+        for start, end in {(0, num_ballots), (0, 1), (num_ballots // 3, num_ballots)}:
+            self.assertEqual(
+                sequential_tally(
+                    [
+                        results.get_encrypted_ballot(bid)
+                        for bid in tree.info.ballot_ids[start:end]
+                    ]
+                ),
+                tree.range_tally(start, end),
+            )
+        self.assertIsNone(tree.range_tally(0, num_ballots + 1))
+
+        group_subtotals = decrypt_group_tallies(
+            tree.group_tallies("BallotType"), results2.context, keypair, pool=self.pool
+        )
+        self.assertTrue(verify_group_subtotals(tree, "BallotType", group_subtotals))
+        for sid, info in results2.tally.map.items():
+            self.assertEqual(
+                info.decrypted_tally,
+                sum(
+                    g.map[sid].decrypted_tally
+                    for g in group_subtotals.values()
+                    if sid in g.map
+                ),
+            )
+
+        # the subtotals, as written by arlo_subtotals, load back for arlo_verify_tally
+        file_names = group_file_names(group_subtotals.keys())
+        for group, subtotal in group_subtotals.items():
+            write_json_helper(
+                DECRYPTED_DIR, file_names[group], subtotal, ["BallotType"]
+            )
+        self.assertEqual(
+            group_subtotals, load_group_subtotals(tree, DECRYPTED_DIR, "BallotType")
+        )
+        self.assertIsNone(load_group_subtotals(tree, DECRYPTED_DIR, "TabulatorNum"))
+
+        legacy_manifest = make_fresh_manifest(LEGACY_DIR)
+        legacy_manifest.write_ciphertext_ballots([eballot], packed=False)
+        self.assertIsNone(
+            legacy_manifest.hashes[ballot_manifest_name(eballot.object_id)].container
+        )
+        self.assertEqual(
+            eballot, legacy_manifest.load_ciphertext_ballot(eballot.object_id)
+        )
+
         # Make sure there's an index.html file; throws an exception if it's missing
         self.assertIsNotNone(stat(path.join(TALLY_TESTING_DIR, "index.html")))
 
@@ -163,12 +301,13 @@ class TestTallyPublishing(unittest.TestCase):
             secret_key=keypair.secret_key,
             verbose=True,
             root_dir=TALLY_TESTING_DIR,
+            columnar=True,
         )
 
         self.assertTrue(results.all_proofs_valid())
 
-        # dump files out to disk
-        write_ray_tally(results, TALLY_TESTING_DIR)
+        # dump files out to disk; the columns were written along with the ballots
+        write_ray_tally(results, TALLY_TESTING_DIR, columnar=True)
         log_and_print("tally_testing written, proceeding to read it back in again")
 
         # now, read it back again!
@@ -184,4 +323,9 @@ class TestTallyPublishing(unittest.TestCase):
 
         self.assertTrue(_list_eq(results.encrypted_ballots, results2.encrypted_ballots))
         self.assertTrue(results.equivalent(results2, keypair))
+        self.assertTrue(
+            verify_tally_from_columns(
+                results2.to_fast_tally(), num_sampled_ballots=None
+            )
+        )
         self.removeTree()  # clean up our mess
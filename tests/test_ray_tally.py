@@ -121,6 +121,7 @@ class TestRayTallies(unittest.TestCase):
             seed_hash=seed_hash,
             master_nonce=master_nonce,
             use_progressbar=False,
+            group_columns=["BallotType", "TabulatorNum"],
         )
         rtally = ray_tally_everything(
             cvrs,
@@ -131,6 +132,24 @@ class TestRayTallies(unittest.TestCase):
             master_nonce=master_nonce,
             root_dir="rtally_output",
             use_progressbar=False,
+            group_columns=["BallotType", "TabulatorNum"],
         )
 
         self.assertEqual(tally, rtally.to_fast_tally())
+
+        # the group subtotals are computed in the same pass, and agree as well
+        self.assertTrue(rtally.all_proofs_valid(recheck_ballots_and_tallies=True))
+        self.assertEqual(tally.group_subtotals.keys(), rtally.group_subtotals.keys())
+        for column, subtotals in tally.group_subtotals.items():
+            rsubtotals = rtally.group_subtotals[column]
+            self.assertEqual(subtotals.groups.keys(), rsubtotals.groups.keys())
+            for value, group in subtotals.groups.items():
+                rgroup = rsubtotals.groups[value]
+                self.assertEqual(group.num_ballots, rgroup.num_ballots)
+                self.assertEqual(
+                    group.tally.to_tally_map(), rgroup.tally.to_tally_map()
+                )
+                self.assertEqual(
+                    {k: v.decrypted_tally for k, v in group.tally.map.items()},
+                    {k: v.decrypted_tally for k, v in rgroup.tally.map.items()},
+                )
@@ -2,19 +2,32 @@ import shutil
 import unittest
 from os import cpu_count
 from pathlib import PurePath
+from threading import Lock
+from time import sleep
 from typing import List
+from unittest.mock import patch, MagicMock
 
 import coverage
 import ray
 
 from arlo_e2e.ray_helpers import ray_init_localhost
+from arlo_e2e.ray_staging import (
+    hand_off_staged_files,
+    take_staged_bundles,
+    BUNDLE_SUFFIX,
+)
 from arlo_e2e.ray_write_retry import (
     set_failure_probability_for_testing,
     write_file_with_retries,
     wait_for_zero_pending_writes,
     reset_pending_state,
+    get_pending_write_counts,
+    get_status_actor,
+    WriteBehindQueue,
+    WRITE_BEHIND_THREADS,
 )
 from arlo_e2e.utils import mkdir_helper, all_files_in_directory
+from arlo_e2e.write_limiter import WriteLimiter, WRITE_LIMIT_INITIAL, WRITE_LIMIT_MIN
 
 
 def write_all_files(num_files: int, num_retries: int = 10) -> None:
@@ -84,6 +97,159 @@ class TestRayWriteRetry(unittest.TestCase):
         ray.shutdown()
         reset_pending_state()
 
+    def test_total_failures(self) -> None:
+        ray_init_localhost(num_cpus=cpu_count())
+        coverage.process_startup()  # necessary for coverage testing to work in parallel
+        set_failure_probability_for_testing(1.0)
+
+        mkdir_helper("write_output")
+
+        # every write is retried on the retry actor, in parallel, then given up on
+        write_all_files(10, 3)
+        num_failures = wait_for_zero_pending_writes()
+        self.assertEqual(num_failures, 10)
+        self.assertEqual((0, 10), get_pending_write_counts())
+        remove_test_tree()
+        ray.shutdown()
+        reset_pending_state()
+
+    def test_pending_count_rises_again(self) -> None:
+        ray_init_localhost(num_cpus=cpu_count())
+        coverage.process_startup()  # necessary for coverage testing to work in parallel
+        status_actor = get_status_actor()
+
+        # the count reaches zero once...
+        status_actor.update_counts.remote(5, 5, 0)
+        self.assertEqual(0, ray.get(status_actor.wait_for_zero_pending.remote()))
+
+        # ...then more writes start, so waiting has to wait for those, too
+        status_actor.update_counts.remote(3, 0, 0)
+        waiting = status_actor.wait_for_zero_pending.remote()
+        ready, _ = ray.wait([waiting], timeout=1.0)
+        self.assertEqual([], ready)
+
+        status_actor.update_counts.remote(0, 2, 0)
+        ready, _ = ray.wait([waiting], timeout=1.0)
+        self.assertEqual([], ready)
+
+        status_actor.update_counts.remote(0, 1, 1)
+        self.assertEqual(1, ray.get(waiting))
+
+        ray.shutdown()
+        reset_pending_state()
+
+    def test_staged_uploads_are_pending(self) -> None:
+        ray_init_localhost(num_cpus=cpu_count())
+        coverage.process_startup()  # necessary for coverage testing to work in parallel
+        set_failure_probability_for_testing(0.0)
+
+        mkdir_helper("write_output/staged")
+        staged_files = []
+        for f in range(10):
+            name = f"file{f:03d}"
+            with open(f"write_output/staged/{name}", "w") as file:
+                file.write(name)
+            staged_files.append((f"write_output/staged/{name}", f"write_output/{name}"))
+
+        # the hand-off returns right away, but the uploads still count as pending writes
+        self.assertEqual([], hand_off_staged_files(staged_files))
+        self.assertEqual(0, wait_for_zero_pending_writes())
+
+        # they were uploaded as one bundle, with the files one after another
+        bundles = take_staged_bundles("write_output")
+        self.assertEqual(1, len(bundles))
+        self.assertEqual(
+            "write_output/file000" + BUNDLE_SUFFIX, bundles[0].published_name
+        )
+        self.assertEqual(
+            [p for _, p in staged_files], [m[0] for m in bundles[0].members]
+        )
+        with open(bundles[0].published_name, "r") as file:
+            self.assertEqual("".join(f"file{f:03d}" for f in range(10)), file.read())
+        self.assertEqual([], take_staged_bundles("write_output"))
+
+        remove_test_tree()
+        ray.shutdown()
+        reset_pending_state()
+
+    def test_write_behind_backs_off(self) -> None:
+        if ray.is_initialized():
+            ray.shutdown()
+
+        self.assertLessEqual(WRITE_LIMIT_INITIAL, WRITE_BEHIND_THREADS)
+        mkdir_helper("write_output")
+
+        in_flight = [0]
+        max_in_flight = [0]
+        lock = Lock()
+
+        def slow_write(name: str, data: bytes) -> None:
+            with lock:
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+            sleep(0.2)
+            with lock:
+                in_flight[0] -= 1
+
+        def max_concurrent_writes(limiter: WriteLimiter, num_files: int) -> int:
+            max_in_flight[0] = 0
+            queue = WriteBehindQueue()
+            with patch(
+                "arlo_e2e.ray_write_retry.get_write_limiter", return_value=limiter
+            ), patch("arlo_e2e.ray_write_retry.storage_write_bytes", slow_write):
+                for f in range(num_files):
+                    queue.submit(f"write_output/file{f:03d}", b"contents")
+                queue.wait_until_empty()
+            return max_in_flight[0]
+
+        # normally, the queue writes as many files at once as the limiter allows
+        self.assertEqual(
+            int(WRITE_LIMIT_INITIAL), max_concurrent_writes(WriteLimiter(), 4)
+        )
+
+        # after a run of failures, it writes them one or two at a time
+        limiter = WriteLimiter()
+        set_failure_probability_for_testing(1.0)
+        with patch("arlo_e2e.ray_write_retry.get_write_limiter", return_value=limiter):
+            queue = WriteBehindQueue()
+            for f in range(WRITE_BEHIND_THREADS):
+                queue.submit(f"write_output/file{f:03d}", b"contents")
+            queue.wait_until_empty()
+        self.assertEqual(WRITE_LIMIT_MIN, limiter.limit)
+
+        set_failure_probability_for_testing(0.0)
+        self.assertLessEqual(max_concurrent_writes(limiter, 4), 2)
+
+        remove_test_tree()
+        reset_pending_state()
+
+    def test_write_behind_retries_directories(self) -> None:
+        if ray.is_initialized():
+            ray.shutdown()
+
+        set_failure_probability_for_testing(0.0)
+        mkdir_helper("write_output/subdir")
+
+        # the first attempt to make the directory fails, so the next file tries again
+        backend = MagicMock()
+        backend.make_dirs.side_effect = [OSError("simulated failure"), None]
+        queue = WriteBehindQueue()
+        with patch(
+            "arlo_e2e.ray_write_retry.storage_for_path",
+            return_value=(backend, "write_output/subdir"),
+        ):
+            for f in range(3):
+                queue.submit(
+                    f"write_output/subdir/file{f:03d}",
+                    b"contents",
+                    directory="write_output/subdir",
+                )
+                queue.wait_until_empty()
+        self.assertEqual(2, backend.make_dirs.call_count)
+
+        remove_test_tree()
+        reset_pending_state()
+
     def test_without_ray(self) -> None:
         if ray.is_initialized():
             ray.shutdown()
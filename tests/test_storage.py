@@ -0,0 +1,144 @@
+import os
+import shutil
+import unittest
+from typing import List
+
+from hypothesis import given, settings
+from hypothesis.strategies import binary, integers, lists
+
+from arlo_e2e.manifest import (
+    make_fresh_manifest,
+    make_existing_manifest,
+    verify_manifest_hashes,
+)
+from arlo_e2e.storage import (
+    HAVE_BOTO3,
+    S3_ENDPOINT_URL_ENV,
+    is_s3_path,
+    reset_storage,
+    storage_for_path,
+    storage_file_size,
+    storage_read_chunks,
+    storage_write_chunks,
+)
+from arlo_e2e.utils import (
+    all_files_in_directory,
+    compose_filename,
+    directory_exists_helper,
+    file_exists_helper,
+    load_file_helper,
+    load_file_range_helper,
+    mkdir_helper,
+)
+
+try:
+    from moto.server import ThreadedMotoServer
+
+    HAVE_MOTO = True
+except ImportError:
+    HAVE_MOTO = False
+
+STORAGE_TESTING_DIR = "storage_testing"
+S3_TESTING_BUCKET = "arlo-e2e-testing"
+MOTO_PORT = 5123
+
+
+class TestLocalStorage(unittest.TestCase):
+    def removeTree(self) -> None:
+        shutil.rmtree(STORAGE_TESTING_DIR, ignore_errors=True)
+
+    def setUp(self) -> None:
+        self.removeTree()
+
+    def tearDown(self) -> None:
+        self.removeTree()
+
+    def test_s3_paths(self) -> None:
+        self.assertTrue(is_s3_path("s3://bucket/tally"))
+        self.assertTrue(is_s3_path(compose_filename("s3://bucket/tally", "x.json")))
+        self.assertFalse(is_s3_path("tally_output"))
+        self.assertFalse(is_s3_path("/mnt/arlo-data/tally_output"))
+
+    @given(lists(binary(max_size=1000), max_size=5), integers(0, 100))
+    @settings(max_examples=20)
+    def test_chunks_round_trip(self, chunks: List[bytes], offset: int) -> None:
+        mkdir_helper(STORAGE_TESTING_DIR)
+        file_name = compose_filename(STORAGE_TESTING_DIR, "chunks.bin")
+        contents = b"".join(chunks)
+
+        storage_write_chunks(file_name, chunks)
+        self.assertEqual(len(contents), storage_file_size(file_name))
+        self.assertEqual(contents, b"".join(storage_read_chunks(file_name)))
+        self.assertEqual(len(contents) > 0, file_exists_helper("", file_name))
+
+        expected_range = contents[offset : offset + 10]
+        actual_range = load_file_range_helper(file_name, offset, 10)
+        if len(expected_range) == 10:
+            self.assertEqual(expected_range, actual_range)
+        else:
+            self.assertIsNone(actual_range)
+
+    def test_missing_files(self) -> None:
+        self.assertFalse(directory_exists_helper(STORAGE_TESTING_DIR))
+        self.assertIsNone(storage_file_size(compose_filename(STORAGE_TESTING_DIR, "x")))
+        self.assertIsNone(load_file_helper(STORAGE_TESTING_DIR, "x"))
+        self.assertEqual([], all_files_in_directory(STORAGE_TESTING_DIR))
+
+        mkdir_helper(STORAGE_TESTING_DIR)
+        self.assertTrue(directory_exists_helper(STORAGE_TESTING_DIR))
+
+
+@unittest.skipUnless(HAVE_BOTO3 and HAVE_MOTO, "needs boto3 and moto")
+class TestS3Storage(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = ThreadedMotoServer(ip_address="127.0.0.1", port=MOTO_PORT)
+        self.server.start()
+        os.environ[S3_ENDPOINT_URL_ENV] = f"http://127.0.0.1:{MOTO_PORT}"
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+        reset_storage()
+
+        backend, _ = storage_for_path(f"s3://{S3_TESTING_BUCKET}/")
+        backend._client.create_bucket(Bucket=S3_TESTING_BUCKET)  # type: ignore
+
+    def tearDown(self) -> None:
+        self.server.stop()
+        del os.environ[S3_ENDPOINT_URL_ENV]
+        reset_storage()
+
+    def test_s3_round_trip(self) -> None:
+        root_dir = f"s3://{S3_TESTING_BUCKET}/tally"
+        self.assertFalse(directory_exists_helper(root_dir))
+
+        # big enough for a multipart upload
+        big_contents = os.urandom(20 * 1024 * 1024)
+        file_name = compose_filename(root_dir, "big.bin", ["columns"])
+        storage_write_chunks(
+            file_name,
+            [big_contents[i : i + 100000] for i in range(0, len(big_contents), 100000)],
+        )
+        self.assertEqual(big_contents, b"".join(storage_read_chunks(file_name)))
+        self.assertEqual(
+            big_contents[1000:1010], load_file_range_helper(file_name, 1000, 10)
+        )
+        self.assertTrue(directory_exists_helper(root_dir))
+
+        manifest = make_fresh_manifest(root_dir)
+        for i in range(10):
+            manifest.write_file(f"b000{i}.json", f"ballot {i}", ["ballots", "b0000"])
+        manifest.write_file("something_else.json", "other stuff")
+        root_hash = manifest.write_manifest()
+
+        manifest2 = make_existing_manifest(root_dir, root_hash)
+        self.assertIsNotNone(manifest2)
+        self.assertEqual(
+            "ballot 3", manifest2.read_file("b0003.json", ["ballots", "b0000"])
+        )
+        self.assertTrue(manifest.equivalent(manifest2))
+
+        # the big file isn't in the manifest, so it shows up as an extra
+        results = verify_manifest_hashes(root_dir, root_hash)
+        self.assertIsNotNone(results)
+        self.assertEqual(["columns|big.bin"], results.extra)
+        self.assertEqual(11, results.num_files)
@@ -6,11 +6,12 @@ from multiprocessing import Pool, cpu_count
 import coverage
 from electionguard.elgamal import ElGamalKeyPair
 from electionguardtest.elgamal import elgamal_keypairs
-from hypothesis import settings, given, HealthCheck, Phase
+from hypothesis import settings, given, HealthCheck, Phase, assume
 from hypothesis.strategies import booleans
 
-from arlo_e2e.dominion import read_dominion_csv
+from arlo_e2e.dominion import read_dominion_csv, DominionCSV
 from arlo_e2e.tally import fast_tally_everything
+from arlo_e2e.tally_faults import locate_tally_faults, cvr_consistency_oracle
 from arlo_e2e_testing.dominion_hypothesis import dominion_cvrs
 
 
@@ -52,10 +53,81 @@ class TestFastTallies(unittest.TestCase):
         # Now, while we've got a tally and a set of cvrs, we'll test some of the other utility
         # methods that we have. This is going to be much faster than regenerating cvrs and tallies.
 
-        # TODO: tests for get_contest_titles_matching and get_ballot_styles_for_contest_titles
+        # TODO: tests for get_ballot_styles_for_contest_titles
+
+        # every contest can be verified on its own, including recomputing its tally from
+        # just the ballots that include it
+        for contest_title in cvrs.metadata.contest_map.keys():
+            self.assertIn(
+                contest_title, tally.get_contest_titles_matching([contest_title])
+            )
+            self.assertTrue(
+                tally.all_proofs_valid(
+                    self.pool,
+                    verbose=False,
+                    recheck_ballots_and_tallies=True,
+                    contests=[contest_title],
+                )
+            )
+        self.assertFalse(tally.all_proofs_valid(contests=["nonexistent contest"]))
 
         for ballot_style in cvrs.metadata.style_map.keys():
             ballots_query = tally.get_ballots_matching_ballot_styles([ballot_style])
             ballots_pandas = cvrs.data[cvrs.data.BallotType == ballot_style]
 
             self.assertEqual(len(ballots_pandas), len(ballots_query))
+
+    @given(dominion_cvrs(max_rows=50), elgamal_keypairs())
+    @settings(
+        deadline=timedelta(milliseconds=50000),
+        suppress_health_check=[HealthCheck.too_slow],
+        max_examples=3,
+        # disabling the "shrink" phase, because it runs very slowly
+        phases=[Phase.explicit, Phase.reuse, Phase.generate, Phase.target],
+    )
+    def test_locate_tally_faults(self, input: str, keypair: ElGamalKeyPair) -> None:
+        coverage.process_startup()  # necessary for coverage testing to work in parallel
+
+        cvrs = read_dominion_csv(StringIO(input))
+        self.assertIsNotNone(cvrs)
+
+        tally = fast_tally_everything(
+            cvrs, self.pool, verbose=False, secret_key=keypair.secret_key
+        )
+        tally_success, prefix_tallies = tally.verify_recomputed_tally(
+            self.pool, verbose=False
+        )
+        self.assertTrue(tally_success)
+        self.assertIsNotNone(prefix_tallies)
+
+        # with the original CVRs, there's nothing to find
+        faults = locate_tally_faults(
+            tally, prefix_tallies, cvr_consistency_oracle(cvrs, keypair), False
+        )
+        self.assertIsNotNone(faults)
+        self.assertEqual([], faults.mismatched_selections)
+        self.assertEqual([], faults.faulty_ballot_ids)
+
+        # now, we'll "corrupt" one vote in the CVRs, and the search should find that ballot
+        selection_columns = [
+            s.to_string()
+            for selections in cvrs.metadata.contest_map.values()
+            for s in selections
+        ]
+        votes = [
+            (index, column)
+            for column in selection_columns
+            for index in cvrs.data.index
+            if cvrs.data.at[index, column] == 1
+        ]
+        assume(len(votes) > 0)
+        index, column = votes[0]
+        data = cvrs.data.copy()
+        data.at[index, column] = 0
+        bad_cvrs = DominionCSV(cvrs.metadata, data, cvrs.metadata_columns)
+
+        faults = locate_tally_faults(
+            tally, prefix_tallies, cvr_consistency_oracle(bad_cvrs, keypair), False
+        )
+        self.assertIsNotNone(faults)
+        self.assertEqual([data.at[index, "BallotId"]], faults.faulty_ballot_ids)
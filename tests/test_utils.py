@@ -1,9 +1,16 @@
 import unittest
+from multiprocessing.pool import ThreadPool
+from typing import Iterator
 
 from hypothesis import given
 from hypothesis.strategies import integers
 
-from arlo_e2e.utils import flatmap, shard_list_uniform, shard_list
+from arlo_e2e.utils import (
+    flatmap,
+    shard_list_uniform,
+    shard_list,
+    imap_unordered_bounded,
+)
 
 
 class FlatmapTest(unittest.TestCase):
@@ -43,3 +50,43 @@ class ShardingTest(unittest.TestCase):
     def test_shard_list_zero_input(self) -> None:
         self.assertEqual([], shard_list([], 3))
         self.assertEqual([], shard_list_uniform([], 3))
+
+
+def _square(x: int) -> int:
+    return x * x
+
+
+def _fail_on_three(x: int) -> int:
+    if x == 3:
+        raise ValueError("three")
+    return x
+
+
+class BoundedMapTest(unittest.TestCase):
+    @given(integers(min_value=1, max_value=8), integers(min_value=0, max_value=100))
+    def test_imap_unordered_bounded(
+        self, max_in_flight: int, total_inputs: int
+    ) -> None:
+        num_taken = 0
+
+        def inputs() -> Iterator[int]:
+            nonlocal num_taken
+            for i in range(total_inputs):
+                num_taken += 1
+                yield i
+
+        results = []
+        with ThreadPool(4) as pool:
+            for result in imap_unordered_bounded(
+                pool, _square, inputs(), max_in_flight
+            ):
+                results.append(result)
+                # never more than max_in_flight inputs taken ahead of the results
+                self.assertTrue(num_taken - len(results) <= max_in_flight)
+
+        self.assertEqual(sorted(i * i for i in range(total_inputs)), sorted(results))
+
+    def test_imap_unordered_bounded_errors(self) -> None:
+        with ThreadPool(2) as pool:
+            with self.assertRaises(ValueError):
+                list(imap_unordered_bounded(pool, _fail_on_three, range(10), 2))
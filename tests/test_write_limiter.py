@@ -0,0 +1,178 @@
+import unittest
+from threading import Lock, Thread
+from time import sleep
+from typing import List
+
+from hypothesis import given
+from hypothesis.strategies import lists, booleans
+
+from arlo_e2e.write_limiter import (
+    LeasedWriteLimiter,
+    WriteLimiter,
+    WriteOutcome,
+    WRITE_LIMIT_MIN,
+    WRITE_LIMIT_MAX,
+    WRITE_LIMIT_INITIAL,
+)
+
+
+class TestWriteLimiter(unittest.TestCase):
+    def test_additive_increase_multiplicative_decrease(self) -> None:
+        limiter = WriteLimiter()
+        for _ in range(100):
+            with limiter.permit():
+                pass
+        grown_limit = limiter.limit
+        self.assertGreater(grown_limit, WRITE_LIMIT_INITIAL + 1)
+
+        with limiter.permit() as permit:
+            permit.failed()
+        self.assertLess(limiter.limit, grown_limit / 1.5)
+
+        # exceptions are failures, too; with no latency history, every failure counts
+        limiter2 = WriteLimiter()
+        for _ in range(20):
+            with self.assertRaises(OSError):
+                with limiter2.permit():
+                    raise OSError("simulated write failure")
+        self.assertEqual(WRITE_LIMIT_MIN, limiter2.limit)
+        self.assertEqual(0, limiter2.in_flight)
+
+    def test_latency_spike(self) -> None:
+        limiter = WriteLimiter()
+        for _ in range(10):
+            limiter.acquire()
+            limiter.release(True, 0.01)
+        before = limiter.limit
+        limiter.acquire()
+        limiter.release(True, 1.0)
+        self.assertLess(limiter.limit, before)
+
+    @given(lists(booleans(), max_size=200))
+    def test_limit_bounds(self, outcomes: List[bool]) -> None:
+        limiter = WriteLimiter()
+        for success in outcomes:
+            limiter.acquire()
+            limiter.release(success, 0.0)
+            self.assertGreaterEqual(limiter.limit, WRITE_LIMIT_MIN)
+            self.assertLessEqual(limiter.limit, WRITE_LIMIT_MAX)
+        self.assertEqual(0, limiter.in_flight)
+
+    def test_blocks_at_limit(self) -> None:
+        limiter = WriteLimiter(initial_limit=1.0)
+        limiter.acquire()
+
+        acquired = []
+        waiter = Thread(target=lambda: acquired.append(limiter.acquire()))
+        waiter.start()
+        sleep(0.1)
+        self.assertEqual([], acquired)
+
+        limiter.release(True, 0.0)
+        waiter.join(timeout=5.0)
+        self.assertEqual([None], acquired)
+
+    def test_observe_counts(self) -> None:
+        limiter = WriteLimiter()
+        limiter.observe_counts(10, 0, 0)
+        self.assertEqual(WRITE_LIMIT_INITIAL, limiter.limit)
+
+        # a backlog by itself isn't a problem
+        limiter.observe_counts(50, 0, 0)
+        self.assertEqual(WRITE_LIMIT_INITIAL, limiter.limit)
+
+        # new failures are
+        limiter.observe_counts(50, 0, 1)
+        self.assertLess(limiter.limit, WRITE_LIMIT_INITIAL)
+
+        # as is a growing backlog while there are writes to retry, which also stops growth
+        limiter2 = WriteLimiter()
+        limiter2.observe_counts(10, 2, 0)
+        limiter2.observe_counts(20, 2, 0)
+        reduced = limiter2.limit
+        self.assertLess(reduced, WRITE_LIMIT_INITIAL)
+        for _ in range(10):
+            limiter2.acquire()
+            limiter2.release(True, 0.0)
+        self.assertEqual(reduced, limiter2.limit)
+
+        limiter2.observe_counts(20, 0, 0)
+        limiter2.acquire()
+        limiter2.release(True, 0.0)
+        self.assertGreater(limiter2.limit, reduced)
+
+    def test_try_acquire_and_give_back(self) -> None:
+        limiter = WriteLimiter(initial_limit=4.0)
+        self.assertEqual(3, limiter.try_acquire(3))
+        self.assertEqual(1, limiter.try_acquire(3))
+        self.assertEqual(0, limiter.try_acquire(3))
+        self.assertEqual(4, limiter.in_flight)
+
+        # unused permits come back without outcomes; a failure shrinks the limit
+        limiter.give_back(4, [(True, 0.0), (False, 0.0)])
+        self.assertEqual(0, limiter.in_flight)
+        self.assertLess(limiter.limit, 4.0)
+
+    def test_leased_shared_limit(self) -> None:
+        # more "processes" than the shared limit: still at most two writes at once
+        node = WriteLimiter(initial_limit=2.0, max_limit=2.0)
+        leases: List[int] = []
+
+        def lease(wanted: int) -> int:
+            node.acquire()
+            granted = 1 + node.try_acquire(wanted - 1)
+            leases.append(granted)
+            return granted
+
+        def give_back(count: int, outcomes: List[WriteOutcome]) -> None:
+            node.give_back(count, outcomes)
+
+        in_flight = [0]
+        max_in_flight = [0]
+        lock = Lock()
+
+        def writer(limiter: LeasedWriteLimiter) -> None:
+            for _ in range(5):
+                with limiter.permit():
+                    with lock:
+                        in_flight[0] += 1
+                        max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+                    sleep(0.01)
+                    with lock:
+                        in_flight[0] -= 1
+
+        processes = [LeasedWriteLimiter(lease, give_back, 0.05) for _ in range(4)]
+        threads = [
+            Thread(target=writer, args=(p,)) for p in processes for _ in range(2)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=10.0)
+
+        self.assertLessEqual(max_in_flight[0], 2)
+
+        # permits are reused, so there are fewer leases than writes
+        self.assertLess(len(leases), 40)
+
+        # and they all come back once the processes have nothing more to write
+        sleep(0.2)
+        self.assertEqual([0, 0, 0, 0], [p.num_leased for p in processes])
+        self.assertEqual(0, node.in_flight)
+
+    def test_leased_gives_back_on_failure(self) -> None:
+        node = WriteLimiter(initial_limit=4.0)
+        limiter = LeasedWriteLimiter(
+            lambda wanted: node.try_acquire(wanted), node.give_back, 60.0
+        )
+
+        limiter.acquire()
+        limiter.release(True, 0.0)
+        self.assertEqual(1, limiter.num_leased)
+        self.assertEqual(1, node.in_flight)
+
+        with limiter.permit() as permit:
+            permit.failed()
+        self.assertEqual(0, limiter.num_leased)
+        self.assertEqual(0, node.in_flight)
+        self.assertLess(node.limit, 4.0)